@@ -0,0 +1,159 @@
+# Every node class declares __slots__: no per-node __dict__, so a parsed
+# program costs a handful of pointers per node. Slots that are not filled
+# in by the constructor (depth, slot, scope) are set by the resolver, except
+# line: the parser sets it on statements to the line they start on.
+
+class ASTNode:
+    __slots__ = ('line',)
+
+
+class Program(ASTNode):
+    __slots__ = ('statements',)
+
+    def __init__(self, statements):
+        self.statements = statements  # list of ASTNode
+
+
+class ImportStatement(ASTNode):
+    __slots__ = ('path', 'alias', 'slot')
+
+    def __init__(self, path, alias=None):
+        self.path = path  # string
+        if alias is None:
+            # Bound under the file name without its .iji suffix
+            alias = path.replace('\\', '/').rsplit('/', 1)[-1]
+            if alias.endswith('.iji'):
+                alias = alias[:-4]
+        self.alias = alias  # str the module is bound to
+
+
+class FunctionDef(ASTNode):
+    __slots__ = ('name', 'params', 'body', 'modifier', 'scope')
+
+    def __init__(self, name, params, body, modifier=None):
+        self.name = name  # str
+        self.params = params  # list of (type, name) tuples
+        self.body = body  # list of ASTNode
+        self.modifier = modifier  # None, "pure" or "memo"
+
+
+class ReturnStatement(ASTNode):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value  # Expression
+
+
+class RaiseStatement(ASTNode):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value  # Expression, the error message
+
+
+class VariableDeclaration(ASTNode):
+    __slots__ = ('var_type', 'name', 'initializer', 'slot')
+
+    def __init__(self, var_type, name, initializer):
+        self.var_type = var_type  # str
+        self.name = name  # str
+        self.initializer = initializer  # Expression
+
+
+class Assignment(ASTNode):
+    __slots__ = ('name', 'value', 'depth', 'slot', 'var_type')
+
+    def __init__(self, name, value):
+        self.name = name  # str
+        self.value = value  # Expression
+        self.var_type = None  # declared type of the target, set by the resolver
+
+
+class IfStatement(ASTNode):
+    __slots__ = ('condition', 'then_body', 'else_body')
+
+    def __init__(self, condition, then_body, else_body=None):
+        self.condition = condition  # Expression
+        self.then_body = then_body  # list of ASTNode
+        self.else_body = else_body or []  # list of ASTNode
+
+
+class WhileLoop(ASTNode):
+    __slots__ = ('condition', 'body')
+
+    def __init__(self, condition, body):
+        self.condition = condition  # Expression
+        self.body = body  # list of ASTNode
+
+
+class TryStatement(ASTNode):
+    __slots__ = ('try_body', 'catch_type', 'catch_name', 'catch_body', 'slot')
+
+    def __init__(self, try_body, catch_type, catch_name, catch_body):
+        self.try_body = try_body  # list of ASTNode
+        self.catch_type = catch_type  # str or None
+        self.catch_name = catch_name  # str bound to the error message
+        self.catch_body = catch_body  # list of ASTNode
+
+
+class BinaryOperation(ASTNode):
+    __slots__ = ('left', 'operator', 'right')
+
+    def __init__(self, left, operator, right):
+        self.left = left  # Expression
+        self.operator = operator  # str
+        self.right = right  # Expression
+
+
+class Literal(ASTNode):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class VariableReference(ASTNode):
+    __slots__ = ('name', 'depth', 'slot')
+
+    def __init__(self, name):
+        self.name = name  # str
+
+
+class FunctionCall(ASTNode):
+    __slots__ = ('name', 'args', 'target', 'builtin')
+
+    def __init__(self, name, args, target=None):
+        self.name = name  # str
+        self.args = args  # list of Expression
+        self.target = target  # Expression evaluating to a module, for module.name(...)
+        self.builtin = None  # the stdlib function it calls, bound by the resolver
+
+
+class MemberAccess(ASTNode):
+    __slots__ = ('container', 'name')
+
+    def __init__(self, container, name):
+        self.container = container  # Expression evaluating to a module
+        self.name = name  # str
+
+
+class ListLiteralNode:
+    __slots__ = ('elements', 'line')
+
+    def __init__(self, elements):
+        self.elements = elements
+
+
+class DictLiteralNode:
+    __slots__ = ('pairs', 'line')
+
+    def __init__(self, pairs):
+        self.pairs = pairs  # list of (key, value) pairs
+
+
+class IndexAccessNode:
+    __slots__ = ('container', 'index', 'line')
+
+    def __init__(self, container, index):
+        self.container = container
+        self.index = index
@@ -0,0 +1,92 @@
+# Compares the tree-walking Executor against the closure-compiling mode on a
+# demo.iji-style loop.
+#
+#   python benchmarks/executor_modes.py [iterations] [repeats]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ast_nodes import (  # noqa: E402
+    Program, FunctionDef, ReturnStatement, VariableDeclaration, Assignment,
+    IfStatement, WhileLoop, BinaryOperation, Literal, VariableReference,
+    FunctionCall, ListLiteralNode, IndexAccessNode,
+)
+from closures import ClosureExecutor  # noqa: E402
+from runtime import Executor  # noqa: E402
+
+
+def var(name):
+    return VariableReference(name)
+
+
+def binop(left, op, right):
+    return BinaryOperation(left, op, right)
+
+
+def build_program(iterations):
+    # func square(int n)
+    #     return n * n
+    # list nums = [1, 2, 3, 4]
+    # int total = 0
+    # int i = 0
+    # while i < iterations
+    #     if i > 2
+    #         total = total + square(i) - nums[3]
+    #     else
+    #         total = total + nums[i]
+    #     i = i + 1
+    return Program([
+        FunctionDef("square", [("int", "n")], [
+            ReturnStatement(binop(var("n"), "*", var("n"))),
+        ]),
+        VariableDeclaration("list", "nums", ListLiteralNode([Literal(n) for n in (1, 2, 3, 4)])),
+        VariableDeclaration("int", "total", Literal(0)),
+        VariableDeclaration("int", "i", Literal(0)),
+        WhileLoop(binop(var("i"), "<", Literal(iterations)), [
+            IfStatement(
+                binop(var("i"), ">", Literal(2)),
+                [Assignment("total", binop(
+                    binop(var("total"), "+", FunctionCall("square", [var("i")])),
+                    "-", IndexAccessNode(var("nums"), Literal(3))))],
+                [Assignment("total", binop(var("total"), "+", IndexAccessNode(var("nums"), var("i"))))],
+            ),
+            Assignment("i", binop(var("i"), "+", Literal(1))),
+        ]),
+    ])
+
+
+def measure(executor_class, iterations, repeats):
+    best = None
+    result = None
+    for _ in range(repeats):
+        executor = executor_class()
+        program = build_program(iterations)
+        start = time.perf_counter()
+        executor.execute(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        result = executor.global_env.get("total")
+    return best, result
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f"{iterations} loop iterations, best of {repeats} runs")
+    baseline = None
+    expected = None
+    for name, executor_class in (("walk", Executor), ("closure", ClosureExecutor)):
+        elapsed, result = measure(executor_class, iterations, repeats)
+        if expected is None:
+            baseline, expected = elapsed, result
+        elif result != expected:
+            raise SystemExit(f"{name}: result {result} differs from {expected}")
+        print(f"{name:<10} {elapsed * 1000:9.1f} ms  {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
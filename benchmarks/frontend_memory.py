@@ -0,0 +1,90 @@
+# Front-end memory footprint: tracemalloc peak per MB of source while the
+# tokens, or the tokens and the parsed tree, are held. Compares Token tuples
+# against the TokenBuffer columns, and __dict__-backed AST nodes (the
+# previous ast_nodes classes) against the __slots__ ones.
+#
+#   python benchmarks/frontend_memory.py [megabytes]
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import ast_nodes  # noqa: E402
+import parser as parser_module  # noqa: E402
+from lexer import Lexer  # noqa: E402
+from lexer_throughput import generate  # noqa: E402
+from parser import Parser  # noqa: E402
+
+NODE_CLASSES = [
+    name for name, value in vars(ast_nodes).items()
+    if isinstance(value, type) and value.__module__ == "ast_nodes" and name != "ASTNode"
+]
+
+
+def dict_nodes():
+    # Same constructors, but plain classes with an instance __dict__
+    return {
+        name: type(name, (), {"__init__": getattr(ast_nodes, name).__init__})
+        for name in NODE_CLASSES
+    }
+
+
+def parse(tokens, nodes=None):
+    saved = {name: getattr(parser_module, name) for name in NODE_CLASSES}
+    if nodes:
+        vars(parser_module).update(nodes)
+    try:
+        p = Parser(tokens)
+        program = p.parse()
+    finally:
+        vars(parser_module).update(saved)
+    if p.errors:
+        raise SystemExit(f"parse errors: {p.errors[:3]}")
+    return program
+
+
+def peak_memory(run):
+    tracemalloc.start()
+    try:
+        result = run()  # held until the peak is read
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    source = generate(megabytes)
+    size = len(source.encode("utf-8")) / (1024 * 1024)
+    legacy = dict_nodes()
+
+    def tokens_and_dict_tree():
+        lexer = Lexer(source)
+        return lexer.tokenize(), parse(lexer, legacy)
+
+    def buffer_and_slots_tree():
+        tokens = Lexer(source).compact()
+        return tokens, parse(tokens)
+
+    variants = [
+        ("Token list", lambda: Lexer(source).tokenize()),
+        ("TokenBuffer", lambda: Lexer(source).compact()),
+        ("Token list + dict nodes", tokens_and_dict_tree),
+        ("TokenBuffer + slots nodes", buffer_and_slots_tree),
+    ]
+
+    print(f"{size:.1f} MB of source, traced peak while the result is held")
+    baseline = None
+    for name, run in variants:
+        per_mb = peak_memory(run) / (1024 * 1024) / size
+        if name.startswith("Token list"):
+            baseline = per_mb
+        print(f"{name:<28} {per_mb:7.1f} MB per MB of source  {baseline / per_mb:5.2f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
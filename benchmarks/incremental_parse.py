@@ -0,0 +1,82 @@
+# Editor-style edits to a large file: the time IncrementalParser.edit()
+# takes against parsing the whole file again, as the editor plugin and the
+# notebook REPL did on every keystroke, and how many top-level statements
+# each edit parsed anew. Every edit's program is checked against a full
+# parse of the same text.
+#
+#   python benchmarks/incremental_parse.py [functions]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from incremental import IncrementalParser  # noqa: E402
+from lexer import Lexer  # noqa: E402
+from parser import Parser  # noqa: E402
+
+FUNCTION = '''
+func step_{n}(int x, list[int] values)
+    int total = 0
+    int i = 0
+    while i < length(values)
+        if values[i] > x
+            total = total + values[i] * {n}
+        else
+            total = total - 1
+        i = i + 1
+    return total
+
+int result_{n} = step_{n}({n}, [1, 2, 3, {n}])
+'''
+
+
+def shape(node):
+    # The node's class and fields, recursively, for comparing trees
+    if isinstance(node, (list, tuple)):
+        return [shape(item) for item in node]
+    slots = [name for cls in type(node).__mro__ for name in getattr(cls, "__slots__", ())]
+    if not slots:
+        return node
+    return (type(node).__name__,) + tuple(shape(getattr(node, name, None)) for name in slots)
+
+
+def edits(source):
+    # (name, start, end, text) in the order an editor would send them
+    middle = source.index("func step_", len(source) // 2)
+    body = source.index("total = total - 1", middle)
+    yield "type a character", body + len("total = total - "), body + len("total = total - 1"), "2"
+    line = source.index("\n", body) + 1
+    yield "insert a line", line, line, "            total = total + 1\n"
+    yield "dedent a line", line, line + 4, ""
+    yield "open a bracket", body, body, "int pending = ["
+    yield "close it", body + len("int pending = ["), body + len("int pending = ["), "]\n        "
+    head = source.rindex("\n", 0, middle) + 1
+    yield "indent a function", head, head, "    "
+
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    source = "".join(FUNCTION.format(n=n) for n in range(functions))
+    start = time.perf_counter()
+    parser = IncrementalParser(source)
+    print(f"{functions} functions, {len(source) // 1024} KB, {len(parser.program.statements)} top-level statements")
+    print(f"initial parse {(time.perf_counter() - start) * 1000:.1f}ms")
+    print(f"{'edit':<20} {'full':>10} {'incremental':>12} {'speedup':>8} {'reparsed':>9}")
+    for name, begin, end, text in edits(parser.source):
+        source = parser.source[:begin] + text + parser.source[end:]
+        start = time.perf_counter()
+        full = Parser(Lexer(source))
+        expected = full.parse()
+        full_time = time.perf_counter() - start
+        start = time.perf_counter()
+        program, changed = parser.edit(begin, end, text)
+        edit_time = time.perf_counter() - start
+        if shape(program.statements) != shape(expected.statements) or parser.errors != full.errors:
+            raise SystemExit(f"{name}: the incremental parse differs from a full parse")
+        print(f"{name:<20} {full_time * 1000:8.1f}ms {edit_time * 1000:10.2f}ms {full_time / edit_time:7.0f}x {len(changed):9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# Lexer throughput in MB/s (and traced peak memory): the previous
+# line-splitting Lexer against the single-pass scanner, materialized and
+# streamed, from a str and from an mmap.
+#
+#   python benchmarks/lexer_throughput.py [megabytes] [repeats]
+
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lexer import Lexer, Token, LexerError  # noqa: E402
+
+BLOCK = '''# Generated block {n}
+func square_{n}(int n)
+    return n * n
+
+int value_{n} = square_{n}({n}) + 3.25 * 2
+string label_{n} = "item " + str(value_{n})
+list nums_{n} = [1, 2, 3, {n}]
+if value_{n} > 5
+    print("big: " + label_{n})
+else
+    print("small")
+while value_{n} < 100
+    value_{n} = value_{n} + nums_{n}[0]
+'''
+
+
+class LegacyLexer:
+    # The previous implementation: regex compiled per instance, source split
+    # into lines, every token collected into a list before parsing starts
+    KEYWORDS = Lexer.KEYWORDS
+    BOOL_LITERALS = Lexer.BOOL_LITERALS
+    TOKEN_SPECIFICATION = [
+        ('TRIPLE_STRING', r'"""(?:.|\n)*?"""'),
+        ('NUMBER',       r'\d+(\.\d*)?'),
+        ('STRING',       r'"([^"\\]|\\.)*"'),
+        ('ID',           r'[A-Za-z_][A-Za-z0-9_]*'),
+        ('OP',           r'==|!=|<=|>=|[+\-*/<>=]'),
+        ('NEWLINE',      r'\n'),
+        ('SKIP',         r'[ \t]+'),
+        ('COMMENT',      r'\#.*'),
+        ('SEMICOLON',    r';'),
+        ('LPAREN',       r'\('),
+        ('RPAREN',       r'\)'),
+        ('COMMA',        r','),
+        ('COLON',        r':'),
+        ('LEFT_BRACKET',  r'\['),
+        ('RIGHT_BRACKET', r'\]'),
+        ('LEFT_BRACE',    r'\{'),
+        ('RIGHT_BRACE',   r'\}'),
+        ('UNKNOWN',      r'.'),
+    ]
+
+    def __init__(self, code):
+        self.code = code
+        self.tokens = []
+        self.indents = [0]
+        self.line = 1
+        self.column = 1
+        self.regex = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in self.TOKEN_SPECIFICATION),
+                                re.MULTILINE)
+
+    def tokenize(self):
+        lines = self.code.splitlines(keepends=True)
+        for line in lines:
+            stripped = line.lstrip('\r\n')
+            indent = len(line) - len(stripped)
+            if stripped == '' or stripped.startswith('#'):
+                self.line += 1
+                self.column = 1
+                continue
+            if indent > self.indents[-1]:
+                self.indents.append(indent)
+                self.tokens.append(Token('INDENT', '', self.line, self.column))
+            while indent < self.indents[-1]:
+                self.indents.pop()
+                self.tokens.append(Token('DEDENT', '', self.line, self.column))
+            self._tokenize_line(stripped)
+            self.line += 1
+            self.column = 1
+        while len(self.indents) > 1:
+            self.indents.pop()
+            self.tokens.append(Token('DEDENT', '', self.line, self.column))
+        self.tokens.append(Token('EOF', '', self.line, self.column))
+        return self.tokens
+
+    def _tokenize_line(self, line):
+        pos = 0
+        while pos < len(line):
+            match = self.regex.match(line, pos)
+            kind = match.lastgroup
+            value = match.group(kind)
+            start_col = pos + 1
+            if kind == 'NEWLINE':
+                self.tokens.append(Token('NEWLINE', '', self.line, start_col))
+            elif kind == 'SKIP':
+                pass
+            elif kind == 'COMMENT':
+                break
+            elif kind == 'ID':
+                lowered = value.lower()
+                if lowered in self.KEYWORDS:
+                    self.tokens.append(Token(lowered.upper(), value, self.line, start_col))
+                elif lowered in self.BOOL_LITERALS:
+                    self.tokens.append(Token('BOOL', lowered == 'true', self.line, start_col))
+                else:
+                    self.tokens.append(Token('ID', value, self.line, start_col))
+            elif kind == 'STRING' or kind == 'TRIPLE_STRING':
+                if kind == 'STRING':
+                    val = bytes(value[1:-1], "utf-8").decode("unicode_escape")
+                else:
+                    val = bytes(value[3:-3], "utf-8").decode("unicode_escape")
+                self.tokens.append(Token('STRING', val, self.line, start_col))
+            elif kind == 'NUMBER':
+                if '.' in value:
+                    self.tokens.append(Token('FLOAT', float(value), self.line, start_col))
+                else:
+                    self.tokens.append(Token('INT', int(value), self.line, start_col))
+            elif kind == 'UNKNOWN':
+                raise LexerError(f'Unknown token {value} at line {self.line} col {start_col}')
+            else:
+                self.tokens.append(Token(kind, value, self.line, start_col))
+            pos = match.end()
+
+
+def generate(megabytes):
+    target = int(megabytes * 1024 * 1024)
+    parts = []
+    size = 0
+    n = 0
+    while size < target:
+        block = BLOCK.format(n=n)
+        parts.append(block)
+        size += len(block)
+        n += 1
+    return "".join(parts)
+
+
+def drain(tokens):
+    count = 0
+    for _ in tokens:
+        count += 1
+    return count
+
+
+def measure(run, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def peak_memory(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    source = generate(megabytes)
+    size = len(source.encode("utf-8")) / (1024 * 1024)
+    with tempfile.NamedTemporaryFile("w", suffix=".iji", delete=False) as f:
+        f.write(source)
+        path = f.name
+
+    variants = [
+        ("legacy tokenize()", lambda: len(LegacyLexer(source).tokenize())),
+        ("scanner tokenize()", lambda: len(Lexer(source).tokenize())),
+        ("scanner streamed", lambda: drain(Lexer(source).scan())),
+        ("scanner streamed, mmap", lambda: drain(Lexer.from_file(path).scan())),
+    ]
+
+    print(f"{size:.1f} MB of source, best of {repeats} runs")
+    try:
+        baseline = None
+        for name, run in variants:
+            elapsed, count = measure(run, repeats)
+            baseline = baseline or elapsed
+            peak = peak_memory(run) / (1024 * 1024)
+            print(f"{name:<24} {size / elapsed:7.2f} MB/s  {baseline / elapsed:5.2f}x  "
+                  f"peak {peak:7.1f} MB  {count} tokens")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
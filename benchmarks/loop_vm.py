@@ -0,0 +1,94 @@
+# Loop-heavy .iji program on the tree-walking Executor, the closure mode and
+# the bytecode VM (compiled at -O2): a counted `while i < n` loop with a
+# branch in its body and a `while j < length(nums)` loop over a list.
+#
+#   python benchmarks/loop_vm.py [iterations] [repeats]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from closures import ClosureExecutor  # noqa: E402
+from compiler import Compiler  # noqa: E402
+from lexer import Lexer  # noqa: E402
+from optimizer import optimize  # noqa: E402
+from parser import Parser  # noqa: E402
+from runtime import Executor  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+SOURCE = '''
+list nums = [1, 2, 3, 4, 5, 6, 7, 8]
+int total = 0
+int i = 0
+while i < {iterations}
+    if i < {half}
+        total = total + i
+    else
+        total = total - 1
+    i = i + 1
+int rounds = 0
+while rounds < {rounds}
+    int j = 0
+    while j < length(nums)
+        total = total + nums[j]
+        j = j + 1
+    rounds = rounds + 1
+'''
+
+
+def parse(source):
+    return Parser(Lexer(source)).parse()
+
+
+def run_executor(executor_class, source):
+    executor = executor_class()
+    executor.execute(parse(source))
+    return executor.global_env.get("total")
+
+
+def run_vm(source):
+    compiler = Compiler()
+    compiler.compile(parse(source))
+    optimize(compiler, 2)
+    vm = VirtualMachine(compiler.instructions, compiler.constants, compiler.functions)
+    vm.run()
+    return vm.globals[compiler.var_indices["total"]]
+
+
+def measure(run, repeats):
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    source = SOURCE.format(iterations=iterations, half=iterations // 2, rounds=iterations // 8)
+
+    print(f"{iterations} counted iterations + {iterations // 8} list passes, best of {repeats} runs")
+    variants = [
+        ("walk", lambda: run_executor(Executor, source)),
+        ("closure", lambda: run_executor(ClosureExecutor, source)),
+        ("vm -O2", lambda: run_vm(source)),
+    ]
+    baseline = None
+    expected = None
+    for name, run in variants:
+        elapsed, result = measure(run, repeats)
+        if expected is None:
+            baseline, expected = elapsed, result
+        elif result != expected:
+            raise SystemExit(f"{name}: result {result} differs from {expected}")
+        print(f"{name:<10} {elapsed * 1000:9.1f} ms  {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# fib-style recursion with and without the memo marker on every backend.
+# The memo cache turns the exponential recursion into one evaluation per
+# argument, so this mostly shows the per-call overhead of a cache hit.
+#
+#   python benchmarks/memo.py [n] [repeats]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import regvm  # noqa: E402
+from cache import compile_source  # noqa: E402
+from closures import ClosureExecutor  # noqa: E402
+from lexer import Lexer  # noqa: E402
+from parser import Parser  # noqa: E402
+from runtime import Executor  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+SOURCE = '''
+{marker}func fib(int n)
+    if n < 2
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+int total = 0
+int i = 0
+while i < 200
+    total = total + fib({n})
+    i = i + 1
+'''
+
+
+def run_executor(executor_class, source):
+    executor = executor_class()
+    executor.execute(Parser(Lexer(source)).parse())
+    return executor.memo
+
+
+def run_vm(source):
+    bytecode = compile_source(source, 2)
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions,
+                        tier_up=False, memoized=bytecode.memoized)
+    vm.run()
+    return vm.memo
+
+
+def run_register(source):
+    compiler = regvm.compile_source(source)
+    vm = regvm.RegisterVM(compiler.instructions, compiler.constants, compiler.functions,
+                          compiler.frame_sizes, memoized=compiler.memoized)
+    vm.run()
+    return vm.memo
+
+
+def measure(run, source, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        memo = run(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, memo
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    backends = [
+        ("walk", lambda source: run_executor(Executor, source)),
+        ("closure", lambda source: run_executor(ClosureExecutor, source)),
+        ("vm", run_vm),
+        ("register", run_register),
+    ]
+    print(f"200 x fib({n}), best of {repeats} runs")
+    for name, run in backends:
+        plain, _ = measure(run, SOURCE.format(marker="", n=n), repeats)
+        memoized, memo = measure(run, SOURCE.format(marker="memo ", n=n), repeats)
+        stats = memo.stats()["fib"]
+        print(f"{name:<10} plain {plain * 1000:8.1f} ms  memo {memoized * 1000:7.2f} ms  "
+              f"{plain / memoized:7.1f}x  (hits {stats['hits']}, misses {stats['misses']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Parse time of machine-generated Ijichi as it grows: one long + chain,
+# deeply nested parentheses and lists, and blocks nested one level per line.
+# The parser keeps its open operators, brackets and blocks on explicit
+# stacks, so none of these reach the recursion limit and the time per token
+# stays flat as the input grows.
+#
+#   python benchmarks/parser_scaling.py [largest size]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lexer import Lexer  # noqa: E402
+from parser import Parser  # noqa: E402
+
+
+def long_sum(n):
+    return "int total = " + " + ".join(f"x{i % 10} * {i}" for i in range(n)) + "\n"
+
+
+def nested_brackets(n):
+    return "list xs = " + "[(" * n + "1" + ")]" * n + "\n"
+
+
+def nested_blocks(n):
+    # One space of indent per level keeps the source linear in n
+    lines = [" " * i + ("if x < 1" if i % 2 else "while x < 1") for i in range(n)]
+    return "\n".join(lines) + "\n" + " " * n + "x = x + 1\n"
+
+
+INPUTS = {
+    "+ chain": long_sum,
+    "nested brackets": nested_brackets,
+    "nested blocks": nested_blocks,
+}
+
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    sizes = [size for size in (1000, 10000, 100000, 1000000) if size <= largest]
+    print(f"recursion limit {sys.getrecursionlimit()}")
+    print(f"{'input':<16} {'size':>8} {'tokens':>9} {'parse':>9} {'us/token':>9}")
+    for name, generate in INPUTS.items():
+        for size in sizes:
+            if name == "nested blocks" and size > 10000:
+                break  # the indentation alone is size**2 / 2 characters
+            tokens = Lexer(generate(size)).compact()
+            parser = Parser(tokens)
+            start = time.perf_counter()
+            parser.parse()
+            elapsed = time.perf_counter() - start
+            if parser.errors:
+                raise SystemExit(f"{name} {size}: {parser.errors[0]}")
+            print(f"{name:<16} {size:>8} {len(tokens):>9} {elapsed * 1000:7.1f}ms {elapsed / len(tokens) * 1e6:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# Per-script latency of cold python ijichi.py runs against the serve.py
+# daemon, for a short script: p50/p90/p99 of running it as a fresh
+# interpreter process, through the client.py command (still one Python
+# startup per script, but nothing of the interpreter to import or parse),
+# and as requests from an already running client, which is the server's
+# own latency. The server is started on a temporary socket and stopped at
+# the end; its --server-stats are printed last.
+#
+#   python benchmarks/serve_latency.py [-n requests] [--cold runs] [-w workers] [script.iji]
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import client  # noqa: E402
+
+# A short script of the kind run thousands of times a minute, by default
+SCRIPT = '''
+func label(string name, int count)
+    if count == 1
+        return name
+    return name + "s"
+
+func total(list values)
+    int sum = 0
+    int i = 0
+    while i < length(values)
+        sum = sum + values[i]
+        i = i + 1
+    return sum
+
+list sizes = [3, 1, 4, 1, 5, 9, 2, 6]
+dict names = {"a": "apple", "b": "banana"}
+int n = total(sizes)
+print(str(n) + " " + label(names["a"], n))
+try
+    print(sizes[20])
+catch error
+    print("no such size")
+'''
+
+
+def percentiles(times):
+    ordered = sorted(times)
+    rank = lambda p: ordered[max(0, (len(ordered) * p + 99) // 100 - 1)] * 1000  # noqa: E731
+    return rank(50), rank(90), rank(99), statistics.mean(ordered) * 1000
+
+
+def timed(run, count):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        status = run()
+        times.append(time.perf_counter() - start)
+        if status:
+            raise SystemExit(f"run failed with status {status}")
+    return times
+
+
+def wait_for(path, server, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("serve.py exited")
+        try:
+            client.connect(path).close()
+            return
+        except client.ServerError:
+            time.sleep(0.05)
+    raise SystemExit("serve.py did not start")
+
+
+def take(argv, flag, default):
+    if flag in argv:
+        i = argv.index(flag)
+        value = int(argv[i + 1])
+        del argv[i:i + 2]
+        return value
+    return default
+
+
+def main(argv):
+    requests = take(argv, "-n", 500)
+    cold = take(argv, "--cold", 30)
+    workers = take(argv, "-w", 2)
+    python = sys.executable
+    quiet = dict(stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        script = os.path.abspath(argv[0]) if argv else os.path.join(tmpdir, "short.iji")
+        if not argv:
+            with open(script, "w") as f:
+                f.write(SCRIPT)
+        path = os.path.join(tmpdir, "ijichi.sock")
+        server = subprocess.Popen([python, os.path.join(ROOT, "serve.py"), "--socket", path, "-w", str(workers)],
+                                  **quiet)
+        try:
+            wait_for(path, server)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            rows = [
+                ("cold ijichi.py", timed(lambda: subprocess.run(
+                    [python, os.path.join(ROOT, "ijichi.py"), script], **quiet).returncode, cold)),
+                ("client.py process", timed(lambda: subprocess.run(
+                    [python, os.path.join(ROOT, "client.py"), "--socket", path, script], **quiet).returncode, cold)),
+                ("client request", timed(lambda: client.run([script], path, (devnull, devnull, devnull)),
+                                         requests)),
+            ]
+            os.close(devnull)
+            stats = client.format_stats(client.server_stats(path))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{argv[0] if argv else 'short script'}: {cold} cold and client.py runs, {requests} requests, {workers} workers")
+    print(f"{'':<18} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for name, times in rows:
+        print(f"{name:<18}" + "".join(f" {value:9.2f}" for value in percentiles(times)))
+    print()
+    print(stats)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,79 @@
+# A report built line by line with out = out + ..., on the stack VM, with
+# the concat pass (-O1 buffers out) and without it (-O0 copies the report so
+# far on every line). Time per MB stays flat as the report grows when the
+# building is linear, and grows with the report when it is quadratic. The
+# unbuffered loop only runs up to --plain-limit MB.
+#
+#   python benchmarks/string_building.py [-n repeats] [--plain-limit MB] [MB ...]
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cache import compile_source  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+PROGRAM = '''
+func report(int rows)
+    string out = ""
+    int i = 0
+    while i < rows
+        out = out + "row " + str(i) + ": value=" + str(i * 7) + " status=ok\\n"
+        i = i + 1
+    return out
+
+print(length(report(ROWS)))
+'''
+
+LINE_BYTES = 35  # about, for choosing the row count
+
+
+def timed(source, opt_level, repeats):
+    bytecode = compile_source(source, opt_level)
+    best = None
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for _ in range(repeats):
+            vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions)
+            start = time.perf_counter()
+            vm.run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best, int(output.getvalue().split()[0])
+
+
+def main(argv):
+    repeats = 3
+    plain_limit = 2.0
+    if "-n" in argv:
+        i = argv.index("-n")
+        repeats = int(argv[i + 1])
+        del argv[i:i + 2]
+    if "--plain-limit" in argv:
+        i = argv.index("--plain-limit")
+        plain_limit = float(argv[i + 1])
+        del argv[i:i + 2]
+    sizes = [float(arg) for arg in argv] or [0.5, 1, 2, 5, 10]
+
+    print(f"best of {repeats} runs")
+    print(f"{'report':>9} {'rows':>8} {'buffered':>12} {'ms/MB':>8} {'plain':>12} {'ms/MB':>8}")
+    for size in sizes:
+        rows = int(size * 1024 * 1024 / LINE_BYTES)
+        source = PROGRAM.replace("ROWS", str(rows))
+        elapsed, length = timed(source, 1, repeats)
+        mb = length / (1024 * 1024)
+        line = f"{mb:7.2f}MB {rows:8} {elapsed * 1000:9.1f} ms {elapsed * 1000 / mb:8.1f}"
+        if size <= plain_limit:
+            plain, plain_length = timed(source, 0, repeats)
+            if plain_length != length:
+                raise SystemExit(f"{size} MB: buffered report differs")
+            line += f" {plain * 1000:9.1f} ms {plain * 1000 / mb:8.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,223 @@
+# Benchmark suite: the .iji programs in benchmarks/programs, plus a large
+# generated source that mostly exercises the lexer and parser, run end to
+# end (source to output, no .ijc cache) on every backend. Each benchmark gets
+# warmup runs and then timed runs, summarized as min, median, mean and
+# standard deviation. Results can be written as JSON and checked against a
+# baseline written earlier by the same script.
+#
+#   python benchmarks/suite.py [-n repeats] [--warmup runs] [--backend name]...
+#       [--bench name]... [--json results.json] [--baseline baseline.json]
+#       [--threshold fraction]
+#
+# Exits with status 1 when a benchmark fails, or when its median is more
+# than threshold (default 0.10) slower than in the baseline. A backend that
+# cannot compile a program (the VMs have no imports) is reported as n/a.
+# New backends go in BACKENDS.
+
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cache import load_program  # noqa: E402
+from closures import ClosureExecutor  # noqa: E402
+from compiler import CompileError  # noqa: E402
+from modules import REGISTRY  # noqa: E402
+from runtime import Executor  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs")
+
+GENERATED_BLOCKS = 2000
+GENERATED_BLOCK = '''
+# Generated block {n}
+func gen_{n}(int a, int b)
+    int c = a * {n} + b
+    if c > 100
+        c = c - 100
+    return c
+
+int value_{n} = gen_{n}({n}, 3) + 1
+string label_{n} = "item " + str(value_{n})
+list nums_{n} = [{n}, value_{n}, 3]
+'''
+
+
+def run_walk(path, executor_class=Executor):
+    # As ijichi.py does it, with the parsed-module cache emptied so every
+    # run parses its imports again like a fresh process would
+    REGISTRY.entries.clear()
+    executor_class(path=path).execute(REGISTRY.load(path))
+
+
+def run_closure(path):
+    run_walk(path, ClosureExecutor)
+
+
+def run_vm(path):
+    bytecode = load_program(path, 1, use_cache=False)
+    VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions,
+                   memoized=bytecode.memoized, exception_table=bytecode.exception_table).run()
+
+
+def run_register(path):
+    import regvm
+    with open(path, "rb") as f:
+        compiler = regvm.compile_source(f.read())
+    regvm.RegisterVM(compiler.instructions, compiler.constants, compiler.functions,
+                     compiler.frame_sizes, memoized=compiler.memoized,
+                     exception_table=compiler.exception_table).run()
+
+
+BACKENDS = {
+    "walk": run_walk,
+    "closure": run_closure,
+    "vm": run_vm,
+    "register": run_register,
+}
+
+
+def programs(tmpdir):
+    # name -> path: every .iji file directly in PROGRAMS, plus "generated"
+    found = {os.path.splitext(os.path.basename(path))[0]: path
+             for path in sorted(glob.glob(os.path.join(PROGRAMS, "*.iji")))}
+    generated = os.path.join(tmpdir, "generated.iji")
+    with open(generated, "w") as f:
+        f.write("".join(GENERATED_BLOCK.format(n=n) for n in range(GENERATED_BLOCKS)))
+    found["generated"] = generated
+    return found
+
+
+def measure(run, path, repeats, warmup):
+    # Timings in seconds, or raises what the program raised
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            run(path)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run(path)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times):
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "runs": times,
+    }
+
+
+def compare(results, baseline, threshold):
+    # Lines describing each regression past threshold
+    regressions = []
+    for bench, backends in results.items():
+        for backend, stats in backends.items():
+            before = baseline.get(bench, {}).get(backend)
+            if not isinstance(stats, dict) or not isinstance(before, dict):
+                continue
+            change = stats["median"] / before["median"] - 1
+            if change > threshold:
+                regressions.append(f"{bench} on {backend}: median {before['median'] * 1000:.1f} ms"
+                                   f" -> {stats['median'] * 1000:.1f} ms (+{change * 100:.1f}%)")
+    return regressions
+
+
+def take(argv, flag, default=None, many=False):
+    # Removes every "flag value" pair from argv
+    values = []
+    while flag in argv:
+        i = argv.index(flag)
+        values.append(argv[i + 1] if i + 1 < len(argv) else "")
+        del argv[i:i + 2]
+    if many:
+        return values
+    return values[-1] if values else default
+
+
+def main(argv):
+    repeats = int(take(argv, "-n", 5))
+    warmup = int(take(argv, "--warmup", 1))
+    backends = take(argv, "--backend", many=True) or list(BACKENDS)
+    benches = take(argv, "--bench", many=True)
+    output = take(argv, "--json")
+    baseline_path = take(argv, "--baseline")
+    threshold = float(take(argv, "--threshold", 0.10))
+    unknown = [name for name in backends if name not in BACKENDS]
+    if argv or unknown or repeats < 1:
+        print("Usage: python benchmarks/suite.py [-n repeats] [--warmup runs] [--backend name]..."
+              " [--bench name]... [--json results.json] [--baseline baseline.json] [--threshold fraction]")
+        print(f"backends: {', '.join(BACKENDS)}")
+        return 1
+
+    baseline = {}
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+
+    failed = False
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        found = programs(tmpdir)
+        missing = [name for name in benches if name not in found]
+        if missing:
+            print(f"Unknown benchmark {', '.join(missing)}; have {', '.join(found)}")
+            return 1
+        print(f"{repeats} runs after {warmup} warmup, times in ms")
+        print(f"{'benchmark':<14} {'backend':<10} {'median':>9} {'min':>9} {'stdev':>8}  vs baseline")
+        for bench, path in found.items():
+            if benches and bench not in benches:
+                continue
+            results[bench] = {}
+            for backend in backends:
+                try:
+                    stats = summarize(measure(BACKENDS[backend], path, repeats, warmup))
+                except CompileError:
+                    results[bench][backend] = "n/a"
+                    print(f"{bench:<14} {backend:<10} {'n/a':>9}")
+                    continue
+                except Exception as e:
+                    failed = True
+                    results[bench][backend] = f"error: {e}"
+                    print(f"{bench:<14} {backend:<10} error: {type(e).__name__}: {e}")
+                    continue
+                results[bench][backend] = stats
+                before = baseline.get(bench, {}).get(backend)
+                change = ""
+                if isinstance(before, dict):
+                    change = f"{(stats['median'] / before['median'] - 1) * 100:+.1f}%"
+                print(f"{bench:<14} {backend:<10} {stats['median'] * 1000:9.1f} {stats['min'] * 1000:9.1f}"
+                      f" {stats['stdev'] * 1000:8.1f}  {change}")
+
+    if output:
+        document = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeats": repeats,
+            "warmup": warmup,
+            "results": results,
+        }
+        with open(output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    regressions = compare(results, baseline, threshold)
+    if regressions:
+        print(f"\nregressions past {threshold * 100:g}%:")
+        for line in regressions:
+            print("  " + line)
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,70 @@
+# Call-heavy functions on the stack VM with and without tier-up to Python
+# code objects (IJICHI_NO_TIERUP), plus the time spent translating.
+#
+#   python benchmarks/tierup.py [repeats]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cache import compile_source  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+PROGRAMS = {
+    "fib": '''
+func fib(int n)
+    if n < 2
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+int result = fib(24)
+''',
+    "loops": '''
+func sum_to(int n)
+    int total = 0
+    int i = 0
+    while i < n
+        if i > n / 2
+            total = total + i * 2
+        else
+            total = total - 1
+        i = i + 1
+    return total
+
+int result = 0
+int c = 0
+while c < 400
+    result = result + sum_to(c)
+    c = c + 1
+''',
+}
+
+
+def run(source, tier_up):
+    bytecode = compile_source(source, 2)
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions, tier_up=tier_up)
+    start = time.perf_counter()
+    vm.run()
+    elapsed = time.perf_counter() - start
+    return elapsed, vm
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"best of {repeats} runs")
+    for name, source in PROGRAMS.items():
+        interpreted = min(run(source, False)[0] for _ in range(repeats))
+        native, vm = min((run(source, True) for _ in range(repeats)), key=lambda r: r[0])
+        start = time.perf_counter()
+        for entry in vm.tier.cache.values():
+            vm.tier.translate(entry.name)
+        translate = (time.perf_counter() - start) / max(len(vm.tier.cache), 1)
+        print(f"{name:<8} interpreted {interpreted * 1000:8.1f} ms  tier-up {native * 1000:8.1f} ms  "
+              f"{interpreted / native:5.2f}x  ({len(vm.natives)} native, "
+              f"{translate * 1000:.2f} ms per translation)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# A million-element reduction written both ways: an interpreted loop over an
+# untyped list, and sum() over a list[int]. Each program builds its own list,
+# so the typed one also pays for the conversion. The typed program runs on
+# both storage backends, NumPy (when installed) and array.array.
+#
+#   python benchmarks/typed_lists.py [-n repeats] [size]
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import vectors  # noqa: E402
+from cache import compile_source  # noqa: E402
+from closures import ClosureExecutor  # noqa: E402
+from lexer import Lexer  # noqa: E402
+from parser import Parser  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+UNTYPED = '''
+func total(list xs)
+    int t = 0
+    int i = 0
+    int n = length(xs)
+    while i < n
+        t = t + xs[i]
+        i = i + 1
+    return t
+
+list xs = range(SIZE)
+print(total(xs))
+'''
+
+TYPED = '''
+func total(list[int] xs)
+    return sum(xs)
+
+list[int] xs = range(SIZE)
+print(total(xs))
+'''
+
+
+def run_vm(source):
+    bytecode = compile_source(source, 2)
+    VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions).run()
+
+
+def run_closure(source):
+    ClosureExecutor().execute(Parser(Lexer(source)).parse())
+
+
+def timed(run, source, repeats):
+    best = None
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run(source)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best, output.getvalue().split()[0]
+
+
+def main(argv):
+    repeats = 3
+    if "-n" in argv:
+        i = argv.index("-n")
+        repeats = int(argv[i + 1])
+        del argv[i:i + 2]
+    size = int(argv[0]) if argv else 1000000
+    untyped = UNTYPED.replace("SIZE", str(size))
+    typed = TYPED.replace("SIZE", str(size))
+
+    storages = ["array.array"]
+    numpy = vectors.load_numpy()
+    if numpy is not None:
+        storages.insert(0, "numpy")
+
+    print(f"sum of {size} ints, best of {repeats} runs")
+    for backend, run in (("vm", run_vm), ("closure", run_closure)):
+        base, expected = timed(run, untyped, repeats)
+        print(f"{backend:<8} {'untyped loop':<22} {base * 1000:9.1f} ms")
+        for storage in storages:
+            vectors.numpy = numpy if storage == "numpy" else None
+            elapsed, result = timed(run, typed, repeats)
+            assert result == expected, (result, expected)
+            print(f"{'':<8} {'list[int] ' + storage:<22} {elapsed * 1000:9.1f} ms"
+                  f"  ({base / elapsed:.1f}x)")
+        vectors.numpy = numpy
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
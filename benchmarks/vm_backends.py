@@ -0,0 +1,112 @@
+# Stack VM against register VM on the same programs: instructions executed
+# and wall time. Programs are the built-in set below, or .iji files given on
+# the command line (their output is discarded).
+#
+#   python benchmarks/vm_backends.py [-n repeats] [file.iji ...]
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import regvm  # noqa: E402
+from cache import compile_source  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+PROGRAMS = {
+    "loops": '''
+list nums = [1, 2, 3, 4, 5, 6, 7, 8]
+int total = 0
+int i = 0
+while i < 200000
+    if i < 100000
+        total = total + i * 2 - 1
+    else
+        total = total - 1
+    i = i + 1
+int rounds = 0
+while rounds < 25000
+    int j = 0
+    while j < length(nums)
+        total = total + nums[j]
+        j = j + 1
+    rounds = rounds + 1
+''',
+    "calls": '''
+func fib(int n)
+    if n < 2
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+int result = fib(22)
+''',
+    "arith": '''
+float x = 0.0
+float y = 1.5
+int i = 0
+while i < 150000
+    x = x + y * 2.0 - x / 4.0
+    y = y + 0.5
+    i = i + 1
+''',
+}
+
+
+def run_stack(source, count=False):
+    bytecode = compile_source(source, 2)
+    # Interpreter against interpreter: no tier-up to Python code
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions,
+                        count=count, tier_up=False)
+    vm.run()
+    return vm.executed
+
+
+def run_register(source, count=False):
+    compiler = regvm.compile_source(source)
+    vm = regvm.RegisterVM(compiler.instructions, compiler.constants, compiler.functions,
+                          compiler.frame_sizes, count=count)
+    vm.run()
+    return vm.executed
+
+
+def timed(run, source, repeats):
+    # Counting is on for the instruction total, off for the timed runs
+    with contextlib.redirect_stdout(io.StringIO()):
+        executed = run(source, count=True)
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run(source)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return executed, best
+
+
+def main(argv):
+    repeats = 3
+    if "-n" in argv:
+        i = argv.index("-n")
+        repeats = int(argv[i + 1])
+        del argv[i:i + 2]
+    programs = PROGRAMS
+    if argv:
+        programs = {}
+        for path in argv:
+            with open(path, "rb") as f:
+                programs[os.path.basename(path)] = f.read()
+
+    print(f"best of {repeats} runs, stack VM at -O2")
+    print(f"{'program':<12} {'backend':<10} {'instructions':>14} {'time':>10}")
+    for name, source in programs.items():
+        base_count, base_time = timed(run_stack, source, repeats)
+        count, elapsed = timed(run_register, source, repeats)
+        print(f"{name:<12} {'stack':<10} {base_count:>14} {base_time * 1000:8.1f} ms")
+        print(f"{'':<12} {'register':<10} {count:>14} {elapsed * 1000:8.1f} ms"
+              f"  ({base_count / count:.2f}x fewer, {base_time / elapsed:.2f}x faster)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,159 @@
+# Function call cost in the stack VM: linked calls (CALL_DIRECT to the
+# callee's entry offset, frames sized by ENTER) against the call path the VM
+# had before, which looked the callee up by name on every call and grew
+# each frame one store at a time. Tier-up is off in both, so every call is
+# interpreted.
+#
+#   python benchmarks/vm_calls.py [repeats]
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cache import compile_source  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+PROGRAMS = {
+    "recursion": '''
+func fib(int n)
+    if n < 2
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+print(fib(24))
+''',
+    "helpers": '''
+func add(int a, int b)
+    return a + b
+
+func step(int x)
+    int y = x * 3
+    int z = y - x
+    return z - x
+
+int total = 0
+int i = 0
+while i < 200000
+    total = add(total, step(i))
+    i = i + 1
+print(total)
+''',
+    "locals": '''
+func mix(int a, int b, int c)
+    int s = a + b
+    int t = b + c
+    int u = s * t
+    int v = u - a
+    int w = v + c
+    return w
+
+int total = 0
+int i = 0
+while i < 100000
+    total = total + mix(i, 2, 3)
+    i = i + 1
+print(total)
+''',
+}
+
+
+class LegacyVirtualMachine(VirtualMachine):
+    # Calls as the VM made them before linking: by name through the
+    # natives, memo and function tables, with frames that grow on each
+    # store to a new local
+    def link(self):
+        pass
+
+    def op_enter(self, ip):
+        return ip + 3
+
+    def op_call_function(self, ip):
+        code = self.instructions
+        fname = self.constants[code[ip + 1]]
+        argc = code[ip + 2]
+        stack = self.stack
+        args = stack[len(stack) - argc:]
+        del stack[len(stack) - argc:]
+        native = self.natives.get(fname)
+        if native is None and self.tier is not None and fname in self.functions:
+            native = self.tier.native(fname)
+        if native is not None:
+            self.stack.append(native(*args))
+            return ip + 3
+        memo = self.memo_caches.get(fname)
+        if memo is not None:
+            self.stack.append(self.call_memo(memo, fname, args))
+            return ip + 3
+        target = self.functions.get(fname)
+        if target is None:
+            raise RuntimeError(f"Unknown function '{fname}'")
+        self.call_stack.append((ip + 3, self.vars, len(stack)))
+        self.vars = args
+        return target
+
+    def op_return_value(self, ip):
+        ret_val = self.stack.pop() if self.stack else None
+        if not self.call_stack:
+            self.return_value = ret_val
+            return len(self.instructions)
+        ip, self.vars, _ = self.call_stack.pop()
+        self.stack.append(ret_val)
+        return ip
+
+    def op_store_var(self, ip):
+        idx = self.instructions[ip + 1]
+        val = self.stack.pop()
+        while len(self.vars) <= idx:
+            self.vars.append(None)
+        self.vars[idx] = val
+        return ip + 2
+
+    def op_store_load_var(self, ip):
+        idx = self.instructions[ip + 1]
+        while len(self.vars) <= idx:
+            self.vars.append(None)
+        self.vars[idx] = self.stack[-1]
+        return ip + 2
+
+    def op_store_global(self, ip):
+        idx = self.instructions[ip + 1]
+        while len(self.globals) <= idx:
+            self.globals.append(None)
+        self.globals[idx] = self.stack.pop()
+        return ip + 2
+
+
+def run(vm_class, bytecode):
+    # A fresh copy of the code each run, as linking and quickening rewrite it
+    vm = vm_class(list(bytecode.instructions), bytecode.constants, bytecode.functions, tier_up=False)
+    captured = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(captured):
+        vm.run()
+    return time.perf_counter() - start, captured.getvalue()
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"best of {repeats} runs, tier-up off")
+    print(f"{'program':<12} {'by name':>10} {'linked':>10} {'speedup':>8}")
+    for name, source in PROGRAMS.items():
+        bytecode = compile_source(source)
+        before = after = float("inf")
+        # Alternating, so both see the same machine
+        for _ in range(repeats):
+            elapsed, expected = run(LegacyVirtualMachine, bytecode)
+            before = min(before, elapsed)
+            elapsed, output = run(VirtualMachine, bytecode)
+            after = min(after, elapsed)
+            if output != expected:
+                raise SystemExit(f"{name}: linked calls printed {output!r}, by name {expected!r}")
+        print(f"{name:<12} {before * 1000:8.1f}ms {after * 1000:8.1f}ms {before / after:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
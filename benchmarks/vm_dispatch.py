@@ -0,0 +1,153 @@
+# Instructions-per-second benchmark for the VM dispatch loop.
+#
+# Compares the old string-compare dispatch chain against the integer opcode
+# dispatch table, with and without superinstructions.
+#
+#   python benchmarks/vm_dispatch.py [statements] [repeats]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ast_nodes import Program, VariableDeclaration, BinaryOperation, Literal, VariableReference  # noqa: E402
+from compiler import Compiler  # noqa: E402
+from opcodes import OPNAMES, OPCODES, SUPERINSTRUCTIONS, UNTYPED, decode  # noqa: E402
+from vm import VirtualMachine  # noqa: E402
+
+
+class LegacyVirtualMachine:
+    # The string-compare dispatch loop the VM used before opcodes were integers
+    def __init__(self, instructions, constants, functions):
+        self.instructions = instructions
+        self.constants = constants
+        self.functions = functions
+        self.stack = []
+        self.vars = []
+        self.ip = 0
+        self.call_stack = []
+
+    def run(self):
+        while self.ip < len(self.instructions):
+            instr = self.instructions[self.ip]
+            op = instr[0]
+
+            if op == "LOAD_CONST":
+                self.stack.append(self.constants[instr[1]])
+            elif op == "LOAD_VAR":
+                self.stack.append(self.vars[instr[1]])
+            elif op == "STORE_VAR":
+                idx = instr[1]
+                val = self.stack.pop()
+                while len(self.vars) <= idx:
+                    self.vars.append(None)
+                self.vars[idx] = val
+            elif op == "BINARY_ADD":
+                b = self.stack.pop()
+                a = self.stack.pop()
+                self.stack.append(a + b)
+            elif op == "BINARY_SUBTRACT":
+                b = self.stack.pop()
+                a = self.stack.pop()
+                self.stack.append(a - b)
+            elif op == "BINARY_MULTIPLY":
+                b = self.stack.pop()
+                a = self.stack.pop()
+                self.stack.append(a * b)
+            elif op == "BINARY_DIVIDE":
+                b = self.stack.pop()
+                a = self.stack.pop()
+                self.stack.append(a / b)
+            elif op == "ENTER":
+                pass  # newer than this loop, which grows frames on STORE_VAR
+            elif op == "CALL_FUNCTION":
+                raise RuntimeError("calls are not part of this benchmark")
+            elif op == "RETURN_VALUE":
+                return self.stack.pop() if self.stack else None
+            else:
+                raise RuntimeError(f"Unknown instruction {op}")
+
+            self.ip += 1
+
+
+UNFUSED = {fused: ops for ops, fused in SUPERINSTRUCTIONS.items()}
+
+
+def unfuse(code):
+    # Expand superinstructions back into the (name, *operands) tuples of the old format
+    instructions = []
+    for _, op, args in decode(code):
+        if op in UNFUSED:
+            first, second, binary = UNFUSED[op]
+            instructions.append((OPNAMES[first], args[0]))
+            instructions.append((OPNAMES[second], args[1]))
+            instructions.append((OPNAMES[binary],))
+        else:
+            instructions.append((OPNAMES[UNTYPED.get(op, op)], *args))
+    return instructions
+
+
+def encode(instructions):
+    code = []
+    for name, *args in instructions:
+        code.append(OPCODES[name])
+        code.extend(args)
+    return code
+
+
+def build_program(statements):
+    # A straight-line block dominated by LOAD_VAR/LOAD_CONST/BINARY_* sequences
+    body = [VariableDeclaration("int", "v0", Literal(1)), VariableDeclaration("int", "v1", Literal(2))]
+    ops = ["+", "-", "*", "+"]
+    for i in range(2, statements):
+        a = VariableReference(f"v{i - 1}")
+        if i % 2:
+            b = VariableReference(f"v{i - 2}")
+        else:
+            b = Literal(i % 7 + 1)
+        expr = BinaryOperation(BinaryOperation(a, ops[i % 4], b), "-", VariableReference(f"v{i - 1}"))
+        body.append(VariableDeclaration("int", f"v{i}", expr))
+    return Program(body)
+
+
+def measure(make_vm, repeats):
+    best = None
+    for _ in range(repeats):
+        vm = make_vm()
+        start = time.perf_counter()
+        vm.run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    compiler = Compiler()
+    compiler.compile(build_program(statements))
+    constants = compiler.constants
+    fused = compiler.instructions
+    legacy = unfuse(fused)
+    plain = encode(legacy)
+    # Throughput is always reported in unfused instructions so the numbers compare directly
+    count = len(legacy)
+
+    variants = [
+        ("string dispatch (before)", lambda: LegacyVirtualMachine(legacy, constants, {})),
+        ("opcode table", lambda: VirtualMachine(plain, constants, {})),
+        ("opcode table + superinstructions", lambda: VirtualMachine(fused, constants, {})),
+    ]
+
+    print(f"{count} instructions, best of {repeats} runs")
+    baseline = None
+    for name, make_vm in variants:
+        elapsed = measure(make_vm, repeats)
+        baseline = baseline or elapsed
+        print(f"{name:<34} {count / elapsed / 1e6:8.2f} M instr/s  {baseline / elapsed:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# cache.py
+#
+# On-disk bytecode cache. A compiled script is written as <name>.ijc next to
+# its source (or under a cache directory) and reused on the next run as long
+# as the source hash, file format, compiler version, optimization level and
+# enabled AST passes all match.
+#
+#   python cache.py [-O0|-O1|-O2] [-d cache_dir] [-f] [-q] <file_or_dir>...
+
+import hashlib
+import marshal
+import os
+import sys
+
+from compiler import COMPILER_VERSION
+
+MAGIC = b"IJC\x00"
+FORMAT_VERSION = 2
+SOURCE_SUFFIX = ".iji"
+CACHE_SUFFIX = ".ijc"
+
+# When set, cache files go under this directory instead of next to the source
+DEFAULT_CACHE_DIR = os.environ.get("IJICHI_CACHE_DIR") or None
+
+# AST passes compile_source() runs from -O1 up, and the variable that turns
+# each off
+AST_PASSES = (("vectorize", "IJICHI_NO_VECTORIZE"), ("concat", "IJICHI_NO_CONCAT"))
+
+
+class CacheError(Exception):
+    pass
+
+
+class Bytecode:
+    def __init__(self, instructions, constants, functions, line_table, memoized=(), exception_table=()):
+        self.instructions = instructions
+        self.constants = constants
+        self.functions = functions
+        self.line_table = line_table
+        self.memoized = memoized  # names of memo functions
+        self.exception_table = exception_table  # (start, end, handler, stack depth) per try block
+
+
+def source_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_path(source_path, cache_dir=None):
+    base = os.path.splitext(source_path)[0] + CACHE_SUFFIX
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    if cache_dir is None:
+        return base
+    # Mirror the absolute source path under the cache directory
+    _, rest = os.path.splitdrive(os.path.abspath(base))
+    return os.path.join(cache_dir, rest.lstrip(os.sep))
+
+
+def compile_source(source, opt_level=1):
+    # Imported here so that loading a valid cache entry never touches the front end
+    from lexer import Lexer
+    from parser import Parser
+    from compiler import Compiler, CompileError
+    from optimizer import optimize
+    from vectorize import vectorize
+    from concat import concat
+
+    # The parser pulls tokens from the lexer as it goes
+    parser = Parser(Lexer(source))
+    ast = parser.parse()
+    if parser.errors:
+        # The parser skips what it cannot read; running the rest is wrong
+        raise CompileError("\n".join(parser.errors))
+    if opt_level >= 1:
+        vectorize(ast)
+        concat(ast)
+    compiler = Compiler()
+    compiler.compile(ast)
+    optimize(compiler, opt_level)
+    return Bytecode(compiler.instructions, compiler.constants, compiler.functions, compiler.line_table,
+                    sorted(compiler.memoized), compiler.exception_table)
+
+
+def enabled_passes(opt_level):
+    if opt_level < 1:
+        return ()
+    return tuple(name for name, variable in AST_PASSES if not os.environ.get(variable))
+
+
+def header(digest, opt_level):
+    return (FORMAT_VERSION, COMPILER_VERSION, opt_level, enabled_passes(opt_level), digest)
+
+
+def dump(bytecode, digest, opt_level):
+    body = (bytecode.instructions, bytecode.constants, bytecode.functions, bytecode.line_table,
+            list(bytecode.memoized), list(bytecode.exception_table))
+    try:
+        return MAGIC + marshal.dumps((header(digest, opt_level), body))
+    except ValueError as e:
+        raise CacheError(f"Cannot serialize bytecode: {e}")
+
+
+def load(data, digest, opt_level):
+    # Returns None for anything stale, foreign or truncated
+    if not data.startswith(MAGIC):
+        return None
+    try:
+        found, body = marshal.loads(memoryview(data)[len(MAGIC):])
+        if found != header(digest, opt_level):
+            return None
+        instructions, constants, functions, line_table, memoized, exception_table = body
+    except (EOFError, ValueError, TypeError):
+        return None
+    return Bytecode(instructions, constants, functions, line_table, memoized, exception_table)
+
+
+def write(path, data):
+    directory = os.path.dirname(path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        # A read-only tree just means running without a cache
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def load_program(path, opt_level=1, use_cache=True, cache_dir=None):
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = source_hash(raw)
+    target = cache_path(path, cache_dir)
+
+    if use_cache:
+        try:
+            with open(target, "rb") as f:
+                bytecode = load(f.read(), digest, opt_level)
+        except OSError:
+            bytecode = None
+        if bytecode is not None:
+            return bytecode
+
+    bytecode = compile_source(raw, opt_level)
+    if use_cache:
+        write(target, dump(bytecode, digest, opt_level))
+    return bytecode
+
+
+def compile_file(path, opt_level=1, cache_dir=None, force=False, quiet=False):
+    # Returns True when an up-to-date cache entry exists afterwards
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = source_hash(raw)
+    target = cache_path(path, cache_dir)
+
+    if not force:
+        try:
+            with open(target, "rb") as f:
+                if load(f.read(), digest, opt_level) is not None:
+                    return True
+        except OSError:
+            pass
+
+    if not quiet:
+        print(f"Compiling {path!r}...")
+    try:
+        bytecode = compile_source(raw, opt_level)
+        ok = write(target, dump(bytecode, digest, opt_level))
+    except Exception as e:
+        print(f"*** Error compiling {path!r}: {e}")
+        return False
+    if not ok:
+        print(f"*** Cannot write {target!r}")
+    return ok
+
+
+def compile_dir(root, opt_level=1, cache_dir=None, force=False, quiet=False):
+    ok = True
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.endswith(SOURCE_SUFFIX):
+                path = os.path.join(dirpath, name)
+                ok = compile_file(path, opt_level, cache_dir, force, quiet) and ok
+    return ok
+
+
+def main(argv):
+    opt_level = 1
+    cache_dir = None
+    force = False
+    quiet = False
+    paths = []
+    args = iter(argv)
+    for arg in args:
+        if arg in ("-O0", "-O1", "-O2"):
+            opt_level = int(arg[2])
+        elif arg == "-d":
+            cache_dir = next(args, None)
+        elif arg == "-f":
+            force = True
+        elif arg == "-q":
+            quiet = True
+        else:
+            paths.append(arg)
+
+    if not paths:
+        print("Usage: python cache.py [-O0|-O1|-O2] [-d cache_dir] [-f] [-q] <file_or_dir>...")
+        return 2
+
+    ok = True
+    for path in paths:
+        if os.path.isdir(path):
+            ok = compile_dir(path, opt_level, cache_dir, force, quiet) and ok
+        else:
+            ok = compile_file(path, opt_level, cache_dir, force, quiet) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+# client.py
+#
+# Thin client for the serve.py daemon. Takes the same arguments as
+# ijichi.py and has a server worker run them, with this process's stdin,
+# stdout and stderr passed over the socket, so the script reads and writes
+# exactly where it would have run locally. Exits with the script's status.
+# Only the standard library is imported here: the lexer, parser and
+# executors are already loaded in the workers.
+#
+#   python client.py [--socket path] <ijichi.py arguments>
+#   python client.py [--socket path] --server-stats
+#
+# The socket defaults to $IJICHI_SOCKET, else ijichi-<uid>.sock in the
+# temporary directory. The protocol helpers below are shared with serve.py.
+
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+SOCKET = os.environ.get("IJICHI_SOCKET") or os.path.join(tempfile.gettempdir(), f"ijichi-{os.getuid()}.sock")
+
+HEADER = struct.Struct("!I")  # length of the JSON message that follows
+MAX_FDS = 3
+
+
+class ServerError(Exception):
+    pass
+
+
+def send_message(sock, message, fds=()):
+    data = json.dumps(message).encode("utf-8")
+    data = HEADER.pack(len(data)) + data
+    sent = socket.send_fds(sock, [data], list(fds)) if fds else 0
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def receive_message(sock, max_fds=0):
+    # (message, received fds); (None, []) when the peer closed the socket
+    if max_fds:
+        data, fds, _, _ = socket.recv_fds(sock, 65536, max_fds)
+    else:
+        data, fds = sock.recv(65536), []
+    if not data:
+        return None, fds
+    while len(data) < HEADER.size or len(data) < HEADER.size + HEADER.unpack_from(data)[0]:
+        more = sock.recv(65536)
+        if not more:
+            raise ServerError("connection closed in the middle of a message")
+        data += more
+    size = HEADER.unpack_from(data)[0]
+    return json.loads(data[HEADER.size:HEADER.size + size]), fds
+
+
+def connect(path=SOCKET):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        sock.close()
+        raise ServerError(f"no server on {path} ({e.strerror}); start one with python ijichi.py serve")
+    return sock
+
+
+def run(args, path=SOCKET, streams=(0, 1, 2)):
+    # Runs ijichi.py args on the server with streams as stdin, stdout and
+    # stderr; returns the exit status
+    with connect(path) as sock:
+        send_message(sock, {"args": list(args), "cwd": os.getcwd()}, streams)
+        reply, _ = receive_message(sock)
+    if reply is None:
+        raise ServerError("the server closed the connection")
+    if "error" in reply:
+        raise ServerError(reply["error"])
+    return reply["status"]
+
+
+def server_stats(path=SOCKET):
+    with connect(path) as sock:
+        send_message(sock, {"stats": True})
+        reply, _ = receive_message(sock)
+    if reply is None:
+        raise ServerError("the server closed the connection")
+    return reply
+
+
+def format_stats(stats):
+    lines = [f"{stats['requests']} requests, {stats['workers']} workers ({stats['busy']} busy),"
+             f" {stats['queued']} queued",
+             f"program cache: {stats['cache_hits']} hits, {stats['cache_misses']} parses"]
+    for name in ("latency", "run"):
+        if stats[name]:
+            lines.append(f"{name + ' ms':<11}" + "  ".join(f"{key} {value:.2f}" for key, value in stats[name].items()))
+    return "\n".join(lines)
+
+
+def main(argv):
+    path = SOCKET
+    if argv[:1] == ["--socket"]:
+        if len(argv) < 2:
+            print("Usage: python client.py [--socket path] <ijichi.py arguments> | --server-stats")
+            return 1
+        path = argv[1]
+        argv = argv[2:]
+    try:
+        if argv == ["--server-stats"]:
+            print(format_stats(server_stats(path)))
+            return 0
+        sys.stdout.flush()
+        sys.stderr.flush()
+        return run(argv, path)
+    except ServerError as e:
+        print(f"client.py: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130  # the server interrupts the worker when the connection closes
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,378 @@
+# closures.py
+#
+# Alternate execution mode for the tree-walking Executor. Every AST node is
+# turned once into a specialized Python closure (operators resolved to
+# operator.* callables, children and slots pre-bound); running a program is
+# then just calling the closure tree.
+
+import operator
+
+from ast_nodes import *
+from runtime import Executor, RuntimeError, UNSET, RETURN, BUILTINS, CATCHABLE
+from vectors import ELEMENT_TYPES, coerce
+
+OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def unset_error(env, slot):
+    return RuntimeError(f"Variable '{env.scope.names[slot]}' used before declaration")
+
+
+class ClosureCompiler:
+    # One per module: call sites bind to cells of that module's functions
+    def __init__(self, executor, module):
+        self.executor = executor
+        self.module = module
+        self.cells = {}  # function name -> [Function], bound into call sites once
+        self.try_depth = 0  # try bodies around the statement being compiled
+
+    def cell(self, name):
+        cell = self.cells.get(name)
+        if cell is None:
+            cell = self.cells[name] = [self.module.functions.get(name)]
+        return cell
+
+    # Statement closures return RETURN when the enclosing function returns,
+    # anything else otherwise.
+
+    def compile_block(self, stmts):
+        body = tuple(self.compile_stmt(stmt) for stmt in stmts)
+        if not body:
+            return lambda env: None
+        if len(body) == 1:
+            return body[0]
+        if len(body) == 2:
+            first, second = body
+
+            def run_pair(env):
+                if first(env) is RETURN:
+                    return RETURN
+                return second(env)
+            return run_pair
+
+        def run_block(env):
+            for stmt in body:
+                if stmt(env) is RETURN:
+                    return RETURN
+            return None
+        return run_block
+
+    def compile_stmt(self, node):
+        method = getattr(self, f"stmt_{type(node).__name__}", None)
+        if method is None:
+            raise RuntimeError(f"No exec method for {type(node).__name__}")
+        return method(node)
+
+    def compile_expr(self, node):
+        method = getattr(self, f"expr_{type(node).__name__}", None)
+        if method is None:
+            raise RuntimeError(f"Unsupported expression type: {type(node).__name__}")
+        return method(node)
+
+    # === Statements ===
+
+    def stmt_ImportStatement(self, node):
+        import_module = self.executor.import_module
+        path, slot, module = node.path, node.slot, self.module
+
+        def bind(env):
+            env.values[slot] = import_module(path, module)
+        return bind
+
+    def stmt_FunctionDef(self, node):
+        executor = self.executor
+        module = self.module
+        functions = module.functions
+        cell = self.cell(node.name)
+
+        def define(env):
+            # Functions close over the environment they are defined in
+            functions[node.name] = cell[0] = executor.make_function(node, env, module)
+        return define
+
+    def stmt_ReturnStatement(self, node):
+        executor = self.executor
+        expr = node.value
+        # A call in a try body has to run before its catch is left
+        if (executor.tail_calls and isinstance(expr, FunctionCall) and expr.builtin is None
+                and expr.target is None and not self.try_depth):
+            cell = self.cell(expr.name)
+            args = tuple(self.compile_expr(arg) for arg in expr.args)
+            name = expr.name
+
+            def tail_call(env):
+                func = cell[0]
+                if func is None:
+                    raise RuntimeError(f"Unknown function '{name}'")
+                executor.tail_call = (func, [arg(env) for arg in args])
+                return RETURN
+            return tail_call
+
+        value = self.compile_expr(expr)
+
+        def ret(env):
+            executor.return_value = value(env)
+            return RETURN
+        return ret
+
+    def stmt_RaiseStatement(self, node):
+        value = self.compile_expr(node.value)
+
+        def throw(env):
+            raise RuntimeError(str(value(env)))
+        return throw
+
+    def stmt_VariableDeclaration(self, node):
+        init = self.typed(node.var_type, self.compile_expr(node.initializer))
+        slot = node.slot
+
+        def declare(env):
+            env.values[slot] = init(env)
+        return declare
+
+    def typed(self, var_type, value):
+        # value, converted on every evaluation when var_type is a typed list
+        if var_type not in ELEMENT_TYPES:
+            return value
+        return lambda env: coerce(var_type, value(env))
+
+    def stmt_Assignment(self, node):
+        value = self.typed(node.var_type, self.compile_expr(node.value))
+        depth, slot = node.depth, node.slot
+        if depth == 0:
+            def assign_local(env):
+                result = value(env)
+                values = env.values
+                if values[slot] is UNSET:
+                    raise unset_error(env, slot)
+                values[slot] = result
+            return assign_local
+
+        def assign(env):
+            env.assign_at(depth, slot, value(env))
+        return assign
+
+    def stmt_IfStatement(self, node):
+        cond = self.compile_expr(node.condition)
+        then_body = self.compile_block(node.then_body)
+        else_body = self.compile_block(node.else_body)
+
+        def run_if(env):
+            if cond(env):
+                return then_body(env)
+            return else_body(env)
+        return run_if
+
+    def stmt_WhileLoop(self, node):
+        cond = self.compile_expr(node.condition)
+        body = self.compile_block(node.body)
+
+        def run_while(env):
+            while cond(env):
+                if body(env) is RETURN:
+                    return RETURN
+            return None
+        return run_while
+
+    def stmt_TryStatement(self, node):
+        self.try_depth += 1
+        try:
+            try_body = self.compile_block(node.try_body)
+        finally:
+            self.try_depth -= 1
+        catch_body = self.compile_block(node.catch_body)
+        slot = node.slot
+
+        def run_try(env):
+            try:
+                return try_body(env)
+            except CATCHABLE as e:
+                env.values[slot] = str(e)
+                return catch_body(env)
+        return run_try
+
+    def stmt_FunctionCall(self, node):
+        return self.expr_FunctionCall(node)
+
+    def stmt_ListLiteralNode(self, node):
+        return self.expr_ListLiteralNode(node)
+
+    def stmt_DictLiteralNode(self, node):
+        return self.expr_DictLiteralNode(node)
+
+    def stmt_IndexAccessNode(self, node):
+        return self.expr_IndexAccessNode(node)
+
+    def stmt_MemberAccess(self, node):
+        return self.expr_MemberAccess(node)
+
+    # === Expressions ===
+
+    def is_local(self, node):
+        return isinstance(node, VariableReference) and node.depth == 0
+
+    def expr_Literal(self, node):
+        value = node.value
+        return lambda env: value
+
+    def expr_VariableReference(self, node):
+        depth, slot = node.depth, node.slot
+        if depth == 0:
+            def load_local(env):
+                value = env.values[slot]
+                if value is UNSET:
+                    raise unset_error(env, slot)
+                return value
+            return load_local
+        if depth == 1:
+            def load_parent(env):
+                env = env.parent
+                value = env.values[slot]
+                if value is UNSET:
+                    raise unset_error(env, slot)
+                return value
+            return load_parent
+        return lambda env: env.get_at(depth, slot)
+
+    def expr_BinaryOperation(self, node):
+        op = OPERATORS.get(node.operator)
+        if op is None:
+            raise RuntimeError(f"Unknown operator '{node.operator}'")
+        if self.is_local(node.left) and isinstance(node.right, Literal):
+            # The loop-condition / counter shape: i < 10, i + 1
+            slot, constant = node.left.slot, node.right.value
+
+            def local_const(env):
+                value = env.values[slot]
+                if value is UNSET:
+                    raise unset_error(env, slot)
+                return op(value, constant)
+            return local_const
+        if self.is_local(node.left) and self.is_local(node.right):
+            a, b = node.left.slot, node.right.slot
+
+            def local_local(env):
+                values = env.values
+                x, y = values[a], values[b]
+                if x is UNSET:
+                    raise unset_error(env, a)
+                if y is UNSET:
+                    raise unset_error(env, b)
+                return op(x, y)
+            return local_local
+        left = self.compile_expr(node.left)
+        if isinstance(node.right, Literal):
+            constant = node.right.value
+            return lambda env: op(left(env), constant)
+        right = self.compile_expr(node.right)
+        return lambda env: op(left(env), right(env))
+
+    def expr_FunctionCall(self, node):
+        args = tuple(self.compile_expr(arg) for arg in node.args)
+        builtin = node.builtin
+        if builtin is not None:
+            if len(args) == 1:
+                arg, = args
+                return lambda env: builtin(arg(env))
+            if len(args) == 2:
+                first, second = args
+                return lambda env: builtin(first(env), second(env))
+            return lambda env: builtin(*[arg(env) for arg in args])
+
+        name = node.name
+        call_function = self.executor.call_function
+        if node.target is not None:
+            target = self.compile_expr(node.target)
+            module_of = self.executor.module_of
+
+            def call_member(env):
+                func = module_of(target(env)).function(name)
+                return call_function(func, [arg(env) for arg in args])
+            return call_member
+
+        cell = self.cell(name)
+        builtin = BUILTINS.get(name)
+
+        def call(env):
+            func = cell[0]
+            if func is None:
+                if builtin is not None:
+                    return builtin(*[arg(env) for arg in args])
+                raise RuntimeError(f"Unknown function '{name}'")
+            return call_function(func, [arg(env) for arg in args])
+        return call
+
+    def expr_MemberAccess(self, node):
+        container = self.compile_expr(node.container)
+        module_of = self.executor.module_of
+        name = node.name
+        return lambda env: module_of(container(env)).get(name)
+
+    def expr_ListLiteralNode(self, node):
+        elements = tuple(self.compile_expr(e) for e in node.elements)
+        return lambda env: [e(env) for e in elements]
+
+    def expr_DictLiteralNode(self, node):
+        pairs = tuple((self.compile_expr(k), self.compile_expr(v)) for k, v in node.pairs)
+        return lambda env: {k(env): v(env) for k, v in pairs}
+
+    def expr_IndexAccessNode(self, node):
+        container = self.compile_expr(node.container)
+        index = self.compile_expr(node.index)
+
+        def access(env):
+            c = container(env)
+            i = index(env)
+            try:
+                return c[i]
+            except (IndexError, KeyError, TypeError):
+                raise RuntimeError(f"Invalid index/key access: {i}")
+        return access
+
+
+class ClosureExecutor(Executor):
+    def compiler(self, module):
+        if module.compiler is None:
+            module.compiler = ClosureCompiler(self, module)
+        return module.compiler
+
+    def exec_Program(self, node, env):
+        self.resolve(node, env)
+        compiler = self.compiler(self.module)
+        for stmt in node.statements:
+            if compiler.compile_stmt(stmt)(env) is RETURN:
+                return self.finish_return()
+        return None
+
+    def call_function(self, func, args):
+        # Call sites are bound per module at compile time, so no module
+        # switch is needed here
+        if func.memo is not None:
+            return self.call_memo(func, args)
+        return self.invoke(func, args)
+
+    def invoke(self, func, args):
+        while True:
+            body = func.compiled
+            if body is None:
+                body = func.compiled = self.compiler(func.module).compile_block(func.body)
+            if body(func.new_env(args)) is not RETURN:
+                return None
+            if self.tail_call is None:
+                value = self.return_value
+                self.return_value = None
+                return value
+            # Tail call: run the callee in place of the current frame
+            func, args = self.tail_call
+            self.tail_call = None
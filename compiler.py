@@ -1,44 +1,49 @@
 # compiler.py
+from ast_nodes import *
+from memo import defined_functions, impurity, marked_functions
+from stdlib import BUILTINS, RESULT_TYPES
+from vectors import CONVERTERS, ELEMENT_TYPES
+from opcodes import (
+    LOAD_CONST, LOAD_VAR, STORE_VAR, LOAD_GLOBAL, STORE_GLOBAL,
+    CALL_FUNCTION, CALL_BUILTIN, RETURN_VALUE, POP_TOP, ENTER,
+    JUMP, POP_JUMP_IF_FALSE, COUNTED_LOOP, RAISE,
+    BUILD_LIST, BUILD_DICT, BINARY_SUBSCR, BUILD_STRING,
+    BINARY_OPS, TYPED_OPS, COMPARE_JUMPS, JUMP_TARGETS, OPERAND_COUNTS, STACK_EFFECTS,
+    decode, fuse, stack_effect,
+)
 
-# === AST Node Classes ===
-class Program:
-    def __init__(self, statements):
-        self.statements = statements
+# Bump whenever the emitted bytecode changes so cached .ijc files are rebuilt
+COMPILER_VERSION = 11
 
-class Function:
-    def __init__(self, name, params, body):
-        self.name = name
-        self.params = params  # list of (type, name) tuples
-        self.body = body
+# Declared types the compiler tracks; other declarations (list, dict) are untyped
+STATIC_TYPES = {"int", "float", "string", "bool"}
+NUMERIC_TYPES = {"int", "float"}
+COMPARISONS = {"==", "!=", "<", "<=", ">", ">="}
 
-class VarDecl:
-    def __init__(self, name, type_, expr):
-        self.name = name
-        self.type_ = type_
-        self.expr = expr
+# Nodes that leave a value on the stack; as statements it is popped
+EXPRESSIONS = (
+    BinaryOperation, Literal, VariableReference, FunctionCall,
+    ListLiteralNode, DictLiteralNode, IndexAccessNode,
+)
 
-class ReturnStmt:
-    def __init__(self, expr):
-        self.expr = expr
 
-class BinaryOp:
-    def __init__(self, left, op, right):
-        self.left = left
-        self.op = op
-        self.right = right
+def literal_type(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "string"
+    return None
 
-class CallExpr:
-    def __init__(self, name, args):
-        self.name = name
-        self.args = args
 
-class Literal:
-    def __init__(self, value):
-        self.value = value
-
-class Variable:
-    def __init__(self, name):
-        self.name = name
+def assignable(declared, actual):
+    # An int value may go in a float; unknown types are left to runtime
+    if declared not in STATIC_TYPES or actual is None:
+        return True
+    return declared == actual or (declared == "float" and actual == "int")
 
 
 # === Compiler Class with Error Handling ===
@@ -47,70 +52,177 @@ class CompileError(Exception):
 
 class Compiler:
     def __init__(self):
-        self.instructions = []
+        self.instructions = []  # flat array: opcode, operands, opcode, ...
+        self.recent = []  # (offset, opcode) of the last instructions, for fusion
         self.constants = []
+        self.constant_indices = {}  # (type, value) -> index into constants
         self.functions = {}
+        self.labels = set()  # offsets control can enter other than by falling through
+        self.line_table = []  # (offset, source line) pairs, in offset order
+        # (start, end, handler, stack depth) per try block, inner blocks first:
+        # an error at an offset in [start, end) continues at handler
+        self.exception_table = []
+        self.function_ranges = []  # (entry, end) of every function body
+        self.arities = {}  # function name -> parameter count
         self.var_indices = {}
+        self.var_types = {}  # var index -> declared type name
+        self.global_indices = {}  # top-level variables, while compiling a function
+        self.global_types = {}
         self.local_count = 0
         self.current_func = None
+        self.typed_count = 0  # binary ops emitted in a typed form
+        self.pure = set()  # functions marked pure or memo
+        self.defined = set()  # every function the program defines
+        self.memoized = set()  # functions marked memo
 
     def compile(self, node):
+        line = getattr(node, "line", None)
+        if line is not None:
+            self.mark_line(line)
         try:
             if isinstance(node, Program):
-                for stmt in node.statements:
-                    self.compile(stmt)
-            elif isinstance(node, Function):
+                self.pure |= marked_functions(node.statements)
+                self.defined |= defined_functions(node.statements)
+                self.emit(ENTER, 0, 0)
+                self.compile_body(node.statements)
+                self.instructions[1] = self.local_count
+                self.thread_jumps()
+                self.size_stacks()
+            elif isinstance(node, FunctionDef):
                 if node.name in self.functions:
                     raise CompileError(f"Function '{node.name}' already defined")
-                self.functions[node.name] = len(self.instructions)
+                if self.current_func is not None:
+                    raise CompileError(f"Nested function '{node.name}' is not supported by the VM")
+                self.check_purity(node)
+                skip = self.emit_jump(JUMP)  # top-level code runs past the body
+                self.mark_label()
+                entry = self.functions[node.name] = len(self.instructions)
+                self.arities[node.name] = len(node.params)
+                self.emit(ENTER, 0, 0)
+                saved = (self.var_indices, self.var_types, self.local_count)
+                self.global_indices, self.global_types = self.var_indices, self.var_types
                 self.current_func = node.name
                 self.var_indices = {name: idx for idx, (typ, name) in enumerate(node.params)}
+                self.var_types = {idx: typ for idx, (typ, name) in enumerate(node.params)}
                 self.local_count = len(node.params)
-                for stmt in node.body:
-                    self.compile(stmt)
-                self.emit("LOAD_CONST", self.add_constant(None))
-                self.emit("RETURN_VALUE")
+                for idx, (typ, name) in enumerate(node.params):
+                    if typ in CONVERTERS:
+                        self.emit(LOAD_VAR, idx)
+                        self.convert(typ)
+                        self.emit(STORE_VAR, idx)
+                self.compile_body(node.body)
+                self.emit(LOAD_CONST, self.add_constant(None))
+                self.emit(RETURN_VALUE)
+                self.instructions[entry + 1] = self.local_count
+                self.function_ranges.append((entry, len(self.instructions)))
+                self.patch(skip)  # top-level code resumes here
                 self.current_func = None
-                self.var_indices = {}
-                self.local_count = 0
-            elif isinstance(node, VarDecl):
+                self.var_indices, self.var_types, self.local_count = saved
+                self.global_indices, self.global_types = {}, {}
+            elif isinstance(node, VariableDeclaration):
                 if node.name in self.var_indices:
                     raise CompileError(f"Variable '{node.name}' already declared")
-                self.compile(node.expr)
-                idx = self.local_count
-                self.var_indices[node.name] = idx
-                self.local_count += 1
-                self.emit("STORE_VAR", idx)
-            elif isinstance(node, ReturnStmt):
-                self.compile(node.expr)
-                self.emit("RETURN_VALUE")
-            elif isinstance(node, BinaryOp):
-                self.compile(node.left)
-                self.compile(node.right)
-                if node.op == "+":
-                    self.emit("BINARY_ADD")
-                elif node.op == "-":
-                    self.emit("BINARY_SUBTRACT")
-                elif node.op == "*":
-                    self.emit("BINARY_MULTIPLY")
-                elif node.op == "/":
-                    self.emit("BINARY_DIVIDE")
+                self.check_type(node.var_type, node.initializer, node.name)
+                self.compile(node.initializer)
+                self.convert(node.var_type)
+                self.emit(STORE_VAR, self.declare(node.name, node.var_type))
+            elif isinstance(node, Assignment):
+                found = self.lookup(node.name)
+                if found is None:
+                    raise CompileError(f"Undefined variable '{node.name}'")
+                op, idx, typ = found
+                self.check_type(typ, node.value, node.name)
+                self.compile(node.value)
+                self.convert(typ)
+                self.emit(STORE_GLOBAL if op == LOAD_GLOBAL else STORE_VAR, idx)
+            elif isinstance(node, ReturnStatement):
+                self.compile(node.value)
+                self.emit(RETURN_VALUE)
+            elif isinstance(node, RaiseStatement):
+                self.compile(node.value)
+                self.emit(RAISE)
+            elif isinstance(node, IfStatement):
+                else_jump = self.compile_condition(node.condition)
+                self.compile_body(node.then_body)
+                if node.else_body:
+                    end_jump = self.emit_jump(JUMP)
+                    self.patch(else_jump)
+                    self.compile_body(node.else_body)
+                    self.patch(end_jump)
+                else:
+                    self.patch(else_jump)
+            elif isinstance(node, WhileLoop):
+                counted = self.counted_loop(node)
+                if counted is not None:
+                    self.compile_counted_loop(node, *counted)
+                else:
+                    self.mark_label()
+                    start = len(self.instructions)
+                    exit_jump = self.compile_condition(node.condition)
+                    self.compile_body(node.body)
+                    self.emit(JUMP, start)
+                    self.patch(exit_jump)
+            elif isinstance(node, TryStatement):
+                # Nothing runs on entering the block; an error inside it
+                # looks its handler up in the exception table
+                self.mark_label()
+                start = len(self.instructions)
+                self.compile_body(node.try_body)
+                self.mark_label()
+                end = len(self.instructions)
+                end_jump = self.emit_jump(JUMP)
+                self.mark_label()  # entered with the error message on the stack
+                handler = len(self.instructions)
+                # A try block is a statement, so it starts on an empty frame stack
+                self.protect(start, end, handler, 0)
+                idx = self.var_indices.get(node.catch_name)
+                if idx is None:
+                    idx = self.declare(node.catch_name, "string")
+                self.emit(STORE_VAR, idx)
+                self.compile_body(node.catch_body)
+                self.patch(end_jump)
+            elif isinstance(node, BinaryOperation):
+                pieces = self.string_pieces(node)
+                if pieces is not None:
+                    for piece in pieces:
+                        self.compile(piece)
+                    self.emit(BUILD_STRING, len(pieces))
                 else:
-                    raise CompileError(f"Unknown binary operator '{node.op}'")
-            elif isinstance(node, CallExpr):
-                if node.name not in self.functions:
+                    self.compile(node.left)
+                    self.compile(node.right)
+                    self.emit(self.binary_op(node))
+            elif isinstance(node, FunctionCall):
+                if node.target is not None:
+                    raise CompileError(f"Module call '{node.name}' is not supported by the VM")
+                builtin = node.name not in self.functions and node.name in BUILTINS
+                if node.name not in self.functions and not builtin:
                     raise CompileError(f"Call to undefined function '{node.name}'")
+                if not builtin:
+                    self.check_arity(node)
                 for arg in node.args:
                     self.compile(arg)
-                self.emit("CALL_FUNCTION", node.name, len(node.args))
+                self.emit(CALL_BUILTIN if builtin else CALL_FUNCTION, self.add_constant(node.name), len(node.args))
             elif isinstance(node, Literal):
                 idx = self.add_constant(node.value)
-                self.emit("LOAD_CONST", idx)
-            elif isinstance(node, Variable):
-                idx = self.var_indices.get(node.name)
-                if idx is None:
+                self.emit(LOAD_CONST, idx)
+            elif isinstance(node, VariableReference):
+                found = self.lookup(node.name)
+                if found is None:
                     raise CompileError(f"Undefined variable '{node.name}'")
-                self.emit("LOAD_VAR", idx)
+                self.emit(found[0], found[1])
+            elif isinstance(node, ListLiteralNode):
+                for element in node.elements:
+                    self.compile(element)
+                self.emit(BUILD_LIST, len(node.elements))
+            elif isinstance(node, DictLiteralNode):
+                for key, value in node.pairs:
+                    self.compile(key)
+                    self.compile(value)
+                self.emit(BUILD_DICT, len(node.pairs))
+            elif isinstance(node, IndexAccessNode):
+                self.compile(node.container)
+                self.compile(node.index)
+                self.emit(BINARY_SUBSCR)
             else:
                 raise CompileError(f"Unknown node type '{type(node).__name__}'")
         except CompileError:
@@ -118,11 +230,292 @@ class Compiler:
         except Exception as e:
             raise CompileError(f"Compilation error: {e}")
 
+    def compile_body(self, statements):
+        for stmt in statements:
+            self.compile(stmt)
+            if isinstance(stmt, EXPRESSIONS):
+                self.emit(POP_TOP)
+
+    def compile_condition(self, expr):
+        # Emits a jump taken when expr is false and returns its operand position
+        if isinstance(expr, BinaryOperation) and expr.operator in COMPARISONS:
+            self.compile(expr.left)
+            self.compile(expr.right)
+            return self.emit_jump(COMPARE_JUMPS[BINARY_OPS[expr.operator]])
+        self.compile(expr)
+        return self.emit_jump(POP_JUMP_IF_FALSE)
+
+    def binary_op(self, node):
+        op = BINARY_OPS.get(node.operator)
+        if op is None:
+            raise CompileError(f"Unknown binary operator '{node.operator}'")
+        typed_op = TYPED_OPS.get((op, self.operand_type(node)))
+        if typed_op is not None:
+            self.typed_count += 1
+            return typed_op
+        return op
+
+    def string_pieces(self, node):
+        # Operands of a + chain of three or more strings, left to right, with
+        # neighbouring literals joined; None for any other operation
+        pieces = []
+        while isinstance(node, BinaryOperation) and node.operator == "+":
+            if self.type_of(node.right) != "string":
+                return None
+            pieces.append(node.right)
+            node = node.left
+        pieces.append(node)
+        if len(pieces) < 3 or self.type_of(node) != "string":
+            return None
+        merged = []
+        for piece in reversed(pieces):
+            if merged and isinstance(piece, Literal) and isinstance(merged[-1], Literal):
+                merged[-1] = Literal(merged[-1].value + piece.value)
+            else:
+                merged.append(piece)
+        return merged if len(merged) >= 3 else None
+
+    def check_arity(self, node):
+        # The VMs check this once, here, where the tree walker checks it on
+        # every call
+        expected = self.arities[node.name]
+        if len(node.args) != expected:
+            raise CompileError(f"Function '{node.name}' expects {expected} arguments, got {len(node.args)}")
+
+    def check_purity(self, node):
+        if node.modifier is None:
+            return
+        reason = impurity(node, self.pure, self.defined)
+        if reason is not None:
+            raise CompileError(reason)
+        if node.modifier == "memo":
+            self.memoized.add(node.name)
+
+    # === Counted loops ===
+
+    def counted_loop(self, node):
+        # (var index, step) for 'while i < bound' ending in 'i = i + step',
+        # where i is a local and bound cannot observe i. Otherwise None.
+        cond = node.condition
+        if not (isinstance(cond, BinaryOperation) and cond.operator == "<"
+                and isinstance(cond.left, VariableReference) and node.body):
+            return None
+        name = cond.left.name
+        idx = self.var_indices.get(name)
+        last = node.body[-1]
+        if idx is None or not (isinstance(last, Assignment) and last.name == name):
+            return None
+        step = last.value
+        if not (isinstance(step, BinaryOperation) and step.operator == "+"
+                and isinstance(step.left, VariableReference) and step.left.name == name
+                and isinstance(step.right, Literal) and type(step.right.value) is int):
+            return None
+        if not self.independent(cond.right, name):
+            return None
+        return idx, step.right.value
+
+    def independent(self, expr, name):
+        # Whether expr can be evaluated before 'name' is incremented without
+        # changing its value: constants, other variables and length(other)
+        if isinstance(expr, Literal):
+            return True
+        if isinstance(expr, VariableReference):
+            return expr.name != name
+        if isinstance(expr, FunctionCall):
+            return (expr.name == "length" and "length" not in self.functions and expr.target is None
+                    and all(isinstance(arg, VariableReference) and arg.name != name for arg in expr.args))
+        return False
+
+    def compile_counted_loop(self, node, idx, step):
+        #     LOAD_VAR i; <bound>; JUMP_IF_NOT_LT exit
+        # body:
+        #     <body without the increment>
+        #     <bound>; COUNTED_LOOP i, step, body
+        # exit:
+        increment = node.body[-1]
+        self.check_type(self.var_types.get(idx), increment.value, increment.name)
+        bound = node.condition.right
+        self.emit(LOAD_VAR, idx)
+        self.compile(bound)
+        exit_jump = self.emit_jump(COMPARE_JUMPS[BINARY_OPS["<"]])
+        self.mark_label()
+        start = len(self.instructions)
+        self.compile_body(node.body[:-1])
+        self.compile(bound)
+        self.emit(COUNTED_LOOP, idx, self.add_constant(step), start)
+        self.patch(exit_jump)
+
+    # === Jumps ===
+
+    def emit_jump(self, op, *args):
+        # Emits a jump whose target (its last operand) is filled in by patch()
+        self.emit(op, *args, 0)
+        return len(self.instructions) - 1
+
+    def patch(self, position):
+        # Points the jump operand at position to the next instruction
+        self.mark_label()
+        self.instructions[position] = len(self.instructions)
+
+    def protect(self, start, end, handler, depth):
+        # Adds [start, end) to the exception table, less the bodies of any
+        # functions defined in it, which run in frames of their own
+        for entry, body_end in self.function_ranges:
+            if start <= entry < end:
+                if start < entry:
+                    self.exception_table.append((start, entry, handler, depth))
+                start = body_end
+        if start < end:
+            self.exception_table.append((start, end, handler, depth))
+
+    def thread_jumps(self):
+        # A jump to an unconditional JUMP goes straight to that JUMP's target
+        code = self.instructions
+        for offset, op, args in decode(code):
+            index = JUMP_TARGETS.get(op)
+            if index is None:
+                continue
+            position = offset + 1 + index
+            target = code[position]
+            seen = set()
+            while target < len(code) and code[target] == JUMP and target not in seen:
+                seen.add(target)
+                target = code[target + 1]
+            code[position] = target
+
+    def size_stacks(self):
+        # Fills in the stack operand of every ENTER: the deepest the operand
+        # stack gets in that frame, found by following its code from the
+        # entry and from each of its catch handlers (entered with the error
+        # message pushed). The top level jumps over the function bodies.
+        code = self.instructions
+        starts = {entry: [(entry, 0)] for entry in [0] + list(self.functions.values())}
+        for _, _, handler, depth in self.exception_table:
+            frame = next((entry for entry, end in self.function_ranges if entry <= handler < end), 0)
+            starts[frame].append((handler, depth + 1))
+        for entry, pending in starts.items():
+            seen = set()
+            deepest = 0
+            while pending:
+                ip, depth = pending.pop()
+                deepest = max(deepest, depth)
+                while ip < len(code) and ip not in seen:
+                    seen.add(ip)
+                    op = code[ip]
+                    count = OPERAND_COUNTS[op]
+                    effect = STACK_EFFECTS[op]
+                    if effect is None:
+                        effect = stack_effect(op, code[ip + 1:ip + 1 + count])
+                    depth += effect
+                    if depth > deepest:
+                        deepest = depth
+                    target = JUMP_TARGETS.get(op)
+                    if target is not None:
+                        pending.append((code[ip + 1 + target], depth))
+                    if op == JUMP or op == RETURN_VALUE or op == RAISE:
+                        break
+                    ip += 1 + count
+            code[entry + 2] = deepest
+
+    def convert(self, var_type):
+        # A value stored in a list[int] / list[float] variable goes through
+        # the builtin converting it to a typed list first
+        if var_type in CONVERTERS:
+            self.emit(CALL_BUILTIN, self.add_constant(CONVERTERS[var_type]), 1)
+
+    # === Variables ===
+
+    def declare(self, name, var_type):
+        idx = self.local_count
+        self.var_indices[name] = idx
+        self.var_types[idx] = var_type
+        self.local_count += 1
+        return idx
+
+    def lookup(self, name):
+        # (load opcode, index, declared type), or None when undefined
+        idx = self.var_indices.get(name)
+        if idx is not None:
+            return LOAD_VAR, idx, self.var_types.get(idx)
+        idx = self.global_indices.get(name)
+        if idx is not None:
+            return LOAD_GLOBAL, idx, self.global_types.get(idx)
+        return None
+
+    # === Static types ===
+
+    def type_of(self, node):
+        # Declared type name of an expression, or None when not known statically
+        if isinstance(node, Literal):
+            return literal_type(node.value)
+        if isinstance(node, VariableReference):
+            found = self.lookup(node.name)
+            return found[2] if found else None
+        if isinstance(node, BinaryOperation):
+            if node.operator in COMPARISONS:
+                return "bool"
+            kind = self.operand_type(node)
+            if kind == "int" and node.operator == "/":
+                return "float"
+            if kind == "string" and node.operator != "+":
+                return None
+            return kind
+        if isinstance(node, IndexAccessNode):
+            return ELEMENT_TYPES.get(self.type_of(node.container))
+        if isinstance(node, FunctionCall) and node.name not in self.functions:
+            return RESULT_TYPES.get(node.name)
+        return None
+
+    def operand_type(self, node):
+        # The TYPED_OPS operand type for a binary operation's two operands
+        left, right = self.type_of(node.left), self.type_of(node.right)
+        if left == "int" and right == "int":
+            return "int"
+        if left in NUMERIC_TYPES and right in NUMERIC_TYPES:
+            return "float"
+        if left == "string" and right == "string":
+            return "string"
+        return None
+
+    def check_type(self, declared, expr, name):
+        actual = self.type_of(expr)
+        if not assignable(declared, actual):
+            raise CompileError(f"Cannot assign {actual} to {declared} variable '{name}'")
+
     def emit(self, op, *args):
-        self.instructions.append((op, *args))
+        code = self.instructions
+        if len(self.recent) == 2:
+            (first, first_op), (second, second_op) = self.recent
+            fused = fuse(first_op, second_op, op)
+            if fused is not None:
+                args = (code[first + 1], code[second + 1])
+                op = fused
+                del code[first:]
+                self.recent = []
+                while self.line_table and self.line_table[-1][0] > first:
+                    self.line_table.pop()
+        self.recent = self.recent[-1:] + [(len(code), op)]
+        code.append(op)
+        code.extend(args)
+
+    def mark_line(self, line):
+        offset = len(self.instructions)
+        table = self.line_table
+        if table and table[-1][0] == offset:
+            table[-1] = (offset, line)
+        elif not table or table[-1][1] != line:
+            table.append((offset, line))
+
+    def mark_label(self):
+        self.labels.add(len(self.instructions))
+        self.recent = []  # never fuse across a label
 
     def add_constant(self, value):
-        if value in self.constants:
-            return self.constants.index(value)
-        self.constants.append(value)
-        return len(self.constants) - 1
+        # Keyed by type so that 1, 1.0 and True stay distinct constants
+        key = (type(value), value)
+        idx = self.constant_indices.get(key)
+        if idx is None:
+            idx = len(self.constants)
+            self.constants.append(value)
+            self.constant_indices[key] = idx
+        return idx
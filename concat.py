@@ -0,0 +1,315 @@
+# concat.py
+#
+# AST pass for strings built up piece by piece in a loop. A while loop
+# qualifies for a variable s declared string in the same function (or at
+# top level) when every assignment to s in the loop has the form
+#
+#   s = s + <piece> + <piece> ...
+#
+# The loop then becomes
+#
+#   list $s1 = [s]
+#   while <condition>
+#       append_string($s1, <piece>, <piece> ...)
+#       ...
+#   s = string_value($s1)
+#
+# with every other read of s in the loop replaced by string_value($s1).
+# append_string and string_value (strings.py) keep the pieces in a list and
+# join them only when the value is read, so the loop takes time linear in
+# the length of the result where each + would copy everything built so far.
+#
+# All the pieces of one assignment are evaluated before any is appended and
+# checked, so a piece that may not be a string (other than the last) may only
+# be followed by pieces whose evaluation cannot fail: literals, variables and
+# str() of them. A type error then surfaces in the same place as with +. A
+# loop inside a try of the same function is left alone, since an error caught
+# there would see s without the pieces appended so far, and so is one calling
+# a function that can see s.
+#
+# IJICHI_NO_CONCAT=1 turns the pass off.
+#
+#   python concat.py <script.iji>     prints which loops were rewritten
+
+import os
+import sys
+
+from ast_nodes import *
+from memo import walk
+from vectorize import unparse
+
+DISABLED = bool(os.environ.get("IJICHI_NO_CONCAT"))
+
+class Rejected(Exception):
+    pass
+
+
+def concat(program):
+    # Rewrites program in place; returns the report, one line per loop and variable
+    buffers = Buffers(program.statements)
+    if not DISABLED:
+        buffers.block(program.statements, None, scope_types(program.statements, None), False)
+    return buffers.report
+
+
+class Buffers:
+    def __init__(self, statements):
+        self.report = []
+        self.count = 0  # variables buffered, for naming the buffers
+        self.functions = {node.name: node for node in walk(statements) if isinstance(node, FunctionDef)}
+        # A program that defines these functions would call its own versions
+        self.shadowed = set(self.functions) & {"append_string", "string_value"}
+        # Names the functions use, for loops at top level
+        self.visible = mentions(node for func in self.functions.values() for node in walk(func.body))
+
+    def block(self, statements, func, types, guarded):
+        # guarded: inside a try of the same function
+        rewritten = []
+        for stmt in statements:
+            if isinstance(stmt, FunctionDef):
+                self.block(stmt.body, stmt, scope_types(stmt.body, stmt), False)
+            elif isinstance(stmt, IfStatement):
+                self.block(stmt.then_body, func, types, guarded)
+                self.block(stmt.else_body or [], func, types, guarded)
+            elif isinstance(stmt, TryStatement):
+                self.block(stmt.try_body, func, types, True)
+                self.block(stmt.catch_body, func, types, guarded)
+            elif isinstance(stmt, WhileLoop):
+                rewritten.extend(self.loop(stmt, func, types, guarded))
+                continue
+            rewritten.append(stmt)
+        statements[:] = rewritten
+
+    def loop(self, loop, func, types, guarded):
+        # Outer loops first: the buffer then also covers the loops inside
+        where = f"while {unparse(loop.condition)}" + (f" (in {func.name})" if func else "")
+        before, after = [], []
+        for name in accumulated(loop.body):
+            if types.get(name, "string") not in ("string", None):
+                continue  # a number or a list
+            try:
+                self.check(loop, name, func, types, guarded)
+            except Rejected as e:
+                self.report.append(f"{where}: {name} not buffered: {e}")
+                continue
+            self.count += 1
+            buffer = f"${name}{self.count}"
+            loop.condition = substitute(loop.condition, name, buffer)
+            rewrite(loop.body, name, buffer)
+            before.append(VariableDeclaration("list", buffer, ListLiteralNode([VariableReference(name)])))
+            after.append(Assignment(name, FunctionCall("string_value", [VariableReference(buffer)])))
+            self.report.append(f"{where}: {name} buffered")
+        self.block(loop.body, func, types, guarded)
+        for stmt in before + after:
+            stmt.line = getattr(loop, "line", None)
+        return before + [loop] + after
+
+    def check(self, loop, name, func, types, guarded):
+        if self.shadowed:
+            raise Rejected(f"the program defines {', '.join(sorted(self.shadowed))}")
+        if types.get(name) != "string":
+            raise Rejected(f"{name} is not declared string in this {'function' if func else 'program'}")
+        if guarded:
+            raise Rejected("the loop is inside a try")
+        nodes = list(walk(loop.body))
+        for node in nodes:
+            if isinstance(node, FunctionDef):
+                raise Rejected(f"the loop defines {node.name}")
+            if isinstance(node, VariableDeclaration) and node.name == name:
+                raise Rejected(f"the loop declares {name}")
+            if isinstance(node, TryStatement) and node.catch_name == name:
+                raise Rejected(f"the loop catches into {name}")
+            if isinstance(node, Assignment) and node.name == name:
+                found = pieces(node)
+                if found is None:
+                    raise Rejected(f"{name} is assigned other than as {name} = {name} + ...")
+                for n, piece in enumerate(found[:-1]):
+                    if not self.string(piece) and not all(self.quiet(later) for later in found[n + 1:]):
+                        raise Rejected(f"{unparse(piece)} may not be a string and is followed by"
+                                       " a piece that may fail")
+        if func is None:
+            visible = self.visible
+        else:
+            visible = mentions(node for inner in walk(func.body) if isinstance(inner, FunctionDef)
+                               for node in walk(inner.body))
+        if name in visible:
+            for call in calls([loop.condition] + nodes):
+                if call.target is None and call.name in self.functions:
+                    raise Rejected(f"the loop calls {call.name}, which can see {name}")
+
+    def string(self, node):
+        # Whether node always evaluates to a string
+        if isinstance(node, Literal):
+            return type(node.value) is str
+        return (isinstance(node, FunctionCall) and node.name == "str" and node.target is None
+                and node.name not in self.functions and len(node.args) == 1)
+
+    def quiet(self, node):
+        # Whether evaluating node cannot fail
+        if isinstance(node, (Literal, VariableReference)):
+            return True
+        return self.string(node) and self.quiet(node.args[0])
+
+
+def scope_types(statements, func):
+    # name -> declared type of the variables of one function, or of the top
+    # level; None for a name declared with different types
+    types = {}
+
+    def declare(name, var_type):
+        types[name] = var_type if types.get(name, var_type) == var_type else None
+
+    for param_type, name in (func.params if func else ()):
+        declare(name, param_type)
+    for node in local(statements):
+        if isinstance(node, VariableDeclaration):
+            declare(node.name, node.var_type)
+        elif isinstance(node, TryStatement):
+            declare(node.catch_name, "string")
+    return types
+
+
+def local(statements):
+    # Like walk(), without going into function definitions
+    for stmt in statements:
+        if isinstance(stmt, FunctionDef):
+            continue
+        yield stmt
+        if isinstance(stmt, IfStatement):
+            yield from local(stmt.then_body)
+            yield from local(stmt.else_body or [])
+        elif isinstance(stmt, WhileLoop):
+            yield from local(stmt.body)
+        elif isinstance(stmt, TryStatement):
+            yield from local(stmt.try_body)
+            yield from local(stmt.catch_body)
+
+
+def accumulated(statements):
+    # Variables assigned as s = s + ... somewhere in statements, in order
+    names = []
+    for node in walk(statements):
+        if isinstance(node, Assignment) and pieces(node) is not None and node.name not in names:
+            names.append(node.name)
+    return names
+
+
+def pieces(stmt):
+    # s = s + a + b  ->  [a, b]; None for any other assignment
+    found = []
+    node = stmt.value
+    while isinstance(node, BinaryOperation) and node.operator == "+":
+        found.append(node.right)
+        node = node.left
+    if not (isinstance(node, VariableReference) and node.name == stmt.name and found):
+        return None
+    found.reverse()
+    return found
+
+
+def expressions(node):
+    # The expressions a node evaluates directly
+    if isinstance(node, VariableDeclaration):
+        return [node.initializer] if node.initializer is not None else []
+    if isinstance(node, (Assignment, ReturnStatement, RaiseStatement)):
+        return [node.value] if node.value is not None else []
+    if isinstance(node, (IfStatement, WhileLoop)):
+        return [node.condition]
+    if isinstance(node, BinaryOperation):
+        return [node.left, node.right]
+    if isinstance(node, FunctionCall):
+        return node.args
+    if isinstance(node, MemberAccess):
+        return [node.container]
+    if isinstance(node, ListLiteralNode):
+        return node.elements
+    if isinstance(node, DictLiteralNode):
+        return [part for pair in node.pairs for part in pair]
+    if isinstance(node, IndexAccessNode):
+        return [node.container, node.index]
+    if isinstance(node, (FunctionDef, TryStatement, ImportStatement, Literal, VariableReference)):
+        return []
+    return [node]
+
+
+def calls(nodes):
+    for node in nodes:
+        if isinstance(node, FunctionCall):
+            yield node
+        yield from calls(expr for expr in expressions(node) if expr is not node)
+
+
+def mentions(nodes):
+    # Every variable name read or assigned in nodes
+    names = set()
+    for node in nodes:
+        if isinstance(node, (VariableReference, Assignment, VariableDeclaration)):
+            names.add(node.name)
+        names |= mentions(expr for expr in expressions(node) if expr is not node)
+    return names
+
+
+def substitute(node, name, buffer):
+    # node with every read of name replaced by string_value(buffer)
+    if isinstance(node, VariableReference):
+        if node.name == name:
+            return FunctionCall("string_value", [VariableReference(buffer)])
+    elif isinstance(node, BinaryOperation):
+        node.left = substitute(node.left, name, buffer)
+        node.right = substitute(node.right, name, buffer)
+    elif isinstance(node, FunctionCall):
+        node.args = [substitute(arg, name, buffer) for arg in node.args]
+    elif isinstance(node, MemberAccess):
+        node.container = substitute(node.container, name, buffer)
+    elif isinstance(node, ListLiteralNode):
+        node.elements = [substitute(element, name, buffer) for element in node.elements]
+    elif isinstance(node, DictLiteralNode):
+        node.pairs = [(substitute(key, name, buffer), substitute(value, name, buffer))
+                      for key, value in node.pairs]
+    elif isinstance(node, IndexAccessNode):
+        node.container = substitute(node.container, name, buffer)
+        node.index = substitute(node.index, name, buffer)
+    return node
+
+
+def rewrite(statements, name, buffer):
+    # Appends go to buffer, reads of name go through string_value(buffer)
+    for n, stmt in enumerate(statements):
+        if isinstance(stmt, Assignment) and stmt.name == name:
+            statements[n] = FunctionCall("append_string", [VariableReference(buffer)]
+                                         + [substitute(piece, name, buffer) for piece in pieces(stmt)])
+            statements[n].line = getattr(stmt, "line", None)
+        elif isinstance(stmt, (VariableDeclaration, Assignment, ReturnStatement, RaiseStatement)):
+            if isinstance(stmt, VariableDeclaration):
+                stmt.initializer = stmt.initializer and substitute(stmt.initializer, name, buffer)
+            else:
+                stmt.value = stmt.value and substitute(stmt.value, name, buffer)
+        elif isinstance(stmt, IfStatement):
+            stmt.condition = substitute(stmt.condition, name, buffer)
+            rewrite(stmt.then_body, name, buffer)
+            rewrite(stmt.else_body or [], name, buffer)
+        elif isinstance(stmt, WhileLoop):
+            stmt.condition = substitute(stmt.condition, name, buffer)
+            rewrite(stmt.body, name, buffer)
+        elif isinstance(stmt, TryStatement):
+            rewrite(stmt.try_body, name, buffer)
+            rewrite(stmt.catch_body, name, buffer)
+        elif not isinstance(stmt, (FunctionDef, ImportStatement)):
+            statements[n] = substitute(stmt, name, buffer)
+
+
+def main(argv):
+    if len(argv) != 1:
+        print("Usage: python concat.py <script.iji>")
+        return 1
+    from lexer import Lexer
+    from parser import Parser
+    with open(argv[0], "rb") as f:
+        program = Parser(Lexer(f.read())).parse()
+    for line in concat(program) or ["no string accumulation in while loops"]:
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
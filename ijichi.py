@@ -1,18 +1,88 @@
 import sys
-from lexer import Lexer
-from parser import Parser
+import profiler
+from modules import REGISTRY, module_path
 from runtime import Executor
+from closures import ClosureExecutor
+
+EXECUTORS = {
+    "walk": Executor,
+    "closure": ClosureExecutor,
+}
+
+
+def run_file(path, mode="walk", tail_calls=False, build=False, workers=None, stats=False, profile=None):
+    path = module_path(path)
+    if build:
+        # Parse the whole import graph in parallel before running anything
+        REGISTRY.build(path, workers)
+    # Parsed from an mmap of the file, unless the build already did it
+    ast = REGISTRY.load(path)
+    # A script with syntax errors does not run. With --build every module in
+    # its import graph is checked here; otherwise imports are checked as they
+    # load
+    paths = REGISTRY.discover(path) if build else [path]
+    errors = [f"{module}: {error}" for module in paths for error in REGISTRY.errors(module)]
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        return 1
+    executor = EXECUTORS[mode](tail_calls=tail_calls, path=path)
+    if profile:
+        # profile is (sort key, collapsed stacks path) from profiler.options()
+        tracker = profiler.Profiler()
+        tracker.attach(executor)
+        try:
+            tracker.timed_run(lambda: executor.execute(ast))
+        finally:
+            profiler.finish(tracker, *profile)
+    else:
+        executor.execute(ast)
+    if stats and executor.memo.caches:
+        print(executor.memo.report(), file=sys.stderr)
+    return 0
+
+
+def run_command(args):
+    # The command line of this file, minus serve; also what a serve.py
+    # worker runs for each client.py request
+    mode = "walk"
+    try:
+        profile = profiler.options(args)
+    except ValueError as e:
+        print(e)
+        return 1
+    tail_calls = "--tail-calls" in args
+    if tail_calls:
+        args.remove("--tail-calls")
+    stats = "--stats" in args
+    if stats:
+        args.remove("--stats")
+    build = "--build" in args
+    if build:
+        args.remove("--build")
+    workers = None
+    if "-j" in args:
+        i = args.index("-j")
+        workers = int(args[i + 1]) if i + 1 < len(args) and args[i + 1].isdigit() else 0
+        del args[i:i + 2]
+    if "--mode" in args:
+        i = args.index("--mode")
+        mode = args[i + 1] if i + 1 < len(args) else ""
+        del args[i:i + 2]
+    if not args or mode not in EXECUTORS or workers == 0 or (profile and mode != "walk"):
+        print(f"Usage: python ijichi.py [--mode {'|'.join(EXECUTORS)}] [--tail-calls] [--build [-j workers]] [--stats]"
+              " [--profile [--profile-sort time|calls|total|name] [--profile-stacks file]] <script.iji>"
+              "\n--profile works with --mode walk"
+              "\n       python ijichi.py serve [--socket path] [-w workers]   (see serve.py)")
+        return 1
+    return run_file(args[0], mode, tail_calls, build, workers, stats, profile)
+
+
+def main(args):
+    if args[:1] == ["serve"]:
+        import serve
+        return serve.main(args[1:])
+    return run_command(args)
 
-def run_file(path):
-    with open(path, "r") as f:
-        source = f.read()
-    tokens = Lexer(source).tokenize()
-    ast = Parser(tokens).parse()
-    executor = Executor()
-    executor.execute(ast)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python ijichi.py <script.iji>")
-        sys.exit(1)
-    run_file(sys.argv[1])
+    sys.exit(main(sys.argv[1:]))
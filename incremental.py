@@ -0,0 +1,200 @@
+# incremental.py
+#
+# Incremental front end for editors and notebook-style REPLs, which parse
+# the same file again on every keystroke or cell. IncrementalParser keeps
+# the source split into chunks of top-level statements. A chunk starts at a
+# line whose first token is at column 1: there the lexer's indentation stack
+# is empty and the parser is between statements, so both can start afresh
+# from that line as if it began the file.
+#
+# An edit is lexed and parsed again from the chunk it falls in, or from the
+# one before when it touches a chunk's first line (an indented line or an
+# else there continues the previous statement). Parsing goes on until it
+# reaches, past the edited text, the start of an old chunk; a change of
+# indentation or an unclosed bracket or string is followed as far as it
+# reaches. The old chunks from there on are kept, with their offsets and
+# lines shifted, and so are the statements parsed from them.
+#
+#   parser = IncrementalParser(source)
+#   program, changed = parser.edit(start, end, text)
+#   program, changed = parser.update(new_source)
+#
+# edit() replaces source[start:end] with text; update() takes the whole new
+# text, as a notebook cell or a saved file delivers it. Both return the new
+# Program and the list of its top-level statements that were parsed anew;
+# every other statement is the same node object as before the edit, so a
+# cache keyed on the nodes only has to drop what is no longer in the
+# program. Their line numbers are moved along with the text. Syntax errors are in parser.errors, as with Parser. Lexer errors
+# are reported there too and, as in Parser, end the program at that point,
+# so a half-typed string does not lose the whole file.
+
+from bisect import bisect_left, bisect_right
+
+from ast_nodes import Program
+from lexer import Lexer, LexerError, EOF, INDENT, DEDENT
+from parser import Parser
+
+
+class Chunk:
+    # One chunk as parse_chunks() finds it
+    __slots__ = ('offset', 'line', 'nodes', 'errors')
+
+    def __init__(self, offset, line):
+        self.offset = offset  # of the chunk's first line in the source
+        self.line = line
+        self.nodes = []  # top-level statements parsed from the chunk
+        self.errors = []  # syntax errors in them, as Parser.errors has them
+
+
+class IncrementalParser:
+    def __init__(self, source=''):
+        self.source = source
+        chunks, _ = self.parse_chunks(0, 1)
+        # The chunks as parallel lists, like the columns of a TokenBuffer, so
+        # an edit splices and shifts them without touching each chunk
+        self.offsets = [chunk.offset for chunk in chunks]
+        self.lines = [chunk.line for chunk in chunks]
+        self.nodes = [chunk.nodes for chunk in chunks]
+        self.chunk_errors = [chunk.errors for chunk in chunks]
+        self.program = Program([node for nodes in self.nodes for node in nodes])
+        self.errors = [error for errors in self.chunk_errors for error in errors]
+
+    def edit(self, start, end, text):
+        old_source = self.source
+        source = self.source = old_source[:start] + text + old_source[end:]
+        shift = len(text) - (end - start)
+        offsets = self.offsets
+
+        first = bisect_right(offsets, start) - 1
+        if first > 0 and source.find('\n', offsets[first], start) < 0:
+            first -= 1
+        # A """ with no """ after it lexes as "" and a string; one the edit
+        # makes or breaks can close it. Only the last """ before the edit can
+        # be such an opening one.
+        if '"""' in old_source[max(0, start - 2):end + 2] or '"""' in source[max(0, start - 2):start + len(text) + 2]:
+            quotes = source.rfind('"""', 0, start)
+            if quotes >= 0:
+                first = min(first, bisect_right(offsets, quotes) - 1)
+        chunks, resume = self.parse_chunks(offsets[first], self.lines[first], start + len(text), offsets, shift)
+
+        # Chunks wholly before the edit that parsed to the same extent hold
+        # the same statements
+        count = len(offsets)
+        old_ends = offsets[1:] + [len(old_source)]
+        ends = [chunk.offset for chunk in chunks[1:]]
+        ends.append(offsets[resume] + shift if resume < count else len(source))
+        changed = []
+        for i, (chunk, end_offset) in enumerate(zip(chunks, ends), first):
+            if end_offset <= start and i < count and offsets[i] == chunk.offset and old_ends[i] == end_offset:
+                chunk.nodes = self.nodes[i]
+                chunk.errors = self.chunk_errors[i]
+            else:
+                changed.extend(chunk.nodes)
+
+        line_shift = 0
+        if resume < count:
+            line_shift = chunks[-1].line + source.count('\n', chunks[-1].offset, offsets[resume] + shift) - self.lines[resume]
+        statements = self.program.statements
+        before = sum(map(len, self.nodes[:first]))
+        after = before + sum(map(len, self.nodes[first:resume]))
+        self.program = Program(statements[:before] + [node for chunk in chunks for node in chunk.nodes] + statements[after:])
+        before = sum(map(len, self.chunk_errors[:first]))
+        after = before + sum(map(len, self.chunk_errors[first:resume]))
+        self.errors = self.errors[:before] + [error for chunk in chunks for error in chunk.errors] + self.errors[after:]
+
+        self.offsets[first:] = [chunk.offset for chunk in chunks] + [offset + shift for offset in offsets[resume:]]
+        self.lines[first:] = [chunk.line for chunk in chunks] + [line + line_shift for line in self.lines[resume:]]
+        self.nodes[first:resume] = [chunk.nodes for chunk in chunks]
+        self.chunk_errors[first:resume] = [chunk.errors for chunk in chunks]
+        if line_shift:
+            shift_lines([node for nodes in self.nodes[first + len(chunks):] for node in nodes], line_shift)
+            if any(self.chunk_errors[first + len(chunks):]):
+                self.renumber_errors(first + len(chunks))
+        return self.program, changed
+
+    def update(self, source):
+        # Edits the span between the text the old and new source start and
+        # end with
+        old = self.source
+        limit = min(len(old), len(source))
+        start = common_length(old, source, limit, lambda s, n: s[:n])
+        tail = common_length(old, source, limit - start, lambda s, n: s[len(s) - n:])
+        return self.edit(start, len(old) - tail, source[start:len(source) - tail])
+
+    def parse_chunks(self, offset, line, unchanged=None, old_offsets=(), shift=0):
+        # Chunks parsed from offset, the start of line, to the end of the
+        # source, or to the first old chunk that starts past unchanged, the
+        # offset where the edited text ends; old_offsets are where the old
+        # chunks start, before the edit moved them by shift. Returns the new
+        # chunks and the index of the old chunk the rest of the source is.
+        source = self.source
+        chunk = Chunk(offset, line)
+        chunks = [chunk]
+        started = False
+        line_start = offset
+        lexer = Lexer(source[offset:])
+        lexer.line = line
+        try:
+            parser = Parser(lexer)
+            while True:
+                token = parser.current_token
+                if token.type == EOF:
+                    break
+                if started and token.column == 1 and token.type != INDENT and token.type != DEDENT:
+                    while line < token.line:
+                        line_start = source.index('\n', line_start) + 1
+                        line += 1
+                    if unchanged is not None and line_start >= unchanged:
+                        i = bisect_left(old_offsets, line_start - shift)
+                        if i < len(old_offsets) and old_offsets[i] == line_start - shift:
+                            return chunks, i
+                    chunk = Chunk(line_start, line)
+                    chunks.append(chunk)
+                started = True
+                try:
+                    stmt = parser.parse_statement()
+                    if stmt:
+                        chunk.nodes.append(stmt)
+                except SyntaxError as e:
+                    chunk.errors.append(str(e))
+                    parser.synchronize()
+        except (LexerError, ValueError) as e:
+            # ValueError: a string with a bad escape
+            chunk.errors.append(str(e))
+        return chunks, len(old_offsets)
+
+    def renumber_errors(self, first):
+        # Error messages carry line numbers: chunks from first on that moved
+        # to other lines and have errors are parsed again for them
+        for i in range(first, len(self.offsets)):
+            if self.chunk_errors[i]:
+                chunks, _ = self.parse_chunks(self.offsets[i], self.lines[i], self.offsets[i] + 1, self.offsets)
+                self.chunk_errors[i] = chunks[0].errors
+        self.errors = [error for errors in self.chunk_errors for error in errors]
+
+
+BLOCKS = ('body', 'then_body', 'else_body', 'try_body', 'catch_body')
+
+
+def shift_lines(statements, shift):
+    # Adds shift to the line of statements and of those nested in them
+    pending = list(statements)
+    while pending:
+        node = pending.pop()
+        line = getattr(node, 'line', None)
+        if line is not None:
+            node.line = line + shift
+        for name in BLOCKS:
+            pending.extend(getattr(node, name, ()))
+
+
+def common_length(a, b, limit, part):
+    # Length of the longest part(a, n) == part(b, n), n <= limit, by bisection
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if part(a, middle) == part(b, middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
@@ -1,7 +1,10 @@
 import re
-from collections import namedtuple
+import sys
+from array import array
+from collections import deque, namedtuple
+from itertools import islice
 
-Token = namedtuple('Token', ['type', 'value', 'line', 'column'])
+Token = namedtuple('Token', ['type', 'value', 'line', 'column'])  # type: a kind id, see KINDS
 
 class LexerError(Exception):
     pass
@@ -9,128 +12,382 @@ class LexerError(Exception):
 class Lexer:
     KEYWORDS = {
         'func', 'if', 'else', 'while', 'return',
-        'try', 'catch', 'raise', 'import', 'from', 'as'
+        'try', 'catch', 'raise', 'import', 'from', 'as', 'pure', 'memo'
     }
     BOOL_LITERALS = {'true', 'false'}
 
     TOKEN_SPECIFICATION = [
         ('TRIPLE_STRING', r'"""(?:.|\n)*?"""'),   # Multiline string (non-greedy)
-        ('NUMBER',       r'\d+(\.\d*)?'),         # Integer or decimal number
-        ('STRING',       r'"([^"\\]|\\.)*"'),     # Double quoted string
+        ('NUMBER',       r'\d+(?:\.\d*)?'),       # Integer or decimal number
+        ('STRING',       r'"(?:[^"\\]|\\.)*"'),   # Double quoted string
         ('ID',           r'[A-Za-z_][A-Za-z0-9_]*'),  # Identifiers
-        ('OP',           r'==|!=|<=|>=|[+\-*/<>]'),  # Operators
-        ('NEWLINE',      r'\n'),                   # Line endings
+        ('OP',           r'==|!=|<=|>=|[+\-*/<>=]'),  # Operators
+        # Line ending plus any blank or comment-only lines after it and the
+        # indentation of the next line
+        ('NEWLINE',      r'\r?\n(?:[ \t]*(?:\#[^\r\n]*)?(?:\r?\n|\Z))*[ \t]*'),
         ('SKIP',         r'[ \t]+'),               # Skip spaces and tabs
-        ('COMMENT',      r'\#.*'),                  # Comments
+        ('COMMENT',      r'\#[^\r\n]*'),            # Comments
         ('SEMICOLON',    r';'),                     # Semicolon separator
         ('LPAREN',       r'\('),
         ('RPAREN',       r'\)'),
         ('COMMA',        r','),
         ('COLON',        r':'),
-        ('UNKNOWN',      r'.'), 
-      
-        LBRACKET = 'LEFT_BRACKET'   # [
-        RBRACKET = 'RIGHT_BRACKET'  # ]
-        LBRACE = 'LEFT_BRACE'       # {
-        RBRACE = 'RIGHT_BRACE'      # }
-        COLON = 'COLON'             # :
-        COMMA = 'COMMA'             # ,
-# Any other character
+        ('LEFT_BRACKET',  r'\['),
+        ('RIGHT_BRACKET', r'\]'),
+        ('LEFT_BRACE',    r'\{'),
+        ('RIGHT_BRACE',   r'\}'),
+        ('DOT',          r'\.'),                    # Module member access
+        ('UNKNOWN',      r'.'),                     # Any other character
     ]
-    
+
+    # Compiled once at import time and shared by every Lexer. Spaces before a
+    # token are consumed with it, so one finditer() walks the whole buffer.
+    # The bytes variants scan an mmap (or any bytes buffer) without decoding it.
+    MASTER = r'[ \t]*(?:' + '|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_SPECIFICATION) + ')'
+    LEADING = r'(?:[ \t]*(?:\#[^\r\n]*)?(?:\r?\n|\Z))*[ \t]*'  # blank lines and indentation at the top
+    regex = re.compile(MASTER)
+    leading = re.compile(LEADING)
+    bytes_regex = re.compile(MASTER.encode('ascii'))
+    bytes_leading = re.compile(LEADING.encode('ascii'))
+
+    # How far ahead peek() may look
+    MAX_LOOKAHEAD = 4
+
+    # Between an opening bracket and its closing one a line ending is only
+    # space: no NEWLINE, INDENT or DEDENT is emitted for it
+    OPENING = frozenset(['LPAREN', 'LEFT_BRACKET', 'LEFT_BRACE'])
+    CLOSING = frozenset(['RPAREN', 'RIGHT_BRACKET', 'RIGHT_BRACE'])
 
     def __init__(self, code):
-        self.code = code
+        self.code = code  # str, bytes or mmap
         self.tokens = []
         self.indents = [0]
         self.line = 1
         self.column = 1
-        self.regex = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in self.TOKEN_SPECIFICATION), re.MULTILINE)
-        self.current_pos = 0
         self.length = len(code)
         self.token_index = 0
+        self.stream = None
+        self.lookahead = deque()
+
+    @classmethod
+    def from_file(cls, path):
+        import mmap
+        with open(path, 'rb') as f:
+            if f.seek(0, 2) == 0:
+                return cls(b'')
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
 
     def tokenize(self):
-        lines = self.code.splitlines(keepends=True)
-        for line in lines:
-            stripped = line.lstrip('\r\n')
-            indent = len(line) - len(stripped)
-            if stripped == '' or stripped.startswith('#'):
-                self.line += 1
-                self.column = 1
-                continue
-            
-            if indent > self.indents[-1]:
-                self.indents.append(indent)
-                self.tokens.append(Token('INDENT', '', self.line, self.column))
-            while indent < self.indents[-1]:
-                self.indents.pop()
-                self.tokens.append(Token('DEDENT', '', self.line, self.column))
-
-            self._tokenize_line(stripped)
-            self.line += 1
-            self.column = 1
-
-        while len(self.indents) > 1:
-            self.indents.pop()
-            self.tokens.append(Token('DEDENT', '', self.line, self.column))
-
-        self.tokens.append(Token('EOF', '', self.line, self.column))
+        # Materializes every token; the parser pulls lazily via next_token() instead
+        self.tokens = list(self.scan())
+        self.token_index = 0
         return self.tokens
 
-    def _tokenize_line(self, line):
-        pos = 0
-        while pos < len(line):
-            match = self.regex.match(line, pos)
-            if not match:
-                raise LexerError(f'Unexpected character {line[pos]} at line {self.line} col {self.column}')
+    def scan(self):
+        code = self.code
+        binary = not isinstance(code, str)
+        regex, leading = (self.bytes_regex, self.bytes_leading) if binary else (self.regex, self.leading)
+        newline = b'\n' if binary else '\n'
+        keyword_ids = KEYWORD_IDS
+        kind_ids = KIND_IDS
+        bool_literals = self.BOOL_LITERALS
+        intern = sys.intern
+        indents = self.indents
+        opening, closing = self.OPENING, self.CLOSING
+        depth = 0
+        length = self.length
+        line = self.line
+
+        # Blank lines and indentation before the first token
+        match = leading.match(code)
+        head = match.group()
+        last = head.rfind(newline)
+        line += head.count(newline)
+        line_start = last + 1
+        indent = len(head) - line_start
+        if indent and match.end() < length:
+            indents.append(indent)
+            yield Token(INDENT, '', line, 1)
+
+        for match in regex.finditer(code, match.end()):
             kind = match.lastgroup
-            value = match.group(kind)
-            start_col = pos + 1
+            start = match.start(kind)
+            raw = value = match.group(kind)
+            if binary:
+                value = raw.decode('utf-8')
 
-            if kind == 'NEWLINE':
-                self.tokens.append(Token('NEWLINE', '', self.line, start_col))
-            elif kind == 'SKIP':
-                pass
-            elif kind == 'COMMENT':
-                # ignore comment till line end
-                break
-            elif kind == 'ID':
+            if kind == 'ID':
                 lowered = value.lower()
-                if lowered in self.KEYWORDS:
-                    self.tokens.append(Token(lowered.upper(), value, self.line, start_col))
-                elif lowered in self.BOOL_LITERALS:
-                    self.tokens.append(Token('BOOL', lowered == 'true', self.line, start_col))
+                keyword = keyword_ids.get(lowered)
+                if keyword is not None:
+                    yield Token(keyword, value, line, start - line_start + 1)
+                elif lowered in bool_literals:
+                    yield Token(BOOL, lowered == 'true', line, start - line_start + 1)
                 else:
-                    self.tokens.append(Token('ID', value, self.line, start_col))
+                    yield Token(ID, intern(value), line, start - line_start + 1)
+            elif kind == 'NEWLINE':
+                if depth:
+                    line += raw.count(newline)
+                    line_start = start + raw.rfind(newline) + 1
+                    continue
+                yield Token(NEWLINE, '', line, start - line_start + 1)
+                line += raw.count(newline)
+                line_start = start + raw.rfind(newline) + 1
+                if match.end() == length:
+                    break
+                # Indentation of the next non-blank line
+                indent = match.end() - line_start
+                if indent > indents[-1]:
+                    indents.append(indent)
+                    yield Token(INDENT, '', line, 1)
+                while indent < indents[-1]:
+                    indents.pop()
+                    yield Token(DEDENT, '', line, 1)
+            elif kind == 'SKIP' or kind == 'COMMENT':
+                pass
             elif kind == 'STRING' or kind == 'TRIPLE_STRING':
                 # Strip quotes and unescape
                 if kind == 'STRING':
                     val = bytes(value[1:-1], "utf-8").decode("unicode_escape")
                 else:
                     val = bytes(value[3:-3], "utf-8").decode("unicode_escape")
-                self.tokens.append(Token('STRING', val, self.line, start_col))
+                yield Token(STRING, val, line, start - line_start + 1)
+                last = raw.rfind(newline)
+                if last >= 0:
+                    line += raw.count(newline)
+                    line_start = start + last + 1
             elif kind == 'NUMBER':
                 if '.' in value:
-                    self.tokens.append(Token('FLOAT', float(value), self.line, start_col))
+                    yield Token(FLOAT, float(value), line, start - line_start + 1)
                 else:
-                    self.tokens.append(Token('INT', int(value), self.line, start_col))
-            elif kind == 'SEMICOLON':
-                self.tokens.append(Token('SEMICOLON', value, self.line, start_col))
+                    yield Token(INT, int(value), line, start - line_start + 1)
             elif kind == 'UNKNOWN':
-                raise LexerError(f'Unknown token {value} at line {self.line} col {start_col}')
+                raise LexerError(f'Unknown token {value} at line {line} col {start - line_start + 1}')
             else:
-                self.tokens.append(Token(kind, value, self.line, start_col))
-            pos = match.end()
+                if kind in opening:
+                    depth += 1
+                elif kind in closing and depth:
+                    depth -= 1
+                yield Token(kind_ids[kind], value, line, start - line_start + 1)
+
+        while len(indents) > 1:
+            indents.pop()
+            yield Token(DEDENT, '', line, 1)
+
+        self.line = line
+        yield Token(EOF, '', line, 1)
 
-    def peek(self):
-        if self.token_index < len(self.tokens):
-            return self.tokens[self.token_index]
-        return None
+    def compact(self):
+        # Scans the whole source into a TokenBuffer: same tokens as scan(),
+        # stored as integer columns instead of Token tuples
+        code = self.code
+        binary = not isinstance(code, str)
+        regex, leading = (self.bytes_regex, self.bytes_leading) if binary else (self.regex, self.leading)
+        newline = b'\n' if binary else '\n'
+        dot = b'.' if binary else '.'
+        keyword_ids = KEYWORD_IDS
+        bool_literals = self.BOOL_LITERALS
+        kind_ids = KIND_IDS
+        indents = self.indents
+        opening, closing = self.OPENING, self.CLOSING
+        depth = 0
+        length = self.length
+        line = self.line
+
+        tokens = TokenBuffer(code)
+        kinds, starts, lengths, lines = tokens.kinds, tokens.starts, tokens.lengths, tokens.lines
+
+        def add(kind, start, size):
+            kinds.append(kind)
+            starts.append(start)
+            lengths.append(size)
+            lines.append(line)
+
+        match = leading.match(code)
+        head = match.group()
+        line += head.count(newline)
+        line_start = head.rfind(newline) + 1
+        indent = len(head) - line_start
+        if indent and match.end() < length:
+            indents.append(indent)
+            add(INDENT, line_start, 0)
+
+        for match in regex.finditer(code, match.end()):
+            kind = match.lastgroup
+            start, end = match.span(kind)
+            if kind == 'ID':
+                raw = match.group(kind)
+                lowered = (raw.decode('utf-8') if binary else raw).lower()
+                keyword = keyword_ids.get(lowered)
+                if keyword is not None:
+                    add(keyword, start, end - start)
+                elif lowered in bool_literals:
+                    add(BOOL, start, end - start)
+                else:
+                    add(ID, start, end - start)
+            elif kind == 'NEWLINE':
+                raw = match.group(kind)
+                if depth:
+                    line += raw.count(newline)
+                    line_start = start + raw.rfind(newline) + 1
+                    continue
+                add(NEWLINE, start, 0)
+                line += raw.count(newline)
+                line_start = start + raw.rfind(newline) + 1
+                if match.end() == length:
+                    break
+                indent = match.end() - line_start
+                if indent > indents[-1]:
+                    indents.append(indent)
+                    add(INDENT, line_start, 0)
+                while indent < indents[-1]:
+                    indents.pop()
+                    add(DEDENT, line_start, 0)
+            elif kind == 'SKIP' or kind == 'COMMENT':
+                pass
+            elif kind == 'NUMBER':
+                add(FLOAT if dot in match.group(kind) else INT, start, end - start)
+            elif kind == 'STRING' or kind == 'TRIPLE_STRING':
+                add(kind_ids[kind], start, end - start)
+                raw = match.group(kind)
+                last = raw.rfind(newline)
+                if last >= 0:
+                    line += raw.count(newline)
+                    line_start = start + last + 1
+            elif kind == 'UNKNOWN':
+                value = match.group(kind)
+                if binary:
+                    value = value.decode('utf-8', 'replace')
+                raise LexerError(f'Unknown token {value} at line {line} col {start - line_start + 1}')
+            else:
+                if kind in opening:
+                    depth += 1
+                elif kind in closing and depth:
+                    depth -= 1
+                add(kind_ids[kind], start, end - start)
+
+        while len(indents) > 1:
+            indents.pop()
+            add(DEDENT, line_start, 0)
+
+        self.line = line
+        add(EOF, line_start, 0)
+        return tokens
+
+    def _pull(self):
+        if self.stream is None:
+            if self.tokens:
+                self.stream = islice(self.tokens, self.token_index, None)
+            else:
+                self.stream = self.scan()
+        return next(self.stream, None)
+
+    def peek(self, offset=0):
+        if offset >= self.MAX_LOOKAHEAD:
+            raise LexerError(f'Lookahead of {offset + 1} tokens exceeds {self.MAX_LOOKAHEAD}')
+        while len(self.lookahead) <= offset:
+            tok = self._pull()
+            if tok is None:
+                return None
+            self.lookahead.append(tok)
+        return self.lookahead[offset]
 
     def next_token(self):
-        if self.token_index < len(self.tokens):
-            tok = self.tokens[self.token_index]
+        if self.lookahead:
+            tok = self.lookahead.popleft()
+        else:
+            tok = self._pull()
+        if tok is not None:
             self.token_index += 1
-            return tok
-        return None
+        return tok
+
+
+# Token kinds as small integers: Token.type in the tokens scan() yields, and
+# the kind column of a TokenBuffer. TRIPLE_STRING is kept apart from STRING
+# in the buffer only so its value knows which quotes to strip; tokens read
+# from either have type STRING. KINDS[type] names a kind in messages.
+KINDS = (
+    'EOF', 'NEWLINE', 'INDENT', 'DEDENT', 'ID', 'INT', 'FLOAT', 'BOOL',
+    'STRING', 'TRIPLE_STRING', 'OP', 'SEMICOLON', 'LPAREN', 'RPAREN', 'COMMA',
+    'COLON', 'LEFT_BRACKET', 'RIGHT_BRACKET', 'LEFT_BRACE', 'RIGHT_BRACE', 'DOT',
+) + tuple(sorted(keyword.upper() for keyword in Lexer.KEYWORDS))
+KIND_IDS = {kind: i for i, kind in enumerate(KINDS)}
+(EOF, NEWLINE, INDENT, DEDENT, ID, INT, FLOAT, BOOL, STRING, TRIPLE_STRING,
+ OP, SEMICOLON, LPAREN, RPAREN, COMMA, COLON, LEFT_BRACKET, RIGHT_BRACKET, LEFT_BRACE, RIGHT_BRACE, DOT,
+ AS, CATCH, ELSE, FROM, FUNC, IF, IMPORT, MEMO, PURE, RAISE, RETURN, TRY, WHILE) = range(len(KINDS))
+KEYWORD_IDS = {keyword: KIND_IDS[keyword.upper()] for keyword in Lexer.KEYWORDS}
+TYPE_IDS = tuple(STRING if kind == TRIPLE_STRING else kind for kind in range(len(KINDS)))
+
+
+class TokenBuffer:
+    # Struct-of-arrays token storage: parallel array('i') columns of kind id,
+    # start offset, length and line, 16 bytes per token. Values and columns are
+    # decoded from the source buffer only when a token is read. Offers the same
+    # next_token()/peek() interface as Lexer, so a Parser can consume either.
+    def __init__(self, code):
+        self.code = code  # str, bytes or mmap
+        self.binary = not isinstance(code, str)
+        self.kinds = array('i')
+        self.starts = array('i')
+        self.lengths = array('i')
+        self.lines = array('i')
+        self.index = 0
+        # Start offset of the line last asked for, so a long line is searched
+        # for its start once rather than once per token
+        self.column_line = None
+        self.line_start = 0
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        return self.token(i)
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self.token(i)
+
+    def type(self, i):
+        return TYPE_IDS[self.kinds[i]]
+
+    def text(self, i):
+        start = self.starts[i]
+        text = self.code[start:start + self.lengths[i]]
+        return text.decode('utf-8') if self.binary else text
+
+    def value(self, i):
+        kind = self.kinds[i]
+        if kind == ID:
+            return sys.intern(self.text(i))
+        if kind == INT:
+            return int(self.text(i))
+        if kind == FLOAT:
+            return float(self.text(i))
+        if kind == BOOL:
+            return self.text(i).lower() == 'true'
+        if kind == STRING:
+            return bytes(self.text(i)[1:-1], "utf-8").decode("unicode_escape")
+        if kind == TRIPLE_STRING:
+            return bytes(self.text(i)[3:-3], "utf-8").decode("unicode_escape")
+        return self.text(i)
+
+    def column(self, i):
+        start = self.starts[i]
+        if self.lines[i] != self.column_line:
+            self.column_line = self.lines[i]
+            self.line_start = self.code.rfind(b'\n' if self.binary else '\n', 0, start)
+        return start - self.line_start
+
+    def token(self, i):
+        return Token(TYPE_IDS[self.kinds[i]], self.value(i), self.lines[i], self.column(i))
+
+    def peek(self, offset=0):
+        i = self.index + offset
+        return self.token(i) if i < len(self.kinds) else None
+
+    def next_token(self):
+        i = self.index
+        if i >= len(self.kinds):
+            return None
+        self.index = i + 1
+        return self.token(i)
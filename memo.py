@@ -0,0 +1,239 @@
+# memo.py
+#
+# Support for `pure func` and `memo func`. Both are checked for purity when
+# the program is resolved or compiled: the body may only use its own
+# parameters and locals and may only call builtins without side effects and
+# other pure functions. A memo function's results are also cached per
+# argument tuple, in an LRU cache bounded by entry count and by an estimate
+# of the bytes it holds.
+#
+# Limits default to IJICHI_MEMO_ENTRIES / IJICHI_MEMO_BYTES when set.
+
+import os
+import sys
+from collections import OrderedDict
+
+from ast_nodes import *
+from stdlib import PURE as PURE_BUILTINS
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("IJICHI_MEMO_ENTRIES") or 4096)
+DEFAULT_MAX_BYTES = int(os.environ.get("IJICHI_MEMO_BYTES") or 4 * 1024 * 1024)
+
+MISS = object()  # lookup() result when the arguments are not cached
+
+
+def marked_functions(statements):
+    # Names of every function marked pure or memo, nested ones included
+    names = set()
+    for node in walk(statements):
+        if isinstance(node, FunctionDef) and node.modifier is not None:
+            names.add(node.name)
+    return names
+
+
+def defined_functions(statements):
+    # Names of every function defined, nested ones included
+    return {node.name for node in walk(statements) if isinstance(node, FunctionDef)}
+
+
+def walk(statements):
+    for stmt in statements:
+        yield stmt
+        if isinstance(stmt, FunctionDef):
+            yield from walk(stmt.body)
+        elif isinstance(stmt, IfStatement):
+            yield from walk(stmt.then_body)
+            yield from walk(stmt.else_body or [])
+        elif isinstance(stmt, WhileLoop):
+            yield from walk(stmt.body)
+        elif isinstance(stmt, TryStatement):
+            yield from walk(stmt.try_body)
+            yield from walk(stmt.catch_body)
+
+
+def impurity(func, pure, defined):
+    # Why the marked FunctionDef func is not pure, or None. pure is the set
+    # of function names that are themselves marked, defined every function
+    # the program defines; those shadow builtins of the same name.
+    local = {name for _, name in func.params}
+    for node in walk(func.body):
+        if isinstance(node, VariableDeclaration):
+            local.add(node.name)
+        elif isinstance(node, TryStatement):
+            local.add(node.catch_name)
+    return Purity(func, local, pure, defined).check()
+
+
+class Purity:
+    def __init__(self, func, local, pure, defined):
+        self.func = func
+        self.local = local
+        self.pure = pure
+        self.defined = defined
+
+    def check(self):
+        for stmt in walk(self.func.body):
+            reason = self.statement(stmt)
+            if reason is not None:
+                return f"{self.func.modifier} function '{self.func.name}' {reason}"
+        return None
+
+    def statement(self, node):
+        if isinstance(node, FunctionDef):
+            return f"defines nested function '{node.name}'"
+        if isinstance(node, ImportStatement):
+            return "imports a module"
+        if isinstance(node, Assignment) and node.name not in self.local:
+            return f"assigns non-local variable '{node.name}'"
+        for expr in self.expressions(node):
+            reason = self.expression(expr)
+            if reason is not None:
+                return reason
+        return None
+
+    def expressions(self, node):
+        # The expressions evaluated directly by a statement
+        if isinstance(node, VariableDeclaration):
+            return [node.initializer]
+        if isinstance(node, (Assignment, ReturnStatement, RaiseStatement)):
+            return [node.value]
+        if isinstance(node, (IfStatement, WhileLoop)):
+            return [node.condition]
+        if isinstance(node, TryStatement):
+            return []
+        return [node]
+
+    def expression(self, node):
+        if isinstance(node, VariableReference):
+            if node.name not in self.local:
+                return f"reads non-local variable '{node.name}'"
+        elif isinstance(node, FunctionCall):
+            if node.target is not None:
+                return f"calls module function '{node.name}'"
+            builtin = node.name not in self.defined and node.name in PURE_BUILTINS
+            if node.name not in self.pure and not builtin:
+                return f"calls '{node.name}', which is not marked pure"
+            return self.first(node.args)
+        elif isinstance(node, MemberAccess):
+            return f"reads module member '{node.name}'"
+        elif isinstance(node, BinaryOperation):
+            return self.first([node.left, node.right])
+        elif isinstance(node, ListLiteralNode):
+            return self.first(node.elements)
+        elif isinstance(node, DictLiteralNode):
+            return self.first([part for pair in node.pairs for part in pair])
+        elif isinstance(node, IndexAccessNode):
+            return self.first([node.container, node.index])
+        return None
+
+    def first(self, nodes):
+        for node in nodes:
+            reason = self.expression(node)
+            if reason is not None:
+                return reason
+        return None
+
+
+def sizeof(value):
+    # Rough size in bytes of a cached argument or result, containers included
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(sizeof(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    return size
+
+
+class MemoCache:
+    def __init__(self, name, max_entries=None, max_bytes=None):
+        self.name = name
+        self.max_entries = DEFAULT_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self.entries = OrderedDict()  # key -> (value, size), least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, args):
+        # Types are part of the key: f(1), f(1.0) and f(true) compare equal
+        # but need not return the same thing
+        return tuple(args), tuple(map(type, args))
+
+    def lookup(self, args):
+        try:
+            key = self.key(args)
+            value, _ = self.entries[key]
+        except (KeyError, TypeError):  # TypeError: unhashable argument, never cached
+            self.misses += 1
+            return MISS
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def store(self, args, value):
+        key = self.key(args)
+        try:
+            hash(key)
+        except TypeError:
+            return
+        size = sizeof(key[0]) + sizeof(value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def wrap(self, function):
+        # function, with calls served from this cache
+        def memoized(*args):
+            value = self.lookup(args)
+            if value is MISS:
+                value = function(*args)
+                self.store(args, value)
+            return value
+        return memoized
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
+
+
+class MemoTable:
+    # The caches of one executor or VM, by function name, all with the same limits
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.caches = {}
+
+    def cache(self, name):
+        cache = self.caches.get(name)
+        if cache is None:
+            cache = self.caches[name] = MemoCache(name, self.max_entries, self.max_bytes)
+        return cache
+
+    def get(self, name):
+        return self.caches.get(name)
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+    def report(self):
+        return "\n".join(
+            f"memo {name}: " + ", ".join(f"{key} {value}" for key, value in stats.items())
+            for name, stats in self.stats().items())
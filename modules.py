@@ -0,0 +1,177 @@
+# modules.py
+#
+# Loading of imported .iji files. The registry keeps one parsed Program per
+# resolved path, reused for as long as the file's mtime is unchanged, so a
+# module imported from many places is read and parsed once per process.
+# build() discovers the import graph of an entry file up front and parses
+# its modules in a process pool before anything runs.
+#
+# A long-lived process (serve.py) sets by_content instead: every load then
+# reads the file and reuses the parsed Program only while a digest of the
+# source is unchanged, so an edit is never missed because the mtime did not
+# move, and touching a file does not cost a reparse.
+#
+#   python modules.py [-j workers] <entry.iji>
+
+import hashlib
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+SOURCE_SUFFIX = ".iji"
+
+# import "path" / import name, at the start of a line; only used to discover
+# the graph, the parser is what actually reads import statements
+IMPORT_PATTERN = re.compile(rb'^[ \t]*import[ \t]+(?:"((?:[^"\\\r\n]|\\.)*)"|([A-Za-z_][A-Za-z0-9_]*))', re.MULTILINE)
+
+
+class ModuleError(Exception):
+    pass
+
+
+def module_path(name, base_dir=None):
+    if not name.endswith(SOURCE_SUFFIX):
+        name += SOURCE_SUFFIX
+    return os.path.realpath(os.path.join(base_dir or os.getcwd(), name))
+
+
+def parse_file(path):
+    from lexer import Lexer
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        raise ModuleError(f"Import failed: File '{path}' not found")
+    return (mtime,) + parse(Lexer.from_file(path))
+
+
+def parse(lexer):
+    from parser import Parser
+    from vectorize import vectorize
+    from concat import concat
+    parser = Parser(lexer)
+    program = parser.parse()
+    vectorize(program)
+    concat(program)
+    return program, parser.errors
+
+
+def scan_imports(path):
+    # Paths imported by the file at path, resolved relative to its directory
+    with open(path, "rb") as f:
+        source = f.read()
+    base_dir = os.path.dirname(path)
+    found = []
+    for match in IMPORT_PATTERN.finditer(source):
+        name = (match.group(1) or match.group(2)).decode("utf-8")
+        found.append(module_path(name, base_dir))
+    return found
+
+
+class ModuleRegistry:
+    def __init__(self, by_content=False):
+        self.entries = {}  # resolved path -> (mtime_ns, Program, parse errors)
+        self.by_content = by_content
+        self.digests = {}  # resolved path -> digest of the source parsed, with by_content
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path):
+        if self.by_content:
+            return self.load_by_content(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            raise ModuleError(f"Import failed: File '{path}' not found")
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != mtime:
+            entry = self.entries[path] = parse_file(path)
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry[1]
+
+    def load_by_content(self, path):
+        from lexer import Lexer
+        try:
+            with open(path, "rb") as f:
+                source = f.read()
+                mtime = os.fstat(f.fileno()).st_mtime_ns
+        except OSError:
+            raise ModuleError(f"Import failed: File '{path}' not found")
+        digest = hashlib.blake2b(source, digest_size=16).digest()
+        entry = self.entries.get(path)
+        if entry is None or self.digests.get(path) != digest:
+            entry = self.entries[path] = (mtime,) + parse(Lexer(source))
+            self.digests[path] = digest
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry[1]
+
+    def errors(self, path):
+        entry = self.entries.get(path)
+        return entry[2] if entry else []
+
+    def discover(self, entry):
+        # Every module reachable from entry, in breadth-first order
+        order = [entry]
+        seen = {entry}
+        for path in order:
+            if not os.path.exists(path):
+                continue
+            for dep in scan_imports(path):
+                if dep not in seen:
+                    seen.add(dep)
+                    order.append(dep)
+        return order
+
+    def stale(self, path):
+        entry = self.entries.get(path)
+        return entry is None or entry[0] != os.stat(path).st_mtime_ns
+
+    def build(self, entry, workers=None):
+        # Parses the whole import graph of entry. Modules do not depend on
+        # each other to parse, so every missing or stale one goes to the pool
+        # at once.
+        paths = [path for path in self.discover(module_path(entry))
+                 if os.path.exists(path) and self.stale(path)]
+        if len(paths) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for path, parsed in zip(paths, pool.map(parse_file, paths)):
+                    self.entries[path] = parsed
+        else:
+            for path in paths:
+                self.entries[path] = parse_file(path)
+        return paths
+
+
+REGISTRY = ModuleRegistry()
+
+
+def main(argv):
+    workers = None
+    if "-j" in argv:
+        i = argv.index("-j")
+        workers = int(argv[i + 1])
+        del argv[i:i + 2]
+    if len(argv) != 1:
+        print("Usage: python modules.py [-j workers] <entry.iji>")
+        return 1
+    start = time.perf_counter()
+    built = REGISTRY.build(argv[0], workers)
+    elapsed = time.perf_counter() - start
+    status = 0
+    for path in built:
+        errors = REGISTRY.errors(path)
+        print(f"{path}: {len(errors)} errors" if errors else path)
+        for error in errors:
+            print(f"    {error}")
+        status = status or (1 if errors else 0)
+    print(f"{len(built)} modules built in {elapsed * 1000:.1f} ms")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
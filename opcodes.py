@@ -0,0 +1,350 @@
+# opcodes.py
+
+# === Opcode Numbers ===
+# Dense integers so the VM can dispatch through a list indexed by opcode.
+LOAD_CONST = 0
+LOAD_VAR = 1
+STORE_VAR = 2
+BINARY_ADD = 3
+BINARY_SUBTRACT = 4
+BINARY_MULTIPLY = 5
+BINARY_DIVIDE = 6
+CALL_FUNCTION = 7
+RETURN_VALUE = 8
+
+# Superinstructions: LOAD_VAR followed by LOAD_CONST / LOAD_VAR and a binary op
+VAR_CONST_ADD = 9
+VAR_CONST_SUBTRACT = 10
+VAR_CONST_MULTIPLY = 11
+VAR_CONST_DIVIDE = 12
+VAR_VAR_ADD = 13
+VAR_VAR_SUBTRACT = 14
+VAR_VAR_MULTIPLY = 15
+VAR_VAR_DIVIDE = 16
+
+# Stores the top of the stack without popping it (STORE_VAR x; LOAD_VAR x)
+STORE_LOAD_VAR = 17
+
+POP_TOP = 18
+
+COMPARE_EQ = 19
+COMPARE_NE = 20
+COMPARE_LT = 21
+COMPARE_LE = 22
+COMPARE_GT = 23
+COMPARE_GE = 24
+
+# Typed instructions, emitted where the declared types prove the operand
+# types and installed by the VM when it quickens a generic instruction.
+# Each checks its operands and deoptimizes to the *_GENERIC form on a miss.
+ADD_INT = 25
+SUBTRACT_INT = 26
+MULTIPLY_INT = 27
+DIVIDE_INT = 28
+ADD_FLOAT = 29
+SUBTRACT_FLOAT = 30
+MULTIPLY_FLOAT = 31
+DIVIDE_FLOAT = 32
+CONCAT_STR = 33
+EQ_INT = 34
+NE_INT = 35
+LT_INT = 36
+LE_INT = 37
+GT_INT = 38
+GE_INT = 39
+EQ_FLOAT = 40
+NE_FLOAT = 41
+LT_FLOAT = 42
+LE_FLOAT = 43
+GT_FLOAT = 44
+GE_FLOAT = 45
+
+# Generic instructions that stopped adapting after a type miss. The compiler
+# never emits these; BINARY_* and COMPARE_* quicken on first execution.
+BINARY_ADD_GENERIC = 46
+BINARY_SUBTRACT_GENERIC = 47
+BINARY_MULTIPLY_GENERIC = 48
+BINARY_DIVIDE_GENERIC = 49
+COMPARE_EQ_GENERIC = 50
+COMPARE_NE_GENERIC = 51
+COMPARE_LT_GENERIC = 52
+COMPARE_LE_GENERIC = 53
+COMPARE_GT_GENERIC = 54
+COMPARE_GE_GENERIC = 55
+
+# Control flow. Jump targets are absolute offsets into the code array.
+JUMP = 56
+POP_JUMP_IF_FALSE = 57
+POP_JUMP_IF_TRUE = 58
+# Fused compare-and-branch: pops two operands, jumps unless the comparison holds
+JUMP_IF_NOT_EQ = 59
+JUMP_IF_NOT_NE = 60
+JUMP_IF_NOT_LT = 61
+JUMP_IF_NOT_LE = 62
+JUMP_IF_NOT_GT = 63
+JUMP_IF_NOT_GE = 64
+# Bottom of a counted while loop: var += constant, then jump back while var < popped bound
+COUNTED_LOOP = 65
+
+# Top-level variables, from inside a function
+LOAD_GLOBAL = 66
+STORE_GLOBAL = 67
+
+BUILD_LIST = 68
+BUILD_DICT = 69
+BINARY_SUBSCR = 70
+
+# Raises an error whose message is the popped value. try blocks have no
+# instructions: Compiler.exception_table maps code ranges to their handlers.
+RAISE = 71
+
+# Joins the top n values of an all-string + chain in one go
+BUILD_STRING = 72
+
+# Call of a builtin (stdlib.py), bound at compile time: the operands are the
+# constant holding its name and the argument count. The VM maps the constant
+# to the function once, when it loads the program.
+CALL_BUILTIN = 73
+
+# First instruction of the program and of every function body. Operands:
+# the number of local variable slots in the frame and the deepest the
+# operand stack gets in its code, both filled in by the compiler. Run on
+# entry, it sizes the frame so that no store has to grow it.
+ENTER = 74
+
+# Calls linked by the VM when it loads a program, or when tier-up has
+# decided about the callee; the compiler never emits these. CALL_DIRECT's
+# operands are the callee's entry offset and the argument count: it builds
+# the whole frame and continues after the callee's ENTER. CALL_NATIVE keeps
+# CALL_FUNCTION's operands and calls the callee's tier-up translation.
+CALL_DIRECT = 75
+CALL_NATIVE = 76
+
+OPNAMES = [
+    "LOAD_CONST", "LOAD_VAR", "STORE_VAR",
+    "BINARY_ADD", "BINARY_SUBTRACT", "BINARY_MULTIPLY", "BINARY_DIVIDE",
+    "CALL_FUNCTION", "RETURN_VALUE",
+    "VAR_CONST_ADD", "VAR_CONST_SUBTRACT", "VAR_CONST_MULTIPLY", "VAR_CONST_DIVIDE",
+    "VAR_VAR_ADD", "VAR_VAR_SUBTRACT", "VAR_VAR_MULTIPLY", "VAR_VAR_DIVIDE",
+    "STORE_LOAD_VAR",
+    "POP_TOP",
+    "COMPARE_EQ", "COMPARE_NE", "COMPARE_LT", "COMPARE_LE", "COMPARE_GT", "COMPARE_GE",
+    "ADD_INT", "SUBTRACT_INT", "MULTIPLY_INT", "DIVIDE_INT",
+    "ADD_FLOAT", "SUBTRACT_FLOAT", "MULTIPLY_FLOAT", "DIVIDE_FLOAT",
+    "CONCAT_STR",
+    "EQ_INT", "NE_INT", "LT_INT", "LE_INT", "GT_INT", "GE_INT",
+    "EQ_FLOAT", "NE_FLOAT", "LT_FLOAT", "LE_FLOAT", "GT_FLOAT", "GE_FLOAT",
+    "BINARY_ADD_GENERIC", "BINARY_SUBTRACT_GENERIC", "BINARY_MULTIPLY_GENERIC", "BINARY_DIVIDE_GENERIC",
+    "COMPARE_EQ_GENERIC", "COMPARE_NE_GENERIC", "COMPARE_LT_GENERIC",
+    "COMPARE_LE_GENERIC", "COMPARE_GT_GENERIC", "COMPARE_GE_GENERIC",
+    "JUMP", "POP_JUMP_IF_FALSE", "POP_JUMP_IF_TRUE",
+    "JUMP_IF_NOT_EQ", "JUMP_IF_NOT_NE", "JUMP_IF_NOT_LT",
+    "JUMP_IF_NOT_LE", "JUMP_IF_NOT_GT", "JUMP_IF_NOT_GE",
+    "COUNTED_LOOP",
+    "LOAD_GLOBAL", "STORE_GLOBAL",
+    "BUILD_LIST", "BUILD_DICT", "BINARY_SUBSCR",
+    "RAISE",
+    "BUILD_STRING",
+    "CALL_BUILTIN",
+    "ENTER",
+    "CALL_DIRECT", "CALL_NATIVE",
+]
+
+OPCODES = {name: op for op, name in enumerate(OPNAMES)}
+
+# Number of operands that follow each opcode in the flat code array
+OPERAND_COUNTS = [
+    1, 1, 1,
+    0, 0, 0, 0,
+    2, 0,
+    2, 2, 2, 2,
+    2, 2, 2, 2,
+    1,
+    0,
+    0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0,
+    0, 0, 0, 0,
+    0,
+    0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0,
+    1, 1, 1,
+    1, 1, 1,
+    1, 1, 1,
+    3,
+    1, 1,
+    1, 1, 0,
+    0,
+    1,
+    2,
+    2,
+    2, 2,
+]
+
+# Net change in operand stack depth per opcode; None where it depends on
+# the operands (see stack_effect)
+STACK_EFFECTS = [
+    1, 1, -1,
+    -1, -1, -1, -1,
+    None, -1,
+    1, 1, 1, 1,
+    1, 1, 1, 1,
+    0,
+    -1,
+    -1, -1, -1, -1, -1, -1,
+    -1, -1, -1, -1,
+    -1, -1, -1, -1,
+    -1,
+    -1, -1, -1, -1, -1, -1,
+    -1, -1, -1, -1, -1, -1,
+    -1, -1, -1, -1,
+    -1, -1, -1, -1, -1, -1,
+    0, -1, -1,
+    -2, -2, -2,
+    -2, -2, -2,
+    -1,
+    1, -1,
+    None, None, -1,
+    -1,
+    None,
+    None,
+    0,
+    None, None,
+]
+
+BINARY_OPS = {
+    "+": BINARY_ADD,
+    "-": BINARY_SUBTRACT,
+    "*": BINARY_MULTIPLY,
+    "/": BINARY_DIVIDE,
+    "==": COMPARE_EQ,
+    "!=": COMPARE_NE,
+    "<": COMPARE_LT,
+    "<=": COMPARE_LE,
+    ">": COMPARE_GT,
+    ">=": COMPARE_GE,
+}
+
+# (generic opcode, operand type) -> typed opcode. Operand types are the
+# declared type names: "int", "float" (int/float mixes) and "string".
+TYPED_OPS = {
+    (BINARY_ADD, "int"): ADD_INT,
+    (BINARY_SUBTRACT, "int"): SUBTRACT_INT,
+    (BINARY_MULTIPLY, "int"): MULTIPLY_INT,
+    (BINARY_DIVIDE, "int"): DIVIDE_INT,
+    (BINARY_ADD, "float"): ADD_FLOAT,
+    (BINARY_SUBTRACT, "float"): SUBTRACT_FLOAT,
+    (BINARY_MULTIPLY, "float"): MULTIPLY_FLOAT,
+    (BINARY_DIVIDE, "float"): DIVIDE_FLOAT,
+    (BINARY_ADD, "string"): CONCAT_STR,
+    (COMPARE_EQ, "int"): EQ_INT,
+    (COMPARE_NE, "int"): NE_INT,
+    (COMPARE_LT, "int"): LT_INT,
+    (COMPARE_LE, "int"): LE_INT,
+    (COMPARE_GT, "int"): GT_INT,
+    (COMPARE_GE, "int"): GE_INT,
+    (COMPARE_EQ, "float"): EQ_FLOAT,
+    (COMPARE_NE, "float"): NE_FLOAT,
+    (COMPARE_LT, "float"): LT_FLOAT,
+    (COMPARE_LE, "float"): LE_FLOAT,
+    (COMPARE_GT, "float"): GT_FLOAT,
+    (COMPARE_GE, "float"): GE_FLOAT,
+}
+
+# Adaptive generic opcode -> the form it settles into after a type miss
+GENERIC_OPS = {
+    BINARY_ADD: BINARY_ADD_GENERIC,
+    BINARY_SUBTRACT: BINARY_SUBTRACT_GENERIC,
+    BINARY_MULTIPLY: BINARY_MULTIPLY_GENERIC,
+    BINARY_DIVIDE: BINARY_DIVIDE_GENERIC,
+    COMPARE_EQ: COMPARE_EQ_GENERIC,
+    COMPARE_NE: COMPARE_NE_GENERIC,
+    COMPARE_LT: COMPARE_LT_GENERIC,
+    COMPARE_LE: COMPARE_LE_GENERIC,
+    COMPARE_GT: COMPARE_GT_GENERIC,
+    COMPARE_GE: COMPARE_GE_GENERIC,
+}
+
+# Comparison (generic) -> fused compare-and-branch taken when it is false
+COMPARE_JUMPS = {
+    COMPARE_EQ: JUMP_IF_NOT_EQ,
+    COMPARE_NE: JUMP_IF_NOT_NE,
+    COMPARE_LT: JUMP_IF_NOT_LT,
+    COMPARE_LE: JUMP_IF_NOT_LE,
+    COMPARE_GT: JUMP_IF_NOT_GT,
+    COMPARE_GE: JUMP_IF_NOT_GE,
+}
+
+# Opcode -> index of its jump target operand
+JUMP_TARGETS = {
+    JUMP: 0, POP_JUMP_IF_FALSE: 0, POP_JUMP_IF_TRUE: 0,
+    JUMP_IF_NOT_EQ: 0, JUMP_IF_NOT_NE: 0, JUMP_IF_NOT_LT: 0,
+    JUMP_IF_NOT_LE: 0, JUMP_IF_NOT_GT: 0, JUMP_IF_NOT_GE: 0,
+    COUNTED_LOOP: 2,
+}
+
+# Opcode -> index of its constant-table operand
+CONST_OPERANDS = {LOAD_CONST: 0, CALL_FUNCTION: 0, CALL_BUILTIN: 0, CALL_NATIVE: 0, COUNTED_LOOP: 1}
+
+# Calls of every kind; the argument count is always the second operand
+CALLS = (CALL_FUNCTION, CALL_BUILTIN, CALL_DIRECT, CALL_NATIVE)
+
+# Any typed or settled-generic opcode -> the adaptive generic one it stands for
+UNTYPED = {typed: generic for (generic, _), typed in TYPED_OPS.items()}
+UNTYPED.update({settled: generic for generic, settled in GENERIC_OPS.items()})
+
+# (first load, second load, binary op) -> fused opcode
+SUPERINSTRUCTIONS = {
+    (LOAD_VAR, LOAD_CONST, BINARY_ADD): VAR_CONST_ADD,
+    (LOAD_VAR, LOAD_CONST, BINARY_SUBTRACT): VAR_CONST_SUBTRACT,
+    (LOAD_VAR, LOAD_CONST, BINARY_MULTIPLY): VAR_CONST_MULTIPLY,
+    (LOAD_VAR, LOAD_CONST, BINARY_DIVIDE): VAR_CONST_DIVIDE,
+    (LOAD_VAR, LOAD_VAR, BINARY_ADD): VAR_VAR_ADD,
+    (LOAD_VAR, LOAD_VAR, BINARY_SUBTRACT): VAR_VAR_SUBTRACT,
+    (LOAD_VAR, LOAD_VAR, BINARY_MULTIPLY): VAR_VAR_MULTIPLY,
+    (LOAD_VAR, LOAD_VAR, BINARY_DIVIDE): VAR_VAR_DIVIDE,
+}
+
+
+def fuse(first, second, op):
+    # Typed binary ops fuse like their generic form; the fused instruction is untyped
+    return SUPERINSTRUCTIONS.get((first, second, UNTYPED.get(op, op)))
+
+
+# Net change in operand stack depth when an instruction runs
+def stack_effect(op, args):
+    if op in CALLS:
+        return 1 - args[1]
+    if op == BUILD_LIST or op == BUILD_STRING:
+        return 1 - args[0]
+    if op == BUILD_DICT:
+        return 1 - 2 * args[0]
+    return STACK_EFFECTS[op]
+
+
+# Yields (offset, opcode, operands) for each instruction in a flat code array
+def decode(code, start=0, end=None):
+    if end is None:
+        end = len(code)
+    ip = start
+    while ip < end:
+        op = code[ip]
+        argc = OPERAND_COUNTS[op]
+        yield ip, op, tuple(code[ip + 1:ip + 1 + argc])
+        ip += 1 + argc
+
+
+def disassemble(code, constants=()):
+    lines = []
+    for offset, op, args in decode(code):
+        text = f"{offset:>5} {OPNAMES[op]:<20}"
+        if args:
+            text += " " + ", ".join(str(a) for a in args)
+        const = CONST_OPERANDS.get(op)
+        if const is not None and args[const] < len(constants):
+            text += f"  ({constants[args[const]]!r})"
+        if op in JUMP_TARGETS:
+            text += f"  (to {args[JUMP_TARGETS[op]]})"
+        lines.append(text.rstrip())
+    return "\n".join(lines)
@@ -0,0 +1,199 @@
+# optimizer.py
+import operator
+
+from opcodes import (
+    LOAD_CONST, LOAD_VAR, STORE_VAR, STORE_LOAD_VAR, RETURN_VALUE, RAISE, JUMP,
+    BINARY_ADD, BINARY_SUBTRACT, BINARY_MULTIPLY, BINARY_DIVIDE,
+    COMPARE_EQ, COMPARE_NE, COMPARE_LT, COMPARE_LE, COMPARE_GT, COMPARE_GE,
+    SUPERINSTRUCTIONS, UNTYPED, CONST_OPERANDS, JUMP_TARGETS, OPERAND_COUNTS, decode, fuse,
+)
+
+FOLDABLE = {
+    BINARY_ADD: operator.add,
+    BINARY_SUBTRACT: operator.sub,
+    BINARY_MULTIPLY: operator.mul,
+    BINARY_DIVIDE: operator.truediv,
+    COMPARE_EQ: operator.eq,
+    COMPARE_NE: operator.ne,
+    COMPARE_LT: operator.lt,
+    COMPARE_LE: operator.le,
+    COMPARE_GT: operator.gt,
+    COMPARE_GE: operator.ge,
+}
+# Typed forms fold like the generic op they specialize
+FOLDABLE.update({typed: FOLDABLE[generic] for typed, generic in UNTYPED.items()})
+
+UNFUSED = {fused: ops for ops, fused in SUPERINSTRUCTIONS.items()}
+
+# Folded strings longer than this stay as runtime operations
+MAX_FOLDED_LENGTH = 4096
+
+
+class Instr:
+    def __init__(self, op, args, label=None, line=None):
+        self.op = op
+        self.args = args
+        self.label = label  # original offset if control can jump here
+        self.line = line  # source line starting at this instruction
+
+
+class Optimizer:
+    # Levels: 0 = off, 1 = constant folding and dead code elimination,
+    # 2 = level 1 plus store/load peephole
+    def __init__(self, compiler, level=1):
+        self.compiler = compiler
+        self.level = level
+
+    def optimize(self):
+        if self.level <= 0:
+            return
+        instrs = self.decode()
+        instrs = self.fold_constants(instrs)
+        instrs = self.remove_dead_code(instrs)
+        if self.level >= 2:
+            instrs = self.collapse_store_load(instrs)
+        self.compact_constants(instrs)
+        self.encode(instrs)
+
+    def decode(self):
+        # Superinstructions are expanded so every pass sees plain loads and ops;
+        # encode() fuses them again.
+        labels = self.compiler.labels | set(self.compiler.functions.values())
+        self.labels = labels | {len(self.compiler.instructions)}
+        lines = dict(self.compiler.line_table)
+        instrs = []
+        for offset, op, args in decode(self.compiler.instructions):
+            label = offset if offset in labels else None
+            line = lines.get(offset)
+            if op in UNFUSED:
+                first, second, binary = UNFUSED[op]
+                instrs.append(Instr(first, (args[0],), label, line))
+                instrs.append(Instr(second, (args[1],)))
+                instrs.append(Instr(binary, ()))
+            else:
+                instrs.append(Instr(op, args, label, line))
+        return instrs
+
+    def fold_constants(self, instrs):
+        constants = self.compiler.constants
+        out = []
+        for ins in instrs:
+            func = FOLDABLE.get(ins.op)
+            if (func is not None and ins.label is None and len(out) >= 2
+                    and out[-1].op == LOAD_CONST and out[-1].label is None
+                    and out[-2].op == LOAD_CONST):
+                try:
+                    value = func(constants[out[-2].args[0]], constants[out[-1].args[0]])
+                except Exception:
+                    # Leave it to fail at runtime with the usual error
+                    out.append(ins)
+                    continue
+                if isinstance(value, str) and len(value) > MAX_FOLDED_LENGTH:
+                    out.append(ins)
+                    continue
+                if out[-1].line is not None and out[-2].line is None:
+                    out[-2].line = out[-1].line
+                out.pop()
+                out[-1].args = (self.compiler.add_constant(value),)
+                continue
+            out.append(ins)
+        return out
+
+    def remove_dead_code(self, instrs):
+        out = []
+        reachable = True
+        for ins in instrs:
+            if ins.label is not None:
+                reachable = True
+            if not reachable:
+                continue
+            out.append(ins)
+            if ins.op == RETURN_VALUE or ins.op == RAISE or ins.op == JUMP:
+                reachable = False
+        return out
+
+    def collapse_store_load(self, instrs):
+        out = []
+        i = 0
+        while i < len(instrs):
+            ins = instrs[i]
+            nxt = instrs[i + 1] if i + 1 < len(instrs) else None
+            if nxt is not None and nxt.label is None and nxt.args == ins.args:
+                # x = x
+                if (ins.op == LOAD_VAR and nxt.op == STORE_VAR and ins.label is None
+                        and ins.line is None and nxt.line is None):
+                    i += 2
+                    continue
+                if ins.op == STORE_VAR and nxt.op == LOAD_VAR and not self.fuses(instrs, i + 1):
+                    out.append(Instr(STORE_LOAD_VAR, ins.args, ins.label, ins.line))
+                    if nxt.line is not None and i + 2 < len(instrs) and instrs[i + 2].line is None:
+                        # The load's statement now starts after it
+                        instrs[i + 2].line = nxt.line
+                    i += 2
+                    continue
+            out.append(ins)
+            i += 1
+        return out
+
+    def fuses(self, instrs, i):
+        # Whether instrs[i] will become the head of a superinstruction on encode
+        if i + 2 >= len(instrs):
+            return False
+        second, binary = instrs[i + 1], instrs[i + 2]
+        if second.label is not None or binary.label is not None:
+            return False
+        return fuse(instrs[i].op, second.op, binary.op) is not None
+
+    def compact_constants(self, instrs):
+        compiler = self.compiler
+        old = compiler.constants
+        remap = {}
+        constants = []
+        for ins in instrs:
+            pos = CONST_OPERANDS.get(ins.op)
+            if pos is not None:
+                idx = ins.args[pos]
+                if idx not in remap:
+                    remap[idx] = len(constants)
+                    constants.append(old[idx])
+                ins.args = ins.args[:pos] + (remap[idx],) + ins.args[pos + 1:]
+        old[:] = constants
+        compiler.constant_indices = {(type(v), v): i for i, v in enumerate(constants)}
+
+    def encode(self, instrs):
+        compiler = self.compiler
+        del compiler.instructions[:]
+        compiler.recent = []
+        compiler.labels = set()
+        compiler.line_table = []
+        code = compiler.instructions
+        moved = {}
+        jumps = []  # (operand offset, old target)
+        for ins in instrs:
+            if ins.label is not None:
+                moved[ins.label] = len(code)
+                compiler.mark_label()
+            if ins.line is not None:
+                compiler.mark_line(ins.line)
+            compiler.emit(ins.op, *ins.args)
+            pos = JUMP_TARGETS.get(ins.op)
+            if pos is not None:
+                jumps.append((len(code) - OPERAND_COUNTS[ins.op] + pos, ins.args[pos]))
+        # Labels whose code was removed entirely now point at what follows them
+        for offset in sorted(self.labels - set(moved)):
+            later = [new for old, new in moved.items() if old > offset]
+            moved[offset] = min(later) if later else len(compiler.instructions)
+        compiler.labels = set(moved.values())
+        for pos, target in jumps:
+            code[pos] = moved[target]
+        for name, offset in compiler.functions.items():
+            compiler.functions[name] = moved[offset]
+        compiler.exception_table = [(moved[start], moved[end], moved[handler], depth)
+                                    for start, end, handler, depth in compiler.exception_table]
+        compiler.function_ranges = [(moved[entry], moved[end]) for entry, end in compiler.function_ranges]
+        compiler.size_stacks()  # folding and fusion change how deep the stack gets
+
+
+def optimize(compiler, level=1):
+    Optimizer(compiler, level).optimize()
+    return compiler
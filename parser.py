@@ -1,3 +1,19 @@
+from ast_nodes import *
+from lexer import (
+    LexerError, Token, KINDS, EOF, NEWLINE, INDENT, DEDENT, ID, INT, FLOAT, BOOL, STRING, OP, SEMICOLON,
+    LPAREN, RPAREN, COMMA, COLON, LEFT_BRACKET, RIGHT_BRACKET, LEFT_BRACE, RIGHT_BRACE, DOT,
+    AS, CATCH, ELSE, FUNC, IF, IMPORT, MEMO, PURE, RAISE, RETURN, TRY, WHILE,
+)
+
+LITERALS = frozenset([INT, FLOAT, STRING, BOOL])
+BLOCK_END = frozenset([DEDENT, EOF])
+
+# Entries of the expression parser's pending stack: (precedence, kind, ...).
+# Operators wait there for their right operand; brackets stay until closed,
+# with precedence 0 so no operator is ever reduced past them.
+BINARY, UNARY, PAREN, CALL, LIST, DICT, INDEX = range(7)
+
+
 class Parser:
     PRECEDENCE = {
         'or': 1,
@@ -6,162 +22,439 @@ class Parser:
         '+': 4, '-': 4,
         '*': 5, '/': 5,
     }
-def parse_list_literal(self):
-    # assumes current token is '['
-    elements = []
-    self.advance()  # consume '['
-    while self.current_token.type != 'RIGHT_BRACKET':
-        elements.append(self.parse_expression())
-        if self.current_token.type == 'COMMA':
-            self.advance()
-        else:
-            break
-    self.expect('RIGHT_BRACKET')
-    return ListLiteralNode(elements)
-    
-def parse_index_access(self, base_expr):
-    while self.current_token.type == 'LEFT_BRACKET':
-        self.advance()
-        index_expr = self.parse_expression()
-        self.expect('RIGHT_BRACKET')
-        base_expr = IndexAccessNode(base_expr, index_expr)
-    return base_expr
-
-
-def parse_dict_literal(self):
-    # assumes current token is '{'
-    pairs = []
-    self.advance()  # consume '{'
-    while self.current_token.type != 'RIGHT_BRACE':
-        key = self.parse_expression()
-        self.expect('COLON')
-        value = self.parse_expression()
-        pairs.append((key, value))
-        if self.current_token.type == 'COMMA':
-            self.advance()
-        else:
-            break
-    self.expect('RIGHT_BRACE')
-    return DictLiteralNode(pairs)
-
-
     UNARY_OPS = {'-', 'not', '!'}
+    UNARY_PRECEDENCE = 6  # not and !; unary minus has the precedence of binary minus
 
     def __init__(self, lexer):
+        # lexer is a Lexer or a TokenBuffer; both provide next_token()/peek()
         self.lexer = lexer
         self.current_token = None
         self.errors = []
-        self.advance()
+        try:
+            self.advance()
+        except (LexerError, ValueError) as e:
+            self.errors.append(str(e))
+            self.current_token = Token(EOF, '', 1, 1)
 
     def advance(self):
         self.current_token = self.lexer.next_token()
 
+    def peek(self, offset=0):
+        # Tokens after current_token, pulled from the lexer on demand
+        return self.lexer.peek(offset)
+
     def expect(self, token_type):
-        if self.current_token.type != token_type:
-            raise SyntaxError(f'Expected {token_type}, got {self.current_token.type}')
+        token = self.current_token
+        if token.type != token_type:
+            raise self.unexpected(token_type, token)
         self.advance()
+        return token
+
+    def unexpected(self, token_type, token):
+        return SyntaxError(f'Expected {KINDS[token_type]}, got {KINDS[token.type]} at line {token.line}')
 
     def parse(self):
         statements = []
-        while self.current_token.type != 'EOF':
-            try:
-                stmt = self.parse_statement()
-                if stmt:
-                    statements.append(stmt)
-            except SyntaxError as e:
-                self.errors.append(str(e))
-                self.synchronize()
+        try:
+            while self.current_token.type != EOF:
+                try:
+                    stmt = self.parse_statement()
+                    if stmt:
+                        statements.append(stmt)
+                except SyntaxError as e:
+                    self.errors.append(str(e))
+                    self.synchronize()
+        except (LexerError, ValueError) as e:
+            # A character the lexer does not know, or a string with a bad
+            # escape: the lexer cannot go on, so the program ends there
+            self.errors.append(str(e))
         return Program(statements)
 
     def synchronize(self):
-        # Basic error recovery:
-        # skip tokens until we find one that can start a statement
-        sync_tokens = {'FUNC', 'IF', 'WHILE', 'RETURN', 'ID', 'DEDENT', 'EOF'}
-        while self.current_token.type not in sync_tokens:
+        # Basic error recovery: drop the rest of the offending line and any
+        # block indented under it
+        while self.current_token.type not in (NEWLINE, EOF):
             self.advance()
+        if self.current_token.type == NEWLINE:
+            self.advance()
+        if self.current_token.type == INDENT:
+            depth = 0
+            while self.current_token.type != EOF:
+                if self.current_token.type == INDENT:
+                    depth += 1
+                elif self.current_token.type == DEDENT:
+                    depth -= 1
+                    if depth == 0:
+                        self.advance()
+                        break
+                self.advance()
+
+    def end_statement(self):
+        t = self.current_token.type
+        if t == NEWLINE or t == SEMICOLON:
+            self.advance()
+        elif t != EOF and t != DEDENT:
+            raise SyntaxError(f'Expected end of statement, got {KINDS[t]} at line {self.current_token.line}')
+
+    # === Statements ===
 
     def parse_statement(self):
+        # One statement, with every block nested in it. The blocks still open
+        # are kept on a stack, innermost last, instead of the Python call
+        # stack, so nesting depth is not limited by the recursion limit. A
+        # compound statement's header returns its block as (statements,
+        # finish); at the block's end finish(statements) returns the node, or
+        # the next block of the same statement (else, catch).
+        blocks = []
+        lines = []  # the line each open block's statement starts on
+        while True:
+            if blocks and self.current_token.type in BLOCK_END:
+                if self.current_token.type == DEDENT:
+                    self.advance()
+                statements, finish = blocks.pop()
+                line = lines.pop()
+                result = finish(statements)
+            else:
+                line = self.current_token.line
+                result = self.statement_or_header()
+            if type(result) is tuple:
+                blocks.append(result)
+                lines.append(line)
+                continue
+            if result is not None:
+                result.line = line
+            if not blocks:
+                return result
+            if result is not None:
+                blocks[-1][0].append(result)
+
+    def open_block(self, finish):
+        self.expect(NEWLINE)
+        self.expect(INDENT)
+        return [], finish
+
+    def statement_or_header(self):
+        # A simple statement, None for an empty one, or the open block of a
+        # compound statement
         t = self.current_token.type
 
-        if t == 'FUNC':
+        if t == FUNC:
             return self.parse_function()
-        elif t == 'IF':
+        elif t == PURE or t == MEMO:
+            # pure func ... / memo func ...
+            modifier = self.current_token.value.lower()
+            self.advance()
+            return self.parse_function(modifier)
+        elif t == IF:
             return self.parse_if()
-        elif t == 'WHILE':
+        elif t == WHILE:
             return self.parse_while()
-        elif t == 'RETURN':
+        elif t == IMPORT:
+            return self.parse_import()
+        elif t == TRY:
+            return self.parse_try()
+        elif t == NEWLINE or t == SEMICOLON:
+            self.advance()
+            return None
+        elif t == RETURN:
             self.advance()
             expr = self.parse_expression()
-            return ReturnStmt(expr)
-        else:
+            self.end_statement()
+            return ReturnStatement(expr)
+        elif t == RAISE:
+            self.advance()
             expr = self.parse_expression()
-            return ExprStmt(expr)
+            self.end_statement()
+            return RaiseStatement(expr)
+        elif t == ID:
+            following = self.peek()
+            if following.type == ID and self.peek(1).value == '=':
+                # int x = expr
+                var_type = self.current_token.value
+                self.advance()
+                name = self.expect(ID).value
+                self.advance()
+                stmt = VariableDeclaration(var_type, name, self.parse_expression())
+                self.end_statement()
+                return stmt
+            if following.type == LEFT_BRACKET and self.typed_declaration():
+                # list[int] xs = expr
+                var_type = self.parse_type()
+                name = self.expect(ID).value
+                self.expect_assign()
+                stmt = VariableDeclaration(var_type, name, self.parse_expression())
+                self.end_statement()
+                return stmt
+            if following.type == OP and following.value == '=':
+                name = self.current_token.value
+                self.advance()
+                self.advance()
+                stmt = Assignment(name, self.parse_expression())
+                self.end_statement()
+                return stmt
 
-    def parse_expression(self, precedence=0):
-        token = self.current_token
+        expr = self.parse_expression()
+        self.end_statement()
+        return expr
 
-        # Unary operator
-        if token.type == 'OP' and token.value in self.UNARY_OPS:
-            op = token.value
-            self.advance()
-            right = self.parse_expression(self.PRECEDENCE.get(op, 6))
-            return UnaryOp(op, right)
-        elif token.type == 'KEYWORD' and token.value == 'not':
-            op = token.value
+    def parse_function(self, modifier=None):
+        self.expect(FUNC)
+        name = self.expect(ID).value
+        self.expect(LPAREN)
+        params = []
+        while self.current_token.type != RPAREN:
+            param_type = self.parse_type()
+            params.append((param_type, self.expect(ID).value))
+            if self.current_token.type != COMMA:
+                break
             self.advance()
-            right = self.parse_expression(self.PRECEDENCE.get(op, 6))
-            return UnaryOp(op, right)
+        self.expect(RPAREN)
+        return self.open_block(lambda body: FunctionDef(name, params, body, modifier))
 
-        # Primary expressions: literals, variables, parenthesis, function calls
-        if token.type in ('INT', 'FLOAT', 'STRING', 'BOOL'):
+    def typed_declaration(self):
+        # Current token ID followed by [ ID ] ID: no expression continues that way
+        tokens = [self.peek(i) for i in range(1, 4)]
+        return None not in tokens and [t.type for t in tokens] == [ID, RIGHT_BRACKET, ID]
+
+    def parse_type(self):
+        # int, list, list[int], ...
+        name = self.expect(ID).value
+        if self.current_token.type == LEFT_BRACKET:
             self.advance()
-            left = Literal(token.value)
-        elif token.type == 'ID':
+            name = f"{name}[{self.expect(ID).value}]"
+            self.expect(RIGHT_BRACKET)
+        return name
+
+    def expect_assign(self):
+        token = self.current_token
+        if token.type != OP or token.value != '=':
+            raise SyntaxError(f'Expected =, got {KINDS[token.type]} at line {token.line}')
+        self.advance()
+
+    def parse_if(self):
+        # The whole else-if chain is one statement: its conditions and then
+        # bodies are collected as the blocks end, and nested into IfStatements
+        # from the last one out when the chain does
+        conditions = []
+        lines = []  # of the else ifs, for their IfStatements
+        bodies = []
+
+        def then_block(body):
+            bodies.append(body)
+            if self.current_token.type != ELSE:
+                return chain_end([])
             self.advance()
-            left = Variable(token.value)
-            # Possible function call
-            if self.current_token.type == 'LPAREN':
-                left = self.parse_call(left)
-        elif token.type == 'LPAREN':
+            if self.current_token.type == IF:
+                lines.append(self.current_token.line)
+                self.advance()
+                conditions.append(self.parse_expression())
+                return self.open_block(then_block)
+            return self.open_block(chain_end)
+
+        def chain_end(else_body):
+            for condition, then_body, line in zip(reversed(conditions), reversed(bodies), reversed([None] + lines)):
+                else_body = [IfStatement(condition, then_body, else_body)]
+                if line is not None:
+                    else_body[0].line = line
+            return else_body[0]
+
+        self.expect(IF)
+        conditions.append(self.parse_expression())
+        return self.open_block(then_block)
+
+    def parse_while(self):
+        self.expect(WHILE)
+        condition = self.parse_expression()
+        return self.open_block(lambda body: WhileLoop(condition, body))
+
+    def parse_try(self):
+        self.expect(TRY)
+        return self.open_block(self.parse_catch)
+
+    def parse_catch(self, try_body):
+        self.expect(CATCH)
+        # catch [type] name
+        catch_type = None
+        name = self.expect(ID).value
+        if self.current_token.type == ID:
+            catch_type, name = name, self.current_token.value
             self.advance()
-            left = self.parse_expression()
-            self.expect('RPAREN')
-        else:
-            raise SyntaxError(f"Unexpected token in expression: {token.type}")
+        return self.open_block(lambda body: TryStatement(try_body, catch_type, name, body))
 
-        # Binary operators using precedence climbing
-        while True:
-            tok = self.current_token
-            if tok.type == 'OP' or (tok.type == 'KEYWORD' and tok.value in ('and', 'or')):
-                op_val = tok.value
-                op_prec = self.PRECEDENCE.get(op_val, 0)
-                if op_prec <= precedence:
-                    break
-                self.advance()
-                right = self.parse_expression(op_prec)
-                left = BinaryOp(left, op_val, right)
-            else:
-                break
+    def parse_import(self):
+        self.expect(IMPORT)
+        token = self.current_token
+        if token.type != STRING and token.type != ID:
+            raise SyntaxError(f'Expected module path, got {KINDS[token.type]} at line {token.line}')
+        self.advance()
+        alias = None
+        if self.current_token.type == AS:
+            self.advance()
+            alias = self.expect(ID).value
+        self.end_statement()
+        return ImportStatement(token.value, alias)
 
-        return left
+    # === Expressions ===
 
-    def parse_call(self, func_expr):
-        self.expect('LPAREN')
-        args = []
-        if self.current_token.type != 'RPAREN':
+    def parse_expression(self):
+        # Operator precedence parsing in one loop over the tokens. Parsed
+        # subexpressions go on operands; operators waiting for their right
+        # operand and the brackets still open (parentheses, call arguments,
+        # list and dict literals, indexes) go on pending. An operator reduces
+        # those of the same or higher precedence first, so binary operators
+        # group to the left. Nothing recurses: the length and nesting of an
+        # expression are only limited by memory.
+        next_token = self.lexer.next_token
+        precedence = self.PRECEDENCE
+        unary_ops = self.UNARY_OPS
+        operands = []
+        pending = []
+        token = self.current_token
+        want_operand = True
+        dots = True  # whether .name may follow the last operand (not after an index)
+        try:
             while True:
-                arg = self.parse_expression()
-                args.append(arg)
-                if self.current_token.type == 'COMMA':
-                    self.advance()
-                else:
+                kind = token.type
+                if want_operand:
+                    if kind in LITERALS:
+                        operands.append(Literal(token.value))
+                        token = next_token()
+                    elif kind == ID:
+                        name = token.value
+                        token = next_token()
+                        if token.type == LPAREN:
+                            pending.append((0, CALL, name, None, len(operands)))
+                            token = next_token()
+                            want_operand = token.type != RPAREN
+                            continue
+                        operands.append(VariableReference(name))
+                    elif kind == OP and token.value in unary_ops:
+                        pending.append((precedence.get(token.value, self.UNARY_PRECEDENCE), UNARY, token.value))
+                        token = next_token()
+                        continue
+                    elif kind == LPAREN:
+                        pending.append((0, PAREN))
+                        token = next_token()
+                        continue
+                    elif kind == LEFT_BRACKET or kind == LEFT_BRACE:
+                        pending.append((0, LIST if kind == LEFT_BRACKET else DICT, len(operands)))
+                        token = next_token()
+                        want_operand = token.type != (RIGHT_BRACKET if kind == LEFT_BRACKET else RIGHT_BRACE)
+                        continue
+                    else:
+                        raise SyntaxError(f"Unexpected token in expression: {KINDS[kind]} at line {token.line}")
+                    want_operand = False
+                    dots = True
+                    continue
+
+                # After an operand: member access and indexing apply to it first
+                if kind == DOT and dots:
+                    # module.name or module.name(...)
+                    token = next_token()
+                    if token.type != ID:
+                        raise self.unexpected(ID, token)
+                    name = token.value
+                    token = next_token()
+                    if token.type == LPAREN:
+                        target = operands.pop()
+                        pending.append((0, CALL, name, target, len(operands)))
+                        token = next_token()
+                        want_operand = token.type != RPAREN
+                    else:
+                        operands[-1] = MemberAccess(operands[-1], name)
+                    continue
+                if kind == LEFT_BRACKET:
+                    pending.append((0, INDEX))
+                    token = next_token()
+                    want_operand = True
+                    continue
+
+                # Then a binary operator
+                if kind == OP:
+                    op_prec = precedence.get(token.value, 0)
+                    if op_prec:
+                        while pending[-1:] and pending[-1][0] >= op_prec:
+                            self.reduce(pending.pop(), operands)
+                        pending.append((op_prec, BINARY, token.value))
+                        token = next_token()
+                        want_operand = True
+                        continue
+
+                # Otherwise the innermost open bracket, or the expression, ends here
+                while pending and pending[-1][0]:
+                    self.reduce(pending.pop(), operands)
+                if not pending:
                     break
-        self.expect('RPAREN')
-        return CallExpr(func_expr.name, args)
+                entry = pending[-1]
+                group = entry[1]
+                if group == CALL:
+                    if token.type == COMMA:
+                        token = next_token()
+                        want_operand = True
+                        continue
+                    if token.type != RPAREN:
+                        raise self.unexpected(RPAREN, token)
+                    base = entry[4]
+                    call = FunctionCall(entry[2], operands[base:], entry[3])
+                    del operands[base:]
+                    operands.append(call)
+                elif group == PAREN:
+                    if token.type != RPAREN:
+                        raise self.unexpected(RPAREN, token)
+                elif group == INDEX:
+                    if token.type != RIGHT_BRACKET:
+                        raise self.unexpected(RIGHT_BRACKET, token)
+                    index = operands.pop()
+                    operands[-1] = IndexAccessNode(operands[-1], index)
+                else:
+                    base = entry[2]
+                    closing = RIGHT_BRACKET if group == LIST else RIGHT_BRACE
+                    if group == DICT and (len(operands) - base) % 2:
+                        # A key; its value follows the colon
+                        if token.type != COLON:
+                            raise self.unexpected(COLON, token)
+                        token = next_token()
+                        want_operand = True
+                        continue
+                    if token.type == COMMA:
+                        token = next_token()
+                        if token.type != closing:
+                            want_operand = True
+                            continue
+                    if token.type != closing:
+                        raise self.unexpected(closing, token)
+                    items = operands[base:]
+                    del operands[base:]
+                    if group == LIST:
+                        operands.append(ListLiteralNode(items))
+                    else:
+                        operands.append(DictLiteralNode(list(zip(items[::2], items[1::2]))))
+                pending.pop()
+                token = next_token()
+                dots = group != INDEX
+        finally:
+            self.current_token = token
+        return operands[0]
+
+    def reduce(self, entry, operands):
+        # Applies a pending operator to the operands on top of the stack
+        if entry[1] == BINARY:
+            right = operands.pop()
+            operands[-1] = BinaryOperation(operands[-1], entry[2], right)
+            return
+        op, right = entry[2], operands[-1]
+        if op != '-':
+            operands[-1] = UnaryOp(op, right)
+        elif isinstance(right, Literal) and type(right.value) in (int, float):
+            operands[-1] = Literal(-right.value)
+        else:
+            operands[-1] = BinaryOperation(Literal(0), '-', right)
 
 
 # AST node for UnaryOp
 class UnaryOp:
+    __slots__ = ('op', 'operand')
+
     def __init__(self, op, operand):
         self.op = op
         self.operand = operand
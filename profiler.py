@@ -0,0 +1,210 @@
+# profiler.py
+#
+# --profile for the VMs and the tree-walking Executor. Counts executions and
+# self time per opcode (per node type for the Executor) and per Ijichi
+# function, and samples the Ijichi call stack every interval seconds of
+# run time. The report is a text table; the samples also come out in the
+# collapsed-stack format flamegraph tools read ("main;f;g 12" per line).
+#
+# Nothing here touches the normal dispatch loops: a VM built with a
+# profiler runs Profiler.run() instead, and an Executor is only wrapped
+# when one is attached.
+#
+# A profiled VM does not tier up, so every function stays visible.
+
+import os
+import sys
+from collections import Counter
+from time import perf_counter
+
+from opcodes import ENTER, OPERAND_COUNTS
+
+DEFAULT_INTERVAL = float(os.environ.get("IJICHI_PROFILE_INTERVAL") or 1) / 1000  # ms -> s
+
+SORT_KEYS = {
+    "time": lambda item: -item[1][1],
+    "calls": lambda item: -item[1][0],
+    "total": lambda item: -item[1][-1],
+    "name": lambda item: item[0],
+}
+
+
+class Profiler:
+    def __init__(self, interval=None):
+        self.interval = DEFAULT_INTERVAL if interval is None else interval
+        self.ops = {}  # opcode or node type -> [count, self time]
+        self.functions = {}  # function -> [calls, self time, total time]
+        self.frames = ["main"]  # Ijichi call stack, outermost first
+        self.entered = []  # start time per frame above main
+        self.active = Counter()  # frames per function, so recursion is timed once
+        self.nested = []  # per timed operation: time spent in operations it ran
+        self.samples = Counter()  # tuple of frames -> samples
+        self.last_sample = None
+        self.elapsed = 0.0
+
+    # === Call stack ===
+
+    def push(self, name, now):
+        self.frames.append(name)
+        self.entered.append(now)
+        self.active[name] += 1
+        entry = self.functions.get(name)
+        if entry is None:
+            entry = self.functions[name] = [0, 0.0, 0.0]
+        entry[0] += 1
+
+    def pop(self, now):
+        name = self.frames.pop()
+        start = self.entered.pop()
+        self.active[name] -= 1
+        if not self.active[name]:
+            self.functions[name][2] += now - start
+
+    def sample(self, now):
+        # One sample per interval that passed, so long operations weigh in
+        if self.last_sample is None:
+            self.last_sample = now
+            return
+        ticks = int((now - self.last_sample) / self.interval)
+        if ticks:
+            self.samples[tuple(self.frames)] += ticks
+            self.last_sample += ticks * self.interval
+
+    def account(self, name, start, now):
+        # Self time of one opcode or node ending at now
+        elapsed = now - start
+        inner = self.nested.pop()
+        if self.nested:
+            self.nested[-1] += elapsed
+        spent = elapsed - inner
+        entry = self.ops.get(name)
+        if entry is None:
+            entry = self.ops[name] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += spent
+        top = self.frames[-1]
+        if top != "main":
+            self.functions[top][1] += spent
+        self.sample(now)
+
+    # === VMs ===
+
+    def run(self, vm, ip, opnames):
+        # Stands in for vm.execute()'s dispatch loop. A change in the
+        # length of vm.call_stack means a call or return happened; a call
+        # lands on the entry offset of the function it named, or just past
+        # its ENTER when the call was linked.
+        code = vm.instructions
+        dispatch = vm.dispatch
+        calls = vm.call_stack
+        entries = {}
+        for name, entry in vm.functions.items():
+            if isinstance(entry, tuple):
+                entries[entry[0]] = name  # RegisterVM keeps (entry offset, register count)
+            else:
+                entries[entry] = entries[entry + 1 + OPERAND_COUNTS[ENTER]] = name
+        frames = self.frames
+        nested = self.nested
+        clock = perf_counter
+        end = len(code)
+        base = len(nested)
+        started = clock()
+        try:
+            while ip < end:
+                if len(calls) != len(frames) - 1:
+                    now = clock()
+                    while len(calls) < len(frames) - 1:
+                        self.pop(now)
+                    if len(calls) > len(frames) - 1:
+                        self.push(entries.get(ip, "?"), now)
+                op = code[ip]
+                nested.append(0.0)
+                start = clock()
+                ip = dispatch[op](ip)
+                self.account(opnames[op], start, clock())
+        except Exception:
+            vm.ip = ip  # the instruction that raised, for the VM's unwind()
+            raise
+        finally:
+            del nested[base:]  # after an error, the operations it cut short
+            if not base:
+                self.elapsed += clock() - started
+        return ip
+
+    # === Executor ===
+
+    def attach(self, executor):
+        # Wraps the executor's dispatch methods on the instance only
+        execute, eval_expr, invoke = executor.execute, executor.eval_expr, executor.invoke
+        clock = perf_counter
+
+        def timed(method):
+            def wrapper(node, env=None):
+                self.nested.append(0.0)
+                start = clock()
+                try:
+                    return method(node, env)
+                finally:
+                    self.account(type(node).__name__, start, clock())
+            return wrapper
+
+        def timed_invoke(func, args):
+            self.push(func.name, clock())
+            try:
+                return invoke(func, args)
+            finally:
+                self.pop(clock())
+
+        executor.execute = timed(execute)
+        executor.eval_expr = timed(eval_expr)
+        executor.invoke = timed_invoke
+
+    def timed_run(self, run):
+        start = perf_counter()
+        try:
+            return run()
+        finally:
+            self.elapsed += perf_counter() - start
+
+    # === Output ===
+
+    def report(self, sort="time", limit=20):
+        key = SORT_KEYS[sort]
+        total = sum(entry[1] for entry in self.ops.values()) or 1
+        lines = [f"profile: {self.elapsed * 1000:.1f} ms, {sum(self.samples.values())} samples"
+                 f" every {self.interval * 1000:g} ms", ""]
+        lines.append(f"{'operation':<28} {'count':>10} {'self ms':>10} {'%':>6}")
+        for name, (count, spent) in sorted(self.ops.items(), key=key)[:limit]:
+            lines.append(f"{name:<28} {count:>10} {spent * 1000:10.2f} {spent / total * 100:5.1f}%")
+        lines += ["", f"{'function':<28} {'calls':>10} {'self ms':>10} {'total ms':>10}"]
+        for name, (calls, spent, inclusive) in sorted(self.functions.items(), key=key)[:limit]:
+            lines.append(f"{name:<28} {calls:>10} {spent * 1000:10.2f} {inclusive * 1000:10.2f}")
+        return "\n".join(lines)
+
+    def collapsed(self):
+        return "".join(f"{';'.join(stack)} {count}\n"
+                       for stack, count in sorted(self.samples.items()))
+
+
+def options(args):
+    # Removes --profile [--profile-sort key] [--profile-stacks path] from
+    # args; returns (sort, stacks path) or None when not profiling
+    values = {"--profile-sort": "time", "--profile-stacks": None}
+    for flag in values:
+        if flag in args:
+            i = args.index(flag)
+            values[flag] = args[i + 1] if i + 1 < len(args) else ""
+            del args[i:i + 2]
+    if "--profile" not in args:
+        return None
+    args.remove("--profile")
+    if values["--profile-sort"] not in SORT_KEYS:
+        raise ValueError(f"--profile-sort takes one of {', '.join(SORT_KEYS)}")
+    return values["--profile-sort"], values["--profile-stacks"]
+
+
+def finish(profiler, sort, stacks):
+    print(profiler.report(sort), file=sys.stderr)
+    if stacks:
+        with open(stacks, "w") as f:
+            f.write(profiler.collapsed())
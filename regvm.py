@@ -0,0 +1,964 @@
+# regvm.py
+#
+# Register-based alternative to the stack VM. Every frame is a fixed-size
+# list of registers: parameters and declared variables first, in the slots
+# Compiler.declare() hands out, then the temporaries of the expression being
+# evaluated. Instructions name their operands, so `total = total + i` is a
+# single ADD r1, r1, r2 instead of LOAD_VAR, LOAD_VAR, BINARY_ADD, STORE_VAR.
+#
+#   python run.py --vm register <script.iji>
+
+import opcodes
+from ast_nodes import *
+from compiler import (
+    Compiler, CompileError, COMPARISONS, EXPRESSIONS,
+)
+from memo import MISS, MemoTable, defined_functions, marked_functions
+from stdlib import BUILTINS
+from strings import join
+from vectors import CONVERTERS
+from vm import CATCHABLE
+
+# === Opcode Numbers ===
+# Operands are register numbers unless noted: k is a constant index, g a
+# global (top-level register) index, t an absolute jump target.
+MOVE = 0            # d, s
+LOAD_CONST = 1      # d, k
+LOAD_GLOBAL = 2     # d, g
+STORE_GLOBAL = 3    # g, s
+
+ADD = 4             # d, a, b
+SUBTRACT = 5
+MULTIPLY = 6
+DIVIDE = 7
+ADD_K = 8           # d, a, k
+SUBTRACT_K = 9
+MULTIPLY_K = 10
+DIVIDE_K = 11
+
+EQ = 12             # d, a, b
+NE = 13
+LT = 14
+LE = 15
+GT = 16
+GE = 17
+EQ_K = 18           # d, a, k
+NE_K = 19
+LT_K = 20
+LE_K = 21
+GT_K = 22
+GE_K = 23
+
+JUMP = 24           # t
+JUMP_IF_FALSE = 25  # s, t
+JUMP_IF_TRUE = 26   # s, t
+JUMP_IF_NOT_EQ = 27  # a, b, t
+JUMP_IF_NOT_NE = 28
+JUMP_IF_NOT_LT = 29
+JUMP_IF_NOT_LE = 30
+JUMP_IF_NOT_GT = 31
+JUMP_IF_NOT_GE = 32
+JUMP_IF_NOT_EQ_K = 33  # a, k, t
+JUMP_IF_NOT_NE_K = 34
+JUMP_IF_NOT_LT_K = 35
+JUMP_IF_NOT_LE_K = 36
+JUMP_IF_NOT_GT_K = 37
+JUMP_IF_NOT_GE_K = 38
+# i += constant k, then jump back to t while i < bound
+COUNTED_LOOP = 39    # i, k, b, t
+COUNTED_LOOP_K = 40  # i, k, bound k, t
+
+CALL = 41           # d, name k, first argument register, argument count
+RETURN = 42         # s
+BUILD_LIST = 43     # d, first, count
+BUILD_DICT = 44     # d, first, pair count
+SUBSCR = 45         # d, a, b
+
+# Raises an error whose message is the value of s. try blocks have no
+# instructions; the exception table maps code ranges to their handlers.
+RAISE = 46          # s
+
+# Joins count registers of an all-string + chain in one go
+CONCAT = 47         # d, first, count
+
+# Call of a builtin bound at compile time; the name constant maps to the
+# function when the VM loads the program
+CALL_BUILTIN = 48   # d, name k, first argument register, argument count
+
+OPNAMES = [
+    "MOVE", "LOAD_CONST", "LOAD_GLOBAL", "STORE_GLOBAL",
+    "ADD", "SUBTRACT", "MULTIPLY", "DIVIDE",
+    "ADD_K", "SUBTRACT_K", "MULTIPLY_K", "DIVIDE_K",
+    "EQ", "NE", "LT", "LE", "GT", "GE",
+    "EQ_K", "NE_K", "LT_K", "LE_K", "GT_K", "GE_K",
+    "JUMP", "JUMP_IF_FALSE", "JUMP_IF_TRUE",
+    "JUMP_IF_NOT_EQ", "JUMP_IF_NOT_NE", "JUMP_IF_NOT_LT",
+    "JUMP_IF_NOT_LE", "JUMP_IF_NOT_GT", "JUMP_IF_NOT_GE",
+    "JUMP_IF_NOT_EQ_K", "JUMP_IF_NOT_NE_K", "JUMP_IF_NOT_LT_K",
+    "JUMP_IF_NOT_LE_K", "JUMP_IF_NOT_GT_K", "JUMP_IF_NOT_GE_K",
+    "COUNTED_LOOP", "COUNTED_LOOP_K",
+    "CALL", "RETURN",
+    "BUILD_LIST", "BUILD_DICT", "SUBSCR",
+    "RAISE",
+    "CONCAT",
+    "CALL_BUILTIN",
+]
+
+OPCODES = {name: op for op, name in enumerate(OPNAMES)}
+
+OPERAND_COUNTS = [
+    2, 2, 2, 2,
+    3, 3, 3, 3,
+    3, 3, 3, 3,
+    3, 3, 3, 3, 3, 3,
+    3, 3, 3, 3, 3, 3,
+    1, 2, 2,
+    3, 3, 3,
+    3, 3, 3,
+    3, 3, 3,
+    3, 3, 3,
+    4, 4,
+    4, 1,
+    3, 3, 3,
+    1,
+    3,
+    4,
+]
+
+# Source operator -> (register form, constant form)
+BINARY_OPS = {
+    "+": (ADD, ADD_K),
+    "-": (SUBTRACT, SUBTRACT_K),
+    "*": (MULTIPLY, MULTIPLY_K),
+    "/": (DIVIDE, DIVIDE_K),
+    "==": (EQ, EQ_K),
+    "!=": (NE, NE_K),
+    "<": (LT, LT_K),
+    "<=": (LE, LE_K),
+    ">": (GT, GT_K),
+    ">=": (GE, GE_K),
+}
+
+# Comparison operator -> (register form, constant form) of its negated branch
+COMPARE_JUMPS = {
+    "==": (JUMP_IF_NOT_EQ, JUMP_IF_NOT_EQ_K),
+    "!=": (JUMP_IF_NOT_NE, JUMP_IF_NOT_NE_K),
+    "<": (JUMP_IF_NOT_LT, JUMP_IF_NOT_LT_K),
+    "<=": (JUMP_IF_NOT_LE, JUMP_IF_NOT_LE_K),
+    ">": (JUMP_IF_NOT_GT, JUMP_IF_NOT_GT_K),
+    ">=": (JUMP_IF_NOT_GE, JUMP_IF_NOT_GE_K),
+}
+
+# Every jump keeps its target in the last operand
+JUMPS = {
+    JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, COUNTED_LOOP, COUNTED_LOOP_K,
+    JUMP_IF_NOT_EQ, JUMP_IF_NOT_NE, JUMP_IF_NOT_LT, JUMP_IF_NOT_LE, JUMP_IF_NOT_GT, JUMP_IF_NOT_GE,
+    JUMP_IF_NOT_EQ_K, JUMP_IF_NOT_NE_K, JUMP_IF_NOT_LT_K,
+    JUMP_IF_NOT_LE_K, JUMP_IF_NOT_GT_K, JUMP_IF_NOT_GE_K,
+}
+
+# Opcode -> index of its constant-table operand
+CONST_OPERANDS = {
+    LOAD_CONST: 1, CALL: 1, CALL_BUILTIN: 1, COUNTED_LOOP: 1, COUNTED_LOOP_K: 1,
+    ADD_K: 2, SUBTRACT_K: 2, MULTIPLY_K: 2, DIVIDE_K: 2,
+    EQ_K: 2, NE_K: 2, LT_K: 2, LE_K: 2, GT_K: 2, GE_K: 2,
+    JUMP_IF_NOT_EQ_K: 1, JUMP_IF_NOT_NE_K: 1, JUMP_IF_NOT_LT_K: 1,
+    JUMP_IF_NOT_LE_K: 1, JUMP_IF_NOT_GT_K: 1, JUMP_IF_NOT_GE_K: 1,
+}
+
+
+def decode(code, start=0, end=None):
+    if end is None:
+        end = len(code)
+    ip = start
+    while ip < end:
+        op = code[ip]
+        argc = OPERAND_COUNTS[op]
+        yield ip, op, tuple(code[ip + 1:ip + 1 + argc])
+        ip += 1 + argc
+
+
+def disassemble(code, constants=()):
+    lines = []
+    for offset, op, args in decode(code):
+        text = f"{offset:>5} {OPNAMES[op]:<20}"
+        if args:
+            text += " " + ", ".join(str(a) for a in args)
+        const = CONST_OPERANDS.get(op)
+        if const is not None and args[const] < len(constants):
+            text += f"  ({constants[args[const]]!r})"
+        if op in JUMPS:
+            text += f"  (to {args[-1]})"
+        lines.append(text.rstrip())
+    return "\n".join(lines)
+
+
+def count_locals(statements):
+    # Upper bound on the slots declare() hands out for a body, so temporaries
+    # can start above every variable the body declares
+    count = 0
+    for stmt in statements:
+        if isinstance(stmt, VariableDeclaration):
+            count += 1
+        elif isinstance(stmt, IfStatement):
+            count += count_locals(stmt.then_body) + count_locals(stmt.else_body or [])
+        elif isinstance(stmt, WhileLoop):
+            count += count_locals(stmt.body)
+        elif isinstance(stmt, TryStatement):
+            count += 1 + count_locals(stmt.try_body) + count_locals(stmt.catch_body)
+    return count
+
+
+# === Compiler ===
+class RegisterCompiler(Compiler):
+    # Reuses Compiler's slot allocation, type checks and loop analysis; only
+    # code generation differs. frame_sizes holds the register count of each
+    # function, and of the top level under None.
+    def __init__(self):
+        super().__init__()
+        self.frame_sizes = {}
+        self.temp_base = 0
+        self.temp = 0  # next free temporary register
+        self.max_temp = 0
+
+    def compile(self, node):
+        line = getattr(node, "line", None)
+        if line is not None:
+            self.mark_line(line)
+        try:
+            if isinstance(node, Program):
+                self.pure |= marked_functions(node.statements)
+                self.defined |= defined_functions(node.statements)
+                self.enter_frame(0, count_locals(node.statements))
+                self.compile_body(node.statements)
+                self.frame_sizes[None] = self.max_temp
+                self.thread_jumps()
+            elif isinstance(node, FunctionDef):
+                if node.name in self.functions:
+                    raise CompileError(f"Function '{node.name}' already defined")
+                if self.current_func is not None:
+                    raise CompileError(f"Nested function '{node.name}' is not supported by the VM")
+                self.check_purity(node)
+                skip = self.emit_jump(JUMP)
+                self.mark_label()
+                self.functions[node.name] = len(self.instructions)
+                self.arities[node.name] = len(node.params)
+                saved = (self.var_indices, self.var_types, self.local_count,
+                         self.temp_base, self.temp, self.max_temp)
+                self.global_indices, self.global_types = self.var_indices, self.var_types
+                self.current_func = node.name
+                self.var_indices = {name: idx for idx, (typ, name) in enumerate(node.params)}
+                self.var_types = {idx: typ for idx, (typ, name) in enumerate(node.params)}
+                self.local_count = len(node.params)
+                self.enter_frame(len(node.params), count_locals(node.body))
+                for idx, (typ, name) in enumerate(node.params):
+                    self.convert(typ, idx, idx)
+                self.compile_body(node.body)
+                result = self.alloc()
+                self.emit(LOAD_CONST, result, self.add_constant(None))
+                self.emit(RETURN, result)
+                self.frame_sizes[node.name] = self.max_temp
+                self.function_ranges.append((self.functions[node.name], len(self.instructions)))
+                self.patch(skip)
+                self.current_func = None
+                (self.var_indices, self.var_types, self.local_count,
+                 self.temp_base, self.temp, self.max_temp) = saved
+                self.global_indices, self.global_types = {}, {}
+            elif isinstance(node, VariableDeclaration):
+                if node.name in self.var_indices:
+                    raise CompileError(f"Variable '{node.name}' already declared")
+                self.check_type(node.var_type, node.initializer, node.name)
+                # Declared after the initializer, which cannot see the name yet
+                idx = self.local_count
+                self.expr(node.initializer, idx)
+                self.convert(node.var_type, idx, idx)
+                self.declare(node.name, node.var_type)
+            elif isinstance(node, Assignment):
+                found = self.lookup(node.name)
+                if found is None:
+                    raise CompileError(f"Undefined variable '{node.name}'")
+                kind, idx, typ = found
+                self.check_type(typ, node.value, node.name)
+                if kind == opcodes.LOAD_GLOBAL:  # lookup() speaks stack opcodes
+                    value = self.expr(node.value)
+                    if typ in CONVERTERS:
+                        # value may be a variable's own register: convert into a temporary
+                        value = self.convert(typ, self.alloc(), value)
+                    self.emit(STORE_GLOBAL, idx, value)
+                else:
+                    self.expr(node.value, idx)
+                    self.convert(typ, idx, idx)
+            elif isinstance(node, ReturnStatement):
+                self.emit(RETURN, self.expr(node.value))
+            elif isinstance(node, RaiseStatement):
+                self.emit(RAISE, self.expr(node.value))
+            elif isinstance(node, IfStatement):
+                else_jump = self.compile_condition(node.condition)
+                self.compile_body(node.then_body)
+                if node.else_body:
+                    end_jump = self.emit_jump(JUMP)
+                    self.patch(else_jump)
+                    self.compile_body(node.else_body)
+                    self.patch(end_jump)
+                else:
+                    self.patch(else_jump)
+            elif isinstance(node, WhileLoop):
+                counted = self.counted_loop(node)
+                if counted is not None:
+                    self.compile_counted_loop(node, *counted)
+                else:
+                    self.mark_label()
+                    start = len(self.instructions)
+                    exit_jump = self.compile_condition(node.condition)
+                    self.compile_body(node.body)
+                    self.emit(JUMP, start)
+                    self.patch(exit_jump)
+            elif isinstance(node, TryStatement):
+                idx = self.var_indices.get(node.catch_name)
+                if idx is None:
+                    idx = self.declare(node.catch_name, "string")
+                start = len(self.instructions)
+                self.compile_body(node.try_body)
+                end = len(self.instructions)
+                end_jump = self.emit_jump(JUMP)
+                # Entered with the message already in idx; in place of the
+                # stack depth, the table names that register
+                self.protect(start, end, len(self.instructions), idx)
+                self.compile_body(node.catch_body)
+                self.patch(end_jump)
+            elif isinstance(node, EXPRESSIONS):
+                self.expr(node)
+            else:
+                raise CompileError(f"Unknown node type '{type(node).__name__}'")
+        except CompileError:
+            raise
+        except Exception as e:
+            raise CompileError(f"Compilation error: {e}")
+
+    def compile_body(self, statements):
+        for stmt in statements:
+            self.compile(stmt)
+            self.temp = self.temp_base  # temporaries never outlive a statement
+
+    def expr(self, node, dest=None):
+        # Evaluates node and returns the register holding its value, which is
+        # dest when given. A local variable is read in place, without a copy.
+        if isinstance(node, VariableReference):
+            found = self.lookup(node.name)
+            if found is None:
+                raise CompileError(f"Undefined variable '{node.name}'")
+            kind, idx, _ = found
+            if kind == opcodes.LOAD_GLOBAL:  # lookup() speaks stack opcodes
+                dest = self.target(dest)
+                self.emit(LOAD_GLOBAL, dest, idx)
+                return dest
+            if dest is not None and dest != idx:
+                self.emit(MOVE, dest, idx)
+                return dest
+            return idx
+        if isinstance(node, Literal):
+            dest = self.target(dest)
+            self.emit(LOAD_CONST, dest, self.add_constant(node.value))
+            return dest
+        saved = self.temp
+        if isinstance(node, BinaryOperation):
+            pieces = self.string_pieces(node)
+            if pieces is not None:
+                first = self.arguments(pieces)
+                self.temp = saved
+                dest = self.target(dest)
+                self.emit(CONCAT, dest, first, len(pieces))
+                return dest
+            ops = BINARY_OPS.get(node.operator)
+            if ops is None:
+                raise CompileError(f"Unknown binary operator '{node.operator}'")
+            left = self.expr(node.left)
+            if isinstance(node.right, Literal):
+                op, right = ops[1], self.add_constant(node.right.value)
+            else:
+                op, right = ops[0], self.expr(node.right)
+            self.temp = saved
+            dest = self.target(dest)
+            self.emit(op, dest, left, right)
+            return dest
+        if isinstance(node, FunctionCall):
+            if node.target is not None:
+                raise CompileError(f"Module call '{node.name}' is not supported by the VM")
+            builtin = node.name not in self.functions and node.name in BUILTINS
+            if node.name not in self.functions and not builtin:
+                raise CompileError(f"Call to undefined function '{node.name}'")
+            if not builtin:
+                self.check_arity(node)
+            first = self.arguments(node.args)
+            self.temp = saved
+            dest = self.target(dest)
+            self.emit(CALL_BUILTIN if builtin else CALL, dest, self.add_constant(node.name), first, len(node.args))
+            return dest
+        if isinstance(node, ListLiteralNode):
+            first = self.arguments(node.elements)
+            self.temp = saved
+            dest = self.target(dest)
+            self.emit(BUILD_LIST, dest, first, len(node.elements))
+            return dest
+        if isinstance(node, DictLiteralNode):
+            first = self.arguments([part for pair in node.pairs for part in pair])
+            self.temp = saved
+            dest = self.target(dest)
+            self.emit(BUILD_DICT, dest, first, len(node.pairs))
+            return dest
+        if isinstance(node, IndexAccessNode):
+            container = self.expr(node.container)
+            index = self.expr(node.index)
+            self.temp = saved
+            dest = self.target(dest)
+            self.emit(SUBSCR, dest, container, index)
+            return dest
+        raise CompileError(f"Unknown node type '{type(node).__name__}'")
+
+    def arguments(self, nodes):
+        # Evaluates nodes into consecutive fresh registers; returns the first
+        first = self.temp
+        for node in nodes:
+            self.expr(node, self.alloc())
+        return first
+
+    def compile_condition(self, expr):
+        # Emits a jump taken when expr is false and returns its operand position
+        if isinstance(expr, BinaryOperation) and expr.operator in COMPARISONS:
+            ops = COMPARE_JUMPS[expr.operator]
+            saved = self.temp
+            left = self.expr(expr.left)
+            if isinstance(expr.right, Literal):
+                position = self.emit_jump(ops[1], left, self.add_constant(expr.right.value))
+            else:
+                position = self.emit_jump(ops[0], left, self.expr(expr.right))
+            self.temp = saved
+            return position
+        saved = self.temp
+        position = self.emit_jump(JUMP_IF_FALSE, self.expr(expr))
+        self.temp = saved
+        return position
+
+    def compile_counted_loop(self, node, idx, step):
+        #     JUMP_IF_NOT_LT i, <bound>, exit
+        # body:
+        #     <body without the increment>
+        #     COUNTED_LOOP i, step, <bound>, body
+        # exit:
+        increment = node.body[-1]
+        self.check_type(self.var_types.get(idx), increment.value, increment.name)
+        bound = node.condition.right
+        exit_jump = self.compile_condition(node.condition)
+        self.mark_label()
+        start = len(self.instructions)
+        self.compile_body(node.body[:-1])
+        step = self.add_constant(step)
+        if isinstance(bound, Literal):
+            self.emit(COUNTED_LOOP_K, idx, step, self.add_constant(bound.value), start)
+        else:
+            self.emit(COUNTED_LOOP, idx, step, self.expr(bound), start)
+            self.temp = self.temp_base
+        self.patch(exit_jump)
+
+    def convert(self, var_type, dest, source):
+        # Converts source into dest for a list[int] / list[float] variable
+        if var_type in CONVERTERS:
+            self.emit(CALL_BUILTIN, dest, self.add_constant(CONVERTERS[var_type]), source, 1)
+        return dest
+
+    # === Registers ===
+
+    def enter_frame(self, params, declared):
+        self.temp_base = self.temp = self.max_temp = params + declared
+
+    def alloc(self):
+        reg = self.temp
+        self.temp += 1
+        if self.temp > self.max_temp:
+            self.max_temp = self.temp
+        return reg
+
+    def target(self, dest):
+        return self.alloc() if dest is None else dest
+
+    def emit(self, op, *args):
+        # No superinstruction fusion: three-address code needs none
+        self.instructions.append(op)
+        self.instructions.extend(args)
+
+    def thread_jumps(self):
+        code = self.instructions
+        for offset, op, args in decode(code):
+            if op not in JUMPS:
+                continue
+            position = offset + len(args)
+            target = code[position]
+            seen = set()
+            while target < len(code) and code[target] == JUMP and target not in seen:
+                seen.add(target)
+                target = code[target + 1]
+            code[position] = target
+
+
+def compile_source(source, opt_level=1):
+    # Register code is not cached on disk; the .ijc cache holds stack bytecode.
+    # There is no bytecode optimizer here, so -O1 and -O2 are the same: the
+    # AST passes run from -O1 up, as for the stack VM.
+    from lexer import Lexer
+    from parser import Parser
+    from vectorize import vectorize
+    from concat import concat
+    parser = Parser(Lexer(source))
+    program = parser.parse()
+    if parser.errors:
+        raise CompileError("\n".join(parser.errors))
+    if opt_level >= 1:
+        vectorize(program)
+        concat(program)
+    compiler = RegisterCompiler()
+    compiler.compile(program)
+    return compiler
+
+
+# === VM ===
+class RegisterVM:
+    def __init__(self, instructions, constants, functions, frame_sizes, count=False,
+                 memoized=(), memo=None, profiler=None, exception_table=()):
+        self.instructions = instructions
+        self.constants = constants
+        # name -> (entry offset, register count)
+        self.functions = {name: (entry, frame_sizes[name]) for name, entry in functions.items()}
+        self.regs = [None] * frame_sizes[None]
+        self.globals = self.regs  # the top-level frame's registers
+        self.ip = 0
+        self.call_stack = []  # (return ip, caller registers, destination register)
+        self.exception_table = exception_table  # (start, end, handler, message register)
+        self.return_value = None
+        self.count = count
+        self.executed = 0
+        self.profiler = profiler  # profiler.Profiler running the dispatch loop instead, if any
+        self.memo = memo or MemoTable()
+        self.memo_caches = {name: self.memo.cache(name) for name in memoized}
+        self.memo_frames = {}  # as in VirtualMachine: call depth -> (cache, args)
+        # Constant index -> builtin, for the CALL_BUILTIN operands that name one
+        self.linked = [BUILTINS.get(value) if type(value) is str else None for value in constants]
+        self.dispatch = [getattr(self, "op_" + name.lower()) for name in OPNAMES]
+        self.dispatch += [self.op_unknown] * (256 - len(self.dispatch))
+
+    def run(self):
+        while True:
+            try:
+                return self.execute()
+            except CATCHABLE as e:
+                handler = self.unwind(e)
+                if handler is None:
+                    raise
+                self.ip = handler
+
+    def unwind(self, error, lowest=0):
+        # As VirtualMachine.unwind(); the handler's frame gets the message in
+        # the catch variable's register instead of on a stack
+        calls = self.call_stack
+        ip = self.ip
+        for depth in range(len(calls), lowest - 1, -1):
+            if depth < len(calls):
+                ip = calls[depth][0] - 1  # within the call that left this frame
+            for start, end, handler, reg in self.exception_table:
+                if start <= ip < end:
+                    if depth < len(calls):
+                        self.regs = calls[depth][1]
+                        del calls[depth:]
+                        if self.memo_frames:
+                            self.drop_memo_frames()
+                    self.regs[reg] = str(error)
+                    return handler
+        return None
+
+    def execute(self):
+        code = self.instructions
+        dispatch = self.dispatch
+        end = len(code)
+        ip = self.ip
+        if self.profiler is not None:
+            ip = self.profiler.run(self, ip, OPNAMES)  # sets self.ip itself on an error
+        else:
+            try:
+                if self.count:
+                    executed = 0
+                    try:
+                        while ip < end:
+                            ip = dispatch[code[ip]](ip)
+                            executed += 1
+                    finally:
+                        self.executed += executed
+                else:
+                    while ip < end:
+                        ip = dispatch[code[ip]](ip)
+            except CATCHABLE:
+                self.ip = ip  # the instruction that raised, for unwind()
+                raise
+        self.ip = ip
+        return self.return_value
+
+    def stats(self):
+        return {"executed": self.executed} if self.count else {}
+
+    def op_move(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]]
+        return ip + 3
+
+    def op_load_const(self, ip):
+        code = self.instructions
+        self.regs[code[ip + 1]] = self.constants[code[ip + 2]]
+        return ip + 3
+
+    def op_load_global(self, ip):
+        code = self.instructions
+        self.regs[code[ip + 1]] = self.globals[code[ip + 2]]
+        return ip + 3
+
+    def op_store_global(self, ip):
+        code = self.instructions
+        self.globals[code[ip + 1]] = self.regs[code[ip + 2]]
+        return ip + 3
+
+    # === Arithmetic and comparison ===
+
+    def op_add(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] + regs[code[ip + 3]]
+        return ip + 4
+
+    def op_subtract(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] - regs[code[ip + 3]]
+        return ip + 4
+
+    def op_multiply(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] * regs[code[ip + 3]]
+        return ip + 4
+
+    def op_divide(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] / regs[code[ip + 3]]
+        return ip + 4
+
+    def op_add_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] + self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_subtract_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] - self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_multiply_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] * self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_divide_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] / self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_eq(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] == regs[code[ip + 3]]
+        return ip + 4
+
+    def op_ne(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] != regs[code[ip + 3]]
+        return ip + 4
+
+    def op_lt(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] < regs[code[ip + 3]]
+        return ip + 4
+
+    def op_le(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] <= regs[code[ip + 3]]
+        return ip + 4
+
+    def op_gt(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] > regs[code[ip + 3]]
+        return ip + 4
+
+    def op_ge(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] >= regs[code[ip + 3]]
+        return ip + 4
+
+    def op_eq_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] == self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_ne_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] != self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_lt_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] < self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_le_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] <= self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_gt_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] > self.constants[code[ip + 3]]
+        return ip + 4
+
+    def op_ge_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        regs[code[ip + 1]] = regs[code[ip + 2]] >= self.constants[code[ip + 3]]
+        return ip + 4
+
+    # === Control flow ===
+
+    def op_jump(self, ip):
+        return self.instructions[ip + 1]
+
+    def op_jump_if_false(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]]:
+            return ip + 3
+        return code[ip + 2]
+
+    def op_jump_if_true(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]]:
+            return code[ip + 2]
+        return ip + 3
+
+    def op_jump_if_not_eq(self, ip):
+        code = self.instructions
+        regs = self.regs
+        if regs[code[ip + 1]] == regs[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_ne(self, ip):
+        code = self.instructions
+        regs = self.regs
+        if regs[code[ip + 1]] != regs[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_lt(self, ip):
+        code = self.instructions
+        regs = self.regs
+        if regs[code[ip + 1]] < regs[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_le(self, ip):
+        code = self.instructions
+        regs = self.regs
+        if regs[code[ip + 1]] <= regs[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_gt(self, ip):
+        code = self.instructions
+        regs = self.regs
+        if regs[code[ip + 1]] > regs[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_ge(self, ip):
+        code = self.instructions
+        regs = self.regs
+        if regs[code[ip + 1]] >= regs[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_eq_k(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]] == self.constants[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_ne_k(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]] != self.constants[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_lt_k(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]] < self.constants[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_le_k(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]] <= self.constants[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_gt_k(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]] > self.constants[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_jump_if_not_ge_k(self, ip):
+        code = self.instructions
+        if self.regs[code[ip + 1]] >= self.constants[code[ip + 2]]:
+            return ip + 4
+        return code[ip + 3]
+
+    def op_counted_loop(self, ip):
+        code = self.instructions
+        regs = self.regs
+        idx = code[ip + 1]
+        value = regs[idx] + self.constants[code[ip + 2]]
+        regs[idx] = value
+        if value < regs[code[ip + 3]]:
+            return code[ip + 4]
+        return ip + 5
+
+    def op_counted_loop_k(self, ip):
+        code = self.instructions
+        regs = self.regs
+        constants = self.constants
+        idx = code[ip + 1]
+        value = regs[idx] + constants[code[ip + 2]]
+        regs[idx] = value
+        if value < constants[code[ip + 3]]:
+            return code[ip + 4]
+        return ip + 5
+
+    def op_raise(self, ip):
+        raise RuntimeError(str(self.regs[self.instructions[ip + 1]]))
+
+    # === Calls ===
+
+    def op_call(self, ip):
+        code = self.instructions
+        regs = self.regs
+        fname = self.constants[code[ip + 2]]
+        first = code[ip + 3]
+        args = regs[first:first + code[ip + 4]]
+        func = self.functions.get(fname)
+        if func is None:
+            raise RuntimeError(f"Unknown function '{fname}'")
+        memo = self.memo_caches.get(fname)
+        if memo is not None:
+            value = memo.lookup(args)
+            if value is not MISS:
+                regs[code[ip + 1]] = value
+                return ip + 5
+            # A miss runs in a frame like any call; RETURN stores it
+            self.memo_frames[len(self.call_stack) + 1] = (memo, tuple(args))
+            self.dispatch[RETURN] = self.op_return_memo
+        entry, size = func
+        self.call_stack.append((ip + 5, regs, code[ip + 1]))
+        args.extend([None] * (size - len(args)))
+        self.regs = args
+        return entry
+
+    def op_call_builtin(self, ip):
+        code = self.instructions
+        regs = self.regs
+        first = code[ip + 3]
+        regs[code[ip + 1]] = self.linked[code[ip + 2]](*regs[first:first + code[ip + 4]])
+        return ip + 5
+
+    def op_return(self, ip):
+        value = self.regs[self.instructions[ip + 1]]
+        if not self.call_stack:
+            self.return_value = value
+            return len(self.instructions)
+        ip, regs, dest = self.call_stack.pop()
+        regs[dest] = value
+        self.regs = regs
+        return ip
+
+    def op_return_memo(self, ip):
+        # RETURN while memo calls are running in frames
+        frames = self.memo_frames
+        frame = frames.pop(len(self.call_stack), None)
+        if frame is not None:
+            memo, args = frame
+            memo.store(args, self.regs[self.instructions[ip + 1]])
+            if not frames:
+                self.dispatch[RETURN] = self.op_return
+        return self.op_return(ip)
+
+    def drop_memo_frames(self):
+        frames = self.memo_frames
+        for depth in [depth for depth in frames if depth > len(self.call_stack)]:
+            del frames[depth]
+        if not frames:
+            self.dispatch[RETURN] = self.op_return
+
+    # === Collections ===
+
+    def op_build_list(self, ip):
+        code = self.instructions
+        regs = self.regs
+        first = code[ip + 2]
+        regs[code[ip + 1]] = regs[first:first + code[ip + 3]]
+        return ip + 4
+
+    def op_concat(self, ip):
+        code = self.instructions
+        regs = self.regs
+        first = code[ip + 2]
+        regs[code[ip + 1]] = join(regs[first:first + code[ip + 3]])
+        return ip + 4
+
+    def op_build_dict(self, ip):
+        code = self.instructions
+        regs = self.regs
+        first = code[ip + 2]
+        items = regs[first:first + 2 * code[ip + 3]]
+        regs[code[ip + 1]] = dict(zip(items[::2], items[1::2]))
+        return ip + 4
+
+    def op_subscr(self, ip):
+        code = self.instructions
+        regs = self.regs
+        index = regs[code[ip + 3]]
+        try:
+            regs[code[ip + 1]] = regs[code[ip + 2]][index]
+        except (IndexError, KeyError, TypeError):
+            raise RuntimeError(f"Invalid index/key access: {index}")
+        return ip + 4
+
+    def op_unknown(self, ip):
+        raise RuntimeError(f"Unknown instruction {self.instructions[ip]}")
@@ -0,0 +1,173 @@
+# resolver.py
+#
+# Static pass over the ast_nodes tree that gives every variable a lexical
+# address. VariableReference and Assignment nodes get (depth, slot), where
+# depth counts scopes outward from the use site; VariableDeclaration nodes
+# get the slot they initialize, as do ImportStatement nodes for the module
+# they bind; FunctionDef nodes get the Scope their frames are built from.
+# Assignment nodes also get the declared type of their target (var_type).
+# FunctionCall nodes naming a builtin (stdlib.py) get the function itself
+# (builtin), unless the program defines a function of that name.
+
+from ast_nodes import *
+from memo import defined_functions, impurity, marked_functions
+from stdlib import BUILTINS
+
+
+class ResolveError(Exception):
+    pass
+
+
+class Scope:
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.slots = {}  # name -> slot index
+        self.names = []  # slot index -> name
+        self.types = {}  # name -> declared type
+        self.pending = []  # FunctionDef nodes whose bodies resolve once this scope is complete
+
+    def declare(self, name, var_type=None):
+        self.types[name] = var_type
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = len(self.names)
+            self.slots[name] = slot
+            self.names.append(name)
+        return slot
+
+    def lookup(self, name):
+        scope = self
+        depth = 0
+        while scope is not None:
+            slot = scope.slots.get(name)
+            if slot is not None:
+                return depth, slot
+            scope = scope.parent
+            depth += 1
+        return None
+
+    def declared_type(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.slots:
+                return scope.types.get(name)
+            scope = scope.parent
+        return None
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Resolver:
+    def __init__(self):
+        self.pure = set()  # names of functions marked pure or memo
+        self.defined = set()  # names of the functions the program being resolved defines
+
+    def resolve(self, node, scope):
+        self.visit(node, scope)
+        self.finish(scope)
+
+    def finish(self, scope):
+        # Function bodies are resolved after the enclosing scope, so they can
+        # refer to globals declared further down the file.
+        while scope.pending:
+            func = scope.pending.pop(0)
+            for stmt in func.body:
+                self.visit(stmt, func.scope)
+            self.finish(func.scope)
+
+    def visit(self, node, scope):
+        method = getattr(self, f"visit_{type(node).__name__}", None)
+        if method is None:
+            raise ResolveError(f"No resolve method for {type(node).__name__}")
+        method(node, scope)
+
+    def visit_all(self, nodes, scope):
+        for node in nodes:
+            self.visit(node, scope)
+
+    def visit_Program(self, node, scope):
+        self.pure |= marked_functions(node.statements)
+        self.defined = defined_functions(node.statements)
+        self.visit_all(node.statements, scope)
+
+    def visit_ImportStatement(self, node, scope):
+        node.slot = scope.declare(node.alias)
+
+    def visit_FunctionDef(self, node, scope):
+        if node.modifier is not None:
+            reason = impurity(node, self.pure, self.defined)
+            if reason is not None:
+                raise ResolveError(reason)
+        node.scope = Scope(parent=scope)
+        for typ, name in node.params:
+            node.scope.declare(name, typ)
+        scope.pending.append(node)
+
+    def visit_ReturnStatement(self, node, scope):
+        self.visit(node.value, scope)
+
+    def visit_RaiseStatement(self, node, scope):
+        self.visit(node.value, scope)
+
+    def visit_VariableDeclaration(self, node, scope):
+        # The initializer cannot see the variable it initializes
+        self.visit(node.initializer, scope)
+        node.slot = scope.declare(node.name, node.var_type)
+
+    def visit_Assignment(self, node, scope):
+        self.visit(node.value, scope)
+        node.depth, node.slot = self.address(node.name, scope)
+        node.var_type = scope.declared_type(node.name)
+
+    def visit_IfStatement(self, node, scope):
+        self.visit(node.condition, scope)
+        self.visit_all(node.then_body, scope)
+        self.visit_all(node.else_body, scope)
+
+    def visit_WhileLoop(self, node, scope):
+        self.visit(node.condition, scope)
+        self.visit_all(node.body, scope)
+
+    def visit_TryStatement(self, node, scope):
+        self.visit_all(node.try_body, scope)
+        node.slot = scope.declare(node.catch_name)
+        self.visit_all(node.catch_body, scope)
+
+    def visit_BinaryOperation(self, node, scope):
+        self.visit(node.left, scope)
+        self.visit(node.right, scope)
+
+    def visit_Literal(self, node, scope):
+        pass
+
+    def visit_VariableReference(self, node, scope):
+        node.depth, node.slot = self.address(node.name, scope)
+
+    def visit_FunctionCall(self, node, scope):
+        if node.target is not None:
+            self.visit(node.target, scope)
+        elif node.name not in self.defined:
+            node.builtin = BUILTINS.get(node.name)
+        self.visit_all(node.args, scope)
+
+    def visit_MemberAccess(self, node, scope):
+        self.visit(node.container, scope)
+
+    def visit_ListLiteralNode(self, node, scope):
+        self.visit_all(node.elements, scope)
+
+    def visit_DictLiteralNode(self, node, scope):
+        for key, value in node.pairs:
+            self.visit(key, scope)
+            self.visit(value, scope)
+
+    def visit_IndexAccessNode(self, node, scope):
+        self.visit(node.container, scope)
+        self.visit(node.index, scope)
+
+    def address(self, name, scope):
+        found = scope.lookup(name)
+        if found is None:
+            raise ResolveError(f"Undefined variable '{name}'")
+        return found
@@ -1,48 +1,96 @@
-from lexer.py import Lexer         
-from parser.py import Parser       
-from compiler.py import Compiler, Program  # Compiler and AST classes from compiler.py
 import sys
+import profiler
+from cache import compile_source, load_program
+from compiler import CompileError
+from vm import VirtualMachine
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python run.py <source_file>")
-        exit(1)
+OPT_FLAGS = {"-O0": 0, "-O1": 1, "-O2": 2}
+BACKENDS = ("stack", "register")
+
+
+def execute(bytecode, stats=False, profile=None):
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions, count=stats,
+                        memoized=bytecode.memoized, profiler=profile and profiler.Profiler(),
+                        exception_table=bytecode.exception_table)
+    return finish(vm, stats, profile)
+
+
+def execute_register(compiler, stats=False, profile=None):
+    from regvm import RegisterVM
+    vm = RegisterVM(compiler.instructions, compiler.constants, compiler.functions,
+                    compiler.frame_sizes, count=stats, memoized=compiler.memoized,
+                    profiler=profile and profiler.Profiler(), exception_table=compiler.exception_table)
+    return finish(vm, stats, profile)
 
-    with open(sys.argv[1], "r") as f:
-        source = f.read()
 
-    main(source)
+def finish(vm, stats, profile):
+    # profile is (sort key, collapsed stacks path) from profiler.options()
+    try:
+        result = vm.run()
+    finally:
+        if profile:
+            profiler.finish(vm.profiler, *profile)
+    if stats:
+        print_stats(vm)
+    return result
 
 
-def main(source_code):
-    # Lexing
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
+def print_stats(vm):
+    print(", ".join(f"{name} {count}" for name, count in vm.stats().items()), file=sys.stderr)
+    if vm.memo.caches:
+        print(vm.memo.report(), file=sys.stderr)
 
-    # Parsing
-    parser = Parser(tokens)
-    ast = parser.parse_program()  # returns a Program node
 
-    # Compiling
-    compiler = Compiler()
-    compiler.compile(ast)
+def main(source_code, opt_level=1, stats=False):
+    # Lexing, parsing, compiling and optimizing
+    bytecode = compile_source(source_code, opt_level)
 
     # Run VM
-    vm = VirtualMachine(compiler.instructions, compiler.constants, compiler.functions)
-    vm.run()
+    return execute(bytecode, stats)
 
-if __name__ == "__main__":
-    source = """
-    func add(int a, int b)
-        return a + b
 
-    func main()
-        int x = 5
-        int y = 10
-        print(add(x, y))
+def run_file(path, opt_level=1, use_cache=True, stats=False, backend="stack", profile=None):
+    if backend == "register":
+        import regvm
+        # Never cached, so --no-cache changes nothing
+        with open(path, "rb") as f:
+            return execute_register(regvm.compile_source(f.read(), opt_level), stats, profile)
+    # A valid .ijc cache entry skips the lexer, parser and compiler entirely
+    return execute(load_program(path, opt_level, use_cache), stats, profile)
+
 
-    main()
-    """
-    main(source)
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    opt_level = 1
+    use_cache = True
+    stats = False
+    backend = "stack"
+    try:
+        profile = profiler.options(args)
+    except ValueError as e:
+        print(e)
+        exit(1)
+    if "--vm" in args:
+        i = args.index("--vm")
+        backend = args[i + 1] if i + 1 < len(args) else ""
+        del args[i:i + 2]
+    for flag in [a for a in args if a in OPT_FLAGS or a in ("--no-cache", "--stats")]:
+        if flag == "--no-cache":
+            use_cache = False
+        elif flag == "--stats":
+            stats = True
+        else:
+            opt_level = OPT_FLAGS[flag]
+        args.remove(flag)
 
+    if not args or backend not in BACKENDS:
+        print(f"Usage: python run.py [--vm {'|'.join(BACKENDS)}] [-O0|-O1|-O2] [--no-cache] [--stats]"
+              " [--profile [--profile-sort time|calls|total|name] [--profile-stacks file]] <source_file>")
+        exit(1)
 
+    try:
+        run_file(args[0], opt_level, use_cache, stats, backend, profile)
+    except CompileError as e:
+        # Syntax and compile errors: nothing has run yet
+        print(e, file=sys.stderr)
+        exit(1)
@@ -3,65 +3,143 @@ from ast_nodes import *
 class RuntimeError(Exception):
     pass
 import os
-from lexer import Lexer
-from parser import Parser
 
-class Executor:
-    ...
-
-    def exec_ImportStatement(self, node, env):
-        filename = node.module_name
-        if not filename.endswith(".iji"):
-            filename += ".iji"
-        if not os.path.exists(filename):
-            raise RuntimeError(f"Import failed: File '{filename}' not found")
-
-        # Load and parse the imported file
-        with open(filename, "r") as f:
-            source = f.read()
+from memo import MISS, MemoTable
+from modules import REGISTRY, ModuleError, module_path
+from resolver import Resolver, ResolveError, Scope
+from stdlib import BUILTINS
+from vectors import ELEMENT_TYPES, coerce
 
-        tokens = Lexer(source).tokenize()
-        ast = Parser(tokens).parse()
 
-        # Execute in its own environment
-        import_env = Environment(parent=env)
-        self.execute(ast, import_env)
+UNSET = object()  # slot whose declaration has not executed yet
+RETURN = object()  # statement status: the enclosing function is returning
 
-        # Optionally: copy public symbols into current env
-        for name, value in import_env.vars.items():
-            if not name.startswith("_"):  # convention: underscore = private
-                env.define(name, value)
+# Errors a catch block handles; the message is bound to the catch variable
+CATCHABLE = (RuntimeError, ArithmeticError, LookupError, TypeError, ValueError, OSError)
 
 
 class Environment:
-    def __init__(self, parent=None):
-        self.vars = {}
+    def __init__(self, scope, parent=None, values=None):
+        self.scope = scope  # resolver.Scope naming the slots
+        self.values = [UNSET] * len(scope) if values is None else values
         self.parent = parent
 
+    def grow(self):
+        # The global scope gains slots as new programs are resolved into it
+        missing = len(self.scope) - len(self.values)
+        if missing > 0:
+            self.values.extend([UNSET] * missing)
+
+    def get_at(self, depth, slot):
+        env = self
+        while depth:
+            env = env.parent
+            depth -= 1
+        value = env.values[slot]
+        if value is UNSET:
+            raise RuntimeError(f"Variable '{env.scope.names[slot]}' used before declaration")
+        return value
+
+    def assign_at(self, depth, slot, value):
+        env = self
+        while depth:
+            env = env.parent
+            depth -= 1
+        if env.values[slot] is UNSET:
+            raise RuntimeError(f"Variable '{env.scope.names[slot]}' used before declaration")
+        env.values[slot] = value
+
+    # Name-based access for host code; resolved programs never use these
+
     def define(self, name, value):
-        self.vars[name] = value
+        slot = self.scope.declare(name)
+        self.grow()
+        self.values[slot] = value
 
     def assign(self, name, value):
-        if name in self.vars:
-            self.vars[name] = value
-        elif self.parent:
-            self.parent.assign(name, value)
-        else:
+        found = self.scope.lookup(name)
+        if found is None:
             raise RuntimeError(f"Undefined variable '{name}'")
+        self.assign_at(*found, value)
 
     def get(self, name):
-        if name in self.vars:
-            return self.vars[name]
-        elif self.parent:
-            return self.parent.get(name)
-        else:
+        found = self.scope.lookup(name)
+        if found is None:
             raise RuntimeError(f"Undefined variable '{name}'")
+        return self.get_at(*found)
+
+
+class Function:
+    # A FunctionDef bound to the environment and module it was defined in,
+    # with its argument binding worked out once
+    def __init__(self, node, closure, module):
+        self.name = node.name
+        self.arity = len(node.params)
+        self.scope = node.scope
+        self.body = node.body
+        self.closure = closure
+        self.module = module  # calls in the body look up functions in module.functions
+        self.compiled = None  # body compiled by backends that compile, on first call
+        self.memo = None  # MemoCache of a memo function
+        self.frame_tail = [UNSET] * (len(node.scope) - self.arity)  # non-parameter slots
+        # (index, type) of list[int] / list[float] parameters, converted on entry
+        self.typed_params = [(i, typ) for i, (typ, _) in enumerate(node.params) if typ in ELEMENT_TYPES]
+
+    def new_env(self, args):
+        if len(args) != self.arity:
+            raise RuntimeError(f"Function '{self.name}' expects {self.arity} arguments, got {len(args)}")
+        if self.typed_params:
+            args = list(args)
+            for i, typ in self.typed_params:
+                args[i] = coerce(typ, args[i])
+        # Parameters occupy the first slots of the function's scope
+        return Environment(self.scope, self.closure, args + self.frame_tail)
+
+
+class Module:
+    # An executed .iji file. Importers bind the Module itself; members are
+    # looked up in its own globals and function table.
+    def __init__(self, name, path, env):
+        self.name = name
+        self.path = path  # None for a program that did not come from a file
+        self.env = env
+        self.functions = {}
+        self.compiler = None  # backend state for code compiled in this module
+
+    def get(self, name):
+        slot = self.env.scope.slots.get(name)
+        if slot is None or name.startswith("_"):
+            raise RuntimeError(f"Module '{self.name}' has no member '{name}'")
+        value = self.env.values[slot]
+        if value is UNSET:
+            raise RuntimeError(f"Variable '{name}' of module '{self.name}' used before declaration")
+        return value
+
+    def function(self, name):
+        func = self.functions.get(name)
+        if func is None or name.startswith("_"):
+            raise RuntimeError(f"Module '{self.name}' has no function '{name}'")
+        return func
+
+    def __repr__(self):
+        return f"<module {self.name}>"
 
 
 class Executor:
-    def __init__(self):
-        self.global_env = Environment()
-        self.functions = {}
+    def __init__(self, tail_calls=False, path=None, memo=None):
+        self.resolver = Resolver()
+        self.memo = memo or MemoTable()  # caches of memo functions, by name
+        self.global_env = Environment(Scope())
+        self.main = Module("__main__", path, self.global_env)
+        self.module = self.main  # module whose code is running
+        self.functions = self.module.functions
+        self.modules = {}  # resolved path -> Module, each file executed once
+        # With tail_calls, 'return f(...)' reuses the current call loop instead
+        # of nesting a Python call, so tail recursion runs in constant stack
+        self.tail_calls = tail_calls
+        self.return_value = None
+        self.tail_call = None  # (Function, args) waiting to replace the current call
+        self.try_depth = 0  # try bodies the current call is running in
         self._register_builtins()
 
     def execute(self, node, env=None):
@@ -72,44 +150,118 @@ class Executor:
     def generic_exec(self, node, env):
         raise RuntimeError(f"No exec method for {type(node).__name__}")
 
+    def resolve(self, node, env):
+        try:
+            self.resolver.resolve(node, env.scope)
+        except ResolveError as e:
+            raise RuntimeError(str(e))
+        env.grow()
+
     def exec_Program(self, node, env):
-        result = None
-        for stmt in node.statements:
-            result = self.execute(stmt, env)
-        return result
+        self.resolve(node, env)
+        if self.exec_block(node.statements, env) is RETURN:
+            return self.finish_return()
+        return None
+
+    def exec_block(self, stmts, env):
+        for stmt in stmts:
+            if self.execute(stmt, env) is RETURN:
+                return RETURN
+        return None
 
     def exec_ImportStatement(self, node, env):
-        # Optional: implement import execution here
-        pass
+        env.values[node.slot] = self.import_module(node.path, self.module)
+
+    def import_module(self, name, importer):
+        base_dir = os.path.dirname(importer.path) if importer.path else None
+        path = module_path(name, base_dir)
+        module = self.modules.get(path)
+        if module is not None:
+            return module
+        try:
+            program = REGISTRY.load(path)
+        except ModuleError as e:
+            raise RuntimeError(str(e))
+        errors = REGISTRY.errors(path)
+        if errors:
+            raise RuntimeError(f"Import failed: {path}: {errors[0]}")
+        alias = os.path.basename(path)[:-len(".iji")]
+        env = Environment(Scope())
+        self._register_builtins(env)
+        # Registered before it runs, so a circular import sees the partly
+        # initialized module instead of recursing
+        module = self.modules[path] = Module(alias, path, env)
+        self.run_module(module, program)
+        return module
+
+    def run_module(self, module, program):
+        caller, functions = self.module, self.functions
+        self.module, self.functions = module, module.functions
+        try:
+            self.execute(program, module.env)
+        finally:
+            self.module, self.functions = caller, functions
 
     def exec_FunctionDef(self, node, env):
-        self.functions[node.name] = (node.params, node.body)
+        # Functions close over the environment they are defined in
+        self.functions[node.name] = self.make_function(node, env, self.module)
+
+    def make_function(self, node, env, module):
+        func = Function(node, env, module)
+        if node.modifier == "memo":
+            name = node.name if module is self.main else f"{module.name}.{node.name}"
+            func.memo = self.memo.cache(name)
+        return func
 
     def exec_ReturnStatement(self, node, env):
-        value = self.eval_expr(node.value, env)
-        raise ReturnSignal(value)
+        expr = node.value
+        # A call in a try body has to run before its catch is left
+        if (self.tail_calls and isinstance(expr, FunctionCall) and not self.try_depth
+                and expr.builtin is None and expr.target is None and expr.name in self.functions):
+            args = [self.eval_expr(arg, env) for arg in expr.args]
+            self.tail_call = (self.functions[expr.name], args)
+        else:
+            self.return_value = self.eval_expr(expr, env)
+        return RETURN
+
+    def exec_RaiseStatement(self, node, env):
+        raise RuntimeError(str(self.eval_expr(node.value, env)))
 
     def exec_VariableDeclaration(self, node, env):
         value = self.eval_expr(node.initializer, env)
-        env.define(node.name, value)
+        if node.var_type in ELEMENT_TYPES:
+            value = coerce(node.var_type, value)
+        env.values[node.slot] = value
 
     def exec_Assignment(self, node, env):
         value = self.eval_expr(node.value, env)
-        env.assign(node.name, value)
+        if node.var_type in ELEMENT_TYPES:
+            value = coerce(node.var_type, value)
+        env.assign_at(node.depth, node.slot, value)
 
     def exec_IfStatement(self, node, env):
         cond = self.eval_expr(node.condition, env)
         if cond:
-            for stmt in node.then_body:
-                self.execute(stmt, env)
-        else:
-            for stmt in node.else_body:
-                self.execute(stmt, env)
+            return self.exec_block(node.then_body, env)
+        return self.exec_block(node.else_body, env)
 
     def exec_WhileLoop(self, node, env):
         while self.eval_expr(node.condition, env):
-            for stmt in node.body:
-                self.execute(stmt, env)
+            if self.exec_block(node.body, env) is RETURN:
+                return RETURN
+        return None
+
+    def exec_TryStatement(self, node, env):
+        depth = self.try_depth
+        self.try_depth = depth + 1
+        try:
+            result = self.exec_block(node.try_body, env)
+        except CATCHABLE as e:
+            self.try_depth = depth
+            env.values[node.slot] = str(e)
+            return self.exec_block(node.catch_body, env)
+        self.try_depth = depth
+        return result
 
     def exec_FunctionCall(self, node, env):
         return self.eval_expr(node, env)
@@ -118,35 +270,91 @@ class Executor:
         if isinstance(expr, Literal):
             return expr.value
         elif isinstance(expr, VariableReference):
-            return env.get(expr.name)
+            return env.get_at(expr.depth, expr.slot)
         elif isinstance(expr, BinaryOperation):
             left = self.eval_expr(expr.left, env)
             right = self.eval_expr(expr.right, env)
             return self.apply_operator(expr.operator, left, right)
         elif isinstance(expr, FunctionCall):
-            if expr.name == "print":
-                args = [self.eval_expr(arg, env) for arg in expr.args]
-                print(*args)
-                return None
-            elif expr.name == "input":
-                prompt = self.eval_expr(expr.args[0], env)
-                return input(prompt)
-            elif expr.name in self.functions:
-                params, body = self.functions[expr.name]
-                new_env = Environment(parent=env)
-                for (typ, name), arg in zip(params, expr.args):
-                    new_env.define(name, self.eval_expr(arg, env))
-                try:
-                    for stmt in body:
-                        self.execute(stmt, new_env)
-                except ReturnSignal as rs:
-                    return rs.value
-                return None
+            builtin = expr.builtin
+            if builtin is not None:
+                return builtin(*[self.eval_expr(arg, env) for arg in expr.args])
+            if expr.target is not None:
+                func = self.module_of(self.eval_expr(expr.target, env)).function(expr.name)
             else:
-                raise RuntimeError(f"Unknown function '{expr.name}'")
+                func = self.functions.get(expr.name)
+                if func is None:
+                    builtin = BUILTINS.get(expr.name)
+                    if builtin is None:
+                        raise RuntimeError(f"Unknown function '{expr.name}'")
+                    return builtin(*[self.eval_expr(arg, env) for arg in expr.args])
+            return self.call_function(func, [self.eval_expr(arg, env) for arg in expr.args])
+        elif isinstance(expr, MemberAccess):
+            return self.module_of(self.eval_expr(expr.container, env)).get(expr.name)
+        elif isinstance(expr, (ListLiteralNode, DictLiteralNode, IndexAccessNode)):
+            return self.execute(expr, env)
         else:
             raise RuntimeError(f"Unsupported expression type: {type(expr).__name__}")
 
+    def module_of(self, value):
+        if not isinstance(value, Module):
+            raise RuntimeError(f"'.' expects a module, got {type(value).__name__}")
+        return value
+
+    def call_in_module(self, func, args):
+        # Runs func with its own module's function table current
+        caller, functions = self.module, self.functions
+        self.module, self.functions = func.module, func.module.functions
+        try:
+            return self.call_function(func, args)
+        finally:
+            self.module, self.functions = caller, functions
+
+    def call_function(self, func, args):
+        if func.module is not self.module:
+            return self.call_in_module(func, args)
+        if func.memo is not None:
+            return self.call_memo(func, args)
+        return self.invoke(func, args)
+
+    def call_memo(self, func, args):
+        value = func.memo.lookup(args)
+        if value is MISS:
+            value = self.invoke(func, args)
+            func.memo.store(args, value)
+        return value
+
+    def invoke(self, func, args):
+        # The callee's returns are its own: a try around the call does not
+        # stop them being tail calls
+        depth = self.try_depth
+        self.try_depth = 0
+        try:
+            while True:
+                if self.exec_block(func.body, func.new_env(args)) is not RETURN:
+                    return None
+                if self.tail_call is None:
+                    value = self.return_value
+                    self.return_value = None
+                    return value
+                # Tail call: run the callee in place of the current frame
+                func, args = self.tail_call
+                self.tail_call = None
+                if func.module is not self.module:
+                    return self.call_in_module(func, args)
+        finally:
+            self.try_depth = depth
+
+    def finish_return(self):
+        # A return at the top level ends the program with that value
+        if self.tail_call is not None:
+            func, args = self.tail_call
+            self.tail_call = None
+            return self.call_function(func, args)
+        value = self.return_value
+        self.return_value = None
+        return value
+
     def apply_operator(self, op, left, right):
         if op == "+": return left + right
         if op == "-": return left - right
@@ -160,25 +368,25 @@ class Executor:
         if op == ">=": return left >= right
         raise RuntimeError(f"Unknown operator '{op}'")
 
-    def _register_builtins(self):
-        self.global_env.define("true", True)
-        self.global_env.define("false", False)
-    def exec_ListLiteralNode(self, node, env):
-    return [self.execute(e, env) for e in node.elements]
+    def _register_builtins(self, env=None):
+        env = env or self.global_env
+        env.define("true", True)
+        env.define("false", False)
 
-def exec_DictLiteralNode(self, node, env):
-    return {self.execute(k, env): self.execute(v, env) for k, v in node.pairs}
+    def exec_ListLiteralNode(self, node, env):
+        return [self.eval_expr(e, env) for e in node.elements]
 
-def exec_IndexAccessNode(self, node, env):
-    container = self.execute(node.container, env)
-    index = self.execute(node.index, env)
-    try:
-        return container[index]
-    except (IndexError, KeyError, TypeError):
-        raise RuntimeError(f"Invalid index/key access: {index}")
+    def exec_MemberAccess(self, node, env):
+        return self.eval_expr(node, env)
 
+    def exec_DictLiteralNode(self, node, env):
+        return {self.eval_expr(k, env): self.eval_expr(v, env) for k, v in node.pairs}
 
+    def exec_IndexAccessNode(self, node, env):
+        container = self.eval_expr(node.container, env)
+        index = self.eval_expr(node.index, env)
+        try:
+            return container[index]
+        except (IndexError, KeyError, TypeError):
+            raise RuntimeError(f"Invalid index/key access: {index}")
 
-class ReturnSignal(Exception):
-    def __init__(self, value):
-        self.value = value
@@ -0,0 +1,366 @@
+# serve.py
+#
+# ijichi serve: a daemon that runs Ijichi scripts for client.py without a
+# new Python process per script. The server imports the lexer, parser and
+# executors once, then forks a pool of workers that inherit them. Each
+# request (the ijichi.py arguments, the client's working directory and its
+# stdin/stdout/stderr as file descriptors) goes to an idle worker, which
+# runs ijichi.run_command() with the client's streams as sys.stdin/stdout/
+# stderr and reports the exit status back.
+#
+# Workers keep their module registry between requests with by_content set
+# (modules.py): an entry script or import is parsed once per worker and
+# reused for as long as its path and the digest of its source are the same.
+# A request goes back to the worker that last ran the same script when
+# that worker is idle, so a script is mostly parsed once per server.
+#
+# The server times every request from accept to reply (latency) and inside
+# the worker (run); python client.py --server-stats prints percentiles of
+# the last STATS_WINDOW. A client that goes away mid-run interrupts the
+# worker with SIGINT; a worker that dies is replaced.
+#
+#   python ijichi.py serve [--socket path] [-w workers]
+#   python serve.py [--socket path] [-w workers]
+
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+from collections import deque
+
+import ijichi  # noqa: F401  imported before forking, so workers inherit it
+import closures  # noqa: F401
+from client import SOCKET, MAX_FDS, send_message, receive_message
+from modules import REGISTRY
+
+STATS_WINDOW = 10000  # requests kept for percentiles
+PERCENTILES = (50, 90, 99)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    # Nearest rank, in milliseconds
+    found = {f"p{p}": ordered[max(0, (len(ordered) * p + 99) // 100 - 1)] * 1000 for p in PERCENTILES}
+    found["max"] = ordered[-1] * 1000
+    return found
+
+
+def exit_status(code):
+    # What the interpreter would exit with for SystemExit(code)
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+# === Worker side ===
+
+def work(control):
+    REGISTRY.by_content = True
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # only a running script is interrupted
+    while True:
+        message, fds = receive_message(control, MAX_FDS)
+        if message is None:
+            return  # the server is gone
+        hits, misses = REGISTRY.hits, REGISTRY.misses
+        start = time.perf_counter()
+        status = run_request(message["args"], message["cwd"], fds)
+        send_message(control, {
+            "status": status,
+            "run": time.perf_counter() - start,
+            "hits": REGISTRY.hits - hits,
+            "misses": REGISTRY.misses - misses,
+        })
+
+
+def run_request(args, cwd, fds):
+    saved = sys.stdin, sys.stdout, sys.stderr, sys.argv
+    streams = []
+    try:
+        streams = [open(fds[0], "r", closefd=False), open(fds[1], "w", closefd=False),
+                   open(fds[2], "w", buffering=1, closefd=False)]
+        sys.stdin, sys.stdout, sys.stderr = streams
+        sys.argv = ["ijichi.py"] + args
+        os.chdir(cwd)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        try:
+            status = ijichi.run_command(list(args))
+        except SystemExit as e:
+            status = exit_status(e.code)
+        except KeyboardInterrupt:
+            status = 130
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+        return status
+    except OSError as e:
+        # Bad cwd or streams: nothing to report to but the status
+        print(f"serve.py: {e}", file=saved[2])
+        return 1
+    finally:
+        for stream in streams:
+            try:
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+        sys.stdin, sys.stdout, sys.stderr, sys.argv = saved
+        for fd in fds:
+            os.close(fd)
+
+
+# === Server side ===
+
+class Worker:
+    def __init__(self, pid, control):
+        self.pid = pid
+        self.control = control
+        self.request = None  # Request being run
+        self.last_key = None
+
+
+class Request:
+    def __init__(self, conn, accepted):
+        self.conn = conn
+        self.accepted = accepted
+        self.message = None
+        self.fds = []
+        self.worker = None
+
+    def key(self):
+        # The script, as far as the arguments tell without parsing them
+        return self.message["cwd"], self.message["args"][-1:]
+
+
+class Server:
+    def __init__(self, path=SOCKET, workers=None):
+        self.path = path
+        self.size = workers or os.cpu_count() or 1
+        self.selector = selectors.DefaultSelector()
+        self.listener = None
+        self.workers = []
+        self.idle = []  # Workers, least recently used first
+        self.queue = deque()  # Requests waiting for a worker
+        self.clients = set()  # every open Request
+        self.latency = deque(maxlen=STATS_WINDOW)
+        self.run_times = deque(maxlen=STATS_WINDOW)
+        self.requests = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def listen(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)  # left behind by a server that died
+            else:
+                raise SystemExit(f"serve.py: a server is already listening on {self.path}")
+            finally:
+                probe.close()
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, self.accept)
+
+    def spawn(self):
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                ours.close()
+                self.close_inherited()
+                work(theirs)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        theirs.close()
+        worker = Worker(pid, ours)
+        self.workers.append(worker)
+        self.idle.append(worker)
+        self.selector.register(ours, selectors.EVENT_READ, lambda: self.finished(worker))
+
+    def close_inherited(self):
+        # In a new worker: the server's sockets, so EOF still means what it should
+        self.selector.close()
+        self.listener.close()
+        for worker in self.workers:
+            worker.control.close()
+        for request in self.clients:
+            request.conn.close()
+            for fd in request.fds:
+                os.close(fd)
+
+    def serve_forever(self):
+        self.listen()
+        for _ in range(self.size):
+            self.spawn()
+        print(f"serve.py: {self.size} workers on {self.path}", file=sys.stderr)
+        while True:
+            for key, _ in self.selector.select():
+                key.data()
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        for worker in self.workers:
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+                os.waitpid(worker.pid, 0)
+            except OSError:
+                pass
+
+    def accept(self):
+        try:
+            conn, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        request = Request(conn, time.perf_counter())
+        self.clients.add(request)
+        self.selector.register(conn, selectors.EVENT_READ, lambda: self.received(request))
+
+    def received(self, request):
+        # The request message, or, while a worker runs it, the client hanging up
+        if request.worker is not None:
+            os.kill(request.worker.pid, signal.SIGINT)
+            self.selector.unregister(request.conn)
+            return
+        try:
+            request.conn.setblocking(True)
+            request.message, request.fds = receive_message(request.conn, MAX_FDS)
+        except (OSError, ValueError) as e:
+            request.message = {"bad": str(e)}
+        if request.message is None or request.message.get("stats"):
+            self.end(request, self.stats() if request.message else None)
+        elif "args" not in request.message or len(request.fds) != MAX_FDS:
+            self.end(request, {"error": f"bad request {request.message}"})
+        else:
+            self.queue.append(request)
+            self.dispatch()
+
+    def dispatch(self):
+        while self.queue and self.idle:
+            request = self.queue.popleft()
+            key = request.key()
+            worker = next((w for w in self.idle if w.last_key == key), self.idle[0])
+            self.idle.remove(worker)
+            worker.request, worker.last_key = request, key
+            request.worker = worker
+            try:
+                send_message(worker.control, {"args": request.message["args"], "cwd": request.message["cwd"]},
+                             request.fds)
+            except OSError:
+                pass  # the worker died; finished() sees its EOF and answers the client
+            for fd in request.fds:
+                os.close(fd)
+            request.fds = []
+
+    def finished(self, worker):
+        try:
+            message, _ = receive_message(worker.control)
+        except (OSError, ValueError):
+            message = None
+        request, worker.request = worker.request, None
+        if message is None:
+            self.replace(worker)
+            if request is not None:
+                self.end(request, {"error": "the worker running the script exited"})
+            return
+        self.requests += 1
+        self.latency.append(time.perf_counter() - request.accepted)
+        self.run_times.append(message["run"])
+        self.cache_hits += message["hits"]
+        self.cache_misses += message["misses"]
+        self.end(request, {"status": message["status"]})
+        self.idle.append(worker)
+        self.dispatch()
+
+    def replace(self, worker):
+        self.selector.unregister(worker.control)
+        worker.control.close()
+        self.workers.remove(worker)
+        if worker in self.idle:
+            self.idle.remove(worker)
+        try:
+            os.waitpid(worker.pid, 0)
+        except OSError:
+            pass
+        self.spawn()
+        self.dispatch()
+
+    def end(self, request, reply):
+        # Answers and closes a request; reply None for a client already gone
+        self.clients.discard(request)
+        if request.conn in self.selector.get_map():
+            self.selector.unregister(request.conn)
+        if reply is not None:
+            try:
+                request.conn.setblocking(True)
+                send_message(request.conn, reply)
+            except OSError:
+                pass
+        request.conn.close()
+        for fd in request.fds:
+            os.close(fd)
+
+    def stats(self):
+        busy = len(self.workers) - len(self.idle)
+        return {
+            "requests": self.requests,
+            "workers": len(self.workers),
+            "busy": busy,
+            "queued": len(self.queue),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "latency": percentiles(self.latency),
+            "run": percentiles(self.run_times),
+        }
+
+
+def main(argv):
+    path = SOCKET
+    workers = None
+    if "--socket" in argv:
+        i = argv.index("--socket")
+        path = argv[i + 1] if i + 1 < len(argv) else ""
+        del argv[i:i + 2]
+    if "-w" in argv:
+        i = argv.index("-w")
+        workers = int(argv[i + 1]) if i + 1 < len(argv) and argv[i + 1].isdigit() else 0
+        del argv[i:i + 2]
+    if argv or not path or workers == 0:
+        print("Usage: python ijichi.py serve [--socket path] [-w workers]")
+        return 1
+    server = Server(path, workers)
+    # SIGTERM and Ctrl-C both stop the server and its workers
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -8,6 +8,9 @@ setup(
     author_email='your.email@example.com',
     packages=find_packages(),
     install_requires=[],
+    extras_require={
+        'numpy': ['numpy'],  # list[int] / list[float] storage; array.array otherwise
+    },
     entry_points={
         'console_scripts': [
             'ijichi=ijichi.cli:main',  # assumes `cli.py` has a `main()` function
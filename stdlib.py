@@ -0,0 +1,173 @@
+# stdlib.py
+#
+# The builtin registry: every function an Ijichi program can call without
+# defining it, shared by the Executor, the closure mode and both VMs. A
+# program's own function of the same name takes precedence. Call sites are
+# bound once, before the program runs: the resolver stores the function on
+# the FunctionCall node (FunctionCall.builtin) and the compilers emit
+# CALL_BUILTIN, whose operand the VMs map to the function when they load the
+# program. No call to a builtin compares or looks up its name at run time.
+#
+# Builtins report bad arguments with TypeError or ValueError (OSError for
+# files), which try/catch handles in every backend. PURE lists those
+# without side effects, the only ones a pure or memo function may call;
+# RESULT_TYPES gives the compilers the type of a call's value.
+#
+# New builtins go in one of the groups below; the typed-list builtins are
+# in vectors.py and the string-buffer ones in strings.py.
+
+import math
+import operator
+import os
+import random as _random
+import time as _time
+
+from strings import STRING_BUILTINS
+from vectors import VECTOR_BUILTINS, TypedList
+
+BUILTINS = {}  # name -> Python callable
+PURE = set()  # names of the builtins without side effects
+RESULT_TYPES = {}  # name -> declared type every call returns, where there is one
+
+
+def register(functions, pure, **result_types):
+    BUILTINS.update(functions)
+    if pure:
+        PURE.update(functions)
+    RESULT_TYPES.update(result_types)
+
+
+# === Conversions ===
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Cannot convert {value!r} to int")
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Cannot convert {value!r} to float")
+
+
+def type_name(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, dict):
+        return "dict"
+    if isinstance(value, list):
+        return "list"
+    if isinstance(value, TypedList):
+        return f"list[{value.kind}]"
+    return type(value).__name__
+
+
+register({
+    "str": str,
+    "length": len,
+    "to_int": to_int,
+    "to_float": to_float,
+    "type": type_name,
+}, pure=True, str="string", length="int", to_int="int", to_float="float", type="string")
+
+
+# === Strings ===
+
+def substring(text, start, end=None):
+    if type(text) is not str:
+        raise TypeError(f"substring expects a string, got {type_name(text)}")
+    return text[start:end]
+
+
+def join_strings(values, separator=""):
+    return str.join(separator, values)
+
+
+register({
+    "upper": str.upper,
+    "lower": str.lower,
+    "trim": str.strip,
+    "split": str.split,
+    "join": join_strings,
+    "replace": str.replace,
+    "find": str.find,
+    "starts_with": str.startswith,
+    "ends_with": str.endswith,
+    "substring": substring,
+    "contains": operator.contains,
+    **STRING_BUILTINS,
+}, pure=True, upper="string", lower="string", trim="string", join="string", replace="string",
+   find="int", starts_with="bool", ends_with="bool", substring="string", contains="bool")
+
+
+# === Math ===
+
+register({
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "sqrt": math.sqrt,
+    "pow": pow,
+    "log": math.log,
+    "sin": math.sin,
+    "cos": math.cos,
+    **VECTOR_BUILTINS,
+}, pure=True, floor="int", ceil="int", sqrt="float", log="float", sin="float", cos="float")
+
+register({
+    "random": _random.random,
+    "random_int": _random.randint,
+}, pure=False, random="float", random_int="int")
+
+
+# === I/O ===
+
+def read_file(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def write_file(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def append_file(path, text):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+
+register({
+    "print": print,
+    "input": input,
+    "read_file": read_file,
+    "write_file": write_file,
+    "append_file": append_file,
+    "file_exists": os.path.exists,
+}, pure=False, read_file="string", file_exists="bool")
+
+
+# === Time ===
+
+def format_time(seconds, pattern="%Y-%m-%d %H:%M:%S"):
+    return _time.strftime(pattern, _time.localtime(seconds))
+
+
+register({
+    "time": _time.time,
+    "clock": _time.perf_counter,
+    "sleep": _time.sleep,
+    "format_time": format_time,
+}, pure=False, time="float", clock="float", format_time="string")
@@ -0,0 +1,50 @@
+# strings.py
+#
+# Runtime side of string building. join() is the multi-operand concatenation
+# behind BUILD_STRING (stack VM) and CONCAT (register VM): a whole chain
+# a + b + c + ... of strings becomes one "".join() instead of a new string
+# per +.
+#
+# append_string and string_value are the builtins the concat pass
+# (concat.py) rewrites accumulation loops to. The buffer is a plain list of
+# pieces; appending is O(1) and the pieces are joined only when the value is
+# read, so building a string of n pieces is linear instead of quadratic.
+# A buffer holds either strings only or a single value of another type, and
+# anything that is not string + string is computed with + exactly as the
+# original loop would have.
+
+from functools import reduce
+from operator import add
+
+
+def join(pieces):
+    for piece in pieces:
+        if type(piece) is not str:
+            # Same result, or same error, as evaluating the + chain
+            return reduce(add, pieces)
+    return "".join(pieces)
+
+
+def append_string(buffer, *pieces):
+    # buffer = buffer + pieces[0] + pieces[1] ..., all or nothing
+    if type(buffer[0]) is str:
+        for piece in pieces:
+            if type(piece) is not str:
+                break
+        else:
+            buffer.extend(pieces)
+            return None
+    buffer[:] = [reduce(add, pieces, string_value(buffer))]
+    return None
+
+
+def string_value(buffer):
+    if len(buffer) > 1:
+        buffer[:] = ["".join(buffer)]
+    return buffer[0]
+
+
+STRING_BUILTINS = {
+    "append_string": append_string,
+    "string_value": string_value,
+}
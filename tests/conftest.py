@@ -0,0 +1,71 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def run(tmp_path):
+    # run(source, *args, script="run.py", env=None) writes source to a file
+    # and runs it the way a user would; returns the CompletedProcess
+    def run(source, *args, script="run.py", env=None, name="main.iji"):
+        path = tmp_path / name
+        path.write_text(source)
+        environment = dict(os.environ, **(env or {}))
+        return subprocess.run([sys.executable, os.path.join(ROOT, script), *args, str(path)],
+                              capture_output=True, text=True, env=environment, cwd=tmp_path, timeout=120)
+    return run
+
+
+def capture(function):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        function()
+    return output.getvalue()
+
+
+def walk(source, executor):
+    from lexer import Lexer
+    from modules import parse
+    program, errors = parse(Lexer(source))
+    assert not errors
+    executor().execute(program)
+
+
+def stack_vm(source, opt_level):
+    from cache import compile_source
+    from run import execute
+    execute(compile_source(source, opt_level))
+
+
+def register_vm(source):
+    from regvm import compile_source
+    from run import execute_register
+    execute_register(compile_source(source))
+
+
+@pytest.fixture
+def outputs():
+    # outputs(source) -> {backend: what the program printed} for every
+    # backend, run in this process
+    from closures import ClosureExecutor
+    from runtime import Executor
+
+    backends = {
+        "walk": lambda source: walk(source, Executor),
+        "closure": lambda source: walk(source, ClosureExecutor),
+        "vm -O0": lambda source: stack_vm(source, 0),
+        "vm -O1": lambda source: stack_vm(source, 1),
+        "vm -O2": lambda source: stack_vm(source, 2),
+        "register": register_vm,
+    }
+
+    def outputs(source):
+        return {name: capture(lambda: backend(source)) for name, backend in backends.items()}
+    return outputs
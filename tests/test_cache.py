@@ -0,0 +1,127 @@
+import marshal
+import os
+
+import pytest
+
+import cache
+from compiler import CompileError
+
+LOOP = """list[int] xs = int_list([1, 2, 3])
+int total = 0
+int i = 0
+while i < length(xs)
+    total = total + xs[i]
+    i = i + 1
+print(total)
+"""
+
+
+def cached_header(path):
+    data = path.read_bytes()
+    assert data.startswith(cache.MAGIC)
+    return marshal.loads(data[len(cache.MAGIC):])[0]
+
+
+def test_ast_passes_are_part_of_the_key(run, tmp_path, monkeypatch):
+    assert run(LOOP).stdout == "6\n"
+    assert cached_header(tmp_path / "main.ijc")[3] == ("vectorize", "concat")
+    assert run(LOOP, env={"IJICHI_NO_VECTORIZE": "1"}).stdout == "6\n"
+    assert cached_header(tmp_path / "main.ijc")[3] == ("concat",)
+
+    digest = cache.source_hash(LOOP.encode())
+    data = (tmp_path / "main.ijc").read_bytes()
+    monkeypatch.setenv("IJICHI_NO_VECTORIZE", "1")
+    assert cache.load(data, digest, 1) is not None
+    monkeypatch.delenv("IJICHI_NO_VECTORIZE")
+    assert cache.load(data, digest, 1) is None
+    assert cache.enabled_passes(0) == ()
+
+
+PROGRAM = """int x = 1
+func f(int n)
+    if n < 1
+        return 0
+    else if n < 5
+        return 1
+    return 2
+
+while x < 3
+    print(x)
+    x = x * 2
+print(f(x))
+"""
+
+
+@pytest.mark.parametrize("opt_level", [0, 1, 2])
+def test_line_table(opt_level):
+    bytecode = cache.compile_source(PROGRAM.encode(), opt_level)
+    offsets = [offset for offset, _ in bytecode.line_table]
+    assert offsets == sorted(offsets)
+    assert {line for _, line in bytecode.line_table} >= {1, 2, 3, 4, 5, 6, 7, 9, 10, 11, 12}
+
+
+def test_round_trip():
+    bytecode = cache.compile_source(PROGRAM.encode(), 1)
+    digest = cache.source_hash(PROGRAM.encode())
+    loaded = cache.load(cache.dump(bytecode, digest, 1), digest, 1)
+    for field in ("instructions", "constants", "functions", "line_table", "exception_table"):
+        assert list(getattr(loaded, field)) == list(getattr(bytecode, field))
+    assert list(loaded.memoized) == list(bytecode.memoized)
+
+
+def test_stale_entries_are_rejected(monkeypatch):
+    bytecode = cache.compile_source(PROGRAM.encode(), 1)
+    digest = cache.source_hash(PROGRAM.encode())
+    data = cache.dump(bytecode, digest, 1)
+    assert cache.load(data, cache.source_hash(b"print(1)\n"), 1) is None
+    assert cache.load(data, digest, 2) is None
+    assert cache.load(data[:len(data) // 2], digest, 1) is None
+    assert cache.load(b"not a cache file", digest, 1) is None
+    monkeypatch.setattr(cache, "COMPILER_VERSION", -1)
+    assert cache.load(data, digest, 1) is None
+
+
+def test_cached_run_matches_fresh_run(run, tmp_path):
+    first = run(PROGRAM)
+    assert (tmp_path / "main.ijc").exists()
+    assert run(PROGRAM).stdout == first.stdout == "1\n2\n1\n"
+    assert run(PROGRAM.replace("print(x)", "print(x * 10)")).stdout == "10\n20\n1\n"
+
+
+def test_line_markers_do_not_block_store_load():
+    from opcodes import STORE_LOAD_VAR, decode
+    bytecode = cache.compile_source(b"int x = 2\nint y = x * 3\nprint(y)\n", 2)
+    assert STORE_LOAD_VAR in [op for _, op, _ in decode(bytecode.instructions)]
+    assert [line for _, line in bytecode.line_table] == [1, 2, 3]
+
+
+def test_warm_a_tree(tmp_path, capsys):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.iji").write_text("print(1)\n")
+    (tmp_path / "sub" / "b.iji").write_text("print(2)\n")
+    (tmp_path / "sub" / "broken.iji").write_text("print(nope(1))\n")
+    cache_dir = tmp_path / "cache"
+    assert cache.main(["-q", "-d", str(cache_dir), str(tmp_path)]) == 1
+    assert "broken.iji" in capsys.readouterr().out
+    assert cache.load_program(str(tmp_path / "a.iji"), cache_dir=str(cache_dir)) is not None
+    assert os.path.exists(cache.cache_path(str(tmp_path / "sub" / "b.iji"), str(cache_dir)))
+    assert not (tmp_path / "a.ijc").exists()
+    # Up to date: nothing to compile the second time
+    (tmp_path / "sub" / "broken.iji").unlink()
+    assert cache.main(["-d", str(cache_dir), str(tmp_path)]) == 0
+    assert capsys.readouterr().out == ""
+
+
+def test_syntax_errors_are_not_cached(tmp_path, capsys):
+    with pytest.raises(CompileError, match="RPAREN at line 2"):
+        cache.compile_source(b"print(1)\nprint(2 +)\n")
+    (tmp_path / "broken.iji").write_text("print(1)\nprint(2 +)\n")
+    for _ in range(2):
+        assert cache.main(["-q", str(tmp_path)]) == 1
+        assert "broken.iji" in capsys.readouterr().out
+    assert not (tmp_path / "broken.ijc").exists()
+
+
+def test_no_cache_flag(run, tmp_path):
+    assert run("print(3)\n", "--no-cache").stdout == "3\n"
+    assert not (tmp_path / "main.ijc").exists()
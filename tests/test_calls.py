@@ -0,0 +1,54 @@
+import pytest
+
+from closures import ClosureExecutor
+from lexer import Lexer
+from parser import Parser
+from runtime import Executor, RuntimeError
+
+EXECUTORS = [Executor, ClosureExecutor]
+
+# A return from inside while and if ends the call, not just the block
+FIND = """func find(list xs, int x)
+    int i = 0
+    while i < length(xs)
+        if xs[i] == x
+            return i
+        i = i + 1
+    return -1
+print(find([4, 5, 6], 6))
+print(find([4, 5, 6], 7))
+"""
+
+
+def execute(executor, source):
+    return executor.execute(Parser(Lexer(source)).parse())
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+@pytest.mark.parametrize("tail_calls", [False, True])
+def test_return_from_nested_blocks(executor, tail_calls, capsys):
+    execute(executor(tail_calls=tail_calls), FIND)
+    assert capsys.readouterr().out == "2\n-1\n"
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+@pytest.mark.parametrize("args, count", [("", 0), ("1, 2", 2)])
+def test_arity_is_checked(executor, args, count):
+    with pytest.raises(RuntimeError, match=f"Function 'f' expects 1 arguments, got {count}"):
+        execute(executor(), f"func f(int a)\n    return a\nf({args})\n")
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+def test_top_level_return_ends_the_program(executor, capsys):
+    assert execute(executor(), "print(1)\nreturn 5\nprint(2)\n") == 5
+    assert capsys.readouterr().out == "1\n"
+
+
+@pytest.mark.parametrize("args, count", [("", 0), ("1, 2", 2)])
+@pytest.mark.parametrize("script, flags", [("ijichi.py", ()), ("ijichi.py", ("--mode", "closure")),
+                                           ("run.py", ("--no-cache",)), ("run.py", ("--vm", "register"))])
+def test_every_backend_rejects_the_wrong_argument_count(run, args, count, script, flags):
+    result = run(f"func f(int a)\n    return a\nprint(f({args}))\n", *flags, script=script)
+    assert result.returncode == 1
+    assert result.stdout == ""
+    assert f"Function 'f' expects 1 arguments, got {count}" in result.stderr
@@ -0,0 +1,61 @@
+import pytest
+
+from closures import ClosureExecutor
+from lexer import Lexer
+from parser import Parser
+from runtime import Executor, RuntimeError
+
+PROGRAMS = [
+    # Redefining a function rebinds the call sites compiled against it
+    "func f()\n    return 1\nprint(f())\nfunc f()\n    return 2\nprint(f())\n",
+    """func g(int n)
+    int i = 0
+    int t = 0
+    while i < n
+        if i / 2 == 1
+            t = t + 10
+        else
+            t = t - 1
+        i = i + 1
+    return t
+print(g(5))
+""",
+    'list xs = [1, [2, 3]]\ndict d = {"a": xs}\nprint(d["a"][1][0] + length(xs))\n',
+    """func counter(int start)
+    int n = start
+    func step(int by)
+        n = n + by
+        return n
+    step(1)
+    return step(10)
+print(counter(5))
+""",
+    "try\n    print([1][3])\ncatch string e\n    print(e)\n",
+]
+
+
+def run(executor, source):
+    executor().execute(Parser(Lexer(source)).parse())
+
+
+@pytest.mark.parametrize("source", PROGRAMS)
+def test_matches_the_tree_walker(source, capsys):
+    run(Executor, source)
+    expected = capsys.readouterr().out
+    run(ClosureExecutor, source)
+    assert capsys.readouterr().out == expected
+
+
+def test_bodies_compile_once():
+    executor = ClosureExecutor()
+    executor.execute(Parser(Lexer("func f(int n)\n    return n\nf(1)\n")).parse())
+    func = executor.functions["f"]
+    body = func.compiled
+    assert body is not None
+    executor.call_function(func, [2])
+    assert func.compiled is body
+
+
+def test_unknown_function():
+    with pytest.raises(RuntimeError, match="Unknown function 'nope'"):
+        run(ClosureExecutor, "func f()\n    return nope()\nf()\n")
@@ -0,0 +1,80 @@
+import pytest
+
+from cache import compile_source, dump, load, source_hash
+from opcodes import decode
+
+PROGRAM = """func inner(int n)
+    if n == 0
+        raise "bottom"
+    return inner(n - 1) + 1
+func middle(int n)
+    list xs = [1, 2]
+    try
+        return inner(n)
+    catch string e
+        return -1 + xs[1]
+func outer()
+    try
+        print(middle(3))
+        raise "outer " + str(1 + 1)
+    catch string e
+        print("caught: " + e)
+    try
+        try
+            print([1][5])
+        catch string e
+            raise "again: " + e
+    catch string e
+        print(e)
+    return 7 * 6 + length([1, 2, 3])
+print(outer())
+try
+    print(1 / 0)
+catch string e
+    print("zero")
+int i = 0
+while i < 3
+    try
+        if i == 1
+            raise "one"
+        print(i)
+    catch string e
+        print(e)
+    i = i + 1
+"""
+
+EXPECTED = "1\ncaught: outer 2\nagain: Invalid index/key access: 5\n45\nzero\n0\none\n2\n"
+
+
+def test_backends_agree(outputs):
+    for backend, output in outputs(PROGRAM).items():
+        assert output == EXPECTED, backend
+
+
+@pytest.mark.parametrize("script, args", [("run.py", ("--no-cache",)), ("run.py", ("--vm", "register")),
+                                          ("ijichi.py", ()), ("ijichi.py", ("--mode", "closure"))])
+def test_uncaught_raise(run, script, args):
+    result = run('print("before")\nraise "uncaught " + str(3)\nprint("after")\n', *args, script=script)
+    assert result.returncode == 1
+    assert result.stdout == "before\n"
+    assert result.stderr.rstrip().endswith("uncaught 3")
+
+
+def test_try_costs_no_instructions():
+    plain = compile_source("int x = 1\nx = x + 1\nprint(x)\n")
+    guarded = compile_source("int x = 1\ntry\n    x = x + 1\ncatch string e\n    print(e)\nprint(x)\n")
+    assert plain.exception_table == []
+    [(start, end, handler, depth)] = guarded.exception_table
+    assert depth == 0
+    # The body is the same instructions, then a jump over the handler
+    body = [(op, args) for offset, op, args in decode(guarded.instructions) if start <= offset < end]
+    assert body == [(op, args) for _, op, args in decode(plain.instructions)][3:5]
+
+
+def test_exception_table_is_cached():
+    source = PROGRAM.encode()
+    bytecode = compile_source(source)
+    digest = source_hash(source)
+    loaded = load(dump(bytecode, digest, 1), digest, 1)
+    assert loaded.exception_table == bytecode.exception_table
+    assert len(loaded.exception_table) == 6
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from incremental import IncrementalParser
+from lexer import Lexer
+from parser import Parser
+
+SOURCE = '''func step(int x, list values)
+    int total = 0
+    int i = 0
+    while i < length(values)
+        if values[i] > x
+            total = total + values[i]
+        else if values[i] == x
+            total = total - 1
+        else
+            total = total * 2
+        i = i + 1
+    return total
+
+string doc = """two
+lines"""
+int result = step(2, [1, 2, 3])
+try
+    print(result)
+catch string e
+    print(e)
+'''
+
+# Snippets random edits insert, chosen to open and close blocks, brackets
+# and strings
+PIECES = ["\n", "    ", "x", "1", "(", ")", "[", "]", '"', '"""', "\nint y = 2\n", "if x\n", "\nfunc g()\n",
+          "else\n", "#", "+ 1", ",", "="]
+
+
+def shape(node):
+    # The node's class and fields, line numbers included, recursively
+    if isinstance(node, (list, tuple)):
+        return [shape(item) for item in node]
+    slots = [name for cls in type(node).__mro__ for name in getattr(cls, "__slots__", ())]
+    if not slots:
+        return node
+    return (type(node).__name__,) + tuple(shape(getattr(node, name, None)) for name in slots)
+
+
+def full_parse(source):
+    parser = Parser(Lexer(source))
+    try:
+        program = parser.parse()
+    except Exception as e:  # lexer errors end the incremental program early instead
+        return None, [str(e)]
+    return program, parser.errors
+
+
+def check(incremental):
+    program, errors = full_parse(incremental.source)
+    if program is None:
+        assert incremental.errors[-1:] == errors
+        return
+    assert shape(incremental.program.statements) == shape(program.statements)
+    assert incremental.errors == errors
+
+
+def test_lines_follow_the_text():
+    parser = IncrementalParser(SOURCE)
+    call = parser.program.statements[-2]
+    assert call.line == 16
+    parser.edit(0, 0, "int a = 1\nint b = 2\n")
+    assert parser.program.statements[-2] is call
+    assert call.line == 18
+    assert parser.program.statements[-1].catch_body[0].line == 22
+    check(parser)
+
+
+def test_only_edited_statements_are_new():
+    parser = IncrementalParser(SOURCE)
+    before = list(parser.program.statements)
+    start = SOURCE.index("total * 2")
+    program, changed = parser.edit(start, start + len("total * 2"), "total * 3")
+    assert [type(node).__name__ for node in changed] == ["FunctionDef"]
+    assert program.statements[1:] == before[1:]
+    assert all(new is old for new, old in zip(program.statements[1:], before[1:]))
+    check(parser)
+
+
+def test_update_takes_the_whole_text():
+    parser = IncrementalParser(SOURCE)
+    program, changed = parser.update(SOURCE.replace("print(result)", "print(result + 1)"))
+    assert [type(node).__name__ for node in changed] == ["TryStatement"]
+    check(parser)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_edits_match_a_full_parse(seed):
+    rng = random.Random(seed)
+    parser = IncrementalParser(SOURCE)
+    for _ in range(25):
+        source = parser.source
+        start = rng.randrange(len(source) + 1)
+        if rng.random() < 0.4 and start < len(source):
+            end = min(len(source), start + rng.randrange(1, 12))
+            text = ""
+        else:
+            end = start
+            text = rng.choice(PIECES)
+        parser.edit(start, end, text)
+        check(parser)
@@ -0,0 +1,109 @@
+import pytest
+
+import ast_nodes
+from lexer import DEDENT, EOF, ID, INDENT, INT, NEWLINE, STRING, Lexer, LexerError, Token, TokenBuffer
+from parser import Parser
+
+SOURCE = """# leading comment
+
+func f(int n)
+    if n > 1.5
+        return "a\\tb"
+
+    # a blank line and a comment inside the block
+    return f(n - 1)
+x = \"\"\"two
+lines\"\"\"
+print(f(2), x, true)
+"""
+
+
+def test_bytes_and_mmap_scan_like_str(tmp_path):
+    path = tmp_path / "main.iji"
+    path.write_bytes(SOURCE.encode())
+    expected = list(Lexer(SOURCE).scan())
+    assert list(Lexer(SOURCE.encode()).scan()) == expected
+    assert list(Lexer.from_file(str(path)).scan()) == expected
+
+
+def test_indentation_and_lines():
+    tokens = list(Lexer(SOURCE).scan())
+    kinds = [token.type for token in tokens]
+    assert kinds.count(INDENT) == kinds.count(DEDENT) == 2
+    assert tokens[-1] == Token(EOF, '', 12, 1)
+    assert Token(STRING, 'a\tb', 5, 16) in tokens
+    # A triple-quoted string moves the lines of what follows it
+    assert Token(STRING, 'two\nlines', 9, 5) in tokens
+    assert [token.line for token in tokens if token.value == 'print'] == [11]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.iji"
+    path.write_bytes(b"")
+    assert [token.type for token in Lexer.from_file(str(path)).scan()] == [EOF]
+
+
+def test_unknown_character():
+    with pytest.raises(LexerError, match="Unknown token \\$ at line 2 col 5"):
+        list(Lexer("x = 1\ny = $\n").scan())
+
+
+def test_lookahead_is_bounded():
+    lexer = Lexer("a b c d e")
+    assert lexer.peek(Lexer.MAX_LOOKAHEAD - 1).value == 'd'
+    with pytest.raises(LexerError, match="exceeds"):
+        lexer.peek(Lexer.MAX_LOOKAHEAD)
+    assert lexer.next_token().value == 'a'
+
+
+def test_no_layout_inside_brackets():
+    code = "print(max(1,\n    2),\n[3,\n  {4: 5}])\n    x\n"
+    tokens = list(Lexer(code).scan())
+    kinds = [token.type for token in tokens]
+    # Only the line ending after the closing bracket counts
+    assert kinds[-6:] == [NEWLINE, INDENT, ID, NEWLINE, DEDENT, EOF]
+    assert kinds.count(NEWLINE) == 2
+    assert [token.line for token in tokens if token.type == INT] == [1, 2, 3, 4, 4]
+    assert list(Lexer(code).compact()) == tokens
+
+
+@pytest.mark.parametrize("code", [SOURCE, SOURCE.encode()])
+def test_token_buffer_matches_scan(code):
+    tokens = Lexer(code).compact()
+    assert isinstance(tokens, TokenBuffer)
+    assert list(tokens) == list(Lexer(code).scan())
+    # Four int columns per token
+    assert tokens.kinds.itemsize * 4 == 16
+
+
+def test_token_buffer_feeds_the_parser():
+    lexer = Lexer(SOURCE)
+    expected = Parser(lexer).parse()
+    tokens = Lexer(SOURCE).compact()
+    program = Parser(tokens).parse()
+    assert len(program.statements) == len(expected.statements) == 3
+    assert tokens.next_token() is None
+
+
+def test_identifiers_are_interned():
+    # Built at run time so the two names are not the same constant
+    source = "".join(["long_", "name = long_", "name\n"])
+    left, right = (token.value for token in Lexer(source).scan() if token.type == ID)
+    assert left is right
+    assert Lexer(source).compact().value(0) is left
+
+
+def test_nodes_have_no_dict():
+    program = Parser(Lexer(SOURCE)).parse()
+    nodes = [program] + program.statements
+    assert nodes and not any(hasattr(node, '__dict__') for node in nodes)
+    for name in dir(ast_nodes):
+        cls = getattr(ast_nodes, name)
+        if isinstance(cls, type) and issubclass(cls, ast_nodes.ASTNode):
+            assert '__dict__' not in dir(cls), name
+
+
+def test_statements_carry_their_line():
+    func, assign, call = Parser(Lexer(SOURCE)).parse().statements
+    assert [func.line, assign.line, call.line] == [3, 9, 11]
+    assert [stmt.line for stmt in func.body] == [4, 8]
@@ -0,0 +1,60 @@
+from cache import compile_source
+from opcodes import CALL_DIRECT, CALL_FUNCTION, ENTER, decode
+from vm import BLANKS, VirtualMachine
+
+PROGRAM = """func add(int a, int b)
+    int c = a + b
+    return c
+memo func sq(int n)
+    return n * n
+print(add(1, add(2, 3)) + sq(3))
+"""
+
+
+def load(source, **options):
+    bytecode = compile_source(source)
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions,
+                        memoized=bytecode.memoized, **options)
+    return bytecode, vm
+
+
+def calls(vm):
+    return [(op, args) for _, op, args in decode(vm.instructions) if op in (CALL_FUNCTION, CALL_DIRECT)]
+
+
+def test_frames_are_sized_up_front():
+    bytecode = compile_source(PROGRAM)
+    # ENTER <locals> <deepest operand stack> starts every frame
+    assert next(decode(bytecode.instructions)) == (0, ENTER, (0, 3))
+    entries = {name: next(decode(bytecode.instructions, entry)) for name, entry in bytecode.functions.items()}
+    assert entries["add"][1:] == (ENTER, (3, 1))
+    assert entries["sq"][1:] == (ENTER, (1, 1))
+
+
+def test_calls_link_to_entries(capsys):
+    bytecode, vm = load(PROGRAM, tier_up=False)
+    sq = bytecode.constants.index("sq")
+    # Memo calls keep going by name, through the cache
+    assert calls(vm) == [(CALL_DIRECT, (bytecode.functions["add"], 2))] * 2 + [(CALL_FUNCTION, (sq, 1))]
+    vm.run()
+    assert capsys.readouterr().out == "15\n"
+
+
+def test_tier_up_links_after_the_threshold(capsys):
+    _, vm = load(PROGRAM, tier_up=True)
+    # Still counting calls by name
+    assert all(op == CALL_FUNCTION for op, _ in calls(vm))
+    vm.run()
+    assert capsys.readouterr().out == "15\n"
+
+
+def test_frames_past_the_blank_table(outputs):
+    count = len(BLANKS) + 10
+    body = "".join(f"    int v{i} = n + {i}\n" for i in range(count))
+    source = f"func wide(int n)\n{body}    return v{count - 1}\nprint(wide(1))\nprint(wide(2))\n"
+    _, vm = load(source, tier_up=False)
+    # Too many locals for CALL_DIRECT's blanks: ENTER sizes the frame
+    assert all(op == CALL_FUNCTION for op, _ in calls(vm))
+    expected = f"{count}\n{count + 1}\n"
+    for backend, output in outputs(source).items():
+        assert output == expected, backend
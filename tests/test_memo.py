@@ -0,0 +1,73 @@
+import pytest
+
+from memo import MISS, MemoCache
+
+FIB = """memo func fib(int n)
+    if n < 2
+        return n
+    return fib(n - 1) + fib(n - 2)
+print(fib(60))
+"""
+
+RUNS = [("run.py", "--no-cache"), ("run.py", "--no-cache", "--vm", "register"), ("ijichi.py",),
+        ("ijichi.py", "--mode", "closure")]
+
+
+@pytest.mark.parametrize("command", RUNS)
+def test_memo_stats(run, command):
+    result = run(FIB, *command[1:], "--stats", script=command[0])
+    assert result.stdout == "1548008755920\n", result.stderr
+    assert "memo fib: hits 58, misses 61, evictions 0, entries 61" in result.stderr
+
+
+@pytest.mark.parametrize("source, reason", [
+    ("int g = 1\npure func f(int n)\n    return n + g\n", "pure function 'f' reads non-local variable 'g'"),
+    ("int g = 1\nmemo func f(int n)\n    g = n\n    return n\n", "memo function 'f' assigns non-local variable 'g'"),
+    ("func h(int n)\n    return n\npure func f(int n)\n    return h(n)\n",
+     "pure function 'f' calls 'h', which is not marked pure"),
+    ("pure func f(int n)\n    print(n)\n    return n\n", "pure function 'f' calls 'print', which is not marked pure"),
+    # A function named like a pure builtin is checked as the function it is
+    ("func abs(int n)\n    print(n)\n    return n\npure func f(int n)\n    return abs(n)\n",
+     "pure function 'f' calls 'abs', which is not marked pure"),
+])
+@pytest.mark.parametrize("command", RUNS)
+def test_impure_functions_are_rejected(run, command, source, reason):
+    result = run(source + "print(f(1))\n", *command[1:], script=command[0])
+    assert result.returncode != 0
+    assert reason in result.stderr
+
+
+def test_lru_eviction():
+    cache = MemoCache("f", max_entries=2)
+    cache.store((1,), "a")
+    cache.store((2,), "b")
+    assert cache.lookup((1,)) == "a"  # 2 is now the least recently used
+    cache.store((3,), "c")
+    assert cache.lookup((2,)) is MISS
+    assert cache.lookup((1,)) == "a" and cache.lookup((3,)) == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_limit():
+    cache = MemoCache("f", max_bytes=2000)
+    cache.store((1,), "x" * 5000)  # larger than the whole cache: not kept
+    assert cache.lookup((1,)) is MISS
+    for i in range(100):
+        cache.store((i,), "x" * 100)
+    assert 0 < cache.bytes <= 2000
+    assert cache.stats()["entries"] < 100
+
+
+def test_keys_include_types():
+    cache = MemoCache("f")
+    cache.store((1,), "int")
+    assert cache.lookup((1.0,)) is MISS
+    assert cache.lookup((True,)) is MISS
+    assert cache.lookup((1,)) == "int"
+
+
+def test_unhashable_arguments_are_not_cached():
+    cache = MemoCache("f")
+    cache.store(([1],), 1)
+    assert cache.lookup(([1],)) is MISS
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,104 @@
+import os
+
+import pytest
+
+from modules import ModuleRegistry, module_path
+
+UTIL = """import "../shared"
+print("loading util")
+int base = 10
+int _hidden = 1
+func add(int n)
+    return n + base + shared.k
+"""
+
+MAIN = """import "lib/util" as u
+import "shared"
+print(u.add(1))
+print(u.base + shared.k)
+"""
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "util.iji").write_text(UTIL)
+    (tmp_path / "shared.iji").write_text('print("loading shared")\nint k = 100\n')
+    return tmp_path
+
+
+@pytest.mark.parametrize("mode", ["walk", "closure"])
+@pytest.mark.parametrize("build", [(), ("--build", "-j", "2")])
+def test_each_module_runs_once(run, tree, mode, build):
+    result = run(MAIN, "--mode", mode, *build, script="ijichi.py")
+    assert result.stdout == "loading shared\nloading util\n111\n110\n", result.stderr
+
+
+@pytest.mark.parametrize("mode", ["walk", "closure"])
+def test_private_names(run, tree, mode):
+    result = run('import "lib/util"\nprint(util._hidden)\n', "--mode", mode, script="ijichi.py")
+    assert result.returncode != 0
+    assert "Module 'util' has no member '_hidden'" in result.stderr
+
+
+def test_circular_import(run, tmp_path):
+    # b sees a partly initialised: a's functions, not yet its later globals
+    (tmp_path / "a.iji").write_text('func f()\n    return 7\nimport "b"\nint x = b.y\n')
+    (tmp_path / "b.iji").write_text('import "a"\nint y = a.f() + 1\n')
+    result = run('import "a"\nprint(a.x)\n', script="ijichi.py")
+    assert result.stdout == "8\n", result.stderr
+
+
+def test_registry_reuses_unchanged_files(tree):
+    registry = ModuleRegistry()
+    path = module_path("shared", str(tree))
+    program = registry.load(path)
+    assert registry.load(path) is program
+    assert (registry.hits, registry.misses) == (1, 1)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert registry.load(path) is not program
+    assert registry.misses == 2
+
+
+def test_registry_by_content(tree):
+    registry = ModuleRegistry(by_content=True)
+    path = tree / "shared.iji"
+    program = registry.load(str(path))
+    # Touching the file does not reparse it; an edit that keeps the mtime does
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert registry.load(str(path)) is program
+    path.write_text("int k = 200\n")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert registry.load(str(path)) is not program
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_build(tree, workers):
+    (tree / "main.iji").write_text(MAIN)
+    registry = ModuleRegistry()
+    built = registry.build(str(tree / "main.iji"), workers)
+    assert [os.path.relpath(path, tree) for path in built] == ["main.iji", os.path.join("lib", "util.iji"), "shared.iji"]
+    assert registry.build(str(tree / "main.iji"), workers) == []
+    program = registry.load(module_path("main", str(tree)))
+    assert len(program.statements) == 4
+    assert registry.misses == 0
+
+
+@pytest.mark.parametrize("script, args", [("ijichi.py", ()), ("ijichi.py", ("--mode", "closure")),
+                                          ("run.py", ("--no-cache",)), ("run.py", ())])
+def test_syntax_errors_stop_the_script(run, script, args):
+    result = run('print("before")\nprint(2 +)\nprint("after")\n', *args, script=script)
+    assert (result.returncode, result.stdout) == (1, "")
+    assert "RPAREN at line 2" in result.stderr
+
+
+@pytest.mark.parametrize("build", [(), ("--build",)])
+def test_syntax_errors_in_imports(run, tmp_path, build):
+    (tmp_path / "broken.iji").write_text("int k = (1\n")
+    result = run('print("before")\nimport "broken"\nprint(broken.k)\n', *build, script="ijichi.py")
+    assert result.returncode == 1
+    # Imports load as they run, unless --build parsed them all first
+    assert result.stdout == ("" if build else "before\n")
+    assert "broken.iji: Expected RPAREN" in result.stderr
@@ -0,0 +1,53 @@
+import pytest
+
+from cache import compile_source
+from opcodes import LOAD_CONST, BINARY_DIVIDE, UNTYPED, decode
+from optimizer import MAX_FOLDED_LENGTH
+
+
+def instructions(source, opt_level):
+    bytecode = compile_source(source, opt_level)
+    return [(op, args) for _, op, args in decode(bytecode.instructions)], bytecode.constants
+
+
+def test_constant_folding():
+    code, constants = instructions("print(2 * 3 + 4)\n", 1)
+    loads = [constants[args[0]] for op, args in code if op == LOAD_CONST]
+    assert loads == [10]
+    code, _ = instructions("print(2 * 3 + 4)\n", 0)
+    assert [op for op, _ in code].count(LOAD_CONST) == 3
+
+
+def test_division_by_zero_is_left_to_run_time(outputs):
+    code, _ = instructions("print(1 / 0)\n", 1)
+    assert BINARY_DIVIDE in [UNTYPED.get(op, op) for op, _ in code]
+    source = 'try\n    print(1 / 0)\ncatch string e\n    print("caught")\n'
+    assert set(outputs(source).values()) == {"caught\n"}
+
+
+def test_long_strings_are_not_folded():
+    half = "x" * (MAX_FOLDED_LENGTH // 2 + 1)
+    _, constants = instructions(f'print("{half}" + "{half}")\n', 1)
+    assert half * 2 not in constants
+
+
+@pytest.mark.parametrize("opt_level", [0, 1, 2])
+def test_dead_code_after_return(opt_level):
+    source = "func f()\n    return 1\n    print(2)\n\nprint(f())\n"
+    code, constants = instructions(source, opt_level)
+    loads = {constants[args[0]] for op, args in code if op == LOAD_CONST}
+    assert (2 in loads) == (opt_level == 0)
+
+
+def test_jumps_survive_removed_code(outputs):
+    source = """int i = 0
+int total = 0
+while i < 5
+    if i == 2
+        total = total + 100
+    else
+        total = total + 1 * 1
+    i = i + 1
+print(total)
+"""
+    assert set(outputs(source).values()) == {"104\n"}
@@ -0,0 +1,115 @@
+import sys
+
+import pytest
+
+from ast_nodes import BinaryOperation, IfStatement, ListLiteralNode, Literal, VariableReference, WhileLoop
+from lexer import Lexer
+from parser import Parser
+
+
+def expression(text):
+    parser = Parser(Lexer(f"x = {text}\n"))
+    program = parser.parse()
+    assert not parser.errors
+    return program.statements[0].value
+
+
+def show(node):
+    # Fully parenthesized, to compare shapes
+    if isinstance(node, BinaryOperation):
+        return f"({show(node.left)} {node.operator} {show(node.right)})"
+    if isinstance(node, Literal):
+        return repr(node.value)
+    if isinstance(node, VariableReference):
+        return node.name
+    if isinstance(node, ListLiteralNode):
+        return "[" + ", ".join(show(element) for element in node.elements) + "]"
+    return type(node).__name__
+
+
+@pytest.mark.parametrize("text, shape", [
+    ("1 + 2 * 3 - 4 / 2", "((1 + (2 * 3)) - (4 / 2))"),
+    ("(1 + 2) * 3", "((1 + 2) * 3)"),
+    ("1 - 2 - 3", "((1 - 2) - 3)"),
+    ("8 / 4 / 2", "((8 / 4) / 2)"),
+    ("a * 2 < b + 1 == c", "(((a * 2) < (b + 1)) == c)"),
+    ("[a + 1, (b)]", "[(a + 1), b]"),
+])
+def test_precedence_and_associativity(text, shape):
+    assert show(expression(text)) == shape
+
+
+def test_long_chain():
+    n = 100000
+    node = expression(" + ".join(["a"] * n))
+    # Left-associative: the left spine is n - 1 deep
+    depth = 0
+    while isinstance(node, BinaryOperation):
+        node = node.left
+        depth += 1
+    assert depth == n - 1
+
+
+def test_deep_brackets():
+    n = sys.getrecursionlimit() * 10
+    node = expression("[(" * n + "1" + ")]" * n)
+    for _ in range(n):
+        assert isinstance(node, ListLiteralNode)
+        node = node.elements[0]
+    assert node.value == 1
+
+
+def test_deep_blocks():
+    n = sys.getrecursionlimit() * 2
+    lines = [" " * i + "while x < 1" for i in range(n)] + [" " * n + "x = x + 1"]
+    parser = Parser(Lexer("\n".join(lines) + "\n"))
+    node = parser.parse().statements[0]
+    assert not parser.errors
+    for _ in range(n - 1):
+        assert isinstance(node, WhileLoop)
+        node = node.body[0]
+    assert len(node.body) == 1
+
+
+def test_else_if_chain():
+    parser = Parser(Lexer("if a\n    x = 1\nelse if b\n    x = 2\nelse\n    x = 3\n"))
+    node = parser.parse().statements[0]
+    assert isinstance(node.else_body[0], IfStatement)
+    assert node.else_body[0].else_body[0].value.value == 3
+
+
+@pytest.mark.parametrize("source", [
+    "list xs = [1,\n    2]\nprint(xs)\n",
+    "print(max(1,\n    2))\nprint(3)\n",
+])
+def test_statements_continue_inside_brackets(source):
+    parser = Parser(Lexer(source))
+    program = parser.parse()
+    assert parser.errors == []
+    assert len(program.statements) == 2
+    assert program.statements[1].line == 3
+
+
+@pytest.mark.parametrize("source, errors, kinds", [
+    ("int x = 1 + \nprint(2)\n", ["Unexpected token in expression: NEWLINE at line 1"], ["FunctionCall"]),
+    ("print(1))\nint y = 2\n", ["Expected end of statement, got RPAREN at line 1"], ["VariableDeclaration"]),
+    ("if\n    print(1)\nprint(2)\n", ["Unexpected token in expression: NEWLINE at line 1"], ["FunctionCall"]),
+])
+def test_errors_are_collected_and_parsing_goes_on(source, errors, kinds):
+    parser = Parser(Lexer(source))
+    program = parser.parse()
+    assert parser.errors == errors
+    assert [type(stmt).__name__ for stmt in program.statements] == kinds
+
+
+@pytest.mark.parametrize("source, errors, kinds", [
+    ('print(1 + "\n', ['Unknown token " at line 1 col 11'], []),
+    ("!x\n", ["Unknown token ! at line 1 col 1"], []),
+    ("$\n", ["Unknown token $ at line 1 col 1"], []),
+    ("print(1)\nint x = 2 $ 3\nprint(x)\n", ["Unknown token $ at line 2 col 11"], ["FunctionCall"]),
+])
+def test_lexer_errors_end_the_program(source, errors, kinds):
+    parser = Parser(Lexer(source))
+    program = parser.parse()
+    assert parser.errors == errors
+    assert [type(stmt).__name__ for stmt in program.statements] == kinds
@@ -0,0 +1,53 @@
+import pytest
+
+import profiler
+
+PROGRAM = """func g(int n)
+    int t = 0
+    int i = 0
+    while i < n
+        t = t + i * i
+        i = i + 1
+    return t
+func f(int n)
+    return g(n) + 1
+int k = 0
+while k < 10
+    print(f(2000))
+    k = k + 1
+"""
+
+COMMANDS = [("run.py", "--no-cache"), ("run.py", "--vm", "register"), ("ijichi.py",)]
+
+
+@pytest.mark.parametrize("command", COMMANDS)
+def test_collapsed_stacks(run, tmp_path, command):
+    stacks = tmp_path / "stacks.txt"
+    result = run(PROGRAM, *command[1:], "--profile", "--profile-sort", "calls", "--profile-stacks", str(stacks),
+                 script=command[0], env={"IJICHI_PROFILE_INTERVAL": "0.1"})
+    assert result.stdout == "2664667001\n" * 10, result.stderr
+    assert result.stderr.startswith("profile: ")
+    counts = {}
+    for line in stacks.read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        counts[stack] = int(count)
+    assert set(counts) <= {"main", "main;f", "main;f;g"}
+    assert counts["main;f;g"] == max(counts.values())
+    # Each function's row: calls, self ms, total ms
+    rows = {line.split()[0]: line.split()[1:] for line in result.stderr.splitlines() if line}
+    assert rows["f"][0] == rows["g"][0] == "10"
+    assert float(rows["f"][2]) >= float(rows["g"][2])
+
+
+def test_options():
+    args = ["--profile", "--profile-sort", "name", "main.iji"]
+    assert profiler.options(args) == ("name", None)
+    assert args == ["main.iji"]
+    assert profiler.options(["main.iji"]) is None
+    with pytest.raises(ValueError, match="--profile-sort takes one of"):
+        profiler.options(["--profile", "--profile-sort", "speed"])
+
+
+def test_only_the_walker_profiles(run):
+    result = run(PROGRAM, "--mode", "closure", "--profile", script="ijichi.py")
+    assert "--profile works with --mode walk" in result.stdout
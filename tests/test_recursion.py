@@ -0,0 +1,71 @@
+import pytest
+
+import tierup
+
+COUNT = """{modifier}func count(int n)
+    if n == 0
+        return 0
+    return 1 + count(n - 1)
+
+print(count({n}))
+"""
+
+BACKENDS = [(), ("--vm", "register")]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("n", [5000, 50000])
+def test_deep_recursion(run, backend, n):
+    result = run(COUNT.format(modifier="", n=n), "--no-cache", *backend)
+    assert result.stdout == f"{n}\n", result.stderr
+
+
+def test_deep_recursion_without_tier_up(run):
+    result = run(COUNT.format(modifier="", n=5000), "--no-cache", env={"IJICHI_NO_TIERUP": "1"})
+    assert result.stdout == "5000\n", result.stderr
+
+
+def test_recursive_natives_are_guarded():
+    from cache import compile_source
+    from vm import VirtualMachine
+    source = COUNT.format(modifier="", n=3) + "func double(int n)\n    return n * 2\n"
+    bytecode = compile_source(source.encode())
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions, tier_up=False)
+    tier = tierup.TierUp(vm)
+    assert tier.recursive("count") and not tier.recursive("double")
+    assert "D[0]" in tier.translate("count").source
+    assert "D[0]" not in tier.translate("double").source
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("tier_up", ["", "1"])
+def test_deep_memo_recursion(run, backend, tier_up):
+    result = run(COUNT.format(modifier="memo ", n=20000), "--no-cache", *backend,
+                 env={"IJICHI_NO_TIERUP": tier_up})
+    assert result.stdout == "20000\n", result.stderr
+
+
+MEMO_ERRORS = """memo func fib(int n)
+    if n == 7
+        raise "seven"
+    if n < 2
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+memo func square(int n)
+    return n * n
+
+try
+    print(fib(10))
+catch string e
+    print("caught " + e)
+print(square(3) + square(3))
+print(fib(6))
+"""
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_memo_call_unwound_by_an_error(run, backend):
+    result = run(MEMO_ERRORS, "--no-cache", *backend, "--stats")
+    assert result.stdout == "caught seven\n18\n8\n", result.stderr
+    assert "memo square: hits 1, misses 1" in result.stderr
@@ -0,0 +1,83 @@
+import pytest
+
+from cache import compile_source as compile_stack
+from compiler import CompileError
+from regvm import ADD, OPNAMES, RegisterVM, compile_source, decode
+from vm import VirtualMachine
+
+SUM_TO = """func sum_to(int n)
+    int total = 0
+    int i = 0
+    while i < n
+        total = total + i
+        i = i + 1
+    return total
+print(sum_to(100))
+"""
+
+
+def test_every_opcode_has_a_handler():
+    vm = RegisterVM([], [], {}, {None: 0})
+    assert len(vm.dispatch) == 256
+    for op, name in enumerate(OPNAMES):
+        assert vm.dispatch[op] != vm.op_unknown, name
+
+
+def test_results_are_written_in_place():
+    # total = total + i is one ADD from and into total's register
+    code = compile_source(SUM_TO)
+    adds = [args for _, op, args in decode(code.instructions) if op == ADD]
+    assert any(args[0] == args[1] for args in adds), adds
+
+
+def test_fewer_instructions_than_the_stack_vm(capsys):
+    code = compile_source(SUM_TO)
+    registers = RegisterVM(code.instructions, code.constants, code.functions, code.frame_sizes, count=True)
+    registers.run()
+    bytecode = compile_stack(SUM_TO, 2)
+    stack = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions, count=True, tier_up=False)
+    stack.run()
+    assert capsys.readouterr().out == "4950\n4950\n"
+    assert registers.stats()["executed"] < stack.stats()["executed"]
+
+
+def test_run_with_stats(run):
+    result = run("int t = 0\nint i = 0\nwhile i < 5\n    t = t + i\n    i = i + 1\nprint(t)\n", "--vm", "register", "--stats")
+    assert result.stdout == "10\n", result.stderr
+    assert result.stderr.startswith("executed ")
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("func f(int a, int b)\n    return a * 10 + b\nprint(f(f(1, 2), 3))\n", "123\n"),
+    ('string s = "a"\nint i = 0\nwhile i < 3\n    s = s + str(i)\n    i = i + 1\nprint(s)\n', "a012\n"),
+    ('dict d = {"k": [1, 2]}\nprint(d["k"][1] * 2.5)\n', "5.0\n"),
+])
+def test_matches_the_stack_vm(outputs, source, expected):
+    results = outputs(source)
+    assert results["register"] == results["vm -O2"] == expected
+
+
+LOOP = """list xs = [1, 2, 3, 4]
+int t = 0
+int i = 0
+while i < length(xs)
+    t = t + xs[i]
+    i = i + 1
+print(t)
+"""
+
+
+def test_opt_level(run, tmp_path):
+    # -O0 leaves the loop as it is written; the AST passes run from -O1 up
+    executed = {}
+    for flags in [("-O0",), ("-O1",), ("-O2", "--no-cache")]:
+        result = run(LOOP, "--vm", "register", "--stats", *flags)
+        assert result.stdout == "10\n", result.stderr
+        executed[flags[0]] = int(result.stderr.split()[1].rstrip(","))
+    assert executed["-O1"] == executed["-O2"] < executed["-O0"]
+    assert not (tmp_path / "main.ijc").exists()
+
+
+def test_syntax_errors():
+    with pytest.raises(CompileError, match="RPAREN at line 1"):
+        compile_source("print(1 +)\n")
@@ -0,0 +1,57 @@
+import pytest
+
+from closures import ClosureExecutor
+from lexer import Lexer
+from parser import Parser
+from resolver import Resolver, Scope
+from runtime import Executor, RuntimeError
+
+EXECUTORS = [Executor, ClosureExecutor]
+
+SCOPES = """int x = 1
+func outer(int a)
+    int y = a + x
+    func inner(int b)
+        return b + y + x
+    y = y + 10
+    return inner(100)
+
+print(outer(5))
+x = 1000
+print(outer(5))
+func shadow(int x)
+    x = x + 1
+    return x
+print(shadow(1))
+print(x)
+"""
+
+
+def parse(source):
+    return Parser(Lexer(source)).parse()
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+def test_lexical_scopes(executor, capsys):
+    executor().execute(parse(SCOPES))
+    assert capsys.readouterr().out == "117\n2115\n2\n1000\n"
+
+
+def test_addresses():
+    program = parse(SCOPES)
+    Resolver().resolve(program, Scope())
+    inner = program.statements[1].body[1]
+    total = inner.body[0].value  # b + y + x
+    addresses = [(node.name, node.depth, node.slot) for node in (total.left.left, total.left.right, total.right)]
+    assert addresses == [("b", 0, 0), ("y", 1, 1), ("x", 2, 0)]
+
+
+@pytest.mark.parametrize("executor", EXECUTORS)
+@pytest.mark.parametrize("source, message", [
+    ("print(y)\n", "Undefined variable 'y'"),
+    ("func f()\n    return z\nprint(f())\n", "Undefined variable 'z'"),
+    ("func f()\n    return g\nprint(f())\nint g = 1\n", "Variable 'g' used before declaration"),
+])
+def test_errors(executor, source, message):
+    with pytest.raises(RuntimeError, match=message):
+        executor().execute(parse(source))
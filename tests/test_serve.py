@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+from conftest import ROOT
+
+SCRIPTS = {
+    "ok": ('print("hi")\n', 0),
+    "raises": ('print("a")\nraise "boom"\n', 1),
+    "missing import": ('import "nowhere"\n', 1),
+}
+
+
+@pytest.fixture
+def server():
+    # A server on its own socket, in a short directory: AF_UNIX paths are
+    # limited to about 100 bytes
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "s.sock")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "ijichi.py"), "serve", "--socket", path, "-w", "2"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while not os.path.exists(path):
+        assert process.poll() is None and time.monotonic() < deadline, "the server did not start"
+        time.sleep(0.05)
+    yield path
+    process.terminate()
+    process.wait(timeout=30)
+    os.rmdir(directory)
+
+
+def client(tmp_path, *args, socket_path, stdin=None):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "client.py"), "--socket", socket_path, *args],
+                          input=stdin, capture_output=True, text=True, cwd=tmp_path, timeout=60)
+
+
+@pytest.mark.parametrize("name", SCRIPTS)
+def test_exit_status_matches_ijichi(server, run, tmp_path, name):
+    source, status = SCRIPTS[name]
+    local = run(source, script="ijichi.py")
+    remote = client(tmp_path, "main.iji", socket_path=server)
+    assert local.returncode == remote.returncode == status
+    assert local.stdout == remote.stdout
+    assert local.stderr.strip().splitlines()[-1:] == remote.stderr.strip().splitlines()[-1:]
+
+
+def test_usage_status(server, tmp_path):
+    result = client(tmp_path, "--mode", "nope", "main.iji", socket_path=server)
+    assert result.returncode == 1
+    assert result.stdout.startswith("Usage: python ijichi.py")
+
+
+def test_streams_and_edits(server, tmp_path):
+    script = tmp_path / "main.iji"
+    script.write_text("print(input())\n")
+    result = client(tmp_path, "main.iji", socket_path=server, stdin="hello\n")
+    assert (result.returncode, result.stdout) == (0, "hello\n")
+    # A worker that already parsed the script sees the edit
+    script.write_text('print("HELLO")\n')
+    result = client(tmp_path, "main.iji", socket_path=server)
+    assert (result.returncode, result.stdout) == (0, "HELLO\n")
+    stats = client(tmp_path, "--server-stats", socket_path=server)
+    assert stats.returncode == 0
+    assert stats.stdout.startswith("2 requests, 2 workers")
+
+
+def test_no_server(tmp_path):
+    result = client(tmp_path, "main.iji", socket_path=str(tmp_path / "none.sock"))
+    assert result.returncode == 1
+    assert "client.py: no server on" in result.stderr
@@ -0,0 +1,97 @@
+import pytest
+
+import stdlib
+from cache import compile_source
+from compiler import CompileError
+from lexer import Lexer
+from modules import parse
+from runtime import Executor
+
+PROGRAM = """string s = "  Hello, World  "
+string t = trim(s)
+print(upper(t) + lower(t))
+print(split("a,b,c", ","))
+print(join(["x", "y"], "-"))
+print(replace(t, "World", "There"))
+print(find(t, "World"))
+print(starts_with(t, "Hell"))
+print(ends_with(t, "x"))
+print(substring(t, 0, 5))
+print(contains(t, "lo"))
+print(type(1) + type(1.5) + type("a") + type([1]) + type({"a": 1}) + type(true))
+print(abs(-3) + min(4, 2) + max(1, 9) + floor(2.7) + ceil(2.1))
+print(round(2.567, 2))
+print(sqrt(16.0) + pow(2, 10))
+print(to_int("42") + to_float("0.5"))
+try
+    print(to_int("x"))
+catch string e
+    print(e)
+try
+    print(substring(5, 0))
+catch string e
+    print(e)
+write_file("out.txt", "one")
+append_file("out.txt", "two")
+print(read_file("out.txt"))
+print(file_exists("out.txt"))
+try
+    print(read_file("nope.txt"))
+catch string e
+    print("no file")
+"""
+
+EXPECTED = """HELLO, WORLDhello, world
+['a', 'b', 'c']
+x-y
+Hello, There
+7
+True
+False
+Hello
+True
+intfloatstringlistdictbool
+19
+2.57
+1028.0
+42.5
+Cannot convert 'x' to int
+substring expects a string, got int
+onetwo
+True
+no file
+"""
+
+
+def test_every_backend(outputs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for backend, output in outputs(PROGRAM).items():
+        assert output == EXPECTED, backend
+
+
+def test_own_functions_take_precedence(outputs):
+    source = "func length(list xs)\n    return 99\nprint(length([1]))\n"
+    for backend, output in outputs(source).items():
+        assert output == "99\n", backend
+
+
+def test_calls_are_bound_before_running(capsys):
+    program, _ = parse(Lexer('print(upper("a"))\n'))
+    Executor().execute(program)
+    assert capsys.readouterr().out == "A\n"
+    call = program.statements[0]
+    assert call.builtin is print
+    assert call.args[0].builtin is str.upper
+
+
+def test_result_types_reach_the_compiler():
+    compile_source('int n = length("ab") + find("ab", "b")\nbool b = contains("ab", "a")\n')
+    with pytest.raises(CompileError, match="Cannot assign int to string variable 'x'"):
+        compile_source('string x = length("a")\n')
+
+
+def test_registry():
+    assert set(stdlib.PURE) <= set(stdlib.BUILTINS)
+    assert set(stdlib.RESULT_TYPES) <= set(stdlib.BUILTINS)
+    assert {"print", "input", "random", "write_file", "time"}.isdisjoint(stdlib.PURE)
+    assert {"sum", "append_string"} <= stdlib.PURE
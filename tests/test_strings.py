@@ -0,0 +1,82 @@
+import pytest
+
+from cache import compile_source
+from opcodes import BUILD_STRING, decode
+from strings import append_string, join, string_value
+
+PROGRAM = """string out = ""
+int i = 0
+while i < 5
+    out = out + str(i) + ","
+    if length(out) > 6
+        out = out + "|"
+    i = i + 1
+print(out)
+string s = "x"
+try
+    while i < 8
+        s = s + str(i)
+        i = i + 1
+catch string e
+    print(e)
+print(s)
+func build(int n)
+    string r = ""
+    int k = 0
+    while k < n
+        r = r + "ab"
+        k = k + 1
+    return r
+print(build(3))
+"""
+
+EXPECTED = "0,1,2,3,|4,|\nx567\nababab\n"
+
+
+def test_backends_agree(outputs, run):
+    for backend, output in outputs(PROGRAM).items():
+        assert output == EXPECTED, backend
+    result = run(PROGRAM, "--no-cache", env={"IJICHI_NO_CONCAT": "1"})
+    assert result.stdout == EXPECTED, result.stderr
+
+
+def test_report(run):
+    assert run(PROGRAM, script="concat.py").stdout == ("while i < 5: out buffered\n"
+                                                       "while i < 8: s not buffered: the loop is inside a try\n"
+                                                       "while k < n (in build): r buffered\n")
+
+
+# A piece that is not a string fails where + would
+MIXED = 'string q = ""\nint j = 0\nwhile j < 3\n    q = q + "a" + j\n    j = j + 1\nprint(q)\n'
+
+
+@pytest.mark.parametrize("args", [("--no-cache",), ("--no-cache", "-O0"), ("--vm", "register")])
+def test_type_errors_are_kept(run, args):
+    result = run(MIXED, *args)
+    assert result.returncode != 0 and result.stdout == ""
+    assert 'TypeError: can only concatenate str (not "int") to str' in result.stderr
+
+
+def test_build_string():
+    source = 'string a = "x"\nstring b = "y"\nprint(a + b + a + "z")\n'
+    ops = [op for _, op, _ in decode(compile_source(source).instructions)]
+    assert BUILD_STRING in ops
+
+
+def test_buffer():
+    buffer = ["a"]
+    append_string(buffer, "b", "c")
+    append_string(buffer, "d")
+    assert buffer == ["a", "b", "c", "d"]
+    assert string_value(buffer) == "abcd" and buffer == ["abcd"]
+    # All or nothing: nothing is appended when a piece is not a string
+    with pytest.raises(TypeError):
+        append_string(buffer, "e", 1)
+    assert string_value(buffer) == "abcd"
+
+
+def test_join():
+    assert join(["a", "b", "c"]) == "abc"
+    assert join([1, 2, 3]) == 6
+    with pytest.raises(TypeError):
+        join(["a", 1])
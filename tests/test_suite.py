@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import suite
+from compiler import CompileError
+from conftest import ROOT, capture
+
+PROGRAMS = sorted(name for name in os.listdir(suite.PROGRAMS) if name.endswith(".iji"))
+
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_backends_agree_on_the_programs(name):
+    path = os.path.join(suite.PROGRAMS, name)
+    results = {}
+    for backend, run in suite.BACKENDS.items():
+        try:
+            results[backend] = capture(lambda: run(path))
+        except CompileError:
+            pass  # n/a in the suite
+    assert "walk" in results and results["walk"]
+    assert len(set(results.values())) == 1, results
+
+
+def test_compare():
+    baseline = {"fib": {"vm": {"median": 1.0}, "walk": {"median": 1.0}, "register": "n/a"}}
+    results = {"fib": {"vm": {"median": 1.05}, "walk": {"median": 1.5}, "register": {"median": 9.0}},
+               "new": {"vm": {"median": 1.0}}}
+    assert suite.compare(results, baseline, 0.10) == ["fib on walk: median 1000.0 ms -> 1500.0 ms (+50.0%)"]
+    assert suite.compare(results, baseline, 0.60) == []
+
+
+def run_suite(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "benchmarks", "suite.py"), *args],
+                          capture_output=True, text=True, timeout=120)
+
+
+def test_baseline_round_trip(tmp_path):
+    results = tmp_path / "results.json"
+    args = ("-n", "2", "--warmup", "0", "--bench", "strings", "--backend", "vm")
+    first = run_suite(*args, "--json", str(results))
+    assert first.returncode == 0, first.stdout + first.stderr
+    document = json.loads(results.read_text())
+    stats = document["results"]["strings"]["vm"]
+    assert len(stats["runs"]) == 2 and stats["min"] <= stats["median"]
+
+    # Against a baseline that ran in no time at all, every run is a regression
+    stats["median"] = 1e-9
+    results.write_text(json.dumps(document))
+    second = run_suite(*args, "--baseline", str(results))
+    assert second.returncode == 1
+    assert "strings on vm: median" in second.stdout
+
+
+def test_usage():
+    result = run_suite("--backend", "nope")
+    assert result.returncode == 1
+    assert "backends: walk, closure, vm, register" in result.stdout
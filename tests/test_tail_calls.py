@@ -0,0 +1,63 @@
+import pytest
+
+MODES = [("--mode", "walk"), ("--mode", "closure")]
+
+TRY = """func boom(int n)
+    raise "boom " + str(n)
+
+func f(int n)
+    try
+        return boom(n)
+    catch string e
+        print("caught " + e)
+    return 0
+
+print(f(3))
+"""
+
+# Tail recursion in a function called from a try body keeps running in
+# constant stack
+DEEP = """func count(int n, int total)
+    if n == 0
+        return total
+    return count(n - 1, total + 1)
+
+try
+    print(count(20000, 0))
+catch string e
+    print(e)
+"""
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_tail_call_in_try_body_is_caught(run, mode):
+    result = run(TRY, *mode, "--tail-calls", script="ijichi.py")
+    assert result.stdout == "caught boom 3\n0\n", result.stderr
+
+
+def test_try_matches_the_vm(run):
+    assert run(TRY).stdout == "caught boom 3\n0\n"
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_tail_recursion_called_from_try(run, mode):
+    result = run(DEEP, *mode, "--tail-calls", script="ijichi.py")
+    assert result.stdout == "20000\n", result.stderr
+
+
+MEMBER = """import "lib"
+func f(int n)
+    return n + 1
+
+func g(int n)
+    return lib.f(n)
+
+print(g(1))
+"""
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_tail_call_to_module_member(run, tmp_path, mode):
+    (tmp_path / "lib.iji").write_text("func f(int n)\n    return n + 1000\n")
+    result = run(MEMBER, *mode, "--tail-calls", script="ijichi.py")
+    assert result.stdout == "1001\n", result.stderr
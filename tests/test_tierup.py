@@ -0,0 +1,68 @@
+import tierup
+from cache import compile_source
+from vm import VirtualMachine
+
+# mix() turns native past the threshold and then raises from native code
+# into the VM's catch; guarded() has a try block and stays interpreted
+PROGRAM = """func mix(int i, list xs)
+    float f = i / 2
+    string s = "n" + str(i)
+    if i > 55
+        return xs[i]
+    return f + length(s)
+func guarded(int i)
+    try
+        return 1 / (i - 60)
+    catch string e
+        return 0
+float t = 0
+int i = 0
+list xs = [1, 2]
+while i < 70
+    t = t + guarded(i)
+    try
+        t = t + mix(i, xs)
+    catch string e
+        t = t - 1
+    i = i + 1
+print(t)
+"""
+
+
+def run_vm(source, tier_up):
+    bytecode = compile_source(source, 2)
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions, tier_up=tier_up,
+                        exception_table=bytecode.exception_table)
+    vm.run()
+    return vm
+
+
+def test_native_code_matches_the_interpreter(capsys):
+    run_vm(PROGRAM, False)
+    expected = capsys.readouterr().out
+    vm = run_vm(PROGRAM, True)
+    assert capsys.readouterr().out == expected
+    assert vm.stats()["native"] == 1
+    assert vm.tier.cache["mix"].function is not None
+    assert vm.tier.cache["guarded"].reason == "has a try block"
+
+
+def test_cold_functions_stay_interpreted(capsys):
+    calls = "".join(f"print(f({i}))\n" for i in range(tierup.THRESHOLD - 1))
+    vm = run_vm("func f(int n)\n    return n + 1\n" + calls, True)
+    assert vm.natives == {}
+    vm = run_vm("func f(int n)\n    return n + 1\n" + calls + "print(f(0))\n", True)
+    assert list(vm.natives) == ["f"]
+
+
+def test_disabled(run):
+    result = run(PROGRAM, "--stats", "--no-cache", env={"IJICHI_NO_TIERUP": "1"})
+    assert "native" not in result.stderr
+    result = run(PROGRAM, "--stats", "--no-cache")
+    assert "native 1" in result.stderr
+
+
+def test_print_translations(run):
+    result = run(PROGRAM, script="tierup.py")
+    assert "def f_mix(" in result.stdout
+    assert "# guarded: stays interpreted: has a try block" in result.stdout
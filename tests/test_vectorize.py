@@ -0,0 +1,134 @@
+import pytest
+
+import vectors
+
+LOOP = """list[int] xs = int_list([{values}])
+int total = {total}
+int i = 0
+while i < length(xs)
+    total = total + xs[i] * {factor}
+    i = i + 1
+print(total)
+"""
+
+CASES = [
+    ("100, 200, 300", 0, 10 ** 18),
+    ("9223372036854775807, 1", 0, 1),
+    ("-9223372036854775807, -9223372036854775807", 0, 2),
+    ("3037000500, 3037000500", 0, 3037000500),
+    ("1, 2, 3", 2 ** 70, 7),
+]
+
+
+@pytest.mark.parametrize("values, total, factor", CASES)
+def test_vectorized_loop_matches_O0(run, values, total, factor):
+    source = LOOP.format(values=values, total=total, factor=factor)
+    expected = str(sum(int(v) for v in values.split(", ")) * factor + total)
+    assert run(source, "-O0", "--no-cache").stdout.strip() == expected
+    assert run(source, "--no-cache").stdout.strip() == expected
+    assert run(source, "--vm", "register").stdout.strip() == expected
+    assert run(source, script="ijichi.py").stdout.strip() == expected
+
+
+@pytest.mark.skipif(vectors.load_numpy() is None, reason="the int64 kernel needs numpy")
+def test_fits_int64():
+    xs = vectors.int_list([1, -2, 3])
+    assert vectors.fits_int64("+ * a0 k0", 3, [xs.data], [10 ** 6])
+    assert not vectors.fits_int64("+ * a0 k0", 3, [xs.data], [2 ** 62])
+    # Each term fits, their sum over the loop does not
+    assert not vectors.fits_int64("+ * a0 k0", 3, [xs.data], [2 ** 61])
+    assert vectors.fits_int64("+ / a0 k0", 3, [xs.data], [2 ** 62])
+
+
+def test_vector_loop_overflow_is_exact():
+    xs = vectors.int_list([2 ** 62, 2 ** 62, 2 ** 62])
+    assert vectors.vector_loop("+ a0 - * a0 k0", 0, 3, [0], [xs], [3]) == [3, -2 * 3 * 2 ** 62]
+
+
+# Two reductions over a typed and a plain list, then a loop whose terms
+# raise at its last iteration: the rewritten loop falls back and raises there
+MIXED = """list[float] xs = [1.5, 2, 4]
+list ys = [1, 2, 0]
+float t = 0
+float u = 10
+int i = 0
+while i < length(xs)
+    t = t + xs[i] * i
+    u = u - ys[i] / 2
+    i = i + 1
+print(t)
+print(u)
+print(i)
+int j = 0
+float w = 0
+try
+    while j <= 2
+        w = w + 1 / ys[j]
+        j = j + 1
+catch string e
+    print("caught")
+print(j)
+print(w)
+"""
+
+
+def test_fallback_raises_where_the_loop_does(outputs, run):
+    expected = "10.0\n8.5\n3\ncaught\n2\n1.5\n"
+    for backend, output in outputs(MIXED).items():
+        assert output == expected, backend
+    result = run(MIXED, "--no-cache", env={"IJICHI_NO_VECTORIZE": "1"})
+    assert result.stdout == expected, result.stderr
+
+
+def test_report(run):
+    result = run("""int i = 0
+int t = 0
+while i < 3
+    print(i)
+    i = i + 1
+while i < 9
+    t = t + i
+    i = i + 2
+func f(list xs)
+    int k = 0
+    while k < length(xs)
+        t = t + xs[k]
+        k = k + 1
+""", script="vectorize.py")
+    assert result.stdout == ("while i < 3: not vectorized: body has a statement other than an assignment (call to print)\n"
+                             "while i < 9: not vectorized: body does not end with i = i + 1\n"
+                             "while k < length(xs) (in f): vectorized\n")
+
+
+def test_programs_defining_length_are_left_alone(run):
+    result = run("func length(list xs)\n    return 1\nlist xs = [5, 6]\nint t = 0\nint i = 0\n"
+                 "while i < length(xs)\n    t = t + xs[i]\n    i = i + 1\nprint(t)\n", script="vectorize.py")
+    assert result.stdout == "while i < length(xs): not vectorized: the program defines length\n"
+
+
+SHADOW = """func vector_loop(int n)
+    return n * 2
+list xs = [1, 2, 3]
+int t = 0
+int i = 0
+while i < length(xs)
+    t = t + xs[i]
+    i = i + 1
+print(t)
+print(vector_loop(4))
+"""
+
+
+def test_vector_loop_is_not_a_builtin_name(outputs, run):
+    for backend, output in outputs(SHADOW).items():
+        assert output == "6\n8\n", backend
+    assert run(SHADOW, script="vectorize.py").stdout == "while i < length(xs): vectorized\n"
+    result = run("print(vector_loop([1]))\n", "--no-cache")
+    assert result.returncode == 1
+    assert "Call to undefined function 'vector_loop'" in result.stderr
+
+
+def test_native_code_calls_the_loop_builtin(run):
+    result = run("func total(list xs)\n    int t = 0\n    int i = 0\n    while i < length(xs)\n"
+                 "        t = t + xs[i]\n        i = i + 1\n    return t\n", script="tierup.py")
+    assert "b__vector_loop(" in result.stdout, result.stdout + result.stderr
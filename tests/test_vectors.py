@@ -0,0 +1,125 @@
+import subprocess
+import sys
+
+import pytest
+
+import vectors
+from conftest import ROOT
+
+PROGRAM = """list[int] xs = [5, 3, 9, 1]
+list[float] fs = [1, 2.5]
+print(xs)
+print(fs)
+print(sort(xs))
+print(filter_gt(xs, 3))
+list[int] view = slice(xs, 1, 3)
+print(view)
+print(map_add(xs, 1))
+print(map_add(xs, xs))
+print(scale(fs, 2))
+print(dot(xs, xs))
+print(sum(fs))
+print(range(3))
+print(length(xs) + xs[2])
+try
+    list[int] bad = [1.5]
+catch string e
+    print(e)
+try
+    print(dot(xs, fs))
+catch string e
+    print(e)
+"""
+
+EXPECTED = """[5, 3, 9, 1]
+[1.0, 2.5]
+[1, 3, 5, 9]
+[5, 9]
+[3, 9]
+[6, 4, 10, 2]
+[10, 6, 18, 2]
+[2.0, 5.0]
+116
+3.5
+[0, 1, 2]
+13
+Cannot convert elements to list[int]
+Length mismatch: 4 and 2
+"""
+
+
+def test_every_backend(outputs):
+    for backend, output in outputs(PROGRAM).items():
+        assert output == EXPECTED, backend
+
+
+@pytest.mark.parametrize("args", [(), ("--vm", "register")])
+def test_without_numpy(run, args):
+    result = run(PROGRAM, "--no-cache", *args, env={"IJICHI_NO_NUMPY": "1"})
+    assert result.stdout == EXPECTED, result.stderr
+
+
+def test_elements_are_python_numbers():
+    xs = vectors.int_list([1, 2])
+    fs = vectors.float_list([1, 2])
+    assert type(xs[0]) is int and type(fs[0]) is float
+    assert type(vectors.vector_sum(xs)) is int and type(vectors.dot(fs, fs)) is float
+
+
+def test_slices_share_the_buffer():
+    xs = vectors.int_list([1, 2, 3, 4])
+    view = vectors.vector_slice(xs, 1, 3)
+    xs.data[1] = 20
+    assert view.tolist() == [20, 3]
+
+
+def test_plain_lists_stay_plain():
+    assert vectors.scale([1, 2], 3) == [3, 6]
+    assert vectors.vector_sort([3, 1]) == [1, 3]
+    assert vectors.coerce("list", [1.5]) == [1.5]
+
+
+@pytest.mark.parametrize("value", [[1.5], ["a"], "abc", 3])
+def test_coerce_refuses(value):
+    with pytest.raises(ValueError):
+        vectors.coerce("list[int]", value)
+
+
+BIG = 2 ** 62
+
+
+def test_builtins_past_int64():
+    xs = vectors.int_list([BIG, BIG, 5])
+    assert vectors.vector_sum(xs) == 2 * BIG + 5
+    assert vectors.dot(xs, xs) == 2 * BIG * BIG + 25
+    assert vectors.map_add(xs, [-1, 1, 0]).tolist() == [BIG - 1, BIG + 1, 5]
+    assert vectors.scale(xs, 1).tolist() == [BIG, BIG, 5]
+    for operation in (lambda: vectors.map_add(xs, xs), lambda: vectors.map_add(xs, 2 ** 70),
+                      lambda: vectors.scale(xs, 2), lambda: vectors.int_list([2 ** 63])):
+        with pytest.raises(ValueError, match="Cannot convert elements to list\\[int\\]"):
+            operation()
+
+
+BUILTINS = """list[int] xs = int_list([4611686018427387904, 4611686018427387904, 5])
+print(sum(xs))
+print(dot(xs, xs))
+try
+    print(scale(xs, 2))
+catch string e
+    print("scale: " + e)
+"""
+
+
+@pytest.mark.parametrize("env", [{}, {"IJICHI_NO_NUMPY": "1"}])
+def test_builtins_agree_across_backends(run, env):
+    result = run(BUILTINS, "--no-cache", env=env)
+    assert result.stdout == ("9223372036854775813\n42535295865117307932921825928971026457\n"
+                             "scale: Cannot convert elements to list[int]\n"), result.stderr
+
+
+def test_numpy_is_imported_with_the_first_typed_list():
+    check = ("import sys, run, vectors\n"
+             "assert 'numpy' not in sys.modules\n"
+             "vectors.int_list([1])\n"
+             "assert ('numpy' in sys.modules) == (vectors.numpy is not None)\n")
+    subprocess.run([sys.executable, "-c", check], cwd=ROOT, check=True)
@@ -0,0 +1,154 @@
+import os
+
+import pytest
+
+from cache import compile_source
+from compiler import CompileError
+from opcodes import (ADD_INT, BINARY_ADD, BINARY_ADD_GENERIC, COUNTED_LOOP, JUMP_IF_NOT_LT, JUMP_IF_NOT_NE, LT_FLOAT,
+                     OPNAMES, SUBTRACT_FLOAT, VAR_VAR_MULTIPLY, decode)
+from vm import VirtualMachine
+
+PROGRAMS = {
+    "arithmetic": ("int a = 7\nint b = 3\nprint(a + b * 2 - a / 7)\nprint((a + b) * (a - b))\n",
+                   "12.0\n40\n"),
+    "functions": ("func add(int a, int b)\n    return a + b\n\nprint(add(add(1, 2), add(3, 4)))\n", "10\n"),
+    "strings": ('string s = "ab"\nprint(s + "c" + str(1))\n', "abc1\n"),
+    "collections": ('list xs = [1, 2, 3]\ndict d = {"k": xs[2]}\nprint(d["k"] + xs[0])\n', "4\n"),
+    "globals": ("int g = 5\nfunc get()\n    return g * 2\n\nprint(get())\n", "10\n"),
+}
+
+
+def opcodes(source, opt_level=1):
+    return [op for _, op, _ in decode(compile_source(source, opt_level).instructions)]
+
+
+def test_every_opcode_has_a_handler():
+    vm = VirtualMachine([], [], {})
+    assert len(vm.dispatch) == 256
+    for op in range(len(OPNAMES)):
+        assert vm.dispatch[op] != vm.op_unknown, OPNAMES[op]
+
+
+def test_unknown_opcode():
+    vm = VirtualMachine([], [], {})
+    vm.instructions.append(250)
+    with pytest.raises(RuntimeError, match="Unknown instruction 250"):
+        vm.run()
+
+
+@pytest.mark.parametrize("opt_level", [0, 1, 2])
+def test_superinstructions(opt_level):
+    assert VAR_VAR_MULTIPLY in opcodes("int x = 2\nint y = x * x\nprint(y)\n", opt_level)
+
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_backends_agree(outputs, name):
+    source, expected = PROGRAMS[name]
+    for backend, output in outputs(source).items():
+        assert output == expected, backend
+
+
+def test_demo(outputs):
+    with open(os.path.join(os.path.dirname(__file__), "..", "demo.iji")) as f:
+        results = outputs(f.read())
+    assert len(set(results.values())) == 1, results
+    assert results["walk"].endswith("Demo complete!\n")
+
+
+def test_declared_types_pick_typed_opcodes():
+    assert ADD_INT in opcodes("int a = 1\nprint(a * 2 + a)\n", 0)
+    # Any int/float mix is done as floats
+    ops = opcodes("float a = 1.5\nprint(a * 2 - a)\nprint(a < 2)\n", 0)
+    assert SUBTRACT_FLOAT in ops and LT_FLOAT in ops
+
+
+@pytest.mark.parametrize("source, message", [
+    ('int x = "a"\n', "Cannot assign string to int variable 'x'"),
+    ("string s = 1\n", "Cannot assign int to string variable 's'"),
+])
+def test_incompatible_declarations(source, message):
+    with pytest.raises(CompileError, match=message):
+        compile_source(source)
+
+
+def test_ints_are_accepted_as_floats(outputs):
+    assert set(outputs("float f = 1\nprint(f / 2)\n").values()) == {"0.5\n"}
+
+
+# xs[i] has no static type, so the + adapts to what it sees at run time
+ADAPTIVE = """func twice(list xs, int i)
+    return xs[i] + xs[i]
+print(twice([1], 0))
+print(twice([1], 0))
+print(twice(["a"], 0))
+"""
+
+
+@pytest.mark.parametrize("quicken", [True, False])
+def test_quickening_and_deoptimization(quicken, capsys):
+    bytecode = compile_source(ADAPTIVE, 0)
+    assert BINARY_ADD in opcodes(ADAPTIVE, 0)
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions, quicken=quicken, tier_up=False)
+    vm.run()
+    assert capsys.readouterr().out == "2\n2\naa\n"
+    ops = [op for _, op, _ in decode(vm.instructions)]
+    if quicken:
+        # Quickened to ADD_INT by the first call, back to generic by the third
+        assert vm.stats() == {"specialized": 1, "deoptimized": 1}
+        assert BINARY_ADD_GENERIC in ops
+    else:
+        assert vm.stats() == {"specialized": 0, "deoptimized": 0}
+        assert BINARY_ADD in ops
+
+
+LOOPS = {
+    "counted": ("int i = 0\nint t = 0\nwhile i < 10\n    t = t + i\n    i = i + 2\nprint(t)\n", "20\n"),
+    "over a list": ("""list xs = [1, 2, 3]
+int i = 0
+int t = 0
+while i < length(xs)
+    if xs[i] != 2
+        t = t + xs[i]
+    else
+        t = t - 100
+    i = i + 1
+print(t)
+""", "-96\n"),
+    # The bound moves and the step is taken in a branch: not a counted loop
+    "moving bound": ("""int i = 0
+int n = 3
+while i < n
+    if i == 0
+        n = 5
+    i = i + 1
+print(i)
+""", "5\n"),
+    "uncounted step": ("int i = 0\nwhile i < 7\n    if i < 3\n        i = i + 1\n    else\n        i = i + 2\nprint(i)\n",
+                       "7\n"),
+    "nested": ("""int i = 0
+int t = 0
+while i < 3
+    int j = 0
+    while j < i
+        t = t * 10 + j + 1
+        j = j + 1
+    i = i + 1
+print(t)
+""", "112\n"),
+    "try": ('try\n    print(1 / 0)\ncatch string e\n    print("caught")\nprint("after")\n', "caught\nafter\n"),
+}
+
+
+@pytest.mark.parametrize("name", LOOPS)
+def test_control_flow_agrees(outputs, name):
+    source, expected = LOOPS[name]
+    for backend, output in outputs(source).items():
+        assert output == expected, backend
+
+
+@pytest.mark.parametrize("opt_level", [0, 1, 2])
+def test_loop_opcodes(opt_level):
+    ops = opcodes(LOOPS["over a list"][0], opt_level)
+    assert JUMP_IF_NOT_LT in ops and JUMP_IF_NOT_NE in ops
+    assert ops.count(COUNTED_LOOP) == 1
+    assert COUNTED_LOOP not in opcodes(LOOPS["uncounted step"][0], opt_level)
@@ -0,0 +1,440 @@
+# tierup.py
+#
+# Second tier for the stack VM. Once a function has been called THRESHOLD
+# times, its bytecode is translated to Python source, built with compile()
+# and exec(), and the VM calls the resulting function directly from then on.
+# Every basic block becomes one `if pc == offset` arm of a dispatch loop,
+# in code order, so falling through and jumping forward run straight on into
+# a later arm; only backward jumps go round the loop. The operand stack is
+# resolved at translation time, so `total = total + i`
+# is plain Python arithmetic on locals. Functions with a try block (any
+# offset in the exception table) or an instruction the translator does not
+# handle stay interpreted.
+#
+# Native calls nest on the Python stack, where the VM's own frames do not.
+# A function that can reach itself through its calls is translated with a
+# guard: past NATIVE_DEPTH nested guarded calls, the call runs in the VM
+# instead, with native code off until it returns, so deep recursion works
+# as it does interpreted.
+#
+# Set IJICHI_NO_TIERUP=1 to keep everything interpreted.
+#
+#   python tierup.py <script.iji>    print the translation of every function
+
+import math
+import os
+import sys
+
+from strings import join
+from opcodes import (
+    LOAD_CONST, LOAD_VAR, STORE_VAR, STORE_LOAD_VAR, LOAD_GLOBAL, STORE_GLOBAL,
+    CALL_BUILTIN, CALL_DIRECT, RETURN_VALUE, RAISE, POP_TOP, ENTER, CALLS,
+    BINARY_ADD, BINARY_SUBTRACT, BINARY_MULTIPLY, BINARY_DIVIDE,
+    COMPARE_EQ, COMPARE_NE, COMPARE_LT, COMPARE_LE, COMPARE_GT, COMPARE_GE,
+    JUMP, POP_JUMP_IF_FALSE, POP_JUMP_IF_TRUE, COUNTED_LOOP,
+    BUILD_LIST, BUILD_DICT, BINARY_SUBSCR, BUILD_STRING,
+    OPNAMES, SUPERINSTRUCTIONS, UNTYPED, COMPARE_JUMPS, JUMP_TARGETS, decode,
+)
+
+THRESHOLD = 50
+NATIVE_DEPTH = 200  # nested calls to guarded native functions
+DISABLED = bool(os.environ.get("IJICHI_NO_TIERUP"))
+
+OPERATORS = {
+    BINARY_ADD: "+",
+    BINARY_SUBTRACT: "-",
+    BINARY_MULTIPLY: "*",
+    BINARY_DIVIDE: "/",
+    COMPARE_EQ: "==",
+    COMPARE_NE: "!=",
+    COMPARE_LT: "<",
+    COMPARE_LE: "<=",
+    COMPARE_GT: ">",
+    COMPARE_GE: ">=",
+}
+# Typed and settled-generic forms compute the same thing
+OPERATORS.update({op: OPERATORS[generic] for op, generic in UNTYPED.items()})
+
+UNFUSED = {fused: ops for ops, fused in SUPERINSTRUCTIONS.items()}
+BRANCHES = {jump: OPERATORS[compare] for compare, jump in COMPARE_JUMPS.items()}
+
+
+class Unsupported(Exception):
+    pass
+
+
+class NativeFunction:
+    # One entry of a VM's tier-up cache; function is None when the
+    # translation was refused, with the reason
+    def __init__(self, name, source=None, function=None, reason=None):
+        self.name = name
+        self.source = source
+        self.function = function
+        self.reason = reason
+
+    def __repr__(self):
+        state = "native" if self.function else f"interpreted ({self.reason})"
+        return f"<NativeFunction {self.name}: {state}>"
+
+
+def subscr(container, index):
+    try:
+        return container[index]
+    except (IndexError, KeyError, TypeError):
+        raise RuntimeError(f"Invalid index/key access: {index}")
+
+
+def builtin_name(name):
+    # The name builtin name has in translated code; internal builtins such
+    # as $vector_loop have a $ no Python name can
+    return "b_" + name.replace("$", "_")
+
+
+class Translator:
+    def __init__(self, code, constants, functions, builtins, name, exception_table=()):
+        self.code = code
+        self.exception_table = exception_table
+        self.constants = constants
+        self.functions = functions
+        self.entries = {entry: name for name, entry in functions.items()}  # for CALL_DIRECT
+        self.builtins = builtins
+        self.name = name
+        self.lines = []
+        self.temps = 0
+        self.max_var = -1
+        self.callees = set()  # names of functions and builtins referenced
+
+    def translate(self, guard=False):
+        blocks = self.blocks(self.functions[self.name])
+        body = []
+        for start, instrs in blocks:
+            self.lines = []
+            self.block(instrs)
+            body.append((start, self.lines))
+        out = []
+        if len(body) == 1:
+            out += body[0][1]
+        else:
+            out.append(f"pc = {body[0][0]}")
+            out.append("while True:")
+            for start, lines in body:
+                out.append(f"    if pc == {start}:")
+                out += ["        " + line for line in lines]
+        names = [f"v{i}" for i in range(self.max_var + 1)]
+        if guard:
+            # On entry the variables are the arguments, then the blank locals
+            # a VM frame starts with
+            out = [f"if D[0] >= {NATIVE_DEPTH}:",
+                   f"    return I({self.name!r}, [{', '.join(names)}])",
+                   "D[0] += 1",
+                   "try:"] + ["    " + line for line in out] + ["finally:", "    D[0] -= 1"]
+        params = ", ".join(f"{name}=None" for name in names)
+        return "\n".join([f"def f_{self.name}({params + ', ' if params else ''}*_):"]
+                         + ["    " + line for line in out]) + "\n"
+
+    def blocks(self, entry):
+        # Instructions reachable from entry, split at jump targets and after branches
+        seen, leaders = self.reachable(entry)
+        for start, end, _, _ in self.exception_table:
+            if any(start <= offset < end for offset in seen):
+                raise Unsupported("has a try block")
+        blocks = []
+        for ip in sorted(seen):
+            if ip in leaders or not blocks:
+                blocks.append((ip, []))
+            blocks[-1][1].append((ip, *seen[ip]))
+        return blocks
+
+    def calls(self):
+        # Names of the functions this one calls, translated or not
+        seen, _ = self.reachable(self.functions[self.name])
+        names = set()
+        for op, args in seen.values():
+            if op in CALLS and op != CALL_BUILTIN:
+                name = self.entries.get(args[0]) if op == CALL_DIRECT else self.constants[args[0]]
+                if name in self.functions:
+                    names.add(name)
+        return names
+
+    def reachable(self, entry):
+        # {offset: (op, args)} for the instructions reachable from entry, and
+        # the offsets that start a block
+        code = self.code
+        seen = {}
+        leaders = {entry}
+        pending = [entry]
+        while pending:
+            ip = pending.pop()
+            while ip not in seen:
+                if ip >= len(code):
+                    raise Unsupported("runs off the end of the code")
+                op = code[ip]
+                if op >= len(OPNAMES):
+                    raise Unsupported(f"unknown opcode {op}")
+                (offset, op, args), = decode(code, ip, ip + 1)
+                seen[ip] = (op, args)
+                following = ip + 1 + len(args)
+                if op in JUMP_TARGETS:
+                    target = args[JUMP_TARGETS[op]]
+                    leaders.add(target)
+                    pending.append(target)
+                    if op == JUMP:
+                        break
+                    leaders.add(following)
+                elif op == RETURN_VALUE or op == RAISE:
+                    break
+                ip = following
+        return seen, leaders
+
+    # === Code generation ===
+
+    def block(self, instrs):
+        stack = []  # Python expressions for the operand stack, with whether each is atomic
+        for ip, op, args in instrs:
+            following = ip + 1 + len(args)
+            if op == LOAD_CONST:
+                stack.append((self.constant(args[0]), True))
+            elif op == LOAD_VAR:
+                stack.append((self.var(args[0]), True))
+            elif op == STORE_VAR or op == STORE_LOAD_VAR:
+                value = stack.pop()[0]
+                name = self.var(args[0])
+                self.spill(stack, name)
+                self.emit(f"{name} = {value}")
+                if op == STORE_LOAD_VAR:
+                    stack.append((name, True))
+            elif op == LOAD_GLOBAL:
+                self.spill(stack)
+                stack.append((self.temp(f"G[{args[0]}]"), True))
+            elif op == STORE_GLOBAL:
+                value = stack.pop()[0]
+                self.spill(stack)
+                self.emit(f"G[{args[0]}] = {value}")
+            elif op in OPERATORS:
+                b = stack.pop()[0]
+                a = stack.pop()[0]
+                stack.append((f"({a} {OPERATORS[op]} {b})", False))
+            elif op in UNFUSED:
+                first, second, binary = UNFUSED[op]
+                b = self.var(args[1]) if second == LOAD_VAR else self.constant(args[1])
+                stack.append((f"({self.var(args[0])} {OPERATORS[binary]} {b})", False))
+            elif op == POP_TOP:
+                value, atomic = stack.pop()
+                if not atomic:
+                    self.emit(value)
+            elif op == ENTER:
+                continue
+            elif op in CALLS:
+                argc = args[1]
+                values = [value for value, _ in stack[len(stack) - argc:]]
+                del stack[len(stack) - argc:]
+                self.spill(stack)
+                name = self.entries[args[0]] if op == CALL_DIRECT else self.constants[args[0]]
+                callee = builtin_name(name) if op == CALL_BUILTIN else self.callee(name)
+                stack.append((self.temp(f"{callee}({', '.join(values)})"), True))
+            elif op == BUILD_LIST:
+                values = [value for value, _ in stack[len(stack) - args[0]:]]
+                del stack[len(stack) - args[0]:]
+                stack.append((f"[{', '.join(values)}]", False))
+            elif op == BUILD_STRING:
+                values = [value for value, _ in stack[len(stack) - args[0]:]]
+                del stack[len(stack) - args[0]:]
+                stack.append((f"join(({', '.join(values)},))", False))
+            elif op == BUILD_DICT:
+                count = 2 * args[0]
+                values = [value for value, _ in stack[len(stack) - count:]]
+                del stack[len(stack) - count:]
+                pairs = ", ".join(f"{k}: {v}" for k, v in zip(values[::2], values[1::2]))
+                stack.append((f"{{{pairs}}}", False))
+            elif op == BINARY_SUBSCR:
+                index = stack.pop()[0]
+                container = stack.pop()[0]
+                self.spill(stack)
+                stack.append((self.temp(f"subscr({container}, {index})"), True))
+            elif op == RETURN_VALUE:
+                self.emit(f"return {stack.pop()[0]}")
+                return self.check_empty(stack)
+            elif op == RAISE:
+                self.emit(f"raise RuntimeError(str({stack.pop()[0]}))")
+                return self.check_empty(stack)
+            elif op == JUMP:
+                self.check_empty(stack)
+                self.emit(f"pc = {args[0]}")
+                if args[0] <= ip:
+                    self.emit("continue")
+                return
+            elif op == POP_JUMP_IF_FALSE or op == POP_JUMP_IF_TRUE:
+                value = stack.pop()[0]
+                self.check_empty(stack)
+                test = f"not {value}" if op == POP_JUMP_IF_FALSE else value
+                return self.branch(test, args[0], ip, following)
+            elif op in BRANCHES:
+                b = stack.pop()[0]
+                a = stack.pop()[0]
+                self.check_empty(stack)
+                return self.branch(f"not ({a} {BRANCHES[op]} {b})", args[0], ip, following)
+            elif op == COUNTED_LOOP:
+                bound = stack.pop()[0]
+                self.check_empty(stack)
+                name = self.var(args[0])
+                self.emit(f"{name} = {name} + {self.constant(args[1])}")
+                return self.branch(f"{name} < {bound}", args[2], ip, following)
+            else:
+                raise Unsupported(f"{OPNAMES[op]} is not translated")
+        # Falls through into the next block
+        self.check_empty(stack)
+        self.emit(f"pc = {following}")
+
+    def branch(self, test, target, ip, following):
+        # Ends a block with a conditional jump
+        if target > ip:
+            self.emit(f"pc = {target} if {test} else {following}")
+            return
+        self.emit(f"if {test}:")
+        self.emit(f"    pc = {target}")
+        self.emit("    continue")
+        self.emit(f"pc = {following}")
+
+    def spill(self, stack, name=None):
+        # Evaluates pending expressions into temporaries before a side effect,
+        # or before name is assigned, so they see the values they would in the VM
+        for i, (value, atomic) in enumerate(stack):
+            if not atomic or value == name:
+                stack[i] = (self.temp(value), True)
+
+    def check_empty(self, stack):
+        if stack:
+            raise Unsupported("operand stack not empty at a block boundary")
+
+    def temp(self, value):
+        name = f"t{self.temps}"
+        self.temps += 1
+        self.emit(f"{name} = {value}")
+        return name
+
+    def var(self, idx):
+        self.max_var = max(self.max_var, idx)
+        return f"v{idx}"
+
+    def constant(self, idx):
+        value = self.constants[idx]
+        if value is None or type(value) in (bool, int, str):
+            return repr(value)
+        if type(value) is float and math.isfinite(value):
+            return repr(value)
+        return f"K[{idx}]"
+
+    def callee(self, name):
+        if name in self.functions:
+            self.callees.add(name)
+            return f"f_{name}"
+        raise Unsupported(f"call to unknown function '{name}'")
+
+    def emit(self, line):
+        self.lines.append(line)
+
+
+class TierUp:
+    # Per-VM tier-up state: call counts and the cache of translations, by
+    # function name. All generated functions share one namespace, where
+    # f_<name> is the native function once one exists and otherwise re-enters
+    # the VM.
+    def __init__(self, vm, threshold=THRESHOLD):
+        self.vm = vm
+        self.threshold = threshold
+        self.counts = {}
+        self.cache = {}  # name -> NativeFunction
+        self.graph = None  # function name -> names it calls, built on first use
+        self.namespace = {"K": vm.constants, "G": vm.globals, "subscr": subscr, "join": join,
+                          "D": [0], "I": vm.interpret}  # guarded native calls running
+        for name, builtin in vm.builtins.items():
+            self.namespace[builtin_name(name)] = builtin
+
+    def native(self, name):
+        # The native function for name, translating it on the call that
+        # reaches the threshold; None while it should stay interpreted
+        count = self.counts[name] = self.counts.get(name, 0) + 1
+        if count != self.threshold:
+            return None
+        entry = self.translate(name)
+        if name not in self.vm.memo_caches:
+            self.vm.relink(name, entry.function)  # the calls stop counting
+        return entry.function
+
+    def translate(self, name):
+        vm = self.vm
+        translator = Translator(vm.instructions, vm.constants, vm.functions, vm.builtins, name,
+                                vm.exception_table)
+        try:
+            source = translator.translate(self.recursive(name))
+        except Unsupported as e:
+            entry = self.cache[name] = NativeFunction(name, reason=str(e))
+            return entry
+        namespace = self.namespace
+        for callee in translator.callees:
+            if f"f_{callee}" not in namespace:
+                namespace[f"f_{callee}"] = self.reentry(callee)
+        exec(compile(source, f"<tierup {name}>", "exec"), namespace)
+        function = namespace[f"f_{name}"]
+        memo = vm.memo_caches.get(name)
+        if memo is not None:
+            # Recursive calls inside the native code go through the cache too
+            function = namespace[f"f_{name}"] = memo.wrap(function)
+        entry = self.cache[name] = NativeFunction(name, source, function)
+        vm.natives[name] = function
+        return entry
+
+    def recursive(self, name):
+        # Whether name can call itself, through any chain of calls
+        vm = self.vm
+        if self.graph is None:
+            self.graph = {}
+            for other in vm.functions:
+                translator = Translator(vm.instructions, vm.constants, vm.functions, vm.builtins, other)
+                try:
+                    self.graph[other] = translator.calls()
+                except Unsupported:
+                    self.graph[other] = set(vm.functions)  # unreadable code may call anything
+        seen = set()
+        pending = list(self.graph[name])
+        while pending:
+            callee = pending.pop()
+            if callee == name:
+                return True
+            if callee not in seen:
+                seen.add(callee)
+                pending.extend(self.graph[callee])
+        return False
+
+    def reentry(self, name):
+        vm = self.vm
+
+        def call(*args):
+            native = vm.natives.get(name)
+            if native is not None:
+                return native(*args)
+            return vm.invoke(name, args)
+        return call
+
+
+def main(argv):
+    if len(argv) != 1:
+        print("Usage: python tierup.py <script.iji>")
+        return 1
+    from cache import load_program
+    from vm import VirtualMachine
+    bytecode = load_program(argv[0], use_cache=False)
+    vm = VirtualMachine(bytecode.instructions, bytecode.constants, bytecode.functions, tier_up=False,
+                        exception_table=bytecode.exception_table)
+    tier = TierUp(vm)
+    for name in bytecode.functions:
+        entry = tier.translate(name)
+        if entry.function is None:
+            print(f"# {name}: stays interpreted: {entry.reason}\n")
+        else:
+            print(entry.source)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,255 @@
+# vectorize.py
+#
+# AST pass that turns counted loops which only accumulate into one bulk
+# operation. A loop qualifies when it has the shape
+#
+#   while i < bound            (or i <= bound)
+#       total = total + <term> - <term> ...
+#       ...                    (more reductions, each variable once)
+#       i = i + 1
+#
+# where bound does not change in the loop and the terms read only i,
+# elements xs[i] of lists the loop does not assign, other variables it does
+# not assign, and numeric literals, combined with + - * /. No iteration then
+# depends on another except through the reductions, so the loop becomes
+#
+#   list $v1 = $vector_loop(spec, i, bound, [total, ...], [xs, ...], [k, ...])
+#   if length($v1) > 0
+#       i = $v1[0]
+#       total = $v1[1]
+#   else
+#       <the original loop>
+#
+# $vector_loop (vectors.vector_loop) runs the terms over whole NumPy arrays
+# when every list is a typed list, otherwise in a Python loop over the
+# elements, and returns [] whenever the loop has to run as written. $-names
+# cannot be written in source, so they never clash with program variables
+# or functions.
+#
+# IJICHI_NO_VECTORIZE=1 turns the pass off.
+#
+#   python vectorize.py <script.iji>     prints which loops were vectorized
+
+import os
+import sys
+
+from ast_nodes import *
+from memo import walk
+
+DISABLED = bool(os.environ.get("IJICHI_NO_VECTORIZE"))
+
+OPERATORS = {"+", "-", "*", "/"}
+
+
+class Rejected(Exception):
+    pass
+
+
+def vectorize(program):
+    # Rewrites program in place; returns the report, one line per loop
+    vectorizer = Vectorizer(program.statements)
+    if not DISABLED:
+        vectorizer.block(program.statements, None)
+    return vectorizer.report
+
+
+class Vectorizer:
+    def __init__(self, statements):
+        self.report = []
+        self.count = 0  # loops rewritten, for naming their result lists
+        # A program that defines length would call its own version
+        self.shadowed = {node.name for node in walk(statements) if isinstance(node, FunctionDef)} & {"length"}
+
+    def block(self, statements, func):
+        # Inner loops first: a loop around a rewritten one no longer qualifies
+        rewritten = []
+        for stmt in statements:
+            if isinstance(stmt, FunctionDef):
+                self.block(stmt.body, stmt.name)
+            elif isinstance(stmt, IfStatement):
+                self.block(stmt.then_body, func)
+                self.block(stmt.else_body or [], func)
+            elif isinstance(stmt, TryStatement):
+                self.block(stmt.try_body, func)
+                self.block(stmt.catch_body, func)
+            elif isinstance(stmt, WhileLoop):
+                self.block(stmt.body, func)
+                where = f"while {unparse(stmt.condition)}" + (f" (in {func})" if func else "")
+                try:
+                    if self.shadowed:
+                        raise Rejected(f"the program defines {', '.join(sorted(self.shadowed))}")
+                    rewritten.extend(self.rewrite(stmt))
+                except Rejected as e:
+                    self.report.append(f"{where}: not vectorized: {e}")
+                else:
+                    self.report.append(f"{where}: vectorized")
+                    continue
+            rewritten.append(stmt)
+        statements[:] = rewritten
+
+    def rewrite(self, loop):
+        cond = loop.condition
+        if not (isinstance(cond, BinaryOperation) and cond.operator in ("<", "<=")
+                and isinstance(cond.left, VariableReference)):
+            raise Rejected("condition is not i < bound or i <= bound")
+        counter = cond.left.name
+        body = loop.body
+        if not body or not is_increment(body[-1], counter):
+            raise Rejected(f"body does not end with {counter} = {counter} + 1")
+
+        reductions = []  # (variable, [(op, term), ...])
+        for stmt in body[:-1]:
+            if not isinstance(stmt, Assignment):
+                raise Rejected(f"body has a statement other than an assignment ({describe(stmt)})")
+            if stmt.name == counter or stmt.name in (name for name, _ in reductions):
+                raise Rejected(f"assigns {stmt.name} more than once")
+            reductions.append((stmt.name, steps(stmt)))
+        if not reductions:
+            raise Rejected("nothing to accumulate")
+
+        assigned = {counter} | {name for name, _ in reductions}
+        bound = cond.right
+        invariant(bound, assigned)
+        if cond.operator == "<=":
+            bound = BinaryOperation(bound, "+", Literal(1))
+
+        kernel = Kernel(counter, assigned)
+        spec = " ; ".join(" ".join(f"{op} {kernel.term(term)}" for op, term in terms)
+                          for _, terms in reductions)
+
+        self.count += 1
+        result = f"$v{self.count}"
+        call = FunctionCall("$vector_loop", [
+            Literal(spec),
+            VariableReference(counter),
+            bound,
+            ListLiteralNode([VariableReference(name) for name, _ in reductions]),
+            ListLiteralNode([VariableReference(name) for name in kernel.lists]),
+            ListLiteralNode([VariableReference(name) for name in kernel.scalars]),
+        ])
+        names = [counter] + [name for name, _ in reductions]
+        unpack = [Assignment(name, IndexAccessNode(VariableReference(result), Literal(n)))
+                  for n, name in enumerate(names)]
+        guard = BinaryOperation(FunctionCall("length", [VariableReference(result)]), ">", Literal(0))
+        declaration = VariableDeclaration("list", result, call)
+        declaration.line = getattr(loop, "line", None)  # where the loop was
+        return [declaration, IfStatement(guard, unpack, [loop])]
+
+
+def is_increment(stmt, counter):
+    value = getattr(stmt, "value", None)
+    return (isinstance(stmt, Assignment) and stmt.name == counter
+            and isinstance(value, BinaryOperation) and value.operator == "+"
+            and isinstance(value.left, VariableReference) and value.left.name == counter
+            and isinstance(value.right, Literal) and value.right.value == 1
+            and type(value.right.value) is int)
+
+
+def steps(stmt):
+    # total = total + a - b  ->  [("+", a), ("-", b)], in evaluation order
+    found = []
+    node = stmt.value
+    while isinstance(node, BinaryOperation) and node.operator in ("+", "-"):
+        found.append((node.operator, node.right))
+        node = node.left
+    if not (isinstance(node, VariableReference) and node.name == stmt.name and found):
+        raise Rejected(f"{stmt.name} is not updated as {stmt.name} = {stmt.name} + ... or - ...")
+    found.reverse()
+    return found
+
+
+def invariant(node, assigned):
+    # The bound is evaluated once, so it may not depend on the loop
+    if isinstance(node, Literal) and type(node.value) in (int, float):
+        return
+    if isinstance(node, VariableReference):
+        if node.name in assigned:
+            raise Rejected(f"bound reads {node.name}, which the loop assigns")
+        return
+    if isinstance(node, BinaryOperation) and node.operator in OPERATORS:
+        invariant(node.left, assigned)
+        invariant(node.right, assigned)
+        return
+    if (isinstance(node, FunctionCall) and node.name == "length" and node.target is None
+            and len(node.args) == 1 and isinstance(node.args[0], VariableReference)):
+        invariant(node.args[0], assigned)
+        return
+    raise Rejected(f"bound {unparse(node)} is not a simple expression")
+
+
+class Kernel:
+    # Translates terms to vector_loop's prefix notation, numbering the lists
+    # and scalar variables they read
+    def __init__(self, counter, assigned):
+        self.counter = counter
+        self.assigned = assigned
+        self.lists = []
+        self.scalars = []
+
+    def term(self, node):
+        if isinstance(node, Literal):
+            if type(node.value) not in (int, float):
+                raise Rejected(f"term uses the non-numeric literal {node.value!r}")
+            return repr(node.value)
+        if isinstance(node, VariableReference):
+            if node.name == self.counter:
+                return "i"
+            if node.name in self.assigned:
+                raise Rejected(f"term reads {node.name}, which carries a value between iterations")
+            return f"k{number(self.scalars, node.name)}"
+        if isinstance(node, IndexAccessNode):
+            container, index = node.container, node.index
+            if not (isinstance(index, VariableReference) and index.name == self.counter):
+                raise Rejected(f"index {unparse(index)} is not {self.counter}")
+            if not isinstance(container, VariableReference) or container.name in self.assigned:
+                raise Rejected(f"indexes {unparse(container)}, which is not a list variable the loop leaves alone")
+            return f"a{number(self.lists, container.name)}"
+        if isinstance(node, BinaryOperation):
+            if node.operator not in OPERATORS:
+                raise Rejected(f"term uses the operator {node.operator}")
+            return f"{node.operator} {self.term(node.left)} {self.term(node.right)}"
+        raise Rejected(f"term {unparse(node)} is not arithmetic on elements")
+
+
+def number(names, name):
+    if name not in names:
+        names.append(name)
+    return names.index(name)
+
+
+def describe(stmt):
+    if isinstance(stmt, FunctionCall):
+        return f"call to {stmt.name}"
+    return type(stmt).__name__
+
+
+def unparse(node):
+    # Source-like text of an expression, for the report
+    if isinstance(node, Literal):
+        return repr(node.value)
+    if isinstance(node, VariableReference):
+        return node.name
+    if isinstance(node, BinaryOperation):
+        return f"{unparse(node.left)} {node.operator} {unparse(node.right)}"
+    if isinstance(node, IndexAccessNode):
+        return f"{unparse(node.container)}[{unparse(node.index)}]"
+    if isinstance(node, FunctionCall):
+        return f"{node.name}({', '.join(unparse(arg) for arg in node.args)})"
+    return type(node).__name__
+
+
+def main(argv):
+    if len(argv) != 1:
+        print("Usage: python vectorize.py <script.iji>")
+        return 1
+    from lexer import Lexer
+    from parser import Parser
+    with open(argv[0], "rb") as f:
+        program = Parser(Lexer(f.read())).parse()
+    for line in vectorize(program) or ["no while loops"]:
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,466 @@
+# vectors.py
+#
+# Typed homogeneous lists: values declared list[int] or list[float]. Their
+# elements live unboxed in a NumPy array when numpy is installed, otherwise
+# in an array.array seen through a memoryview, and the builtins below work
+# on the whole sequence in C instead of one element per interpreted step.
+# The builtins accept plain lists as well; a plain (untyped) list stays a
+# Python list. Slicing a typed list shares the underlying buffer.
+#
+# Set IJICHI_NO_NUMPY=1 to use the array.array backend even with numpy
+# installed. numpy is imported when the first typed list is made, not with
+# this module: most scripts never declare one, and importing numpy takes
+# longer than many of them take to run.
+
+import array
+import operator
+import os
+import re
+from functools import partial
+from itertools import islice
+
+numpy = None  # the numpy module once load_numpy() has found it
+numpy_loaded = False
+
+# Declared type -> element type
+ELEMENT_TYPES = {"list[int]": "int", "list[float]": "float"}
+
+TYPECODES = {"int": "q", "float": "d"}
+DTYPES = {"int": "int64", "float": "float64"}
+DTYPE_KINDS = {"int": "iu", "float": "iuf"}  # numpy dtype kinds each element type accepts
+INT64_LIMIT = 2 ** 63  # list[int] elements are below it in magnitude
+
+
+class TypedList:
+    # data is a numpy array, or a memoryview over an array.array
+    __slots__ = ("kind", "data")
+    __hash__ = None
+
+    def __init__(self, kind, data):
+        self.kind = kind
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if type(index) is not int:
+            raise TypeError(f"list indices must be integers, not {type(index).__name__}")
+        value = self.data[index]
+        # Elements come out as plain Python numbers
+        return value if numpy is None else value.item()
+
+    def __iter__(self):
+        return iter(self.data.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, TypedList):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def tolist(self):
+        return self.data.tolist()
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+
+def load_numpy():
+    # The numpy module typed lists use, or None for array.array; imports it
+    # the first time
+    global numpy, numpy_loaded
+    if not numpy_loaded:
+        numpy_loaded = True
+        if not os.environ.get("IJICHI_NO_NUMPY"):
+            try:
+                import numpy
+            except ImportError:
+                pass
+    return numpy
+
+
+def make(kind, values):
+    # A new TypedList of kind holding values (any iterable of numbers).
+    # Every typed list starts here, so numpy is loaded before any exists.
+    if load_numpy() is not None:
+        if isinstance(values, TypedList):
+            values = values.data
+        data = numpy.asarray(values)
+        if data.size and (data.dtype.kind not in DTYPE_KINDS[kind]
+                          or data.dtype.kind == "u" and kind == "int" and data.max() >= INT64_LIMIT):
+            raise ValueError(f"Cannot convert elements to list[{kind}]")
+        return TypedList(kind, data.astype(DTYPES[kind], copy=False))
+    if isinstance(values, TypedList):
+        if values.kind == "float" and kind == "int":
+            raise ValueError(f"Cannot convert elements to list[{kind}]")
+        values = values.data
+    try:
+        return TypedList(kind, memoryview(array.array(TYPECODES[kind], values)))
+    except (TypeError, OverflowError):
+        raise ValueError(f"Cannot convert elements to list[{kind}]")
+
+
+def coerce(var_type, value):
+    # The value a variable declared var_type holds after assigning value
+    kind = ELEMENT_TYPES.get(var_type)
+    if kind is None:
+        return value
+    if isinstance(value, TypedList) and value.kind == kind:
+        return value
+    if isinstance(value, (list, TypedList)):
+        return make(kind, value)
+    raise ValueError(f"Cannot assign {type(value).__name__} to {var_type}")
+
+
+def result_kind(*values):
+    # Element type of an operation's result: float if anything is
+    kinds = [v.kind if isinstance(v, TypedList) else "float" if isinstance(v, float) else "int"
+             for v in values]
+    return "float" if "float" in kinds else "int"
+
+
+def check_lengths(xs, ys):
+    if len(xs) != len(ys):
+        raise ValueError(f"Length mismatch: {len(xs)} and {len(ys)}")
+
+
+def raw(value):
+    return value.data if isinstance(value, TypedList) else value
+
+
+def largest(value):
+    # The largest |v| of a list's elements or a number, as a Python int, to
+    # tell whether int64 arithmetic on it can wrap around. NumPy does that
+    # silently; Python ints and array.array, which refuses values past
+    # int64, never do.
+    value = raw(value)
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return max(-int(value.min()), int(value.max())) if value.size else 0
+    if isinstance(value, list):
+        return max(map(abs, value), default=0)
+    return abs(value)
+
+
+# === Builtins ===
+
+def int_list(values):
+    return coerce("list[int]", values)
+
+
+def float_list(values):
+    return coerce("list[float]", values)
+
+
+def vector_sum(xs):
+    if isinstance(xs, TypedList):
+        if numpy is not None:
+            if xs.kind == "float" or len(xs) * largest(xs) < INT64_LIMIT:
+                return xs.data.sum().item()
+            return sum(xs.data.tolist())
+        return sum(xs.data)
+    return sum(xs)
+
+
+def map_add(xs, ys):
+    # Element-wise xs + ys, where ys is a list of the same length or a number
+    typed = isinstance(xs, TypedList)
+    kind = result_kind(xs, ys) if typed else None
+    if typed and numpy is not None:
+        if kind == "float" or largest(xs) + largest(ys) < INT64_LIMIT:
+            if isinstance(ys, (list, TypedList)):
+                check_lengths(xs, ys)
+                ys = numpy.asarray(raw(ys))
+            return TypedList(kind, xs.data + ys)
+        # Exact, and make() refuses what does not fit
+        xs, ys = xs.tolist(), ys.tolist() if isinstance(ys, TypedList) else ys
+    if isinstance(ys, (list, TypedList)):
+        check_lengths(xs, ys)
+        values = map(operator.add, raw(xs), raw(ys))
+    else:
+        values = map(partial(operator.add, ys), raw(xs))
+    if typed:
+        return make(kind, list(values))
+    return list(values)
+
+
+def scale(xs, factor):
+    if isinstance(xs, TypedList):
+        kind = result_kind(xs, factor)
+        if numpy is None:
+            return make(kind, map(partial(operator.mul, factor), xs.data))
+        if kind == "float" or largest(xs) * largest(factor) < INT64_LIMIT:
+            return TypedList(kind, xs.data * factor)
+        return make(kind, [x * factor for x in xs.data.tolist()])
+    return [x * factor for x in xs]
+
+
+def dot(xs, ys):
+    check_lengths(xs, ys)
+    if numpy is not None and isinstance(xs, TypedList) and isinstance(ys, TypedList):
+        if "float" in (xs.kind, ys.kind) or len(xs) * largest(xs) * largest(ys) < INT64_LIMIT:
+            return numpy.dot(xs.data, ys.data).item()
+        xs, ys = xs.tolist(), ys.tolist()
+    return sum(map(operator.mul, raw(xs), raw(ys)))
+
+
+def vector_sort(xs):
+    # A sorted copy
+    if isinstance(xs, TypedList):
+        if numpy is not None:
+            return TypedList(xs.kind, numpy.sort(xs.data))
+        return make(xs.kind, sorted(xs.data))
+    return sorted(xs)
+
+
+def filter_gt(xs, bound):
+    # The elements greater than bound, in order
+    if isinstance(xs, TypedList):
+        if numpy is not None:
+            return TypedList(xs.kind, xs.data[xs.data > bound])
+        return make(xs.kind, filter(partial(operator.lt, bound), xs.data))
+    return [x for x in xs if x > bound]
+
+
+def vector_slice(xs, start, end):
+    # xs[start:end]; a typed list's slice is a view of the same buffer
+    if isinstance(xs, TypedList):
+        return TypedList(xs.kind, xs.data[start:end])
+    return xs[start:end]
+
+
+def int_range(start, end=None):
+    if end is None:
+        start, end = 0, start
+    return list(range(start, end))
+
+
+# === Vectorized loops ===
+# vectorize.py rewrites a counted loop that only accumulates into a call to
+# vector_loop(spec, i, end, accumulators, lists, scalars). spec describes one
+# reduction per accumulator, separated by ";": each is a sequence of steps,
+# "+" or "-" followed by a term in prefix notation over i, aN (element i of
+# list N), kN (scalar N) and numeric literals. "+ * a0 k0 - a1" stands for
+# t0 = t0 + a0[i] * k0 - a1[i]. The result is [end, t0, t1, ...], or [] when
+# the loop has to run as written: something is not a list of the right
+# length, or evaluating the terms raised. Terms are pure, so running the
+# loop afterwards raises the same error at the same iteration.
+
+LOOP_ERRORS = (ArithmeticError, LookupError, TypeError, ValueError)
+TOKEN = re.compile(r"[-+*/]|i|[ak]\d+|-?\d+(\.\d*)?([eE][-+]?\d+)?")
+KERNELS = {}  # (spec, lists, scalars, mode) -> compiled kernel
+
+
+class Magnitude:
+    # An upper bound on |v| over every element of a term, found by running
+    # the kernel's own expressions on bounds instead of arrays. NumPy int64
+    # arithmetic wraps around silently, so an int intermediate that could
+    # reach 2**63 raises OverflowError here and the loop runs on Python ints.
+    __slots__ = ("bound", "is_float")
+
+    def __init__(self, bound, is_float):
+        if not is_float and bound >= INT64_LIMIT:
+            raise OverflowError("int64 overflow")
+        self.bound = bound
+        self.is_float = is_float
+
+    def __add__(self, other):
+        other = magnitude(other)
+        return Magnitude(self.bound + other.bound, self.is_float or other.is_float)
+
+    def __mul__(self, other):
+        other = magnitude(other)
+        return Magnitude(self.bound * other.bound, self.is_float or other.is_float)
+
+    def __truediv__(self, other):
+        return Magnitude(0, True)  # floats only; they overflow to inf, which errstate catches
+
+    __radd__ = __sub__ = __rsub__ = __add__
+    __rmul__ = __mul__
+    __rtruediv__ = __truediv__
+
+
+def magnitude(value):
+    if isinstance(value, Magnitude):
+        return value
+    return Magnitude(abs(value), type(value) is float)
+
+
+def array_magnitude(data):
+    if data.dtype.kind == "f":
+        return Magnitude(0, True)
+    return Magnitude(largest(data), False)
+
+
+def accumulate(total, steps, count):
+    # total op1 v1 op2 v2 ... over every element, left to right, for the
+    # terms v of steps [(op, array or scalar), ...]. Rounding matches the
+    # element loop: int additions are exact in any order, and a float total
+    # only ever adds or subtracts floats, which x - v = x + (-v) reorders
+    # into one sequence without changing a single result.
+    values = [value if isinstance(value, numpy.ndarray) else numpy.full(count, value)
+              for _, value in steps]
+    signed = [value if op == "+" else -value for (op, _), value in zip(steps, values)]
+    if type(total) is int and all(value.dtype.kind in "iu" for value in values):
+        # fits_int64() has checked that neither the sums nor the total wrap
+        combined = signed[0]
+        for value in signed[1:]:
+            combined = combined + value
+        return total + int(combined.sum())
+    if type(total) is float:
+        # cumsum adds strictly left to right, unlike sum's pairwise tree
+        sequence = [numpy.array([total])] + [numpy.column_stack(signed).ravel()]
+        return numpy.cumsum(numpy.concatenate(sequence).astype("float64"))[-1].item()
+    for row in zip(*(value.tolist() for value in values)):
+        for (op, _), value in zip(steps, row):
+            total = total + value if op == "+" else total - value
+    return total
+
+
+def parse_spec(spec, lists, scalars):
+    # [[(op, python expression), ...] per reduction]
+    reductions = []
+    for part in spec.split(";"):
+        tokens = part.split()
+        for token in tokens:
+            if not TOKEN.fullmatch(token) or token[0] == "a" and int(token[1:]) >= lists \
+                    or token[0] == "k" and int(token[1:]) >= scalars:
+                raise ValueError(f"Bad vector loop token {token!r}")
+        tokens.reverse()
+        steps = []
+        while tokens:
+            op = tokens.pop()
+            if op not in "+-":
+                raise ValueError(f"Bad vector loop step {op!r}")
+            steps.append((op, term(tokens)))
+        reductions.append(steps)
+    return reductions
+
+
+def term(tokens):
+    token = tokens.pop()
+    if token in ("+", "-", "*", "/"):
+        left = term(tokens)
+        return f"({left} {token} {term(tokens)})"
+    return f"({token})"
+
+
+def unpack(names, source):
+    return [f"    {', '.join(names)}, = {source}"] if names else []
+
+
+def bounds(spec, lists, scalars):
+    # The Magnitude of every term, per reduction, from those of i, the lists
+    # and the scalars
+    key = (spec, lists, scalars, "bounds")
+    function = KERNELS.get(key)
+    if function is not None:
+        return function
+    reductions = parse_spec(spec, lists, scalars)
+    lines = ["def bounds(i, lists, k):"]
+    lines += unpack([f"a{n}" for n in range(lists)], "lists")
+    lines += unpack([f"k{n}" for n in range(scalars)], "k")
+    terms = ", ".join("[" + ", ".join(expr for _, expr in steps) + "]" for steps in reductions)
+    lines.append(f"    return [{terms}]")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    function = KERNELS[key] = namespace["bounds"]
+    return function
+
+
+def fits_int64(spec, end, data, scalars):
+    # Whether the vector kernel can run on data without an int64 value
+    # wrapping: every int term, and count times the sum of a reduction's
+    # terms, stay below 2**63
+    count = len(data[0])
+    try:
+        reductions = bounds(spec, len(data), len(scalars))(
+            Magnitude(end, False), [array_magnitude(xs) for xs in data], scalars)
+        for terms in reductions:
+            terms = [magnitude(value) for value in terms]
+            if not any(value.is_float for value in terms):
+                Magnitude(count * sum(value.bound for value in terms), False)
+    except OverflowError:
+        return False
+    return True
+
+
+def kernel(spec, lists, scalars, vector):
+    key = (spec, lists, scalars, vector)
+    function = KERNELS.get(key)
+    if function is not None:
+        return function
+    reductions = parse_spec(spec, lists, scalars)
+    acc = [f"t{n}" for n in range(len(reductions))]
+    lines = ["def kernel(start, end, t, lists, k):"]
+    lines += unpack(acc, "t")
+    lines += unpack([f"k{n}" for n in range(scalars)], "k")
+    names = [f"a{n}" for n in range(lists)]
+    if vector:
+        # Terms are whole arrays; accumulate() folds them into the totals
+        lines += unpack(names, "lists")
+        lines += ["    i = arange(start, end)", "    count = end - start"]
+        for t, steps in zip(acc, reductions):
+            terms = ", ".join(f"({op!r}, {expr})" for op, expr in steps)
+            lines.append(f"    {t} = accumulate({t}, [{terms}], count)")
+    else:
+        sources = ["range(start, end)"] + [f"lists[{n}]" for n in range(lists)]
+        lines.append(f"    for {', '.join(['i'] + names)} in zip({', '.join(sources)}):")
+        for t, steps in zip(acc, reductions):
+            lines.append(f"        {t} = {t} " + " ".join(f"{op} {expr}" for op, expr in steps))
+    lines.append(f"    return [end, {', '.join(acc)}]")
+    namespace = {"accumulate": accumulate, "arange": numpy.arange if vector else None}
+    exec("\n".join(lines), namespace)
+    function = KERNELS[key] = namespace["kernel"]
+    return function
+
+
+def elements(xs, start, end):
+    # xs[start:end] for a loop that walks it once, without copying when possible
+    if isinstance(xs, TypedList):
+        part = xs.data[start:end]
+        return part if numpy is None else part.tolist()
+    return islice(xs, start, end)
+
+
+def vector_loop(spec, start, end, accumulators, lists, scalars):
+    if type(start) is not int or type(end) is not int or start < 0:
+        return []
+    if end <= start:
+        return [start, *accumulators]
+    for xs in lists:
+        if not isinstance(xs, (list, TypedList)) or len(xs) < end:
+            return []
+    if (numpy is not None and lists and all(isinstance(xs, TypedList) for xs in lists)
+            and all(type(k) in (int, float) for k in scalars)):
+        data = [xs.data[start:end] for xs in lists]
+        try:
+            if fits_int64(spec, end, data, scalars):
+                with numpy.errstate(all="raise"):
+                    return kernel(spec, len(lists), len(scalars), True)(start, end, accumulators, data, scalars)
+        except LOOP_ERRORS:
+            pass  # e.g. a division by zero: let the element loop find it
+    try:
+        return kernel(spec, len(lists), len(scalars), False)(
+            start, end, accumulators, [elements(xs, start, end) for xs in lists], scalars)
+    except LOOP_ERRORS:
+        return []
+
+
+VECTOR_BUILTINS = {
+    "int_list": int_list,
+    "float_list": float_list,
+    "sum": vector_sum,
+    "map_add": map_add,
+    "scale": scale,
+    "dot": dot,
+    "sort": vector_sort,
+    "filter_gt": filter_gt,
+    "slice": vector_slice,
+    "range": int_range,
+    # Only for the calls vectorize.py emits: source cannot name a $-function,
+    # so programs neither call nor shadow it
+    "$vector_loop": vector_loop,
+}
+
+# Declared type -> the builtin that converts a value to it
+CONVERTERS = {"list[int]": "int_list", "list[float]": "float_list"}
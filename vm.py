@@ -1,72 +1,818 @@
+import operator
+
+from memo import MISS, MemoTable
+from stdlib import BUILTINS
+from strings import join
+from tierup import DISABLED as TIERUP_DISABLED, TierUp
+from opcodes import (
+    OPNAMES, TYPED_OPS, GENERIC_OPS, CALL_FUNCTION, CALL_DIRECT, CALL_NATIVE, RETURN_VALUE, decode,
+    BINARY_ADD, BINARY_SUBTRACT, BINARY_MULTIPLY, BINARY_DIVIDE,
+    COMPARE_EQ, COMPARE_NE, COMPARE_LT, COMPARE_LE, COMPARE_GT, COMPARE_GE,
+    BINARY_ADD_GENERIC, BINARY_SUBTRACT_GENERIC, BINARY_MULTIPLY_GENERIC, BINARY_DIVIDE_GENERIC,
+    COMPARE_EQ_GENERIC, COMPARE_NE_GENERIC, COMPARE_LT_GENERIC,
+    COMPARE_LE_GENERIC, COMPARE_GT_GENERIC, COMPARE_GE_GENERIC,
+)
+
+# Operand types the *_FLOAT instructions accept, as a float declaration may hold an int
+FLOAT_TYPES = frozenset([int, float])
+
+# BLANKS[n] is n empty local variable slots, for CALL_DIRECT to fill in frames with
+BLANKS = [[None] * n for n in range(256)]
+
+# Errors a catch block handles; the message is pushed for the handler
+CATCHABLE = (RuntimeError, ArithmeticError, LookupError, TypeError, ValueError, OSError)
+
+
+def operand_kind(a, b):
+    # The TYPED_OPS operand type covering both values, or None
+    ta, tb = type(a), type(b)
+    if ta is int and tb is int:
+        return "int"
+    if ta in FLOAT_TYPES and tb in FLOAT_TYPES:
+        return "float"
+    if ta is str and tb is str:
+        return "string"
+    return None
+
+
+def adaptive(func, opcode):
+    # Generic instruction that rewrites itself on its first execution
+    def handler(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        stack[-1] = func(a, b)
+        self.quicken(ip, opcode, a, b)
+        return ip + 1
+    return handler
+
+
 class VirtualMachine:
-    def __init__(self, instructions, constants, functions):
-        self.instructions = instructions
+    def __init__(self, instructions, constants, functions, quicken=True, count=False, tier_up=None,
+                 memoized=(), memo=None, profiler=None, exception_table=()):
+        self.instructions = instructions  # flat array of integer opcodes and operands
         self.constants = constants
         self.functions = functions
         self.stack = []
         self.vars = []
+        self.globals = self.vars  # the top-level frame's variables
         self.ip = 0  # instruction pointer
-        self.call_stack = []
+        self.call_stack = []  # (return ip, caller vars, stack depth at the call) per call
+        self.exception_table = exception_table  # Compiler.exception_table
+        self.return_value = None
+        self.specialized = 0  # generic instructions rewritten to typed ones
+        self.deoptimized = 0  # typed instructions rewritten back after a type miss
+        self.count = count  # count executed instructions, at some cost per dispatch
+        self.executed = 0
+        self.profiler = profiler  # profiler.Profiler running the dispatch loop instead, if any
+        self.builtins = BUILTINS
+        # Constant index -> builtin, for the CALL_BUILTIN operands that name one
+        self.linked = [BUILTINS.get(value) if type(value) is str else None for value in constants]
+        self.natives = {}  # function name -> Python function it was translated to
+        # Constant index -> native function, for the CALL_NATIVE operands that name one
+        self.linked_natives = [None] * len(constants)
+        self.call_sites = {}  # function name -> offsets of its CALL_FUNCTIONs not linked yet
+        self.memo = memo or MemoTable()
+        self.memo_caches = {name: self.memo.cache(name) for name in memoized}
+        # Call depth -> (cache, args) for memo calls running in VM frames, whose
+        # results go into the cache when they return
+        self.memo_frames = {}
+        if tier_up is None:
+            tier_up = not TIERUP_DISABLED and profiler is None
+        self.tier = TierUp(self) if tier_up else None
+        self.link()
+        # Dispatch table indexed by opcode; each handler returns the next ip
+        self.dispatch = [getattr(self, "op_" + name.lower()) for name in OPNAMES]
+        self.dispatch += [self.op_unknown] * (256 - len(self.dispatch))
+        if not quicken:
+            for opcode, generic in GENERIC_OPS.items():
+                self.dispatch[opcode] = self.dispatch[generic]
+
+    def link(self):
+        # Rewrites the calls to each function into CALL_DIRECTs to its entry.
+        # Calls to a memo function keep looking it up by name, and while
+        # tier-up may still translate a function its calls stay unlinked too,
+        # counting towards the threshold; relink() links them once it decides.
+        code = self.instructions
+        for offset, op, args in decode(code):
+            if op == CALL_NATIVE:
+                # Linked by another VM over the same code, to its own natives
+                code[offset] = op = CALL_FUNCTION
+            if op == CALL_FUNCTION:
+                self.call_sites.setdefault(self.constants[args[0]], []).append(offset)
+        if self.tier is None:
+            for name in list(self.call_sites):
+                if name not in self.memo_caches:
+                    self.relink(name)
+
+    def relink(self, name, native=None):
+        # Links the calls to name: to native when tier-up translated it,
+        # otherwise straight to its bytecode
+        entry = self.functions.get(name)
+        if entry is None:
+            return  # left to fail at run time as an unknown function
+        code = self.instructions
+        if native is None and code[entry + 1] >= len(BLANKS):
+            return  # too many locals for CALL_DIRECT; its ENTER sizes the frame
+        for offset in self.call_sites.pop(name, ()):
+            if native is None:
+                code[offset] = CALL_DIRECT
+                code[offset + 1] = entry
+            else:
+                code[offset] = CALL_NATIVE
+                self.linked_natives[code[offset + 1]] = native
 
     def run(self):
-        while self.ip < len(self.instructions):
-            instr = self.instructions[self.ip]
-            op = instr[0]
-
-            if op == "LOAD_CONST":
-                idx = instr[1]
-                self.stack.append(self.constants[idx])
-            elif op == "LOAD_VAR":
-                idx = instr[1]
-                self.stack.append(self.vars[idx])
-            elif op == "STORE_VAR":
-                idx = instr[1]
-                val = self.stack.pop()
-                # Expand vars if needed
-                while len(self.vars) <= idx:
-                    self.vars.append(None)
-                self.vars[idx] = val
-            elif op == "BINARY_ADD":
-                b = self.stack.pop()
-                a = self.stack.pop()
-                self.stack.append(a + b)
-            elif op == "BINARY_SUBTRACT":
-                b = self.stack.pop()
-                a = self.stack.pop()
-                self.stack.append(a - b)
-            elif op == "BINARY_MULTIPLY":
-                b = self.stack.pop()
-                a = self.stack.pop()
-                self.stack.append(a * b)
-            elif op == "BINARY_DIVIDE":
-                b = self.stack.pop()
-                a = self.stack.pop()
-                self.stack.append(a / b)
-            elif op == "CALL_FUNCTION":
-                fname = instr[1]
-                argc = instr[2]
-                args = [self.stack.pop() for _ in range(argc)][::-1]
-
-                if fname == "print":  # Built-in function example
-                    print(*args)
-                    self.stack.append(None)
+        while True:
+            try:
+                return self.execute()
+            except CATCHABLE as e:
+                handler = self.unwind(e)
+                if handler is None:
+                    raise
+                self.ip = handler
+
+    def invoke(self, fname, args):
+        # A call from native code to a function without a native version
+        memo = self.memo_caches.get(fname)
+        if memo is not None:
+            return self.call_memo(memo, fname, args)
+        return self.call(fname, args)
+
+    def interpret(self, fname, args):
+        # A call from native code nested too deep on the Python stack: runs
+        # fname, and everything it calls, in VM frames
+        natives, tier, call_native = self.natives, self.tier, self.dispatch[CALL_NATIVE]
+        self.natives, self.tier = {}, None
+        self.dispatch[CALL_NATIVE] = self.op_call_function  # same operands, called by name
+        try:
+            return self.invoke(fname, args)
+        finally:
+            self.natives, self.tier = natives, tier
+            self.dispatch[CALL_NATIVE] = call_native
+
+    def call_memo(self, memo, fname, args):
+        value = memo.lookup(args)
+        if value is MISS:
+            value = self.call(fname, args)
+            memo.store(args, value)
+        return value
+
+    def call(self, fname, args):
+        # Runs an interpreted function to completion on behalf of native
+        # code; its try blocks are handled here, any other error propagates
+        base = len(self.call_stack)
+        self.call_stack.append((len(self.instructions), self.vars, len(self.stack)))
+        self.vars = list(args)
+        self.ip = self.functions[fname]
+        while True:
+            try:
+                self.execute()
+                return self.stack.pop()
+            except CATCHABLE as e:
+                handler = self.unwind(e, base + 1)
+                if handler is None:
+                    # Back to the state the native caller called from
+                    _, self.vars, depth = self.call_stack[base]
+                    del self.stack[depth:]
+                    del self.call_stack[base:]
+                    if self.memo_frames:
+                        self.drop_memo_frames()
+                    raise
+                self.ip = handler
+
+    def unwind(self, error, lowest=0):
+        # Finds the handler for an error raised at self.ip in the exception
+        # table, looking in the current frame and then in its callers down to
+        # call depth lowest. Unwinds to it, with the error message on the
+        # stack, and returns its offset; None when no try covers the error.
+        calls = self.call_stack
+        ip = self.ip
+        for depth in range(len(calls), lowest - 1, -1):
+            if depth < len(calls):
+                ip = calls[depth][0] - 1  # within the call that left this frame
+            for start, end, handler, stack_depth in self.exception_table:
+                if start <= ip < end:
+                    if depth < len(calls):
+                        self.vars = calls[depth][1]
+                        del calls[depth:]
+                        if self.memo_frames:
+                            self.drop_memo_frames()
+                    base = calls[depth - 1][2] if depth else 0
+                    del self.stack[base + stack_depth:]
+                    self.stack.append(str(error))
+                    return handler
+        return None
+
+    def execute(self):
+        code = self.instructions
+        dispatch = self.dispatch
+        end = len(code)
+        ip = self.ip
+        if self.profiler is not None:
+            ip = self.profiler.run(self, ip, OPNAMES)  # sets self.ip itself on an error
+        else:
+            # A try statement costs nothing here until something is raised
+            try:
+                if self.count:
+                    executed = 0
+                    try:
+                        while ip < end:
+                            ip = dispatch[code[ip]](ip)
+                            executed += 1
+                    finally:
+                        self.executed += executed
                 else:
-                    # Save current state
-                    self.call_stack.append((self.ip, self.vars))
-                    # Jump to function start
-                    self.ip = self.functions[fname]
-                    # Setup new locals for function params
-                    self.vars = list(args)
-                    continue  # Skip ip increment for jump
-            elif op == "RETURN_VALUE":
-                ret_val = self.stack.pop() if self.stack else None
-                if not self.call_stack:
-                    # End of program
-                    return ret_val
-                # Restore caller state
-                self.ip, self.vars = self.call_stack.pop()
-                self.stack.append(ret_val)
-            else:
-                raise RuntimeError(f"Unknown instruction {op}")
+                    while ip < end:
+                        ip = dispatch[code[ip]](ip)
+            except CATCHABLE:
+                self.ip = ip  # the instruction that raised, for unwind()
+                raise
+        self.ip = ip
+        return self.return_value
+
+    def stats(self):
+        stats = {"specialized": self.specialized, "deoptimized": self.deoptimized}
+        if self.count:
+            stats["executed"] = self.executed
+        if self.tier is not None:
+            stats["native"] = len(self.natives)
+        return stats
+
+    def quicken(self, ip, opcode, a, b):
+        typed_op = TYPED_OPS.get((opcode, operand_kind(a, b)))
+        if typed_op is None:
+            self.instructions[ip] = GENERIC_OPS[opcode]
+        else:
+            self.instructions[ip] = typed_op
+            self.specialized += 1
+
+    def deoptimize(self, ip, generic):
+        self.instructions[ip] = generic
+        self.deoptimized += 1
+
+    def op_load_const(self, ip):
+        self.stack.append(self.constants[self.instructions[ip + 1]])
+        return ip + 2
+
+    def op_load_var(self, ip):
+        self.stack.append(self.vars[self.instructions[ip + 1]])
+        return ip + 2
+
+    def op_store_var(self, ip):
+        self.vars[self.instructions[ip + 1]] = self.stack.pop()
+        return ip + 2
+
+    def op_pop_top(self, ip):
+        self.stack.pop()
+        return ip + 1
+
+    # === Arithmetic and comparison ===
+    # BINARY_* / COMPARE_* are what the compiler emits for operands of unknown
+    # type. They quicken into a typed instruction, or settle on *_GENERIC.
+
+    op_binary_add = adaptive(operator.add, BINARY_ADD)
+    op_binary_subtract = adaptive(operator.sub, BINARY_SUBTRACT)
+    op_binary_multiply = adaptive(operator.mul, BINARY_MULTIPLY)
+    op_binary_divide = adaptive(operator.truediv, BINARY_DIVIDE)
+    op_compare_eq = adaptive(operator.eq, COMPARE_EQ)
+    op_compare_ne = adaptive(operator.ne, COMPARE_NE)
+    op_compare_lt = adaptive(operator.lt, COMPARE_LT)
+    op_compare_le = adaptive(operator.le, COMPARE_LE)
+    op_compare_gt = adaptive(operator.gt, COMPARE_GT)
+    op_compare_ge = adaptive(operator.ge, COMPARE_GE)
+
+    # Typed instructions check their operands and deoptimize on a miss
+
+    def op_add_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, BINARY_ADD_GENERIC)
+        stack[-1] = a + b
+        return ip + 1
+
+    def op_subtract_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, BINARY_SUBTRACT_GENERIC)
+        stack[-1] = a - b
+        return ip + 1
+
+    def op_multiply_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, BINARY_MULTIPLY_GENERIC)
+        stack[-1] = a * b
+        return ip + 1
+
+    def op_divide_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, BINARY_DIVIDE_GENERIC)
+        stack[-1] = a / b
+        return ip + 1
+
+    def op_add_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, BINARY_ADD_GENERIC)
+        stack[-1] = a + b
+        return ip + 1
+
+    def op_subtract_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, BINARY_SUBTRACT_GENERIC)
+        stack[-1] = a - b
+        return ip + 1
+
+    def op_multiply_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, BINARY_MULTIPLY_GENERIC)
+        stack[-1] = a * b
+        return ip + 1
+
+    def op_divide_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, BINARY_DIVIDE_GENERIC)
+        stack[-1] = a / b
+        return ip + 1
+
+    def op_concat_str(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not str or type(b) is not str:
+            self.deoptimize(ip, BINARY_ADD_GENERIC)
+        stack[-1] = a + b
+        return ip + 1
+
+    def op_eq_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, COMPARE_EQ_GENERIC)
+        stack[-1] = a == b
+        return ip + 1
+
+    def op_ne_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, COMPARE_NE_GENERIC)
+        stack[-1] = a != b
+        return ip + 1
+
+    def op_lt_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, COMPARE_LT_GENERIC)
+        stack[-1] = a < b
+        return ip + 1
+
+    def op_le_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, COMPARE_LE_GENERIC)
+        stack[-1] = a <= b
+        return ip + 1
+
+    def op_gt_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, COMPARE_GT_GENERIC)
+        stack[-1] = a > b
+        return ip + 1
+
+    def op_ge_int(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) is not int or type(b) is not int:
+            self.deoptimize(ip, COMPARE_GE_GENERIC)
+        stack[-1] = a >= b
+        return ip + 1
+
+    def op_eq_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, COMPARE_EQ_GENERIC)
+        stack[-1] = a == b
+        return ip + 1
+
+    def op_ne_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, COMPARE_NE_GENERIC)
+        stack[-1] = a != b
+        return ip + 1
+
+    def op_lt_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, COMPARE_LT_GENERIC)
+        stack[-1] = a < b
+        return ip + 1
+
+    def op_le_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, COMPARE_LE_GENERIC)
+        stack[-1] = a <= b
+        return ip + 1
+
+    def op_gt_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, COMPARE_GT_GENERIC)
+        stack[-1] = a > b
+        return ip + 1
+
+    def op_ge_float(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        a = stack[-1]
+        if type(a) not in FLOAT_TYPES or type(b) not in FLOAT_TYPES:
+            self.deoptimize(ip, COMPARE_GE_GENERIC)
+        stack[-1] = a >= b
+        return ip + 1
+
+    def op_binary_add_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] + b
+        return ip + 1
+
+    def op_binary_subtract_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] - b
+        return ip + 1
+
+    def op_binary_multiply_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] * b
+        return ip + 1
+
+    def op_binary_divide_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] / b
+        return ip + 1
+
+    def op_compare_eq_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] == b
+        return ip + 1
+
+    def op_compare_ne_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] != b
+        return ip + 1
+
+    def op_compare_lt_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] < b
+        return ip + 1
+
+    def op_compare_le_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] <= b
+        return ip + 1
+
+    def op_compare_gt_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] > b
+        return ip + 1
+
+    def op_compare_ge_generic(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        stack[-1] = stack[-1] >= b
+        return ip + 1
+
+    def op_call_function(self, ip):
+        code = self.instructions
+        fname = self.constants[code[ip + 1]]
+        argc = code[ip + 2]
+        stack = self.stack
+        args = stack[len(stack) - argc:]
+        del stack[len(stack) - argc:]
+
+        native = self.natives.get(fname)
+        if native is None and self.tier is not None and fname in self.functions:
+            native = self.tier.native(fname)
+        if native is not None:
+            self.stack.append(native(*args))
+            return ip + 3
+        target = self.functions.get(fname)
+        if target is None:
+            raise RuntimeError(f"Unknown function '{fname}'")
+        memo = self.memo_caches.get(fname)
+        if memo is not None:
+            value = memo.lookup(args)
+            if value is not MISS:
+                stack.append(value)
+                return ip + 3
+            # A miss runs in a frame like any call; RETURN_VALUE stores it
+            self.memo_frames[len(self.call_stack) + 1] = (memo, tuple(args))
+            self.dispatch[RETURN_VALUE] = self.op_return_memo
+        # Save current state
+        self.call_stack.append((ip + 3, self.vars, len(stack)))
+        # Setup new locals for function params
+        self.vars = args
+        # Jump to function start
+        return target
+
+    def op_call_direct(self, ip):
+        # The arguments come off the operand stack as the callee's frame,
+        # which gets the rest of its slots in the same step. Popping one or
+        # two is cheaper than slicing and deleting.
+        code = self.instructions
+        entry = code[ip + 1]
+        argc = code[ip + 2]
+        stack = self.stack
+        if argc == 1:
+            frame = [stack.pop()]
+        elif argc == 2:
+            b = stack.pop()
+            frame = [stack.pop(), b]
+        else:
+            frame = stack[len(stack) - argc:]
+            del stack[len(stack) - argc:]
+        frame += BLANKS[code[entry + 1] - argc]
+        self.call_stack.append((ip + 3, self.vars, len(stack)))
+        self.vars = frame
+        return entry + 3  # past the ENTER
+
+    def op_call_native(self, ip):
+        code = self.instructions
+        argc = code[ip + 2]
+        stack = self.stack
+        if argc == 1:
+            stack[-1] = self.linked_natives[code[ip + 1]](stack[-1])
+        else:
+            args = stack[len(stack) - argc:]
+            del stack[len(stack) - argc:]
+            stack.append(self.linked_natives[code[ip + 1]](*args))
+        return ip + 3
+
+    def op_enter(self, ip):
+        # A frame entered by name or from native code: the arguments are in
+        # place, the other locals get their slots here
+        missing = self.instructions[ip + 1] - len(self.vars)
+        if missing > 0:
+            self.vars += [None] * missing
+        return ip + 3
+
+    def op_call_builtin(self, ip):
+        code = self.instructions
+        argc = code[ip + 2]
+        stack = self.stack
+        if argc == 1:
+            stack[-1] = self.linked[code[ip + 1]](stack[-1])
+        else:
+            args = stack[len(stack) - argc:]
+            del stack[len(stack) - argc:]
+            stack.append(self.linked[code[ip + 1]](*args))
+        return ip + 3
+
+    def op_return_value(self, ip):
+        if self.call_stack:
+            # Restore caller state; the return value stays on top of the
+            # stack, which is where the caller takes it from
+            ip, self.vars, _ = self.call_stack.pop()
+            return ip
+        # End of program
+        self.return_value = self.stack.pop() if self.stack else None
+        return len(self.instructions)
+
+    def op_return_memo(self, ip):
+        # RETURN_VALUE while memo calls are running in VM frames
+        frames = self.memo_frames
+        frame = frames.pop(len(self.call_stack), None)
+        if frame is not None:
+            memo, args = frame
+            memo.store(args, self.stack[-1])
+            if not frames:
+                self.dispatch[RETURN_VALUE] = self.op_return_value
+        return self.op_return_value(ip)
+
+    def drop_memo_frames(self):
+        # Forgets the memo calls an error unwound, which never return
+        frames = self.memo_frames
+        for depth in [depth for depth in frames if depth > len(self.call_stack)]:
+            del frames[depth]
+        if not frames:
+            self.dispatch[RETURN_VALUE] = self.op_return_value
+
+    # === Superinstructions ===
+
+    def op_var_const_add(self, ip):
+        code = self.instructions
+        self.stack.append(self.vars[code[ip + 1]] + self.constants[code[ip + 2]])
+        return ip + 3
+
+    def op_var_const_subtract(self, ip):
+        code = self.instructions
+        self.stack.append(self.vars[code[ip + 1]] - self.constants[code[ip + 2]])
+        return ip + 3
+
+    def op_var_const_multiply(self, ip):
+        code = self.instructions
+        self.stack.append(self.vars[code[ip + 1]] * self.constants[code[ip + 2]])
+        return ip + 3
+
+    def op_var_const_divide(self, ip):
+        code = self.instructions
+        self.stack.append(self.vars[code[ip + 1]] / self.constants[code[ip + 2]])
+        return ip + 3
+
+    def op_var_var_add(self, ip):
+        code = self.instructions
+        local = self.vars
+        self.stack.append(local[code[ip + 1]] + local[code[ip + 2]])
+        return ip + 3
+
+    def op_var_var_subtract(self, ip):
+        code = self.instructions
+        local = self.vars
+        self.stack.append(local[code[ip + 1]] - local[code[ip + 2]])
+        return ip + 3
+
+    def op_var_var_multiply(self, ip):
+        code = self.instructions
+        local = self.vars
+        self.stack.append(local[code[ip + 1]] * local[code[ip + 2]])
+        return ip + 3
+
+    def op_var_var_divide(self, ip):
+        code = self.instructions
+        local = self.vars
+        self.stack.append(local[code[ip + 1]] / local[code[ip + 2]])
+        return ip + 3
+
+    def op_store_load_var(self, ip):
+        self.vars[self.instructions[ip + 1]] = self.stack[-1]
+        return ip + 2
+
+    def op_load_global(self, ip):
+        self.stack.append(self.globals[self.instructions[ip + 1]])
+        return ip + 2
+
+    def op_store_global(self, ip):
+        self.globals[self.instructions[ip + 1]] = self.stack.pop()
+        return ip + 2
+
+    # === Collections ===
+
+    def op_build_list(self, ip):
+        count = self.instructions[ip + 1]
+        stack = self.stack
+        if count:
+            items = stack[-count:]
+            del stack[-count:]
+        else:
+            items = []
+        stack.append(items)
+        return ip + 2
+
+    def op_build_dict(self, ip):
+        count = 2 * self.instructions[ip + 1]
+        stack = self.stack
+        items = stack[len(stack) - count:]
+        del stack[len(stack) - count:]
+        stack.append(dict(zip(items[::2], items[1::2])))
+        return ip + 2
+
+    def op_build_string(self, ip):
+        count = self.instructions[ip + 1]
+        stack = self.stack
+        items = stack[len(stack) - count:]
+        del stack[len(stack) - count:]
+        stack.append(join(items))
+        return ip + 2
+
+    def op_binary_subscr(self, ip):
+        stack = self.stack
+        index = stack.pop()
+        try:
+            stack[-1] = stack[-1][index]
+        except (IndexError, KeyError, TypeError):
+            raise RuntimeError(f"Invalid index/key access: {index}")
+        return ip + 1
+
+    # === Control flow ===
+
+    def op_jump(self, ip):
+        return self.instructions[ip + 1]
+
+    def op_pop_jump_if_false(self, ip):
+        if self.stack.pop():
+            return ip + 2
+        return self.instructions[ip + 1]
+
+    def op_pop_jump_if_true(self, ip):
+        if self.stack.pop():
+            return self.instructions[ip + 1]
+        return ip + 2
+
+    def op_jump_if_not_eq(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        if stack.pop() == b:
+            return ip + 2
+        return self.instructions[ip + 1]
+
+    def op_jump_if_not_ne(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        if stack.pop() != b:
+            return ip + 2
+        return self.instructions[ip + 1]
+
+    def op_jump_if_not_lt(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        if stack.pop() < b:
+            return ip + 2
+        return self.instructions[ip + 1]
+
+    def op_jump_if_not_le(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        if stack.pop() <= b:
+            return ip + 2
+        return self.instructions[ip + 1]
+
+    def op_jump_if_not_gt(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        if stack.pop() > b:
+            return ip + 2
+        return self.instructions[ip + 1]
+
+    def op_jump_if_not_ge(self, ip):
+        stack = self.stack
+        b = stack.pop()
+        if stack.pop() >= b:
+            return ip + 2
+        return self.instructions[ip + 1]
+
+    def op_counted_loop(self, ip):
+        code = self.instructions
+        local = self.vars
+        idx = code[ip + 1]
+        value = local[idx] + self.constants[code[ip + 2]]
+        local[idx] = value
+        if value < self.stack.pop():
+            return code[ip + 3]
+        return ip + 4
+
+    def op_raise(self, ip):
+        raise RuntimeError(str(self.stack.pop()))
 
-            self.ip += 1
+    def op_unknown(self, ip):
+        raise RuntimeError(f"Unknown instruction {self.instructions[ip]}")